@@ -0,0 +1,3 @@
+"""Performance benchmarks, run as
+    python3 -m falcon_kit.bench <subcommand> --help
+"""
@@ -0,0 +1,58 @@
+import argparse
+import json
+import logging
+import sys
+
+from . import aligners, kernels, memory, transport, workflow
+
+
+class HelpF(argparse.RawTextHelpFormatter, argparse.ArgumentDefaultsHelpFormatter):
+    pass
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m falcon_kit.bench',
+        description='Performance benchmarks for falcon_kit. Results are written as JSON.',
+        formatter_class=HelpF)
+    parser.add_argument('--json-fn', default='-',
+                        help='output JSON file; "-" for stdout')
+    subparsers = parser.add_subparsers(dest='cmd')
+    subparsers.required = True
+    transport.add_arguments(subparsers.add_parser(
+        'transport', help=transport.__doc__.splitlines()[0],
+        description=transport.__doc__, formatter_class=HelpF))
+    aligners.add_arguments(subparsers.add_parser(
+        'aligners', help=aligners.__doc__.splitlines()[0],
+        description=aligners.__doc__, formatter_class=HelpF))
+    kernels.add_arguments(subparsers.add_parser(
+        'kernels', help=kernels.__doc__.splitlines()[0],
+        description=kernels.__doc__, formatter_class=HelpF))
+    memory.add_arguments(subparsers.add_parser(
+        'memory', help=memory.__doc__.splitlines()[0],
+        description=memory.__doc__, formatter_class=HelpF))
+    workflow.add_arguments(subparsers.add_parser(
+        'workflow', help=workflow.__doc__.splitlines()[0],
+        description=workflow.__doc__, formatter_class=HelpF))
+    return parser.parse_args(argv[1:])
+
+
+def write_json(results, fn):
+    if fn == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(fn, 'w') as ofs:
+            json.dump(results, ofs, indent=2, sort_keys=True)
+            ofs.write('\n')
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    results = args.func(args)
+    write_json(results, args.json_fn)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
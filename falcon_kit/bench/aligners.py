@@ -0,0 +1,127 @@
+"""Time the consensus aligners (--aligner), and compare their consensus.
+
+Each aligner runs over the same pile-ups, in this process. The consensus of
+each pile-up is compared to that of the first aligner (by edlib), and, for
+simulated pile-ups, to the template the reads were simulated from.
+--input-fn reads pile-ups in the input format of fc_consensus instead,
+e.g. src/test/test.in.
+"""
+import logging
+import random
+import time
+
+import edlib
+
+from ..mains import consensus
+from . import synth
+from .transport import as_seqtuples
+
+LOG = logging.getLogger(__name__)
+
+
+def identity(a, b, mode='NW'):
+    """1 - edit distance / the longer length (or / len(a), for mode='HW', a within b).
+    Case is ignored, since the consensus is in lower case where the coverage is low.
+    """
+    a, b = a.upper(), b.upper()
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    ed = edlib.align(a, b, mode=mode)['editDistance']
+    return 1.0 - float(ed) / (len(a) if mode == 'HW' else max(len(a), len(b)))
+
+
+def read_pileups(fn):
+    """Yield the pile-ups of fn (in the input format of fc_consensus) as lists of sequences, seed first.
+    """
+    seqs = []
+    with open(fn) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            if fields[0] == '+':
+                if len(seqs) > 1:
+                    yield seqs
+                seqs = []
+            elif fields[0] == '*':
+                seqs = []
+            elif fields[0] == '-':
+                break
+            else:
+                seqs.append(fields[1])
+
+
+def run_one(aligner, pileups, args):
+    ws = consensus.get_workspace()
+    aligned0, _ = consensus.get_consensus_counts(ws)
+    wall0 = time.time()
+    cnss = [consensus.get_consensus_core(seqs, args.min_cov, 8, args.min_idt, False, aligner=aligner)
+            for seqs in pileups]
+    wall = time.time() - wall0
+    aligned1, _ = consensus.get_consensus_counts(ws)
+    return cnss, dict(
+        aligner=aligner,
+        pileups=len(pileups),
+        reads_aligned=aligned1 - aligned0,
+        wall_s=round(wall, 4),
+        mbases_per_s=round(sum(len(s.seq) for seqs in pileups for s in seqs[1:]) / wall / 1e6, 3) if wall else None,
+        cns_bases=sum(len(cns) for cns in cnss),
+    )
+
+
+def run(args):
+    templates = None
+    if args.input_fn:
+        LOG.info('Reading pile-ups from {!r}'.format(args.input_fn))
+        pileups = [as_seqtuples(seqs) for seqs in read_pileups(args.input_fn)]
+    else:
+        rnd = random.Random(args.seed)
+        LOG.info('Simulating {} pile-ups of {} x {} bp at {} identity'.format(
+            args.n_pileups, args.n_reads, args.read_len, args.identity))
+        templates = [synth.random_seq(rnd, args.read_len) for _ in range(args.n_pileups)]
+        pileups = [as_seqtuples(synth.sim_pileup(rnd, args.read_len, args.n_reads, args.identity, template))
+                   for template in templates]
+    results = []
+    first_cnss = None
+    for aligner in args.aligners:
+        cnss, res = run_one(aligner, pileups, args)
+        if first_cnss is None:
+            first_cnss = cnss
+        idts = [identity(cns, first) for (cns, first) in zip(cnss, first_cnss)]
+        res.update(
+            vs=args.aligners[0],
+            identical=sum(cns == first for (cns, first) in zip(cnss, first_cnss)),
+            mean_idt_vs=round(sum(idts) / len(idts), 5) if idts else None,
+            min_idt_vs=round(min(idts), 5) if idts else None,
+        )
+        if templates is not None:
+            idts = [identity(cns, template, mode='HW') for (cns, template) in zip(cnss, templates)]
+            res.update(mean_idt_template=round(sum(idts) / len(idts), 5) if idts else None)
+        LOG.info('{}'.format(res))
+        results.append(res)
+    return results
+
+
+def add_arguments(parser):
+    parser.add_argument('--input-fn', default=None,
+                        help='pile-ups in the input format of fc_consensus; if not given, simulate them')
+    parser.add_argument('--n-pileups', type=int, default=10,
+                        help='number of pile-ups to simulate')
+    parser.add_argument('--n-reads', type=int, default=20,
+                        help='reads per simulated pile-up')
+    parser.add_argument('--read-len', type=int, default=5000,
+                        help='length of the simulated seeds')
+    parser.add_argument('--identity', type=float, default=0.85,
+                        help='identity of the simulated reads to their template')
+    parser.add_argument('--min-cov', type=int, default=6,
+                        help='as for fc_consensus')
+    parser.add_argument('--min-idt', type=float, default=0.70,
+                        help='as for fc_consensus')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='random seed')
+    parser.add_argument('--aligners', nargs='+', default=list(consensus.ALIGNERS),
+                        choices=list(consensus.ALIGNERS),
+                        help='aligners to run; the first is the one the others are compared to')
+    parser.set_defaults(func=run)
@@ -0,0 +1,278 @@
+"""Throughput, latency and peak RSS of the ext_falcon kernels, one call at a time.
+
+Kernels:
+  kmer_lookup   find_kmer_pos_for_seq() + find_best_aln_range(), per read
+  kmer_index    find_kmer_pos_in_index() + find_best_aln_range(), per read (as consensus does)
+  align         align() of the k-mer range of each read to the seed, per read
+  align_myers   align_myers() of the same, per read
+  cns_tags      get_cns_from_align_tags() of the accepted alignments, per pile-up
+  consensus     generate_consensus() (get_consensus_core()), per pile-up
+
+Each kernel runs in a fresh worker process, over the same simulated pile-ups.
+What a kernel needs (e.g. k-mer ranges, align tags) is set up in that process,
+outside the timed calls; the peak RSS growth of the worker includes it.
+Save the JSON of one commit and pass it as --baseline-fn on another to compare.
+"""
+from ctypes import (POINTER, c_char_p, c_int, c_uint, c_void_p)
+import json
+import logging
+import multiprocessing
+import random
+import resource
+import time
+
+from .. import falcon_kit
+from ..functional import percentile
+from ..mains import consensus
+from . import synth
+from .transport import as_seqtuples
+
+LOG = logging.getLogger(__name__)
+
+falcon = falcon_kit.falcon
+falcon.get_align_tags.argtypes = [c_char_p, c_char_p, c_int, c_int, c_int, c_uint, c_int]
+falcon.get_align_tags.restype = c_void_p
+falcon.free_align_tags.argtypes = [c_void_p]
+falcon.get_cns_from_align_tags.argtypes = [POINTER(c_void_p), c_uint, c_uint, c_uint]
+falcon.get_cns_from_align_tags.restype = POINTER(falcon_kit.ConsensusData)
+
+K = 8
+# As in generate_consensus() (falcon.c).
+INDEL_ALLOWENCE_0 = 6
+INDEL_ALLOWENCE_1 = 0.10
+INDEL_ALLOWENCE_2 = 150
+
+
+def get_ranges(seqs):
+    """Return [(read, s1, e1, s2, e2)] for the reads of seqs (bytes, seed first) which
+    generate_consensus() would align, with the k-mer range of each.
+    """
+    kup = falcon_kit.kup
+    seed = seqs[0]
+    index = kup.allocate_kmer_index(K)
+    km = kup.allocate_kmer_match()
+    ranges = []
+    try:
+        kup.build_kmer_index(index, seed, len(seed))
+        kup.mask_kmer_index(index, 10000)
+        for read in seqs[1:]:
+            kup.find_kmer_pos_in_index(index, read, len(read), km)
+            arange = kup.find_best_aln_range(km, K, K * INDEL_ALLOWENCE_0, 5)
+            s1, e1, s2, e2 = arange[0].s1, arange[0].e1, arange[0].s2, arange[0].e2
+            kup.free_aln_range(arange)
+            if e1 - s1 < 100 or e2 - s2 < 100 or \
+                    abs((e1 - s1) - (e2 - s2)) > int(0.5 * INDEL_ALLOWENCE_1 * (e1 - s1 + e2 - s2)):
+                continue
+            ranges.append((read, s1, e1, s2, e2))
+    finally:
+        kup.free_kmer_match(km)
+        kup.free_kmer_index(index)
+    return ranges
+
+
+def time_kmer_lookup(pileups, args):
+    kup = falcon_kit.kup
+    for seqs in pileups:
+        seed = seqs[0]
+        lk = kup.allocate_kmer_lookup(1 << (K * 2))
+        sa = kup.allocate_seq(len(seed))
+        sda = kup.allocate_seq_addr(len(seed))
+        kup.add_sequence(0, K, seed, len(seed), sda, sa, lk)
+        kup.mask_k_mer(1 << (K * 2), lk, 10000)
+        for read in seqs[1:]:
+            t0 = time.perf_counter()
+            km = kup.find_kmer_pos_for_seq(read, len(read), K, sda, lk)
+            arange = kup.find_best_aln_range(km, K, K * INDEL_ALLOWENCE_0, 5)
+            yield time.perf_counter() - t0, len(read)
+            kup.free_aln_range(arange)
+            kup.free_kmer_match(km)
+        kup.free_seq_addr_array(sda)
+        kup.free_seq_array(sa)
+        kup.free_kmer_lookup(lk)
+
+
+def time_kmer_index(pileups, args):
+    kup = falcon_kit.kup
+    index = kup.allocate_kmer_index(K)
+    km = kup.allocate_kmer_match()
+    for seqs in pileups:
+        seed = seqs[0]
+        kup.build_kmer_index(index, seed, len(seed))
+        kup.mask_kmer_index(index, 10000)
+        for read in seqs[1:]:
+            t0 = time.perf_counter()
+            kup.find_kmer_pos_in_index(index, read, len(read), km)
+            arange = kup.find_best_aln_range(km, K, K * INDEL_ALLOWENCE_0, 5)
+            yield time.perf_counter() - t0, len(read)
+            kup.free_aln_range(arange)
+    kup.free_kmer_match(km)
+    kup.free_kmer_index(index)
+
+
+def time_align(pileups, args, myers=False):
+    DWA = falcon_kit.DWA
+    for seqs in pileups:
+        seed = seqs[0]
+        for (read, s1, e1, s2, e2) in get_ranges(seqs):
+            q, t = read[s1:e1], seed[s2:e2]
+            t0 = time.perf_counter()
+            if myers:
+                aln = DWA.align_myers(q, len(q), t, len(t), INDEL_ALLOWENCE_2)
+            else:
+                aln = DWA.align(q, len(q), t, len(t), INDEL_ALLOWENCE_2, 1)
+            yield time.perf_counter() - t0, len(q)
+            DWA.free_alignment(aln)
+
+
+def time_align_myers(pileups, args):
+    return time_align(pileups, args, myers=True)
+
+
+def get_tags(seqs, min_idt):
+    """Return the align tags of the reads generate_consensus() would accept for seqs,
+    and the number of read bases in them.
+    """
+    DWA = falcon_kit.DWA
+    tags = []
+    n_bases = 0
+    seed = seqs[0]
+    for j, (read, s1, e1, s2, e2) in enumerate(get_ranges(seqs)):
+        aln = DWA.align(read[s1:e1], e1 - s1, seed[s2:e2], e2 - s2, INDEL_ALLOWENCE_2, 1)
+        size = aln[0].aln_str_size
+        if size > 500 and float(aln[0].dist) / size < 1.0 - min_idt:
+            tags.append(falcon.get_align_tags(aln[0].q_aln_str, aln[0].t_aln_str, size, s1, s2, j + 1, 0))
+            n_bases += e1 - s1
+        DWA.free_alignment(aln)
+    return tags, n_bases
+
+
+def time_cns_tags(pileups, args):
+    for seqs in pileups:
+        tags, n_bases = get_tags(seqs, args['min_idt'])
+        tags_ptr = (c_void_p * len(tags))(*tags)
+        t0 = time.perf_counter()
+        cns = falcon.get_cns_from_align_tags(tags_ptr, len(tags), len(seqs[0]), args['min_cov'])
+        yield time.perf_counter() - t0, n_bases
+        falcon.free_consensus_data(cns)
+        for tag in tags:
+            falcon.free_align_tags(tag)
+
+
+def time_consensus(pileups, args):
+    for seqs in pileups:
+        seqtuples = as_seqtuples(s.decode('ascii') for s in seqs)
+        t0 = time.perf_counter()
+        consensus.get_consensus_core(seqtuples, args['min_cov'], K, args['min_idt'], False)
+        yield time.perf_counter() - t0, sum(len(s) for s in seqs[1:])
+
+
+KERNELS = {
+    'kmer_lookup': time_kmer_lookup,
+    'kmer_index': time_kmer_index,
+    'align': time_align,
+    'align_myers': time_align_myers,
+    'cns_tags': time_cns_tags,
+    'consensus': time_consensus,
+}
+
+
+def measure(c_input):
+    """In a worker: return the (latency, bases) of each call of the kernel over the
+    pile-ups, repeated, and how much the peak RSS grew (in KB) while they ran.
+    """
+    kernel, pileups, args = c_input
+    func = KERNELS[kernel]
+    calls = []
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for _ in range(args['repeat']):
+        calls.extend(func(pileups, args))
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return calls, rss - rss0
+
+
+def summarize(kernel, calls, rss_kb, args):
+    lats = sorted(lat for (lat, _) in calls)
+    total = sum(lats)
+    n_bases = sum(bases for (_, bases) in calls)
+    return dict(
+        kernel=kernel,
+        read_len=args.read_len,
+        identity=args.identity,
+        n_pileups=args.n_pileups,
+        n_reads=args.n_reads,
+        calls=len(lats),
+        total_s=round(total, 4),
+        calls_per_s=round(len(lats) / total, 1) if total else None,
+        mbases_per_s=round(n_bases / total / 1e6, 3) if total else None,
+        p50_ms=round(percentile(lats, 50) * 1e3, 4) if lats else None,
+        p90_ms=round(percentile(lats, 90) * 1e3, 4) if lats else None,
+        p99_ms=round(percentile(lats, 99) * 1e3, 4) if lats else None,
+        max_ms=round(lats[-1] * 1e3, 4) if lats else None,
+        peak_rss_growth_mb=round(rss_kb / 1024.0, 1),
+    )
+
+
+def compare(res, baseline, max_slowdown):
+    """Add the speedup of res over the result in baseline for the same kernel and
+    pile-ups (if any), and warn if it is slower than max_slowdown allows.
+    """
+    keys = ('kernel', 'read_len', 'identity', 'n_pileups', 'n_reads')
+    for old in baseline:
+        if all(old.get(key) == res[key] for key in keys) and old.get('total_s') and res['total_s']:
+            res['baseline_total_s'] = old['total_s']
+            res['speedup'] = round(float(old['total_s']) / res['total_s'], 3)
+            if res['speedup'] * max_slowdown < 1.0:
+                LOG.warning('{} is {:.2f}x slower than in the baseline'.format(
+                    res['kernel'], 1.0 / res['speedup']))
+            break
+
+
+def run(args):
+    rnd = random.Random(args.seed)
+    LOG.info('Simulating {} pile-ups of {} x {} bp at {} identity'.format(
+        args.n_pileups, args.n_reads, args.read_len, args.identity))
+    pileups = [[s.encode('ascii') for s in synth.sim_pileup(rnd, args.read_len, args.n_reads, args.identity)]
+               for _ in range(args.n_pileups)]
+    baseline = []
+    if args.baseline_fn:
+        with open(args.baseline_fn) as f:
+            baseline = json.load(f)
+    kernel_args = dict(min_cov=args.min_cov, min_idt=args.min_idt, repeat=args.repeat)
+    results = []
+    for kernel in args.kernels:
+        pool = multiprocessing.Pool(1)
+        try:
+            calls, rss_kb = pool.apply(measure, ((kernel, pileups, kernel_args),))
+        finally:
+            pool.terminate()
+        res = summarize(kernel, calls, rss_kb, args)
+        compare(res, baseline, args.max_slowdown)
+        LOG.info('{}'.format(res))
+        results.append(res)
+    return results
+
+
+def add_arguments(parser):
+    parser.add_argument('--n-pileups', type=int, default=5,
+                        help='number of pile-ups to simulate')
+    parser.add_argument('--n-reads', type=int, default=20,
+                        help='reads per simulated pile-up')
+    parser.add_argument('--read-len', type=int, default=10000,
+                        help='length of the simulated seeds')
+    parser.add_argument('--identity', type=float, default=0.85,
+                        help='identity of the simulated reads to their template')
+    parser.add_argument('--min-cov', type=int, default=6,
+                        help='as for fc_consensus')
+    parser.add_argument('--min-idt', type=float, default=0.70,
+                        help='as for fc_consensus')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='run each kernel over the pile-ups this many times')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='random seed')
+    parser.add_argument('--kernels', nargs='+', default=sorted(KERNELS),
+                        choices=sorted(KERNELS))
+    parser.add_argument('--baseline-fn', default=None,
+                        help='JSON of an earlier run, to compare to')
+    parser.add_argument('--max-slowdown', type=float, default=1.1,
+                        help='warn of kernels slower than this, relative to --baseline-fn')
+    parser.set_defaults(func=run)
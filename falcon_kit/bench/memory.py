@@ -0,0 +1,72 @@
+"""Peak memory (RSS) and time of the consensus of one large pile-up.
+
+Each aligner runs in a fresh worker process, which reports how much its
+peak RSS grew while it generated the consensus; the pile-up is simulated
+in the parent, before the fork, so it is not counted.
+"""
+import logging
+import multiprocessing
+import random
+import resource
+import time
+
+from ..mains import consensus
+from . import synth
+from .transport import as_seqtuples
+
+LOG = logging.getLogger(__name__)
+
+
+def measure(args):
+    seqs, min_cov, aligner = args
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    wall0 = time.time()
+    cns = consensus.get_consensus_core(seqs, min_cov, 8, 0.70, False, aligner=aligner)
+    wall = time.time() - wall0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return len(cns), wall, rss - rss0
+
+
+def run(args):
+    rnd = random.Random(args.seed)
+    LOG.info('Generating a pile-up of {} x {} bp'.format(args.n_reads, args.read_len))
+    if args.identity < 1.0:
+        seqs = synth.sim_pileup(rnd, args.read_len, args.n_reads, args.identity)
+    else:
+        seqs = synth.fast_pileup(rnd, args.read_len, args.n_reads)
+    seqs = as_seqtuples(seqs)
+    results = []
+    for aligner in args.aligners:
+        pool = multiprocessing.Pool(1)
+        try:
+            cns_len, wall, rss_kb = pool.apply(measure, ((seqs, args.min_cov, aligner),))
+        finally:
+            pool.terminate()
+        res = dict(
+            aligner=aligner,
+            n_reads=args.n_reads,
+            read_len=args.read_len,
+            identity=args.identity,
+            cns_len=cns_len,
+            wall_s=round(wall, 4),
+            peak_rss_growth_mb=round(rss_kb / 1024.0, 1),
+        )
+        LOG.info('{}'.format(res))
+        results.append(res)
+    return results
+
+
+def add_arguments(parser):
+    parser.add_argument('--n-reads', type=int, default=200,
+                        help='reads in the pile-up')
+    parser.add_argument('--read-len', type=int, default=20000,
+                        help='length of the seed read')
+    parser.add_argument('--identity', type=float, default=1.0,
+                        help='identity of the reads to their template; 1 for exact copies, which are quick to simulate')
+    parser.add_argument('--min-cov', type=int, default=6,
+                        help='as for fc_consensus')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='random seed')
+    parser.add_argument('--aligners', nargs='+', default=['dw'],
+                        choices=list(consensus.ALIGNERS))
+    parser.set_defaults(func=run)
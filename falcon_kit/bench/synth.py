@@ -0,0 +1,79 @@
+"""Synthetic sequences for benchmarks.
+"""
+
+
+def random_seq(rnd, length):
+    return ''.join(rnd.choice('ACGT') for _ in range(length))
+
+
+def sim_error(rnd, seq, pi=0.05, pd=0.05, ps=0.01):
+    """Return seq with random insertions (pi), deletions (pd) and substitutions (ps),
+    as in src/test/generate_test.py.
+    """
+    out_seq = []
+    for c in seq:
+        while 1:
+            r = rnd.uniform(0, 1)
+            if r < pi:
+                out_seq.append(rnd.choice('ACGT'))
+            else:
+                break
+        r -= pi
+        if r < pd:
+            continue
+        r -= pd
+        if r < ps:
+            out_seq.append(rnd.choice('ACGT'))
+            continue
+        out_seq.append(c)
+    return ''.join(out_seq)
+
+
+def error_rates(identity):
+    """Split 1-identity into insertion, deletion and substitution rates,
+    in the proportions of PacBio CLR reads (roughly 5:3:1).
+    >>> [round(r, 3) for r in error_rates(0.82)]
+    [0.1, 0.06, 0.02]
+    """
+    err = 1.0 - identity
+    return (err * 5 / 9, err * 3 / 9, err * 1 / 9)
+
+
+def sim_pileup(rnd, seed_len, n_reads, identity=0.85, template=None):
+    """Return [seed] + reads, where reads are noisy copies of random
+    sub-ranges of the template of the seed (which is noisy too).
+    Each read covers at least 2/3 of the seed.
+    The template is random, unless given (of seed_len), e.g. to compare the consensus to it.
+    """
+    pi, pd, ps = error_rates(identity)
+    if template is None:
+        template = random_seq(rnd, seed_len)
+    seqs = [sim_error(rnd, template, pi, pd, ps)]
+    for _ in range(n_reads):
+        s = rnd.randint(0, seed_len // 3)
+        e = rnd.randint(2 * seed_len // 3, seed_len)
+        seqs.append(sim_error(rnd, template[s:e], pi, pd, ps))
+    return seqs
+
+
+def fast_pileup(rnd, seed_len, n_reads):
+    """Like sim_pileup(), but reads are exact slices, for when only sizes matter.
+    """
+    template = random_seq(rnd, seed_len)
+    seqs = [template]
+    for _ in range(n_reads):
+        s = rnd.randint(0, seed_len // 3)
+        e = rnd.randint(2 * seed_len // 3, seed_len)
+        seqs.append(template[s:e])
+    return seqs
+
+
+RC_MAP = str.maketrans('ACGT', 'TGCA')
+
+
+def revcomp(seq):
+    """
+    >>> revcomp('AACGT')
+    'ACGTT'
+    """
+    return seq[::-1].translate(RC_MAP)
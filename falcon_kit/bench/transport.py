@@ -0,0 +1,100 @@
+"""How much parent CPU it takes to hand pile-ups to consensus workers.
+
+'pickle' is the default transport of falcon_kit.mains.consensus (lists of SeqTuple);
+'shared' is --shared-memory. The workers do no consensus here, only
+what get_consensus_*() do before calling into C, so the parent is the bottleneck.
+"""
+from ctypes import (c_char, c_char_p, addressof)
+import logging
+import random
+import time
+
+from ..multiproc import Pool, imap_bounded
+from ..mains import consensus
+from . import synth
+
+LOG = logging.getLogger(__name__)
+
+
+def as_seqtuples(strs):
+    return [consensus.SeqTuple(name=str(i), seq=s, qstrand=0, qstart=-1, qend=-1, qlen=-1,
+                               tstart=-1, tend=-1, tlen=-1, aln='*', is_mapped=False, is_trimmed=False)
+            for i, s in enumerate(strs)]
+
+
+def touch_pickled(seqs):
+    seqs_ptr = (c_char_p * len(seqs))()
+    seqs_ptr[:] = [bytes(val.seq, encoding='ascii') for val in seqs]
+    return len(seqs_ptr)
+
+
+def touch_shared(ref):
+    shm = consensus.attach_shared_memory(ref.shm_name)
+    c_buf = (c_char * shm.size).from_buffer(shm.buf)
+    base = addressof(c_buf)
+    seqs_ptr = (c_char_p * len(ref.offsets))(*[base + offset for offset in ref.offsets])
+    n = len(seqs_ptr)
+    del seqs_ptr, c_buf
+    return n
+
+
+def run_one(transport, pileups, n_core, max_in_flight):
+    ring = None
+    if transport == 'shared':
+        ring = consensus.SharedPileupRing(max_in_flight)
+        func = touch_shared
+        inputs = (ring.put(seqs) for seqs in pileups)
+    else:
+        func = touch_pickled
+        inputs = iter(pileups)
+    pool = Pool(n_core)
+    try:
+        wall0, cpu0 = time.time(), time.process_time()
+        n = sum(imap_bounded(pool, func, inputs, max_in_flight))
+        wall, cpu = time.time() - wall0, time.process_time() - cpu0
+    finally:
+        pool.terminate()
+        if ring is not None:
+            ring.close()
+    assert n == sum(len(seqs) for seqs in pileups)
+    return dict(
+        transport=transport,
+        pileups=len(pileups),
+        wall_s=round(wall, 4),
+        parent_cpu_s=round(cpu, 4),
+        parent_cpu_frac=round(cpu / wall, 3) if wall else None,
+        mbases_per_s=round(sum(len(s.seq) for seqs in pileups for s in seqs) / wall / 1e6, 1) if wall else None,
+    )
+
+
+def run(args):
+    rnd = random.Random(args.seed)
+    LOG.info('Generating {} pile-ups of {} x {} bp'.format(args.n_pileups, args.n_reads, args.read_len))
+    pileup = as_seqtuples(synth.fast_pileup(rnd, args.read_len, args.n_reads))
+    # Same content each time is fine; only the sizes matter.
+    pileups = [pileup] * args.n_pileups
+    results = []
+    for transport in args.transports:
+        res = run_one(transport, pileups, args.n_core, args.max_in_flight)
+        res.update(n_core=args.n_core, n_reads=args.n_reads, read_len=args.read_len)
+        LOG.info('{}'.format(res))
+        results.append(res)
+    return results
+
+
+def add_arguments(parser):
+    parser.add_argument('--n-core', type=int, default=4,
+                        help='number of worker processes')
+    parser.add_argument('--n-pileups', type=int, default=40,
+                        help='number of pile-ups to send')
+    parser.add_argument('--n-reads', type=int, default=500,
+                        help='reads per pile-up')
+    parser.add_argument('--read-len', type=int, default=20000,
+                        help='length of the seed read')
+    parser.add_argument('--max-in-flight', type=int, default=16,
+                        help='pile-ups in flight')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='random seed')
+    parser.add_argument('--transports', nargs='+', default=['pickle', 'shared'],
+                        choices=['pickle', 'shared'])
+    parser.set_defaults(func=run)
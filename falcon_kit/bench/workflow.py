@@ -0,0 +1,346 @@
+"""Wall time, CPU time and peak RSS of each stage of an assembly of a simulated genome.
+
+Stages (in order; each reads what the ones before it wrote to --work-dir):
+  simulate           a random genome, and raw reads of it with errors, to --coverage;
+                     writes the pile-ups of the seeds (reads of at least --length-cutoff),
+                     as LA4Falcon -f prints them, and the preads and their overlaps
+  consensus          fc_consensus of the pile-ups (--n-core=0)
+  ovlp_filter        both stages of fc_ovlp_filter, on the overlaps as LA4Falcon -mo prints them
+  ovlp_to_graph      fc_ovlp_to_graph
+  graph_to_contig    fc_graph_to_contig
+  dedup_a_tigs       fc_dedup_a_tigs
+  dedup_a_tp         fc_dedup_a_tp
+  collect_pread_gfa  fc_collect_pread_gfa
+
+No external programs (daligner, LA4Falcon, falconc) are run. The preads are
+the parts of the genome under the seeds, without errors, rather than the
+consensus of their pile-ups, so the overlaps among them are known exactly.
+
+Each stage runs in a fresh worker process, in one process, as in a cluster
+job of one core. Its peak RSS includes what the worker inherits from this
+process (the interpreter and falcon_kit); the growth is what the stage added.
+"""
+import bisect
+import contextlib
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from .. import ovlp_reader
+from ..mains import (collect_pread_gfa, consensus, dedup_a_tigs, dedup_a_tp,
+                     graph_to_contig, ovlp_filter, ovlp_to_graph)
+from . import synth
+
+LOG = logging.getLogger(__name__)
+
+
+def sim_reads(rnd, genome, coverage, read_len, identity):
+    """Return [(start, end, strand, seq)] of reads of genome[start:end] (reverse-complemented
+    if strand), with errors, of random lengths from read_len/2 to 3*read_len/2, until
+    their templates cover genome coverage times.
+    """
+    pi, pd, ps = synth.error_rates(identity)
+    glen = len(genome)
+    reads = []
+    n_bases = 0
+    while n_bases < coverage * glen:
+        rlen = min(glen, rnd.randint(read_len // 2, 3 * read_len // 2))
+        start = rnd.randint(0, glen - rlen)
+        strand = rnd.randint(0, 1)
+        template = genome[start:start + rlen]
+        if strand:
+            template = synth.revcomp(template)
+        reads.append((start, start + rlen, strand, synth.sim_error(rnd, template, pi, pd, ps)))
+        n_bases += rlen
+    return reads
+
+
+def get_overlapping(intervals, min_ovlp):
+    """Return, for each of the intervals (start, end, ...), sorted by start,
+    the indices (in order) of the others which overlap it by at least min_ovlp.
+    """
+    starts = [iv[0] for iv in intervals]
+    max_len = max([iv[1] - iv[0] for iv in intervals] or [0])
+    overlapping = []
+    for i, (start, end) in enumerate(iv[:2] for iv in intervals):
+        lo = bisect.bisect_left(starts, start - max_len)
+        hi = bisect.bisect_left(starts, end - min_ovlp + 1)
+        overlapping.append([j for j in range(lo, hi)
+                            if j != i and min(end, intervals[j][1]) - max(start, intervals[j][0]) >= min_ovlp])
+    return overlapping
+
+
+def get_pileup_lines(reads, seeds, min_ovlp):
+    """Yield the lines LA4Falcon -f would print for the pile-ups of the seeds (indices of reads),
+    with the part of each overlapping read under the seed, on the strand of the seed.
+    The part is found by scaling, since the errors shift the bases of a read.
+    """
+    order = sorted(range(len(reads)), key=lambda i: reads[i][0])
+    by_start = [reads[i] for i in order]
+    rank = dict((i, r) for (r, i) in enumerate(order))
+    overlapping = get_overlapping(by_start, min_ovlp)
+    for i in seeds:
+        s_start, s_end, s_strand, s_seq = reads[i]
+        yield '{} {}'.format(ovlp_reader.format_id(i), s_seq)
+        for r in overlapping[rank[i]]:
+            start, end, strand, seq = by_start[r]
+            if strand:
+                seq = synth.revcomp(seq)
+            scale = float(len(seq)) / (end - start)
+            part = seq[int((max(start, s_start) - start) * scale):int((min(end, s_end) - start) * scale)]
+            if s_strand:
+                part = synth.revcomp(part)
+            yield '{} {}'.format(ovlp_reader.format_id(order[r]), part)
+        yield '+ +'
+    yield '- -'
+
+
+def get_m4_lines(preads, min_ovlp):
+    """Yield the lines LA4Falcon -mo would print for the exact overlaps of preads,
+    [(start, end, strand)] in the genome, by q_id and then t_id.
+    """
+    order = sorted(range(len(preads)), key=lambda i: preads[i][0])
+    by_start = [preads[i] for i in order]
+    rank = dict((i, r) for (r, i) in enumerate(order))
+    overlapping = get_overlapping(by_start, min_ovlp)
+
+    def get_range(pread, start, end):
+        # [start, end) of the genome, in the coordinates of pread.
+        if pread[2]:
+            return pread[1] - end, pread[1] - start
+        return start - pread[0], end - pread[0]
+    for q in range(len(preads)):
+        q_pread = preads[q]
+        q_len = q_pread[1] - q_pread[0]
+        for t in sorted(order[r] for r in overlapping[rank[q]]):
+            t_pread = preads[t]
+            t_len = t_pread[1] - t_pread[0]
+            start, end = max(q_pread[0], t_pread[0]), min(q_pread[1], t_pread[1])
+            q_s, q_e = get_range(q_pread, start, end)
+            t_s, t_e = get_range(t_pread, start, end)
+            if t_s == 0 and t_e == t_len:
+                kind = 'contains'
+            elif q_s == 0 and q_e == q_len:
+                kind = 'contained'
+            else:
+                kind = 'overlap'
+            yield '{} {} {} 100.00 0 {} {} {} {} {} {} {} {}'.format(
+                ovlp_reader.format_id(q), ovlp_reader.format_id(t), -(end - start),
+                q_s, q_e, q_len, q_pread[2] ^ t_pread[2], t_s, t_e, t_len, kind)
+
+
+def write_lines(fn, lines):
+    n = 0
+    with open(fn, 'w') as f:
+        for line in lines:
+            f.write(line + '\n')
+            n += 1
+    return n
+
+
+def count_fasta(fn):
+    """Return the number of records and bases of a FASTA file.
+    """
+    n_seqs = n_bases = 0
+    with open(fn) as f:
+        for line in f:
+            if line.startswith('>'):
+                n_seqs += 1
+            else:
+                n_bases += len(line.strip())
+    return n_seqs, n_bases
+
+
+def run_simulate(args):
+    rnd = random.Random(args['seed'])
+    genome = synth.random_seq(rnd, args['genome_size'])
+    write_lines('genome.fasta', ['>genome', genome])
+    reads = sim_reads(rnd, genome, args['coverage'], args['read_len'], args['identity'])
+    write_lines('raw_reads.fasta',
+                ('>{}\n{}'.format(ovlp_reader.format_id(i), r[3]) for (i, r) in enumerate(reads)))
+    seeds = [i for (i, r) in enumerate(reads) if r[1] - r[0] >= args['length_cutoff']]
+    n_lines = write_lines('pileups.txt', get_pileup_lines(reads, seeds, args['min_ovlp']))
+    preads = [reads[i][:3] for i in seeds]
+    write_lines('preads4falcon.fasta', (
+        '>{}\n{}'.format(ovlp_reader.format_id(i), synth.revcomp(genome[s:e]) if strand else genome[s:e])
+        for (i, (s, e, strand)) in enumerate(preads)))
+    n_ovlps = write_lines('preads.ovl', get_m4_lines(preads, args['min_ovlp']))
+    return dict(raw_reads=len(reads), raw_bases=sum(len(r[3]) for r in reads),
+                seeds=len(seeds), pileup_lines=n_lines,
+                preads=len(preads), pread_bases=sum(e - s for (s, e, _) in preads),
+                pread_overlaps=n_ovlps)
+
+
+def run_consensus(args):
+    with open('pileups.txt') as stdin, open('preads.fasta', 'w') as stdout:
+        sys.stdin = stdin
+        try:
+            with contextlib.redirect_stdout(stdout):
+                consensus.main(['fc_consensus', '--n-core', '0', '--min-cov', str(args['min_cov'])])
+        finally:
+            sys.stdin = sys.__stdin__
+    n_seqs, n_bases = count_fasta('preads.fasta')
+    return dict(cns_seqs=n_seqs, cns_bases=n_bases)
+
+
+def run_ovlp_filter(args):
+    params = (args['max_diff'], args['max_cov'], args['min_cov_ovlp'], args['min_len'], 96.0)
+    with open('preads.ovl', 'rb') as f:
+        res = ovlp_filter.filter_stage1_chunks(ovlp_reader.yield_chunks(f.read), *params)
+    contained = res['contained'].difference(res['ignore'])
+    with open('preads.ovl', 'rb') as f:
+        lines = ovlp_filter.filter_stage2_chunks(ovlp_reader.yield_chunks(f.read), *params,
+                                                 res['ignore'], contained, args['bestn'])
+    write_lines('preads.m4', lines)
+    return dict(ignored=len(res['ignore']), contained=len(contained), overlaps=len(lines))
+
+
+def run_ovlp_to_graph(args):
+    with open('fc_ovlp_to_graph.log', 'w') as stdout, contextlib.redirect_stdout(stdout):
+        # No checkpoint, so that a repeat times the whole stage again.
+        ovlp_to_graph.main(['fc_ovlp_to_graph', '--overlap-file', 'preads.m4', '--graph-checkpoint', ''])
+    return dict()
+
+
+def run_graph_to_contig(args):
+    graph_to_contig.main(['fc_graph_to_contig'])
+    n_seqs, n_bases = count_fasta('p_ctg.fasta')
+    n_a_seqs, n_a_bases = count_fasta('a_ctg_all.fasta')
+    return dict(p_ctgs=n_seqs, p_ctg_bases=n_bases, a_ctgs=n_a_seqs, a_ctg_bases=n_a_bases)
+
+
+def run_dedup_a_tigs(args):
+    with open('a_ctg.fasta', 'w') as stdout, contextlib.redirect_stdout(stdout):
+        dedup_a_tigs.main(['fc_dedup_a_tigs'])
+    n_seqs, n_bases = count_fasta('a_ctg.fasta')
+    return dict(a_ctgs=n_seqs, a_ctg_bases=n_bases)
+
+
+def run_dedup_a_tp(args):
+    with open('a_ctg_tiling_path', 'w') as stdout, contextlib.redirect_stdout(stdout):
+        dedup_a_tp.main(['fc_dedup_a_tp'])
+    return dict()
+
+
+def run_collect_pread_gfa(args):
+    with open('asm.gfa.json', 'w') as stdout, contextlib.redirect_stdout(stdout):
+        collect_pread_gfa.main(['fc_collect_pread_gfa'])
+    return dict(gfa_json_bytes=os.path.getsize('asm.gfa.json'))
+
+
+STAGES = [
+    ('simulate', run_simulate),
+    ('consensus', run_consensus),
+    ('ovlp_filter', run_ovlp_filter),
+    ('ovlp_to_graph', run_ovlp_to_graph),
+    ('graph_to_contig', run_graph_to_contig),
+    ('dedup_a_tigs', run_dedup_a_tigs),
+    ('dedup_a_tp', run_dedup_a_tp),
+    ('collect_pread_gfa', run_collect_pread_gfa),
+]
+
+
+def get_cpu(who):
+    ru = resource.getrusage(who)
+    return ru.ru_utime + ru.ru_stime
+
+
+def measure(c_input):
+    """In a worker, in work_dir: run the stage, and return what it reports, its wall
+    and CPU time (with that of any processes it waited for), and the peak RSS (in KB)
+    of the worker before and after.
+    """
+    stage, work_dir, args = c_input
+    func = dict(STAGES)[stage]
+    os.chdir(work_dir)
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cpu0 = get_cpu(resource.RUSAGE_SELF) + get_cpu(resource.RUSAGE_CHILDREN)
+    wall0 = time.time()
+    info = func(args)
+    wall = time.time() - wall0
+    cpu = get_cpu(resource.RUSAGE_SELF) + get_cpu(resource.RUSAGE_CHILDREN) - cpu0
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return info, wall, cpu, rss0, rss
+
+
+def run_stages(args, work_dir):
+    stage_args = dict(
+        seed=args.seed, genome_size=args.genome_size, coverage=args.coverage, read_len=args.read_len,
+        identity=args.identity, length_cutoff=args.length_cutoff or args.read_len, min_ovlp=args.min_ovlp,
+        min_cov=args.min_cov, max_diff=args.max_diff, max_cov=args.max_cov, min_cov_ovlp=args.min_cov_ovlp,
+        min_len=args.min_len, bestn=args.bestn)
+    results = []
+    for stage, _ in STAGES:
+        if stage not in args.stages:
+            continue
+        LOG.info('Running stage {!r} in {!r}'.format(stage, work_dir))
+        pool = multiprocessing.Pool(1)
+        try:
+            info, wall, cpu, rss0, rss = pool.apply(measure, ((stage, work_dir, stage_args),))
+        finally:
+            pool.terminate()
+        res = dict(
+            stage=stage,
+            genome_size=args.genome_size,
+            coverage=args.coverage,
+            read_len=args.read_len,
+            identity=args.identity,
+            wall_s=round(wall, 4),
+            cpu_s=round(cpu, 4),
+            peak_rss_mb=round(rss / 1024.0, 1),
+            peak_rss_growth_mb=round((rss - rss0) / 1024.0, 1),
+        )
+        res.update(info)
+        LOG.info('{}'.format(res))
+        results.append(res)
+    return results
+
+
+def run(args):
+    if args.work_dir:
+        if not os.path.isdir(args.work_dir):
+            os.makedirs(args.work_dir)
+        return run_stages(args, os.path.abspath(args.work_dir))
+    with tempfile.TemporaryDirectory() as work_dir:
+        return run_stages(args, work_dir)
+
+
+def add_arguments(parser):
+    parser.add_argument('--genome-size', type=int, default=200000,
+                        help='length of the simulated genome')
+    parser.add_argument('--coverage', type=float, default=30,
+                        help='coverage of the simulated raw reads')
+    parser.add_argument('--read-len', type=int, default=10000,
+                        help='mean length of the raw reads (from half this to 1.5 times it)')
+    parser.add_argument('--identity', type=float, default=0.85,
+                        help='identity of the raw reads to the genome')
+    parser.add_argument('--length-cutoff', type=int, default=0,
+                        help='minimum length of a seed read; 0 for --read-len')
+    parser.add_argument('--min-ovlp', type=int, default=1000,
+                        help='minimum overlap of reads in the genome, to be in a pile-up or an overlap of preads')
+    parser.add_argument('--min-cov', type=int, default=6,
+                        help='as for fc_consensus')
+    parser.add_argument('--max-diff', type=int, default=100,
+                        help='as for fc_ovlp_filter')
+    parser.add_argument('--max-cov', type=int, default=100,
+                        help='as for fc_ovlp_filter')
+    parser.add_argument('--min-cov-ovlp', type=int, default=2,
+                        help='--min-cov for fc_ovlp_filter')
+    parser.add_argument('--min-len', type=int, default=2500,
+                        help='as for fc_ovlp_filter')
+    parser.add_argument('--bestn', type=int, default=10,
+                        help='as for fc_ovlp_filter')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='random seed')
+    parser.add_argument('--stages', nargs='+', default=[stage for (stage, _) in STAGES],
+                        choices=[stage for (stage, _) in STAGES],
+                        help='stages to run; the others must have been run in --work-dir before')
+    parser.add_argument('--work-dir', default=None,
+                        help='directory for the files of the stages, which is kept; if not given, a temporary one')
+    parser.set_defaults(func=run)
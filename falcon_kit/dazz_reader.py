@@ -0,0 +1,221 @@
+"""Read the pile-ups for consensus straight from a Dazzler DB and a .las file,
+as LA4Falcon -f prints them, but without the text in between.
+
+The reads are decoded from the 2-bit .bps of the DB in C (src/c/dazz.c),
+and the overlaps are read from the .las with struct. get_pileup_fields()
+yields the fields of each line LA4Falcon would print, so
+consensus.get_seq_data() treats both inputs alike.
+
+write_db() and write_las() write small ones, for tests.
+"""
+from ctypes import (c_char_p, c_int, create_string_buffer)
+import array
+import collections
+import itertools
+import mmap
+import os
+import struct
+from falcon_kit import falcon as dazz
+from .ovlp_reader import format_id
+
+dazz.dazz_decode_read.argtypes = [c_char_p, c_int, c_int, c_int, c_int, c_char_p]
+dazz.dazz_decode_read.restype = None
+
+# DAZZ_DB (in DB.h), which starts the .idx; only the first 4 fields matter here.
+DB_HEADER = struct.Struct('<4i4fi4xq5i4xqi4xqqq')
+# DAZZ_READ, one per read of the untrimmed DB, after DB_HEADER: origin, rlen, fpulse, boff, coff, flags.
+DB_READ = struct.Struct('<3i4xqqi4x')
+DB_ALL = 0x1
+DB_BEST = 0x0800
+
+# novl, tspace
+LAS_HEADER = struct.Struct('<qi')
+# Overlap (in align.h), without its trace pointer: tlen, diffs, abpos, bbpos, aepos, bepos, flags, aread, bread.
+LAS_RECORD = struct.Struct('<6iI2i4x')
+LAS_COMP = 0x1
+TRACE_XOVR = 125  # Traces of larger tspace take 2 bytes per value.
+
+Overlap = collections.namedtuple('Overlap', ['aread', 'bread', 'comp', 'abpos', 'aepos', 'bbpos', 'bepos', 'diffs'])
+
+
+def get_db_paths(db_fn):
+    """Return the .idx and .bps of the Dazzler DB db_fn (with or without its .db).
+
+    >>> get_db_paths('foo/raw_reads.db')
+    ('foo/.raw_reads.idx', 'foo/.raw_reads.bps')
+    """
+    dirname, basename = os.path.split(db_fn)
+    root = basename[:-3] if basename.endswith('.db') else basename
+    return (os.path.join(dirname, '.{}.idx'.format(root)),
+            os.path.join(dirname, '.{}.bps'.format(root)))
+
+
+class DazzDB(object):
+    """The reads of a Dazzler DB, trimmed as DBsplit set it up (by Trim_DB() in DB.c),
+    so read i here is read i of the .las files of the DB.
+    """
+    def __len__(self):
+        return len(self.rlens)
+
+    def get_seq(self, i, start=0, end=None, comp=False):
+        """Return bases [start, end) of read i, or of its reverse complement if comp, in upper case.
+        """
+        rlen = self.rlens[i]
+        if end is None:
+            end = rlen
+        if not 0 <= start <= end <= rlen:
+            raise ValueError('Bad range [{}, {}) of read {} of length {} in {!r}'.format(
+                start, end, i, rlen, self.db_fn))
+        boff = self.boffs[i]
+        packed = self.bps[boff:boff + (rlen + 3) // 4]
+        out = create_string_buffer(end - start)
+        dazz.dazz_decode_read(packed, rlen, start, end, int(comp), out)
+        return out.raw[:end - start].decode('ascii')
+
+    def __init__(self, db_fn):
+        self.db_fn = db_fn
+        idx_fn, bps_fn = get_db_paths(db_fn)
+        with open(idx_fn, 'rb') as f:
+            idx = f.read()
+        ureads, treads, cutoff, allarr = DB_HEADER.unpack_from(idx)[:4]
+        end = DB_HEADER.size + ureads * DB_READ.size
+        if len(idx) < end:
+            raise ValueError('{!r} is too short for {} reads'.format(idx_fn, ureads))
+        reads = DB_READ.iter_unpack(idx[DB_HEADER.size:end])
+        if cutoff > 0 or not (allarr & DB_ALL):
+            best = 0 if (allarr & DB_ALL) else DB_BEST
+            reads = (r for r in reads if (r[5] & DB_BEST) >= best and r[1] >= cutoff)
+        self.rlens = array.array('i')
+        self.boffs = array.array('q')
+        for (origin, rlen, fpulse, boff, coff, flags) in reads:
+            self.rlens.append(rlen)
+            self.boffs.append(boff)
+        with open(bps_fn, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.bps = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.bps = b''
+
+
+def read_las(las_fn):
+    """Yield the Overlaps of a .las file, in its order (by aread, after LAsort).
+    The traces are skipped.
+    """
+    with open(las_fn, 'rb') as f:
+        data = f.read(LAS_HEADER.size)
+        if len(data) < LAS_HEADER.size:
+            raise ValueError('{!r} is too short for a .las file'.format(las_fn))
+        novl, tspace = LAS_HEADER.unpack(data)
+        if novl == 0:
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    tbytes = 1 if tspace <= TRACE_XOVR else 2
+    offset = LAS_HEADER.size
+    try:
+        for _ in range(novl):
+            tlen, diffs, abpos, bbpos, aepos, bepos, flags, aread, bread = LAS_RECORD.unpack_from(buf, offset)
+            offset += LAS_RECORD.size + tlen * tbytes
+            yield Overlap(aread, bread, bool(flags & LAS_COMP), abpos, aepos, bbpos, bepos, diffs)
+    finally:
+        buf.close()
+
+
+def is_proper(ovl, alen, blen):
+    """True if the overlap reaches an end of a read on both sides (LA4Falcon -o).
+    """
+    return ((ovl.abpos == 0 or ovl.bbpos == 0) and
+            (ovl.aepos == alen or ovl.bepos == blen))
+
+
+def get_pileup_fields(db, overlaps, min_seed_len=0, flags='fo'):
+    """Yield the fields of the lines LA4Falcon -H<min_seed_len> -<flags> would print
+    for these overlaps: [name, seq] for each seed, and then for the aligned part
+    of each read overlapping it (reverse-complemented as needed), ['+', '+'] after
+    each pile-up, and ['-', '-'] at the end.
+    Of the flags, 'o' keeps only proper overlaps; 's' discards the pile-ups of
+    seeds contained in a longer read (as ['*', '*']); and 'g' keeps only the
+    longest overlap of each read. Others (e.g. 'f', 'P') change nothing here.
+    """
+    proper = 'o' in flags
+    skip_contained = 's' in flags
+    group = 'g' in flags
+    rlens = db.rlens
+    for aread, ovls in itertools.groupby(overlaps, key=lambda ovl: ovl.aread):
+        alen = rlens[aread]
+        if alen < min_seed_len:
+            continue
+        hits = []
+        contained = False
+        for ovl in ovls:
+            blen = rlens[ovl.bread]
+            if proper and not is_proper(ovl, alen, blen):
+                continue
+            if skip_contained and alen < blen and ovl.abpos == 0 and ovl.aepos == alen:
+                contained = True
+                break
+            hits.append(ovl)
+        if contained:
+            yield ['*', '*']
+            continue
+        if not hits:
+            continue
+        if group:
+            longest = collections.OrderedDict()
+            for ovl in hits:
+                best = longest.get(ovl.bread)
+                if best is None or ovl.aepos - ovl.abpos > best.aepos - best.abpos:
+                    longest[ovl.bread] = ovl
+            hits = list(longest.values())
+        yield [format_id(aread), db.get_seq(aread)]
+        for ovl in hits:
+            yield [format_id(ovl.bread), db.get_seq(ovl.bread, ovl.bbpos, ovl.bepos, ovl.comp)]
+        yield ['+', '+']
+    yield ['-', '-']
+
+
+def write_db(db_fn, seqs, cutoff=-1, all_reads=True):
+    """Write seqs (str of ACGT) as a Dazzler DB of one block, e.g. for tests.
+    If cutoff >= 0, it is trimmed as if by DBsplit -x<cutoff> (and -a, if all_reads).
+    """
+    idx_fn, bps_fn = get_db_paths(db_fn)
+    codes = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+    reads = []
+    boff = 0
+    with open(bps_fn, 'wb') as f:
+        for origin, seq in enumerate(seqs):
+            packed = bytearray((len(seq) + 3) // 4)
+            for i, c in enumerate(seq.upper()):
+                packed[i >> 2] |= codes[c] << (6 - 2 * (i & 3))
+            f.write(packed)
+            reads.append((origin, len(seq), 0, boff, 0, DB_BEST))
+            boff += len(packed)
+    kept = [r for r in reads if r[1] >= cutoff]
+    allarr = DB_ALL if all_reads else 0
+    with open(idx_fn, 'wb') as f:
+        f.write(DB_HEADER.pack(len(reads), len(kept), cutoff, allarr, 0.25, 0.25, 0.25, 0.25,
+                               max([r[1] for r in reads] or [0]), sum(r[1] for r in reads),
+                               len(reads), 0, 0, 0, 0, 0, 0, 0, 0, 0))
+        for r in reads:
+            f.write(DB_READ.pack(*r))
+    root = os.path.basename(db_fn)[:-3] if db_fn.endswith('.db') else os.path.basename(db_fn)
+    with open(db_fn, 'w') as f:
+        f.write('files = {:9d}\n'.format(1))
+        f.write('{:9d} {} {}\n'.format(len(reads), root, root))
+        f.write('blocks = {:9d}\n'.format(1))
+        f.write('size = {:11d} cutoff = {:9d} all = {:1d}\n'.format(200000000, max(cutoff, 0), int(all_reads)))
+        f.write('{:9d} {:9d}\n'.format(0, 0))
+        f.write('{:9d} {:9d}\n'.format(len(reads), len(kept)))
+
+
+def write_las(las_fn, overlaps, tspace=100):
+    """Write the Overlaps as a .las file, e.g. for tests, with a trace (of zeros)
+    of one pair of values per tspace of aread.
+    """
+    tbytes = 1 if tspace <= TRACE_XOVR else 2
+    with open(las_fn, 'wb') as f:
+        f.write(LAS_HEADER.pack(len(overlaps), tspace))
+        for ovl in overlaps:
+            tlen = 2 * ((ovl.aepos - 1) // tspace - ovl.abpos // tspace + 1) if ovl.aepos > ovl.abpos else 0
+            f.write(LAS_RECORD.pack(tlen, ovl.diffs, ovl.abpos, ovl.bbpos, ovl.aepos, ovl.bepos,
+                                    LAS_COMP if ovl.comp else 0, ovl.aread, ovl.bread))
+            f.write(bytes(tlen * tbytes))
@@ -2,7 +2,7 @@
 
 __all__ = [
     'kup', 'DWA', 'falcon',
-    'KmerLookup', 'KmerMatch', 'AlnRange', 'ConsensusData',
+    'KmerLookup', 'KmerMatch', 'KmerIndex', 'AlnRange', 'ConsensusStats', 'ConsensusData',
     'Alignment', 'get_alignment',
 ]
 
@@ -25,7 +25,18 @@ class KmerLookup(Structure):
 class KmerMatch(Structure):
     _fields_ = [("count", seq_coor_t),
                 ("query_pos", POINTER(seq_coor_t)),
-                ("target_pos", POINTER(seq_coor_t))]
+                ("target_pos", POINTER(seq_coor_t)),
+                ("size", seq_coor_t)]
+
+
+class KmerIndex(Structure):
+    _fields_ = [("K", c_uint),
+                ("lk", POINTER(KmerLookup)),
+                ("sda", POINTER(seq_coor_t)),
+                ("seq_len", seq_coor_t),
+                ("seq_size", seq_coor_t),
+                ("used", POINTER(seq_coor_t)),
+                ("n_used", seq_coor_t)]
 
 
 class AlnRange(Structure):
@@ -36,9 +47,23 @@ class AlnRange(Structure):
                 ("score", c_long)]
 
 
+class ConsensusStats(Structure):
+    _fields_ = [("n_reads", c_uint),
+                ("n_bad_range", c_uint),
+                ("n_cov_skipped", c_uint),
+                ("n_aligned", c_uint),
+                ("n_low_idt", c_uint),
+                ("n_used", c_uint),
+                ("kmer_s", c_double),
+                ("align_s", c_double),
+                ("msa_s", c_double),
+                ("vote_s", c_double)]
+
+
 class ConsensusData(Structure):
     _fields_ = [("sequence", c_char_p),
-                ("eff_cov", POINTER(c_uint))]
+                ("eff_cov", POINTER(c_uint)),
+                ("stats", ConsensusStats)]
 
 
 try:
@@ -73,6 +98,16 @@ kup.find_kmer_pos_for_seq.argtypes = [POINTER(c_char), seq_coor_t, c_uint, POINT
 kup.find_kmer_pos_for_seq.restype = POINTER(KmerMatch)
 kup.free_kmer_match.argtypes = [POINTER(KmerMatch)]
 
+kup.allocate_kmer_index.argtypes = [c_uint]
+kup.allocate_kmer_index.restype = POINTER(KmerIndex)
+kup.free_kmer_index.argtypes = [POINTER(KmerIndex)]
+kup.build_kmer_index.argtypes = [POINTER(KmerIndex), POINTER(c_char), seq_coor_t]
+kup.mask_kmer_index.argtypes = [POINTER(KmerIndex), seq_coor_t]
+kup.allocate_kmer_match.argtypes = []
+kup.allocate_kmer_match.restype = POINTER(KmerMatch)
+kup.find_kmer_pos_in_index.argtypes = [POINTER(KmerIndex), POINTER(c_char), seq_coor_t,
+                                       POINTER(KmerMatch)]
+
 
 kup.find_best_aln_range.argtypes = [
     POINTER(KmerMatch), seq_coor_t, seq_coor_t, seq_coor_t]
@@ -111,7 +146,22 @@ DWA = falcon_dll
 DWA.align.argtypes = [POINTER(c_char), c_long, POINTER(
     c_char), c_long, c_long, c_int]
 DWA.align.restype = POINTER(Alignment)
+DWA.align_myers.argtypes = [POINTER(c_char), c_long, POINTER(
+    c_char), c_long, c_long]
+DWA.align_myers.restype = POINTER(Alignment)
 DWA.free_alignment.argtypes = [POINTER(Alignment)]
+# See ALIGN_TRACEBACK_* in common.h.
+ALIGN_TRACEBACK_FULL = 0
+ALIGN_TRACEBACK_COMPACT = 1
+DWA.set_align_traceback.argtypes = [c_int]
+DWA.get_align_traceback.restype = c_int
+# See ALIGN_SIMD_* in common.h.
+ALIGN_SIMD_NONE = 0
+ALIGN_SIMD_SSE2 = 1
+ALIGN_SIMD_AVX2 = 2
+DWA.set_align_simd.argtypes = [c_int]
+DWA.set_align_simd.restype = c_int
+DWA.get_align_simd.restype = c_int
 
 
 falcon = falcon_dll
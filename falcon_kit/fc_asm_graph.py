@@ -1,5 +1,6 @@
-from .FastaReader import open_fasta_reader
 from .io import FilePercenter
+from .pread_store import PreadStore
+import collections.abc
 import networkx as nx
 
 RCMAP = dict(list(zip("ACGTacgtNn-", "TGCAtgcaNn-")))
@@ -11,6 +12,29 @@ def reverse_end(node_id):
     return node_id + ":" + new_end
 
 
+class EdgeSeqs(collections.abc.Mapping):
+    """The sequences of the "G" edges of sg_edges (of an AsmGraph), by (v, w),
+    looked up in preads (a PreadStore) only when asked for.
+    """
+
+    def __getitem__(self, edge):
+        (seq_id, s, t), score, idt, type_ = self.sg_edges[edge]
+        if type_ != "G":
+            raise KeyError(edge)
+        return self.preads.get_edge_seq(seq_id, s, t)
+
+    def __iter__(self):
+        return (edge for (edge, data) in self.sg_edges.items() if data[-1] == "G")
+
+    def __len__(self):
+        return self.n_edges
+
+    def __init__(self, sg_edges, preads):
+        self.sg_edges = sg_edges
+        self.preads = preads
+        self.n_edges = sum(1 for _ in self)
+
+
 class AsmGraph(object):
 
     def __init__(self, sg_file, utg_file, ctg_file):
@@ -43,37 +67,7 @@ class AsmGraph(object):
                 self.sg_edges[(v, w)] = ((seq_id, b, e), score, idt, type_)
 
     def load_sg_seq(self, fasta_fn):
-        all_read_ids = set()  # read ids in the graph
-
-        for v, w in self.sg_edges:
-            type_ = self.sg_edges[(v, w)][-1]
-            if type_ != "G":
-                continue
-            v = v.split(":")[0]
-            w = w.split(":")[0]
-            all_read_ids.add(v)
-            all_read_ids.add(w)
-
-        seqs = {}
-        # load all p-read name into memory
-        with open_fasta_reader(fasta_fn) as f:
-            for r in f:
-                if r.name not in all_read_ids:
-                    continue
-                seqs[r.name] = r.sequence.upper()
-
-        for v, w in self.sg_edges:
-            seq_id, s, t = self.sg_edges[(v, w)][0]
-            type_ = self.sg_edges[(v, w)][-1]
-
-            if type_ != "G":
-                continue
-
-            if s < t:
-                e_seq = seqs[seq_id][s:t]
-            else:
-                e_seq = "".join([RCMAP[c] for c in seqs[seq_id][t:s][::-1]])
-            self.sg_edge_seqs[(v, w)] = e_seq
+        self.sg_edge_seqs = EdgeSeqs(self.sg_edges, PreadStore(fasta_fn))
 
     def get_seq_from_path(self, path):
         if len(self.sg_edge_seqs) == 0:
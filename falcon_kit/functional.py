@@ -300,6 +300,19 @@ def weighted_average(cols):
     return sum(w * v for (w, v) in cols) / sum(w for (w, v) in cols)
 
 
+def percentile(values, p):
+    """Nearest-rank percentile p (0-100) of sorted values, or None if there are none.
+
+    >>> percentile([1, 2, 3, 4], 50), percentile([1, 2, 3, 4], 90), percentile([1, 2, 3, 4], 0)
+    (2, 4, 1)
+    >>> percentile(list(range(1, 101)), 7), percentile([], 50)
+    (7, None)
+    """
+    if not values:
+        return None
+    return values[max(0, -(-len(values) * p // 100) - 1)]
+
+
 def parsed_readlengths_from_dbdump_output(output):
     """Given output text from the DBump command,
     yield all read-lengths.
@@ -1,10 +1,12 @@
 import argparse
+import collections.abc
 import os
 import sys
 import json
 
 from falcon_kit.fc_asm_graph import AsmGraph
 from falcon_kit.FastaReader import FastaReader
+from falcon_kit.pread_store import PreadStore
 from falcon_kit.gfa_graph import *
 import falcon_kit.tiling_path
 
@@ -23,6 +25,30 @@ def load_seqs(fasta_fn, store_only_seq_len):
             seqs[r.name.split()[0]] = (len(r.sequence), '*')
     return seqs
 
+class PreadSeqs(collections.abc.Mapping):
+    """
+    The (length, sequence) of each read of a PreadStore, as load_seqs() gives them,
+    but each sequence is read only when looked up.
+    """
+    def __getitem__(self, name):
+        return (self.preads.length(name), '*' if self.store_only_seq_len else self.preads.get_seq(name))
+
+    def __iter__(self):
+        return iter(self.preads.names())
+
+    def __len__(self):
+        return len(self.preads)
+
+    def __init__(self, preads, store_only_seq_len):
+        self.preads = preads
+        self.store_only_seq_len = store_only_seq_len
+
+def load_pread_seqs(fasta_fn, store_only_seq_len):
+    """
+    Same as load_seqs(), for the preads, but without reading them into memory.
+    """
+    return PreadSeqs(PreadStore(fasta_fn), store_only_seq_len)
+
 def load_pread_overlaps(fp_in):
     preads_overlap_dict = {}
     for line in fp_in:
@@ -159,8 +185,8 @@ def run(fp_out, p_ctg_tiling_path, a_ctg_tiling_path,
 
     gfa_graph = GFAGraph()
 
-    # Load preads.
-    preads_dict = load_seqs(preads_fasta, (not write_reads))
+    # Index the preads.
+    preads_dict = load_pread_seqs(preads_fasta, (not write_reads))
 
     # Load the pread overlaps
     with open(preads_ovl, 'r') as fp:
@@ -1,13 +1,15 @@
-from ctypes import (POINTER, c_char_p, c_uint, c_uint,
-                    c_uint, c_uint, c_uint, c_double, string_at, pointer)
-from falcon_kit.multiproc import Pool
+from ctypes import (POINTER, c_char, c_char_p, c_int, c_uint, c_uint,
+                    c_uint, c_uint, c_uint, c_ulong, c_double, c_void_p, string_at, pointer, addressof, byref)
+from falcon_kit.multiproc import Pool, imap_bounded
 from falcon_kit import falcon
 import argparse
+import json
 import logging
 import multiprocessing
 import os
 import re
 import sys
+import time
 import falcon_kit
 import falcon_kit.util.io as io
 import collections
@@ -23,6 +25,33 @@ falcon.generate_consensus_from_mapping.argtypes = [
     POINTER(c_char_p), POINTER(POINTER(falcon_kit.AlnRange)), c_uint, c_uint, c_uint, c_double]
 falcon.generate_consensus_from_mapping.restype = POINTER(falcon_kit.ConsensusData)
 
+falcon.allocate_consensus_workspace.argtypes = []
+falcon.allocate_consensus_workspace.restype = c_void_p
+falcon.free_consensus_workspace.argtypes = [c_void_p]
+falcon.set_consensus_max_cov.argtypes = [c_void_p, c_uint]
+falcon.set_consensus_max_cov.restype = None
+falcon.set_consensus_aligner.argtypes = [c_void_p, c_int]
+falcon.set_consensus_aligner.restype = None
+falcon.get_consensus_counts.argtypes = [c_void_p, POINTER(c_ulong), POINTER(c_ulong)]
+falcon.get_consensus_counts.restype = None
+
+falcon.generate_consensus_ws.argtypes = [
+    c_void_p, POINTER(c_char_p), c_uint, c_uint, c_uint, c_double]
+falcon.generate_consensus_ws.restype = POINTER(falcon_kit.ConsensusData)
+
+falcon.generate_consensus_from_mapping_ws.argtypes = [
+    c_void_p, POINTER(c_char_p), POINTER(POINTER(falcon_kit.AlnRange)), c_uint, c_uint, c_uint, c_double]
+falcon.generate_consensus_from_mapping_ws.restype = POINTER(falcon_kit.ConsensusData)
+
+falcon.get_trim_ranges_ws.argtypes = [
+    c_void_p, POINTER(c_char_p), c_uint, c_uint, c_int, POINTER(falcon_kit.AlnRange)]
+falcon.get_trim_ranges_ws.restype = None
+
+falcon.generate_consensus_batch.argtypes = [
+    POINTER(c_void_p), c_uint, POINTER(c_char_p), POINTER(POINTER(falcon_kit.AlnRange)),
+    POINTER(c_uint), c_uint, c_uint, c_uint, c_double, POINTER(POINTER(falcon_kit.ConsensusData))]
+falcon.generate_consensus_batch.restype = None
+
 """
 SeqTuple encodes a single line in a block for consensus. Legacy code used only the 'name' and 'seq' (read from input),
 but if the coordinates are already known, we can use this info.
@@ -39,6 +68,37 @@ Parameter 'is_trimmed' is a bool, indicating that the sequence was trimmed from
 """
 SeqTuple = collections.namedtuple('SeqTuple', ['name', 'seq', 'qstrand', 'qstart', 'qend', 'qlen', 'tstart', 'tend', 'tlen', 'aln', 'is_mapped', 'is_trimmed'])
 
+# The --aligner choices; see CONSENSUS_ALIGNER_* in common.h.
+ALIGNERS = collections.OrderedDict([
+    ('dw', 0),     # banded O(ND) alignment (the default)
+    ('myers', 1),  # banded bit-vector alignment
+])
+
+_workspace = None
+# Whether the get_consensus_*() functions add a profile of each seed to their results;
+# set by run() (for --profile-fn) before the workers fork.
+_profile = False
+
+def get_workspace():
+    """Return the consensus workspace of this process, allocating it on first use.
+    The C side keeps its k-mer lookup, seed arrays and MSA working space in here,
+    so they are reused (and only grown) from one seed to the next.
+    Pool workers each allocate their own, since this is never called in the parent before the fork.
+    """
+    global _workspace
+    if _workspace is None:
+        _workspace = falcon.allocate_consensus_workspace()
+    return _workspace
+
+def get_consensus_counts(ws):
+    """Return (n_aligned, n_skipped): how many reads the workspace has aligned to their seeds so far,
+    and how many it skipped because --max-cov-per-base was already reached there.
+    """
+    n_aligned = c_ulong()
+    n_skipped = c_ulong()
+    falcon.get_consensus_counts(ws, byref(n_aligned), byref(n_skipped))
+    return n_aligned.value, n_skipped.value
+
 def get_longest_reads(seqs, max_n_read, max_cov_aln, sort=True):
     # including the sort kwarg allows us to avoid a redundant sort
     # in get_consensus_trimmed()
@@ -61,27 +121,29 @@ def get_longest_reads(seqs, max_n_read, max_cov_aln, sort=True):
     return(seqs[:longest_n_reads])
 
 
-def get_alignment(seq1, seq0, edge_tolerance=1000):
-
+def get_alignment(seq1, seq0, edge_tolerance=1000, index=None, kmer_match=None):
+    """Find the range of seq1 which aligns to seq0, from their shared k-mers.
+    Both are bytes. To check many reads against one seed, pass the seed's
+    index (see build_seed_index()) and a kmer_match buffer to reuse;
+    otherwise, both are made and freed here.
+    """
     kup = falcon_kit.kup
     K = 8
-    lk_ptr = kup.allocate_kmer_lookup(1 << (K * 2))
-    sa_ptr = kup.allocate_seq(len(seq0))
-    sda_ptr = kup.allocate_seq_addr(len(seq0))
-    kup.add_sequence(0, K, seq0, len(seq0), sda_ptr, sa_ptr, lk_ptr)
-
-    kup.mask_k_mer(1 << (K * 2), lk_ptr, 16)
-    kmer_match_ptr = kup.find_kmer_pos_for_seq(
-        seq1, len(seq1), K, sda_ptr, lk_ptr)
-    kmer_match = kmer_match_ptr[0]
-    aln_range_ptr = kup.find_best_aln_range2(kmer_match_ptr, K, K * 50, 25)
+    own_index = index is None
+    if own_index:
+        index = build_seed_index(seq0, K)
+        kmer_match = kup.allocate_kmer_match()
+    kup.find_kmer_pos_in_index(index, seq1, len(seq1), kmer_match)
+    aln_range_ptr = kup.find_best_aln_range2(kmer_match, K, K * 50, 25)
     #x,y = zip( * [ (kmer_match.query_pos[i], kmer_match.target_pos[i]) for i in range(kmer_match.count )] )
     aln_range = aln_range_ptr[0]
-    kup.free_kmer_match(kmer_match_ptr)
     s1, e1, s0, e0, km_score = aln_range.s1, aln_range.e1, aln_range.s2, aln_range.e2, aln_range.score
     e1 += K + K // 2
     e0 += K + K // 2
-    kup.free_aln_range(aln_range)
+    kup.free_aln_range(aln_range_ptr)
+    if own_index:
+        kup.free_kmer_match(kmer_match)
+        kup.free_kmer_index(index)
     len_1 = len(seq1)
     len_0 = len(seq0)
     if e1 > len_1:
@@ -99,10 +161,6 @@ def get_alignment(seq1, seq0, edge_tolerance=1000):
         aln_t_s = s0
         aln_t_e = e0
 
-    kup.free_seq_addr_array(sda_ptr)
-    kup.free_seq_array(sa_ptr)
-    kup.free_kmer_lookup(lk_ptr)
-
     if s1 > edge_tolerance and s0 > edge_tolerance:
         return 0, 0, 0, 0, 0, 0, "none"
 
@@ -115,6 +173,28 @@ def get_alignment(seq1, seq0, edge_tolerance=1000):
         return 0, 0, 0, 0, 0, 0, "none"
 
 
+def build_seed_index(seed, K=8):
+    """Return the k-mer index of seed (bytes) for get_alignment().
+    The caller frees it with falcon_kit.kup.free_kmer_index().
+    """
+    kup = falcon_kit.kup
+    index = kup.allocate_kmer_index(K)
+    kup.build_kmer_index(index, seed, len(seed))
+    kup.mask_kmer_index(index, 16)
+    return index
+
+
+def get_trim_ranges(seqs, edge_tolerance, K=8):
+    """Return an AlnRange for each of seqs[1:]: where it aligns to the seed seqs[0],
+    as get_alignment() would find it, or all 0s. The seed is indexed only once.
+    """
+    seqs_ptr = (c_char_p * len(seqs))()
+    seqs_ptr[:] = [bytes(val.seq, encoding='ascii') for val in seqs]
+    ranges = (falcon_kit.AlnRange * len(seqs))()
+    falcon.get_trim_ranges_ws(get_workspace(), seqs_ptr, len(seqs), K, edge_tolerance, ranges)
+    return ranges[:len(seqs) - 1]
+
+
 def get_trimmed_seq(seq, s, e):
     # Mapping info is useless after clipping, so just reset it.
     ret = SeqTuple(name = seq.name, seq = seq.seq[s:e],
@@ -123,11 +203,24 @@ def get_trimmed_seq(seq, s, e):
                     aln = '*', is_mapped = False, is_trimmed = True)
     return ret
 
-def get_consensus_core(seqs, min_cov, K, min_idt, allow_external_mapping):
+def get_consensus_core(seqs, min_cov, K, min_idt, allow_external_mapping, max_cov_per_base=0, aligner='dw', with_stats=False):
     seqs_ptr = (c_char_p * len(seqs))()
     seqs_ptr[:] = [bytes(val.seq, encoding='ascii')  for val in seqs]
-
+    return get_consensus_from_ptr(seqs_ptr, seqs, min_cov, K, min_idt, allow_external_mapping, max_cov_per_base, aligner, with_stats)
+
+def get_stats_dict(stats):
+    """Return the fields of a ConsensusStats as a dict.
+    """
+    return dict((name, getattr(stats, name)) for (name, _) in stats._fields_)
+
+def get_consensus_from_ptr(seqs_ptr, seqs, min_cov, K, min_idt, allow_external_mapping, max_cov_per_base=0, aligner='dw', with_stats=False):
+    """seqs_ptr is the char** handed to C; seqs supplies only the mapping fields.
+    With with_stats, return (consensus, stats), where stats is the ConsensusStats
+    of the seed (see consensus_stats in common.h) as a dict, or None on failure.
+    """
     all_seqs_mapped = False
+    falcon.set_consensus_max_cov(get_workspace(), max_cov_per_base)
+    falcon.set_consensus_aligner(get_workspace(), ALIGNERS[aligner])
 
     if allow_external_mapping:
         all_seqs_mapped = True
@@ -138,8 +231,8 @@ def get_consensus_core(seqs, min_cov, K, min_idt, allow_external_mapping):
 
     if not all_seqs_mapped:
         LOG.info('Internally mapping the sequences.')
-        consensus_data_ptr = falcon.generate_consensus(
-            seqs_ptr, len(seqs), min_cov, K, min_idt)
+        consensus_data_ptr = falcon.generate_consensus_ws(
+            get_workspace(), seqs_ptr, len(seqs), min_cov, K, min_idt)
 
     else:
         LOG.info('Using external mapping coordinates from input.')
@@ -147,46 +240,86 @@ def get_consensus_core(seqs, min_cov, K, min_idt, allow_external_mapping):
         for i, seq in enumerate(seqs):
             a = falcon_kit.AlnRange(seq.qstart, seq.qend, seq.tstart, seq.tend, (seq.qend - seq.qstart))
             aln_ranges_ptr[i] = pointer(a)
-        consensus_data_ptr = falcon.generate_consensus_from_mapping(
-            seqs_ptr, aln_ranges_ptr, len(seqs), min_cov, K, min_idt)
+        consensus_data_ptr = falcon.generate_consensus_from_mapping_ws(
+            get_workspace(), seqs_ptr, aln_ranges_ptr, len(seqs), min_cov, K, min_idt)
         del aln_ranges_ptr
 
     del seqs_ptr
+    if max_cov_per_base:
+        LOG.debug(' Aligned {} reads, skipped {}, so far'.format(*get_consensus_counts(get_workspace())))
 
     if not consensus_data_ptr:
-        return ''
+        return ('', None) if with_stats else ''
     # assert consensus_data_ptr
     consensus = string_at(consensus_data_ptr[0].sequence)[:]
     #eff_cov = consensus_data_ptr[0].eff_cov[:len(consensus)]
+    stats = get_stats_dict(consensus_data_ptr[0].stats) if with_stats else None
     LOG.debug(' Freeing')
     falcon.free_consensus_data(consensus_data_ptr)
+    if with_stats:
+        return consensus.decode('ascii'), stats
     return consensus.decode('ascii')
 
+def get_counts(stats):
+    """Return (n_aligned, n_skipped) of one seed, from the stats of get_consensus_from_ptr(),
+    as get_consensus_counts() counts them. Each result carries these, so that
+    the parent can total them even when the workspaces are in pool workers.
+    """
+    if not stats:
+        return (0, 0)
+    return (stats['n_aligned'], stats['n_cov_skipped'])
+
+def get_profile(seed_id, seed_len, n_pileup, stats, consensus, total_s, trim_s=0.0):
+    """Return the profile of one seed, for --profile-fn (see PROFILE_FIELDS),
+    but for out_len, which only the parent knows.
+    n_pileup is the number of reads in the pile-up as given to the worker;
+    stats is from get_consensus_from_ptr().
+    """
+    profile = dict(seed_id=seed_id, seed_len=seed_len, n_pileup=n_pileup,
+                   total_s=total_s, trim_s=trim_s, cns_len=len(consensus))
+    profile.update(stats or dict((name, 0) for (name, _) in falcon_kit.ConsensusStats._fields_))
+    return profile
+
 def get_consensus_without_trim(c_input):
     seqs, seed_id, config = c_input
     LOG.debug('Starting get_consensus_without_trim(len(seqs)=={}, seed_id={})'.format(
         len(seqs), seed_id))
-    min_cov, K, max_n_read, min_idt, edge_tolerance, trim_size, min_cov_aln, max_cov_aln, allow_external_mapping = config
+    min_cov, K, max_n_read, min_idt, edge_tolerance, trim_size, min_cov_aln, max_cov_aln, allow_external_mapping, max_cov_per_base, aligner = config
+    t0 = time.time()
+    pileup = seqs
     if len(seqs) > max_n_read:
         seqs = get_longest_reads(seqs, max_n_read, max_cov_aln, sort=True)
 
-    consensus = get_consensus_core(seqs, min_cov, K, min_idt, allow_external_mapping)
+    consensus, stats = get_consensus_core(seqs, min_cov, K, min_idt, allow_external_mapping, max_cov_per_base, aligner, with_stats=True)
     LOG.debug(' Finishing get_consensus_without_trim(seed_id={})'.format(seed_id))
 
-    return consensus, seed_id
+    if _profile:
+        return consensus, seed_id, get_counts(stats), get_profile(seed_id, len(pileup[0].seq), len(pileup) - 1, stats, consensus, time.time() - t0)
+    return consensus, seed_id, get_counts(stats)
 
 def get_consensus_with_trim(c_input):
     seqs, seed_id, config = c_input
     LOG.debug('Starting get_consensus_with_trim(len(seqs)=={}, seed_id={})'.format(
         len(seqs), seed_id))
-    min_cov, K, max_n_read, min_idt, edge_tolerance, trim_size, min_cov_aln, max_cov_aln, allow_external_mapping = config
+    min_cov, K, max_n_read, min_idt, edge_tolerance, trim_size, min_cov_aln, max_cov_aln, allow_external_mapping, max_cov_per_base, aligner = config
+    t0 = time.time()
+    trim_seqs = get_trimmed_pileup(seqs, config)
+    trim_s = time.time() - t0
+    consensus, stats = get_consensus_core(trim_seqs, min_cov, K, min_idt, allow_external_mapping, max_cov_per_base, aligner, with_stats=True)
+    LOG.debug(' Finishing get_consensus_with_trim(seed_id={})'.format(seed_id))
+
+    if _profile:
+        return consensus, seed_id, get_counts(stats), get_profile(seed_id, len(seqs[0].seq), len(seqs) - 1, stats, consensus, time.time() - t0, trim_s)
+    return consensus, seed_id, get_counts(stats)
+
+def get_trimmed_pileup(seqs, config):
+    """Return the seed, plus the reads which align to it, trimmed to the aligned range.
+    """
+    min_cov, K, max_n_read, min_idt, edge_tolerance, trim_size, min_cov_aln, max_cov_aln, allow_external_mapping, max_cov_per_base, aligner = config
     trim_seqs = []
     seed = seqs[0]
-    for seq in seqs[1:]:
-        aln_data = get_alignment(seq.seq, seed.seq, edge_tolerance)
-        s1, e1, s2, e2, aln_size, aln_score, c_status = aln_data
-        if c_status == "none":
-            continue
+    for seq, aln_range in zip(seqs[1:], get_trim_ranges(seqs, edge_tolerance)):
+        s1, e1, aln_score = aln_range.s1, aln_range.e1, aln_range.score
         if aln_score > 1000 and e1 - s1 > 500:
             e1 -= trim_size
             s1 += trim_size
@@ -200,82 +333,274 @@ def get_consensus_with_trim(c_input):
         # seqs already sorted, dont' sort again
         trim_seqs = get_longest_reads(
             trim_seqs, max_n_read, max_cov_aln, sort=False)
+    return trim_seqs
+
+def get_consensus_batch(pileups, workspaces, min_cov, K, min_idt, allow_external_mapping, max_cov_per_base=0, aligner='dw', trims=None):
+    """Generate the consensus of each (seqs, seed_id) in pileups, on one thread per workspace.
+    Return [(consensus, seed_id, counts)], in order, where counts is from get_counts()
+    (plus the profile of each seed, if profiling, with the total time of each the sum of its parts).
+    trims, if given, is the (n_pileup, trim_s) of each pile-up: its size before
+    trimming (or get_longest_reads()), and how long that took, for the profile.
+    The GIL is released for the duration (as for any ctypes call), so
+    the caller can run this in a thread and parse more input meanwhile.
+    """
+    all_seqs = [seq for (seqs, seed_id) in pileups for seq in seqs]
+    seqs_ptr = (c_char_p * len(all_seqs))()
+    seqs_ptr[:] = [bytes(val.seq, encoding='ascii') for val in all_seqs]
+    n_seqs = (c_uint * len(pileups))(*[len(seqs) for (seqs, seed_id) in pileups])
+    aln_ranges_ptr = None
+    if allow_external_mapping:
+        aln_ranges_ptr = (POINTER(falcon_kit.AlnRange) * len(all_seqs))()
+        i = 0
+        for (seqs, seed_id) in pileups:
+            if all(seq.is_mapped for seq in seqs):
+                for j, seq in enumerate(seqs):
+                    a = falcon_kit.AlnRange(seq.qstart, seq.qend, seq.tstart, seq.tend, (seq.qend - seq.qstart))
+                    aln_ranges_ptr[i + j] = pointer(a)
+            i += len(seqs)
+    results_ptr = (POINTER(falcon_kit.ConsensusData) * len(pileups))()
+    for ws in workspaces:
+        falcon.set_consensus_max_cov(ws, max_cov_per_base)
+        falcon.set_consensus_aligner(ws, ALIGNERS[aligner])
+    falcon.generate_consensus_batch(
+        workspaces, len(workspaces), seqs_ptr, aln_ranges_ptr, n_seqs, len(pileups),
+        min_cov, K, min_idt, results_ptr)
+    del seqs_ptr, aln_ranges_ptr
+
+    if trims is None:
+        trims = [(len(seqs) - 1, 0.0) for (seqs, seed_id) in pileups]
+    results = []
+    for (seqs, seed_id), (n_pileup, trim_s), consensus_data_ptr in zip(pileups, trims, results_ptr):
+        consensus = ''
+        stats = None
+        if consensus_data_ptr:
+            consensus = string_at(consensus_data_ptr[0].sequence).decode('ascii')
+            stats = get_stats_dict(consensus_data_ptr[0].stats)
+            falcon.free_consensus_data(consensus_data_ptr)
+        if _profile:
+            total_s = trim_s + (sum(stats[key] for key in ('kmer_s', 'align_s', 'msa_s', 'vote_s')) if stats else 0.0)
+            results.append((consensus, seed_id, get_counts(stats), get_profile(seed_id, len(seqs[0].seq), n_pileup, stats, consensus, total_s, trim_s)))
+        else:
+            results.append((consensus, seed_id, get_counts(stats)))
+    return results
 
-    consensus = get_consensus_core(trim_seqs, min_cov, K, min_idt, allow_external_mapping)
-    LOG.debug(' Finishing get_consensus_with_trim(seed_id={})'.format(seed_id))
-
-    return consensus, seed_id
-
-def get_seq_data(config, min_n_read, min_len_aln):
-    max_len = 128000
-    min_cov, K, max_n_read, min_idt, edge_tolerance, trim_size, min_cov_aln, max_cov_aln, allow_external_mapping = config
+"""
+PileupRef names a pile-up packed into shared memory by SharedPileupRing.put().
+The sequences are NUL-terminated ASCII, starting at 'offsets' within the segment 'shm_name'.
+'headers' are the SeqTuples with seq=None, which still carry the mapping fields.
+"""
+PileupRef = collections.namedtuple('PileupRef', ['shm_name', 'offsets', 'headers'])
+
+def pack_pileup(seqs, buf):
+    r"""Copy the strings of seqs into buf (a writable buffer), NUL-terminated.
+    Return the list of offsets.
+    >>> buf = bytearray(8)
+    >>> pack_pileup(['ACG', 'TT'], buf)
+    [0, 4]
+    >>> bytes(buf)
+    b'ACG\x00TT\x00\x00'
+    """
+    offsets = []
+    pos = 0
+    for seq in seqs:
+        n = len(seq)
+        offsets.append(pos)
+        buf[pos:pos + n] = seq.encode('ascii')
+        buf[pos + n] = 0
+        pos += n + 1
+    return offsets
+
+def get_packed_size(seqs):
+    """
+    >>> get_packed_size(['ACG', 'TT'])
+    7
+    """
+    return sum(len(seq) + 1 for seq in seqs)
+
+class SharedPileupRing(object):
+    """Round-robin shared-memory slots for handing pile-ups to pool workers.
+    Only offsets and headers get pickled; workers pass the sequences to C
+    straight out of shared memory, without copying or re-encoding them.
+    Slot i is reused for every n_slots-th pile-up, so at most n_slots
+    pile-ups may be in flight (see multiproc.imap_bounded()).
+    A slot is replaced by a bigger segment when a pile-up does not fit.
+    """
+    min_slot_size = 1 << 20
+
+    def put(self, seqs):
+        strs = [seq.seq for seq in seqs]
+        size = get_packed_size(strs)
+        i = self.n_put % len(self.slots)
+        self.n_put += 1
+        shm = self.slots[i]
+        if shm is None or shm.size < size:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            slot_size = self.min_slot_size
+            while slot_size < size:
+                slot_size *= 2
+            shm = self.shared_memory.SharedMemory(create=True, size=slot_size)
+            self.slots[i] = shm
+        offsets = pack_pileup(strs, shm.buf)
+        headers = [seq._replace(seq=None) for seq in seqs]
+        return PileupRef(shm.name, offsets, headers)
+
+    def close(self):
+        for shm in self.slots:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.slots = []
+
+    def __init__(self, n_slots):
+        from multiprocessing import resource_tracker, shared_memory # python3.8+
+        # Construct this before forking the pool, so workers share our tracker.
+        # Otherwise each worker starts its own, which unlinks whatever that
+        # worker attached when it exits.
+        resource_tracker.ensure_running()
+        self.shared_memory = shared_memory
+        self.slots = [None] * n_slots
+        self.n_put = 0
+
+_attached = collections.OrderedDict()
+
+def attach_shared_memory(name, max_attached=64):
+    """Return SharedMemory for name, attaching it once per worker process.
+    Slots are long-lived, but the parent replaces them as they grow,
+    so we let go of the least recently used attachments.
+    """
+    from multiprocessing import shared_memory # python3.8+
+    shm = _attached.pop(name, None)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=name)
+    _attached[name] = shm
+    while len(_attached) > max_attached:
+        _, old = _attached.popitem(last=False)
+        old.close()
+    return shm
+
+def get_consensus_from_shared(c_input):
+    ref, seed_id, config, trim = c_input
+    LOG.debug('Starting get_consensus_from_shared(len(seqs)=={}, seed_id={})'.format(
+        len(ref.offsets), seed_id))
+    min_cov, K, max_n_read, min_idt, edge_tolerance, trim_size, min_cov_aln, max_cov_aln, allow_external_mapping, max_cov_per_base, aligner = config
+    shm = attach_shared_memory(ref.shm_name)
+    if trim:
+        # The trimming code works on python strings, so this is not zero-copy.
+        buf = shm.buf
+        seqs = []
+        for header, offset in zip(ref.headers, ref.offsets):
+            end = offset
+            while buf[end] != 0:
+                end += 1
+            seqs.append(header._replace(seq=bytes(buf[offset:end]).decode('ascii')))
+        del buf
+        return get_consensus_with_trim((seqs, seed_id, config))
+    # get_seq_data() has already applied get_longest_reads().
+    t0 = time.time()
+    c_buf = (c_char * shm.size).from_buffer(shm.buf)
+    base = addressof(c_buf)
+    seqs_ptr = (c_char_p * len(ref.offsets))(*[base + offset for offset in ref.offsets])
+    consensus, stats = get_consensus_from_ptr(seqs_ptr, ref.headers, min_cov, K, min_idt, allow_external_mapping, max_cov_per_base, aligner, with_stats=True)
+    del seqs_ptr, c_buf
+    LOG.debug(' Finishing get_consensus_from_shared(seed_id={})'.format(seed_id))
+    if _profile:
+        seed_len = ref.offsets[1] - ref.offsets[0] - 1 if len(ref.offsets) > 1 else 0
+        return consensus, seed_id, get_counts(stats), get_profile(seed_id, seed_len, len(ref.offsets) - 1, stats, consensus, time.time() - t0)
+    return consensus, seed_id, get_counts(stats)
+
+def get_stdin_fields():
+    """Yield the fields of each line of LA4Falcon -f output on stdin.
+    """
+    with sys.stdin as f:
+        for line in f:
+            yield line.strip().split()
+
+def get_las_fields(args):
+    """Yield the fields of each line LA4Falcon -f would print for --db-fn and --las-fn,
+    without running it; see dazz_reader.get_pileup_fields().
+    """
+    from .. import dazz_reader
+    db = dazz_reader.DazzDB(args.db_fn)
+    LOG.info('Reading pile-ups of {} reads in {!r} from {!r}'.format(len(db), args.db_fn, args.las_fn))
+    return dazz_reader.get_pileup_fields(db, dazz_reader.read_las(args.las_fn),
+                                         args.min_seed_len, args.la4falcon_flags)
+
+def get_input_fields(args):
+    if args.las_fn:
+        return get_las_fields(args)
+    return get_stdin_fields()
+
+def get_seq_data(config, min_n_read, min_len_aln, fields=None):
+    """Yield (seqs, seed_id, config) for each pile-up of enough reads in fields,
+    the split lines of LA4Falcon -f output (by default, from stdin).
+    """
+    min_cov, K, max_n_read, min_idt, edge_tolerance, trim_size, min_cov_aln, max_cov_aln, allow_external_mapping, max_cov_per_base, aligner = config
     seqs = []
     seed_id = None
     seed_len = 0
     seqs_data = []
     read_cov = 0
     read_ids = set()
-    with sys.stdin as f:
-        for line in f:
-            split_line = line.strip().split()
-            if len(split_line) < 2:
-                continue
-
-            qname = split_line[0]
-            qseq = split_line[1]
-            qstrand, qstart, qend, qlen = 0, -1, -1, -1
-            tstart, tend, tlen = -1, -1, -1
-            aln, is_mapped, is_trimmed = '*', False, False
-
-            if len(split_line) >= 10:
-                qstrand = int(split_line[2])
-                qstart = int(split_line[3])
-                qend = int(split_line[4])
-                qlen = int(split_line[5])
-                tstart = int(split_line[6])
-                tend = int(split_line[7])
-                tlen = int(split_line[8])
-                aln = split_line[9]
-                is_mapped = True
-
-            new_seq = SeqTuple(name = qname, seq = qseq,
-                                qstrand = qstrand, qstart = qstart, qend = qend, qlen = qlen,
-                                tstart = tstart, tend = tend, tlen = tlen,
-                                aln = aln, is_mapped = is_mapped, is_trimmed = is_trimmed)
-
-            if len(new_seq.seq) > max_len:
-                new_seq = get_trimmed_seq(new_seq, 0, max_len - 1)
-
-            if new_seq.name not in ("+", "-", "*"):
-                if len(new_seq.seq) >= min_len_aln:
-                    if len(seqs) == 0:
-                        seqs.append(new_seq)  # the "seed"
-                        seed_len = len(new_seq.seq)
-                        seed_id = new_seq.name
-                    if new_seq.name not in read_ids:  # avoidng using the same read twice. seed is used again here by design
-                        seqs.append(new_seq)
-                        read_ids.add(new_seq.name)
-                        read_cov += len(new_seq.seq)
-
-            elif split_line[0] == "+":
-                if len(seqs) >= min_n_read and read_cov // seed_len >= min_cov_aln:
-                    seqs = get_longest_reads(
-                        seqs, max_n_read, max_cov_aln, sort=True)
-                    yield (seqs, seed_id, config)
-                #seqs_data.append( (seqs, seed_id) )
-                seqs = []
-                read_ids = set()
-                seed_id = None
-                read_cov = 0
-            elif split_line[0] == "*":
-                seqs = []
-                read_ids = set()
-                seed_id = None
-                read_cov = 0
-            elif split_line[0] == "-":
-                # yield (seqs, seed_id)
-                #seqs_data.append( (seqs, seed_id) )
-                break
+    if fields is None:
+        fields = get_stdin_fields()
+    for split_line in fields:
+        if len(split_line) < 2:
+            continue
+
+        qname = split_line[0]
+        qseq = split_line[1]
+        qstrand, qstart, qend, qlen = 0, -1, -1, -1
+        tstart, tend, tlen = -1, -1, -1
+        aln, is_mapped, is_trimmed = '*', False, False
+
+        if len(split_line) >= 10:
+            qstrand = int(split_line[2])
+            qstart = int(split_line[3])
+            qend = int(split_line[4])
+            qlen = int(split_line[5])
+            tstart = int(split_line[6])
+            tend = int(split_line[7])
+            tlen = int(split_line[8])
+            aln = split_line[9]
+            is_mapped = True
+
+        new_seq = SeqTuple(name = qname, seq = qseq,
+                            qstrand = qstrand, qstart = qstart, qend = qend, qlen = qlen,
+                            tstart = tstart, tend = tend, tlen = tlen,
+                            aln = aln, is_mapped = is_mapped, is_trimmed = is_trimmed)
+
+        if new_seq.name not in ("+", "-", "*"):
+            if len(new_seq.seq) >= min_len_aln:
+                if len(seqs) == 0:
+                    seqs.append(new_seq)  # the "seed"
+                    seed_len = len(new_seq.seq)
+                    seed_id = new_seq.name
+                if new_seq.name not in read_ids:  # avoidng using the same read twice. seed is used again here by design
+                    seqs.append(new_seq)
+                    read_ids.add(new_seq.name)
+                    read_cov += len(new_seq.seq)
+
+        elif split_line[0] == "+":
+            if len(seqs) >= min_n_read and read_cov // seed_len >= min_cov_aln:
+                seqs = get_longest_reads(
+                    seqs, max_n_read, max_cov_aln, sort=True)
+                yield (seqs, seed_id, config)
+            #seqs_data.append( (seqs, seed_id) )
+            seqs = []
+            read_ids = set()
+            seed_id = None
+            read_cov = 0
+        elif split_line[0] == "*":
+            seqs = []
+            read_ids = set()
+            seed_id = None
+            read_cov = 0
+        elif split_line[0] == "-":
+            # yield (seqs, seed_id)
+            #seqs_data.append( (seqs, seed_id) )
+            break
 
 
 def format_seq(seq, col):
@@ -291,6 +616,16 @@ def parse_args(argv):
     parser.add_argument('--n-core', type=int, default=24,
                         help='number of processes used for generating consensus; '
                         '0 for main process only')
+    parser.add_argument('--n-thread', type=int, default=0,
+                        help='number of threads (in this one process) used for generating consensus; '
+                        'if set, --n-core and --shared-memory are ignored')
+    parser.add_argument('--max-in-flight', type=int, default=0,
+                        help='maximum number of pile-ups read from stdin but not yet written out; '
+                        'this bounds the memory of the parent process; 0 for 4 per process in --n-core '
+                        '(with --n-thread, the number of pile-ups per batch, by default 4 per thread)')
+    parser.add_argument('--shared-memory', action='store_true', default=False,
+                        help='pass pile-ups to the worker processes in shared memory (under /dev/shm), rather than pickled; '
+                        'needs room there for about MAX_IN_FLIGHT pile-ups')
     parser.add_argument('--min-cov', type=int, default=6,
                         help='minimum coverage to break the consensus')
     parser.add_argument('--min-cov-aln', type=int, default=10,
@@ -299,6 +634,12 @@ def parse_args(argv):
     parser.add_argument('--max-cov-aln', type=int, default=0,  # 0 to emulate previous behavior
                         help='maximum coverage of alignment data; a seed read with more than MAX_COV_ALN average depth' + \
                         ' of coverage of the longest alignments will be capped, excess shorter alignments will be ignored')
+    parser.add_argument('--max-cov-per-base', type=int, default=0,  # 0 to emulate previous behavior
+                        help='stop aligning reads to the parts of a seed already covered by MAX_COV_PER_BASE accepted alignments; ' +
+                        'the remaining reads are skipped, longest first, so this mostly saves the alignment of short reads at high coverage')
+    parser.add_argument('--aligner', default='dw', choices=list(ALIGNERS),
+                        help='how reads are aligned to their seed: "dw" is the banded O(ND) alignment; ' +
+                        '"myers" is a banded bit-vector (Myers) global alignment of the same k-mer anchored ranges')
     parser.add_argument('--min-len-aln', type=int, default=0,  # 0 to emulate previous behavior
                         help='minimum length of a sequence in an alignment to be used in consensus; any shorter sequence will be completely ignored')
     parser.add_argument('--min-n-read', type=int, default=10,
@@ -320,59 +661,178 @@ def parse_args(argv):
                         help='the size for triming both ends from initial sparse aligned region')
     parser.add_argument('--allow-external-mapping', action="store_true", default=False,
                         help='if provided, externally determined mapping coordinates will be used for error correction')
+    parser.add_argument('--db-fn', default=None,
+                        help='read the reads of the pile-ups from this Dazzler DB, rather than LA4Falcon output on stdin; ' +
+                        'needs --las-fn')
+    parser.add_argument('--las-fn', default=None,
+                        help='read the pile-ups from the overlaps in this .las file (of --db-fn)')
+    parser.add_argument('--min-seed-len', type=int, default=0,
+                        help='with --las-fn, as LA4Falcon -H: seeds shorter than this are skipped')
+    parser.add_argument('--la4falcon-flags', default='fo',
+                        help='with --las-fn, as the flags of LA4Falcon: "o" for proper overlaps only, ' +
+                        '"s" to skip seeds contained in longer reads, "g" for the longest overlap of each read only')
+    parser.add_argument('--profile-fn', default=None,
+                        help='write a profile of each seed here: its pile-up, what became of its reads, where the time went, ' +
+                        'and the length of its consensus; as JSON lines if it ends in .jsonl, else as TSV. ' +
+                        'See python3 -m falcon_kit.mains.consensus_profile to summarize these')
     parser.add_argument('-v', '--verbose-level', type=float, default=2.0,
                         help='logging level (WARNING=3, INFO=2, DEBUG=1)')
-    return parser.parse_args(argv[1:])
+    args = parser.parse_args(argv[1:])
+    if bool(args.db_fn) != bool(args.las_fn):
+        parser.error('--db-fn and --las-fn go together')
+    return args
+
+def get_config(args):
+    K = 8
+    config = args.min_cov, K, \
+        args.max_n_read, args.min_idt, args.edge_tolerance, \
+        args.trim_size, args.min_cov_aln, args.max_cov_aln, \
+        args.allow_external_mapping, args.max_cov_per_base, args.aligner
+    return config
+
+def run_threads(args, profile_writer=None):
+    """Generate consensus on args.n_thread threads of this process.
+    Batches of pile-ups go to generate_consensus_batch() in a helper thread,
+    while this thread parses (and maybe trims) the next batch.
+    """
+    import concurrent.futures
+    config = get_config(args)
+    min_cov, K, max_n_read, min_idt, edge_tolerance, trim_size, min_cov_aln, max_cov_aln, allow_external_mapping, max_cov_per_base, aligner = config
+    batch_size = args.max_in_flight
+    if batch_size <= 0:
+        batch_size = 4 * args.n_thread
+    workspaces = (c_void_p * args.n_thread)(
+        *[falcon.allocate_consensus_workspace() for _ in range(args.n_thread)])
+
+    def gen_batches():
+        # With the (n_pileup, trim_s) of each pile-up, as get_consensus_with_trim() profiles them.
+        batch = []
+        trims = []
+        for (seqs, seed_id, _) in get_seq_data(config, args.min_n_read, args.min_len_aln, get_input_fields(args)):
+            n_pileup = len(seqs) - 1
+            trim_s = 0.0
+            if args.trim:
+                t0 = time.time()
+                seqs = get_trimmed_pileup(seqs, config)
+                trim_s = time.time() - t0
+            elif len(seqs) > max_n_read:
+                seqs = get_longest_reads(seqs, max_n_read, max_cov_aln, sort=True)
+            batch.append((seqs, seed_id))
+            trims.append((n_pileup, trim_s))
+            if len(batch) >= batch_size:
+                yield batch, trims
+                batch = []
+                trims = []
+        if batch:
+            yield batch, trims
+
+    LOG.info('running generate_consensus_batch on {} threads, {} pile-ups per batch'.format(
+        args.n_thread, batch_size))
+    executor = concurrent.futures.ThreadPoolExecutor(1)
+    try:
+        future = None
+        counts = []
+        for batch, trims in gen_batches():
+            next_future = executor.submit(get_consensus_batch,
+                batch, workspaces, min_cov, K, min_idt, allow_external_mapping, max_cov_per_base, aligner, trims)
+            if future is not None:
+                counts.append(process_results(future.result(), args, profile_writer))
+            future = next_future
+        if future is not None:
+            counts.append(process_results(future.result(), args, profile_writer))
+        LOG.info('finished generate_consensus_batch')
+        if max_cov_per_base:
+            log_counts(sum(c[0] for c in counts), sum(c[1] for c in counts), max_cov_per_base)
+    finally:
+        executor.shutdown()
+        for ws in workspaces:
+            falcon.free_consensus_workspace(ws)
 
 def run(args):
+    global _profile
     logging.basicConfig(level=int(round(10*args.verbose_level)))
 
+    profile_writer = None
+    if args.profile_fn:
+        _profile = True
+        profile_writer = ProfileWriter(args.profile_fn)
+    try:
+        run_pool_or_threads(args, profile_writer)
+    finally:
+        _profile = False
+        if profile_writer is not None:
+            profile_writer.close()
+
+def run_pool_or_threads(args, profile_writer):
+    if args.n_thread > 0:
+        assert args.n_thread <= multiprocessing.cpu_count(), 'Requested n_thread={} > cpu_count={}'.format(
+                args.n_thread, multiprocessing.cpu_count())
+        run_threads(args, profile_writer)
+        return
+
     assert args.n_core <= multiprocessing.cpu_count(), 'Requested n_core={} > cpu_count={}'.format(
             args.n_core, multiprocessing.cpu_count())
 
     def Start():
         LOG.info('Started a worker in {} from parent {}'.format(
             os.getpid(), os.getppid()))
+    max_in_flight = args.max_in_flight
+    if max_in_flight <= 0:
+        max_in_flight = 4 * max(1, args.n_core)
+    ring = None
+    if args.shared_memory and args.n_core > 0:
+        ring = SharedPileupRing(max_in_flight)
     exe_pool = Pool(args.n_core, initializer=Start)
     if args.trim:
         get_consensus = get_consensus_with_trim
     else:
         get_consensus = get_consensus_without_trim
 
-    K = 8
-    config = args.min_cov, K, \
-        args.max_n_read, args.min_idt, args.edge_tolerance, \
-        args.trim_size, args.min_cov_aln, args.max_cov_aln, \
-        args.allow_external_mapping
+    config = get_config(args)
     # TODO: pass config object, not tuple, so we can add fields
-    inputs = []
-    for datum in get_seq_data(config, args.min_n_read, args.min_len_aln):
-        inputs.append((get_consensus, datum))
+    # Pile-ups are parsed lazily, and at most max_in_flight are held at once.
+    seq_data = get_seq_data(config, args.min_n_read, args.min_len_aln, get_input_fields(args))
+    if ring is not None:
+        inputs = ((get_consensus_from_shared, (ring.put(seqs), seed_id, config, args.trim))
+                  for (seqs, seed_id, config) in seq_data)
+    else:
+        inputs = ((get_consensus, datum) for datum in seq_data)
     try:
-        LOG.info('running {!r}'.format(get_consensus))
-        for res in exe_pool.imap(io.run_func, inputs):
-            process_get_consensus_result(res, args)
+        LOG.info('running {!r} with at most {} pile-ups in flight'.format(get_consensus, max_in_flight))
+        n_aligned, n_skipped = process_results(imap_bounded(exe_pool, io.run_func, inputs, max_in_flight), args, profile_writer)
+        exe_pool.close()
+        exe_pool.join()
         LOG.info('finished {!r}'.format(get_consensus))
+        if args.max_cov_per_base:
+            log_counts(n_aligned, n_skipped, args.max_cov_per_base)
     except:
         LOG.exception('failed gen_consensus')
         exe_pool.terminate()
         raise
+    finally:
+        if ring is not None:
+            ring.close()
 
 good_region = re.compile("[ACGT]+")
 
 def process_get_consensus_result(res, args, limit=500):
-        cns, seed_id = res
+        """Write the consensus of res (from a get_consensus_*() function) to stdout.
+        Return how many bases were written.
+        """
+        cns, seed_id = res[:2]
         seed_id = int(seed_id)
         if len(cns) < limit:
-            return
+            return 0
 
         if args.output_full:
             print('>{:d}_f'.format(seed_id))
             print(cns)
+            return len(cns)
         else:
             cns = good_region.findall(cns)
             if args.output_multi:
                 seq_i = 0
+                n_bases = 0
                 for cns_seq in cns:
                     if len(cns_seq) < limit:
                         continue
@@ -381,12 +841,62 @@ def process_get_consensus_result(res, args, limit=500):
                     print(">prolog/%s%01d/%d_%d" % (seed_id, seq_i, 0, len(cns_seq)))
                     print(format_seq(cns_seq, 80))
                     seq_i += 1
+                    n_bases += len(cns_seq)
+                return n_bases
             else:
                 if len(cns) == 0:
-                    return
+                    return 0
                 cns.sort(key=lambda x: len(x))
                 print('>{:d}'.format(seed_id))
                 print(cns[-1])
+                return len(cns[-1])
+
+# The columns of --profile-fn; see get_profile(), and consensus_stats in common.h.
+PROFILE_FIELDS = [
+    'seed_id', 'seed_len', 'n_pileup', 'n_reads',
+    'n_bad_range', 'n_cov_skipped', 'n_aligned', 'n_low_idt', 'n_used',
+    'trim_s', 'kmer_s', 'align_s', 'msa_s', 'vote_s', 'total_s',
+    'cns_len', 'out_len',
+]
+
+class ProfileWriter(object):
+    """Write the profile of each seed to fn, as JSON lines if it ends in .jsonl
+    (or .json), and otherwise as TSV, under a header of PROFILE_FIELDS.
+    """
+    def write(self, profile, out_len):
+        profile = dict(profile, out_len=out_len)
+        if self.jsonl:
+            self.f.write(json.dumps(dict((key, profile[key]) for key in PROFILE_FIELDS)) + '\n')
+        else:
+            self.f.write('\t'.join(
+                ('{:.6f}'.format(profile[key]) if key.endswith('_s') else str(profile[key]))
+                for key in PROFILE_FIELDS) + '\n')
+
+    def close(self):
+        self.f.close()
+
+    def __init__(self, fn):
+        self.jsonl = fn.endswith('.jsonl') or fn.endswith('.json')
+        self.f = open(fn, 'w')
+        if not self.jsonl:
+            self.f.write('\t'.join(PROFILE_FIELDS) + '\n')
+
+def process_results(results, args, profile_writer):
+    """Write each result, and its profile.
+    Return the total (n_aligned, n_skipped) of their counts (see get_counts()).
+    """
+    n_aligned = n_skipped = 0
+    for res in results:
+        out_len = process_get_consensus_result(res, args)
+        n_aligned += res[2][0]
+        n_skipped += res[2][1]
+        if profile_writer is not None:
+            profile_writer.write(res[3], out_len)
+    return n_aligned, n_skipped
+
+def log_counts(n_aligned, n_skipped, max_cov_per_base):
+    LOG.info('aligned {} reads, skipped {} for --max-cov-per-base={}'.format(
+        n_aligned, n_skipped, max_cov_per_base))
 
 def main(argv=sys.argv):
     args = parse_args(argv)
@@ -0,0 +1,120 @@
+"""Summarize the per-seed profiles of consensus (fc_consensus --profile-fn),
+e.g. of all the cns tasks of a run, and list the slowest seeds.
+"""
+import argparse
+import json
+import sys
+
+from ..functional import percentile
+from ..util import io
+from .consensus import PROFILE_FIELDS
+
+# Where the time of a seed goes, in the order of PROFILE_FIELDS.
+PHASES = ['trim_s', 'kmer_s', 'align_s', 'msa_s', 'vote_s']
+COLUMNS = ['seed_id', 'seed_len', 'n_pileup', 'n_used', 'n_bad_range', 'n_low_idt',
+           'kmer_s', 'align_s', 'msa_s', 'vote_s', 'total_s', 'out_len']
+
+
+def parse_value(key, value):
+    if key == 'seed_id':
+        return str(value)
+    if key.endswith('_s'):
+        return float(value)
+    return int(value)
+
+
+def read_profiles(fn):
+    """Yield the profile of each seed in fn (TSV or JSON lines) as a dict.
+    """
+    with open(fn) as f:
+        header = None
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            if line.startswith('{'):
+                profile = json.loads(line)
+            elif header is None:
+                header = line.split('\t')
+                continue
+            else:
+                profile = dict(zip(header, line.split('\t')))
+            yield dict((key, parse_value(key, profile[key])) for key in PROFILE_FIELDS if key in profile)
+
+
+def pct(part, whole):
+    return '{:.1f}%'.format(100.0 * part / whole) if whole else '-'
+
+
+def summarize(fp_out, profiles, n_files, top, sort_by):
+    if not profiles:
+        fp_out.write('No seeds in {} files.\n'.format(n_files))
+        return
+    totals = dict((key, sum(p.get(key, 0) for p in profiles)) for key in PROFILE_FIELDS if key != 'seed_id')
+    total_s = totals['total_s']
+    times = sorted(p['total_s'] for p in profiles)
+    n_worst = max(1, len(times) // 100)
+    fp_out.write('seeds: {:,} in {:,} files\n'.format(len(profiles), n_files))
+    fp_out.write('time: {:.1f} s in all; {}, other {}\n'.format(
+        total_s,
+        ', '.join('{} {}'.format(key[:-2], pct(totals[key], total_s)) for key in PHASES),
+        pct(total_s - sum(totals[key] for key in PHASES), total_s)))
+    fp_out.write('time per seed: p50 {:.3f} s, p90 {:.3f} s, p99 {:.3f} s, max {:.3f} s\n'.format(
+        percentile(times, 50), percentile(times, 90), percentile(times, 99), times[-1]))
+    fp_out.write('the slowest 1% of seeds ({:,}) took {} of the time\n'.format(
+        n_worst, pct(sum(times[-n_worst:]), total_s)))
+    fp_out.write('reads: {:,} in pile-ups, {:,} to align; of those, bad k-mer range {}, '
+                 'skipped for coverage {}, aligned {}, too different {}, used {}\n'.format(
+                     totals['n_pileup'], totals['n_reads'],
+                     pct(totals['n_bad_range'], totals['n_reads']), pct(totals['n_cov_skipped'], totals['n_reads']),
+                     pct(totals['n_aligned'], totals['n_reads']), pct(totals['n_low_idt'], totals['n_reads']),
+                     pct(totals['n_used'], totals['n_reads'])))
+    fp_out.write('bases: {:,} in seeds, {:,} of consensus written\n'.format(totals['seed_len'], totals['out_len']))
+    worst = sorted(profiles, key=lambda p: -p[sort_by])[:top]
+    fp_out.write('\nslowest {} seeds, by {}:\n'.format(len(worst), sort_by))
+    fp_out.write('\t'.join(COLUMNS + ['fn']) + '\n')
+    for p in worst:
+        fp_out.write('\t'.join(
+            ('{:.3f}'.format(p[key]) if key.endswith('_s') else str(p[key])) for key in COLUMNS)
+            + '\t' + p['fn'] + '\n')
+
+
+def run(fp_out, profile_fns, fofn, top, sort_by):
+    fns = list(profile_fns)
+    if fofn:
+        fns.extend(io.validated_fns(fofn))
+    profiles = []
+    for fn in fns:
+        for profile in read_profiles(fn):
+            profile['fn'] = fn
+            profiles.append(profile)
+    summarize(fp_out, profiles, len(fns), top, sort_by)
+
+
+class HelpF(argparse.RawTextHelpFormatter, argparse.ArgumentDefaultsHelpFormatter):
+    pass
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=HelpF)
+    parser.add_argument('profile_fns', nargs='*',
+                        help='files written by fc_consensus --profile-fn (TSV or JSON lines)')
+    parser.add_argument('--fofn', default=None,
+                        help='a file of more such filenames')
+    parser.add_argument('--top', type=int, default=20,
+                        help='how many of the slowest seeds to list')
+    parser.add_argument('--sort-by', default='total_s', choices=[key for key in PROFILE_FIELDS if key != 'seed_id'],
+                        help='what "slowest" means')
+    args = parser.parse_args(argv[1:])
+    if not args.profile_fns and not args.fofn:
+        parser.error('no profiles given')
+    return args
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    run(sys.stdout, **vars(args))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -85,7 +85,8 @@ def symlink(actual):
 
 # This function was copied from bash.py and modified.
 def script_run_consensus(config, db_fn, las_fn, out_file_fn, nproc):
-    """config: dazcon, falcon_sense_greedy, falcon_sense_skip_contained, LA4Falcon_preload
+    """config: dazcon, falcon_sense_greedy, falcon_sense_skip_contained, LA4Falcon_preload, LA4Falcon_inprocess
+    With LA4Falcon_inprocess, consensus reads the DB and .las itself, as LA4Falcon would print them.
     """
     symlink_db(db_fn, symlink=symlink)
     db_fn = os.path.basename(db_fn)
@@ -108,6 +109,8 @@ def script_run_consensus(config, db_fn, las_fn, out_file_fn, nproc):
     if LA4Falcon_flags:
         LA4Falcon_flags = '-' + ''.join(set(LA4Falcon_flags))
     run_consensus = "LA4Falcon -H$CUTOFF %s {db_fn} {las_fn} | python3 -m falcon_kit.mains.consensus {falcon_sense_option} >| {out_file_bfn}" % LA4Falcon_flags
+    if config.get('LA4Falcon_inprocess', False):
+        run_consensus = "python3 -m falcon_kit.mains.consensus --db-fn {db_fn} --las-fn {las_fn} --min-seed-len $CUTOFF --la4falcon-flags %s {falcon_sense_option} >| {out_file_bfn}" % LA4Falcon_flags.lstrip('-').replace('P', '')
 
     if config.get('dazcon', False):
         run_consensus = """
@@ -18,11 +18,12 @@ But that script is simple, and only depends on the alignment info that the previ
 """
 
 import argparse
+import itertools
 import logging
 import sys
 import networkx as nx
-from ..FastaReader import open_fasta_reader
 from ..io import open_progress
+from ..pread_store import PreadStore
 
 RCMAP = dict(list(zip("ACGTacgtNn-", "TGCAtgcaNn-")))
 
@@ -40,20 +41,20 @@ def reverse_end(node_id):
     return node_id + ":" + new_end
 
 
-def yield_first_seq(one_path_edges, seqs):
+def yield_first_seq(one_path_edges, preads):
     if one_path_edges and one_path_edges[0][0] != one_path_edges[-1][1]:
         # If non-empty, and non-circular,
         # prepend the entire first read.
         (vv, ww) = one_path_edges[0]
         (vv_rid, vv_letter) = vv.split(":")
         if vv_letter == 'E':
-            first_seq = seqs[vv_rid]
+            first_seq = preads.get_seq(vv_rid)
         else:
             assert vv_letter == 'B'
-            first_seq = "".join([RCMAP[c] for c in seqs[vv_rid][::-1]])
+            first_seq = preads.get_edge_seq(vv_rid, preads.length(vv_rid), 0)
         yield first_seq
 
-def compose_ctg(seqs, edge_data, ctg_id, path_edges, proper_ctg):
+def compose_ctg(preads, edge_data, ctg_id, path_edges, proper_ctg):
     total_score = 0
     total_length = 0
     edge_lines = []
@@ -61,13 +62,13 @@ def compose_ctg(seqs, edge_data, ctg_id, path_edges, proper_ctg):
 
     # If required, add the first read to the path sequence.
     if proper_ctg:
-        sub_seqs = list(yield_first_seq(path_edges, seqs))
+        sub_seqs = list(yield_first_seq(path_edges, preads))
         total_length = 0 if len(sub_seqs) == 0 else len(sub_seqs[0])
 
     # Splice-in the rest of the path sequence.
     for vv, ww in path_edges:
-        rid, s, t, aln_score, idt, e_seq = edge_data[(vv, ww)]
-        sub_seqs.append(e_seq)
+        rid, s, t, aln_score, idt = edge_data[(vv, ww)]
+        sub_seqs.append(preads.get_edge_seq(rid, s, t))
         edge_lines.append('%s %s %s %s %d %d %d %0.2f' % (
             ctg_id, vv, ww, rid, s, t, aln_score, idt))
         total_length += abs(s - t)
@@ -75,31 +76,134 @@ def compose_ctg(seqs, edge_data, ctg_id, path_edges, proper_ctg):
 
     return edge_lines, sub_seqs, total_score, total_length
 
-def run(improper_p_ctg, proper_a_ctg, preads_fasta_fn, sg_edges_list_fn, utg_data_fn, ctg_paths_fn):
+def yield_bubble_paths_nx(edges, s, t):
+    """Yield the (score, path) of each alternative path from s to t in the bubble of edges
+    (v, w, e_score): the lightest path (by networkx), then the lightest once the edges
+    of that one are removed, and so on.
+    """
+    c_graph = nx.DiGraph()
+    for v, w, e_score in edges:
+        c_graph.add_edge(v, w, e_score=e_score)
+
+    shortest_path = nx.shortest_path(c_graph, s, t, "e_score")
+    score = nx.shortest_path_length(c_graph, s, t, "e_score")
+    yield score, shortest_path
+
+    while 1:
+        n0 = shortest_path[0]
+        for n1 in shortest_path[1:]:
+            c_graph.remove_edge(n0, n1)
+            n0 = n1
+        try:
+            shortest_path = nx.shortest_path(
+                c_graph, s, t, "e_score")
+            score = nx.shortest_path_length(
+                c_graph, s, t, "e_score")
+        except nx.exception.NetworkXNoPath:
+            break
+        yield score, shortest_path
+
+
+def get_bubble_paths_dag(edges, s, t, max_paths=0):
+    """The (score, path) of the alternative paths of yield_bubble_paths_nx() (at most
+    max_paths, unless 0), by dynamic programming over the bubble in topological order:
+    one pass per path, rather than two Dijkstra searches.
+    Return None if the paths might not be the same: if the bubble has a cycle or a
+    negative score, if s cannot reach t, or if two paths tie for the lightest (as networkx
+    breaks ties its own way).
+    """
+    out_edges = {}
+    in_degree = {}
+    for v, w, e_score in edges:
+        if e_score < 0:
+            return None
+        out_edges.setdefault(w, {})
+        in_degree.setdefault(v, 0)
+        out = out_edges.setdefault(v, {})
+        if w not in out:
+            in_degree[w] = in_degree.get(w, 0) + 1
+        out[w] = e_score
+    if s == t or s not in out_edges or t not in out_edges:
+        return None
+
+    order = [v for v in out_edges if in_degree[v] == 0]
+    for v in order:
+        for w in out_edges[v]:
+            in_degree[w] -= 1
+            if in_degree[w] == 0:
+                order.append(w)
+    if len(order) != len(out_edges):
+        return None
+    order = order[order.index(s):]
+
+    paths = []
+    while not max_paths or len(paths) < max_paths:
+        # n_best[v] is the number of lightest paths from s to v, up to 2.
+        dist = {s: 0}
+        n_best = {s: 1}
+        pred = {}
+        for v in order:
+            if v == t:
+                break
+            if v not in dist:
+                continue
+            d = dist[v]
+            for w, e_score in out_edges[v].items():
+                dw = d + e_score
+                old = dist.get(w)
+                if old is None or dw < old:
+                    dist[w] = dw
+                    n_best[w] = n_best[v]
+                    pred[w] = v
+                elif dw == old:
+                    n_best[w] = min(2, n_best[w] + n_best[v])
+        if t not in dist:
+            if not paths:
+                return None
+            break
+        if n_best[t] > 1:
+            return None
+        path = [t]
+        while path[-1] != s:
+            path.append(pred[path[-1]])
+        path.reverse()
+        paths.append((dist[t], path))
+        for v, w in zip(path[:-1], path[1:]):
+            del out_edges[v][w]
+    return paths
+
+
+def get_bubble_paths(edges, s, t, max_paths, stats):
+    """The (score, path) of the alternative paths from s to t of a compound unitig,
+    heaviest first, at most max_paths (unless 0), as get_bubble_paths_dag() finds them
+    or, failing that, yield_bubble_paths_nx(). Count them in stats.
+    """
+    # One more than max_paths, to tell whether any path was left out.
+    n_paths = max_paths + 1 if max_paths else 0
+    all_alt_path = get_bubble_paths_dag(edges, s, t, n_paths)
+    if all_alt_path is None:
+        stats['nx_bubbles'] += 1
+        all_alt_path = list(itertools.islice(
+            yield_bubble_paths_nx(edges, s, t), n_paths or None))
+    if max_paths and len(all_alt_path) > max_paths:
+        del all_alt_path[max_paths:]
+        stats['capped_bubbles'] += 1
+        log('bubble {} ~ {} ({} edges) capped at {} paths'.format(s, t, len(edges), max_paths))
+    stats['bubbles'] += 1
+    stats['paths'] += len(all_alt_path)
+    stats['max_paths'] = max(stats['max_paths'], len(all_alt_path))
+    stats['max_edges'] = max(stats['max_edges'], len(edges))
+    all_alt_path.sort()
+    all_alt_path.reverse()
+    return all_alt_path
+
+
+def run(improper_p_ctg, proper_a_ctg, preads_fasta_fn, sg_edges_list_fn, utg_data_fn, ctg_paths_fn, max_bubble_paths=0):
     """improper==True => Neglect the initial read.
     We used to need that for unzip.
     """
-    reads_in_layout = set()
-    with open_progress(sg_edges_list_fn) as f:
-        for l in f:
-            l = l.strip().split()
-            """001039799:E 000333411:E 000333411 17524 20167 17524 99.62 G"""
-            v, w, rid, s, t, aln_score, idt, type_ = l
-            if type_ != "G":
-                continue
-            r1 = v.split(":")[0]
-            reads_in_layout.add(r1)
-            r2 = w.split(":")[0]
-            reads_in_layout.add(r2)
-
-    seqs = {}
-    # load all p-read name into memory
-    with open_fasta_reader(preads_fasta_fn) as f:
-        for r in f:
-            rname = r.name.strip().split()[0]
-            if rname not in reads_in_layout:
-                continue
-            seqs[rname] = r.sequence.upper() # name == rid-string
+    # The sequences of the edges are looked up in the preads only as the contigs are written.
+    preads = PreadStore(preads_fasta_fn)
 
     edge_data = {}
     with open_progress(sg_edges_list_fn) as f:
@@ -111,24 +215,23 @@ def run(improper_p_ctg, proper_a_ctg, preads_fasta_fn, sg_edges_list_fn, utg_dat
             if type_ != "G":
                 continue
             r1, dir1 = v.split(":")
-            reads_in_layout.add(r1) # redundant, but harmless
             r2, dir2 = w.split(":")
-            reads_in_layout.add(r2) # redundant, but harmless
 
             s = int(s)
             t = int(t)
             aln_score = int(aln_score)
             idt = float(idt)
 
+            if rid not in preads:
+                raise KeyError(rid)
             if s < t:
-                e_seq = seqs[rid][s:t]
                 assert 'E' == dir2
             else:
                 # t and s were swapped for 'c' alignments in ovlp_to_graph.generate_string_graph():702
                 # They were translated from reverse-dir to forward-dir coordinate system in LA4Falcon.
-                e_seq = "".join([RCMAP[c] for c in seqs[rid][t:s][::-1]])
+                # (The sequence is then the reverse complement of [t:s]; see PreadStore.get_edge_seq().)
                 assert 'B' == dir2
-            edge_data[(v, w)] = (rid, s, t, aln_score, idt, e_seq)
+            edge_data[(v, w)] = (rid, s, t, aln_score, idt)
 
     utg_data = {}
     with open_progress(utg_data_fn) as f:
@@ -151,6 +254,7 @@ def run(improper_p_ctg, proper_a_ctg, preads_fasta_fn, sg_edges_list_fn, utg_dat
     p_ctg_t_out = open("p_ctg_tiling_path", "w")
     a_ctg_t_out = open("a_ctg_all_tiling_path", "w")
     layout_ctg = set()
+    bubble_stats = dict(bubbles=0, paths=0, nx_bubbles=0, capped_bubbles=0, max_paths=0, max_edges=0)
 
     with open_progress(ctg_paths_fn) as f:
         for l in f:
@@ -186,43 +290,17 @@ def run(improper_p_ctg, proper_a_ctg, preads_fasta_fn, sg_edges_list_fn, utg_dat
                         one_path.extend(path_or_edges)
                 if type_ == "compound":
 
-                    c_graph = nx.DiGraph()
-
-                    all_alt_path = []
+                    edges = []
                     for ss, vv, tt in path_or_edges:
                         type_, length, score, sub_path = utg_data[(ss, vv, tt)]
 
                         v1 = sub_path[0]
                         for v2 in sub_path[1:]:
-                            c_graph.add_edge(
-                                v1, v2, e_score=edge_data[(v1, v2)][3])
+                            edges.append((v1, v2, edge_data[(v1, v2)][3]))
                             v1 = v2
 
-                    shortest_path = nx.shortest_path(c_graph, s, t, "e_score")
-                    score = nx.shortest_path_length(c_graph, s, t, "e_score")
-                    all_alt_path.append((score, shortest_path))
-
-                    # a_ctg_data.append( (s, t, shortest_path) ) #first path is the same as the one used in the primary contig
-                    while 1:
-                        n0 = shortest_path[0]
-                        for n1 in shortest_path[1:]:
-                            c_graph.remove_edge(n0, n1)
-                            n0 = n1
-                        try:
-                            shortest_path = nx.shortest_path(
-                                c_graph, s, t, "e_score")
-                            score = nx.shortest_path_length(
-                                c_graph, s, t, "e_score")
-                            #a_ctg_data.append( (s, t, shortest_path) )
-                            all_alt_path.append((score, shortest_path))
-
-                        except nx.exception.NetworkXNoPath:
-                            break
-                        # if len(shortest_path) < 2:
-                        #    break
-                    # Is sorting required, if we are appending the shortest paths in order?
-                    all_alt_path.sort()
-                    all_alt_path.reverse()
+                    # The heaviest of the alternative paths is the first.
+                    all_alt_path = get_bubble_paths(edges, s, t, max_bubble_paths, bubble_stats)
                     shortest_path = all_alt_path[0][1]
                     # The longest branch in the compound unitig is added to the primary path.
                     if len(one_path) != 0:
@@ -238,7 +316,7 @@ def run(improper_p_ctg, proper_a_ctg, preads_fasta_fn, sg_edges_list_fn, utg_dat
             one_path_edges = list(zip(one_path[:-1], one_path[1:]))
 
             # Compose the primary contig.
-            p_edge_lines, p_ctg_seq_chunks, p_total_score, p_total_length = compose_ctg(seqs, edge_data, ctg_id, one_path_edges, (not improper_p_ctg))
+            p_edge_lines, p_ctg_seq_chunks, p_total_score, p_total_length = compose_ctg(preads, edge_data, ctg_id, one_path_edges, (not improper_p_ctg))
 
             # Write out the tiling path.
             p_ctg_t_out.write('\n'.join(p_edge_lines))
@@ -262,7 +340,7 @@ def run(improper_p_ctg, proper_a_ctg, preads_fasta_fn, sg_edges_list_fn, utg_dat
 
                     a_ctg_id = '%s-%03d-%02d' % (ctg_id, a_id + 1, sub_id)
                     a_edge_lines, sub_seqs, a_total_score, a_total_length = compose_ctg(
-                        seqs, edge_data, a_ctg_id, atig_path_edges, proper_a_ctg)
+                        preads, edge_data, a_ctg_id, atig_path_edges, proper_a_ctg)
 
                     seq = ''.join(sub_seqs)
 
@@ -295,6 +373,9 @@ def run(improper_p_ctg, proper_a_ctg, preads_fasta_fn, sg_edges_list_fn, utg_dat
     p_ctg_out.close()
     a_ctg_t_out.close()
     p_ctg_t_out.close()
+    preads.close()
+    log('{bubbles} bubbles (compound unitigs), {paths} alternative paths; {nx_bubbles} bubbles by networkx, '
+        '{capped_bubbles} capped; at most {max_paths} paths and {max_edges} edges in a bubble'.format(**bubble_stats))
 
 class HelpF(argparse.RawDescriptionHelpFormatter, argparse.ArgumentDefaultsHelpFormatter):
     pass
@@ -329,6 +410,9 @@ We write these:
     parser.add_argument('--ctg-paths-fn', type=str,
             default='./ctg_paths',
             help='Input. File containing contig paths, produced by ovlp_to_graph.py.')
+    parser.add_argument('--max-bubble-paths', type=int,
+            default=0,
+            help='At most this many alternative paths (a_ctg) per bubble (0 for all), for pathological bubbles.')
     args = parser.parse_args(argv[1:])
     run(**vars(args))
 
@@ -1,17 +1,38 @@
 from falcon_kit.multiproc import Pool
+from falcon_kit import ovlp_reader
+from ctypes import byref, c_int, c_long
 import falcon_kit.util.io as io
 import argparse
+import array
 import os
 import sys
 
-Reader = io.CapturedProcessReaderContext
+Reader = ovlp_reader.OvlpReaderContext
 
 
 def run_filter_stage1(db_fn, fn, la4falcon_flags, max_diff, max_ovlp, min_ovlp, min_len, min_idt):
     cmd = "LA4Falcon -%s %s %s" % (la4falcon_flags, db_fn, fn)
     reader = Reader(cmd)
     with reader:
-        return fn, filter_stage1(reader.readlines, max_diff, max_ovlp, min_ovlp, min_len, min_idt)
+        return fn, filter_stage1_chunks(reader.readchunks(), max_diff, max_ovlp, min_ovlp, min_len, min_idt)
+
+
+def filter_stage1_chunks(chunks, max_diff, max_ovlp, min_ovlp, min_len, min_idt=90.0):
+    """Same as filter_stage1(), but for chunks from ovlp_reader.
+    """
+    ignore_rtn = set()
+    contained_rtn = set()
+    for chunk in chunks:
+        ignore = (c_int * chunk.n)()
+        contained = (c_int * chunk.n)()
+        n_ignore = c_long()
+        n_contained = c_long()
+        ovlp_reader.ovlp.ovlp_filter_stage1(chunk.records, chunk.n,
+                max_diff, max_ovlp, min_ovlp, min_len, min_idt,
+                ignore, byref(n_ignore), contained, byref(n_contained))
+        ignore_rtn.update(ovlp_reader.format_id(i) for i in ignore[:n_ignore.value])
+        contained_rtn.update(ovlp_reader.format_id(i) for i in contained[:n_contained.value])
+    return { "ignore": ignore_rtn, "contained": contained_rtn }
 
 
 def filter_stage1(readlines, max_diff, max_ovlp, min_ovlp, min_len, min_idt=90.0):
@@ -72,7 +93,30 @@ def run_filter_stage2(db_fn, fn, la4falcon_flags, max_diff, max_ovlp, min_ovlp,
     cmd = "LA4Falcon -%s %s %s" % (la4falcon_flags, db_fn, fn)
     reader = Reader(cmd)
     with reader:
-        return fn, filter_stage2(reader.readlines, max_diff, max_ovlp, min_ovlp, min_len, min_idt, ignore_set, contained_set, bestn)
+        return fn, filter_stage2_chunks(reader.readchunks(), max_diff, max_ovlp, min_ovlp, min_len, min_idt, ignore_set, contained_set, bestn)
+
+
+def filter_stage2_chunks(chunks, max_diff, max_ovlp, min_ovlp, min_len, min_idt, ignore_set, contained_set, bestn):
+    """Same as filter_stage2(), but for chunks from ovlp_reader,
+    and each selected overlap is a line, not a list of fields.
+    """
+    ignore = ovlp_reader.get_sorted_ids(ignore_set)
+    contained = ovlp_reader.get_sorted_ids(contained_set)
+    return select_stage2(chunks, min_len, min_idt, ignore, contained, bestn)
+
+
+def select_stage2(chunks, min_len, min_idt, ignore, contained, bestn):
+    """ignore and contained are sorted c_int arrays.
+    """
+    ovlp_output = []
+    for chunk in chunks:
+        selected = (c_long * chunk.n)()
+        n_selected = ovlp_reader.ovlp.ovlp_filter_stage2(chunk.buf, chunk.records, chunk.n,
+                min_len, min_idt,
+                ignore, len(ignore), contained, len(contained),
+                bestn, selected)
+        ovlp_output.extend(chunk.line(i) for i in selected[:n_selected])
+    return ovlp_output
 
 
 def filter_stage2(readlines, max_diff, max_ovlp, min_ovlp, min_len, min_idt, ignore_set, contained_set, bestn):
@@ -157,6 +201,95 @@ def filter_stage2(readlines, max_diff, max_ovlp, min_ovlp, min_len, min_idt, ign
     return ovlp_output
 
 
+def run_filter_stage1_block(db_fn, fn, la4falcon_flags, max_diff, max_ovlp, min_ovlp, min_len, min_idt, candidates_fn):
+    cmd = "LA4Falcon -%s %s %s" % (la4falcon_flags, db_fn, fn)
+    reader = Reader(cmd)
+    with reader:
+        return fn, filter_stage1_block(reader.readchunks(), max_diff, max_ovlp, min_ovlp, min_len, min_idt, candidates_fn)
+
+
+def filter_stage1_block(chunks, max_diff, max_ovlp, min_ovlp, min_len, min_idt, candidates_fn):
+    """Like filter_stage1_chunks(), but also write to candidates_fn
+    (as LA4Falcon -m lines) every overlap that stage 2 could still select,
+    so stage 2 never runs LA4Falcon again.
+    The ids are returned as sorted array('i').
+
+    Only the global ignore/contained sets decide which candidates stage 2 keeps,
+    so we cannot cut them to bestn here; we drop only what this block's own
+    ignore/contained ids (a subset of the global ones) already exclude.
+    """
+    ignore_rtn = set()
+    contained_rtn = set()
+    with open(candidates_fn, 'wb') as out:
+        for chunk in chunks:
+            ignore = (c_int * chunk.n)()
+            contained = (c_int * chunk.n)()
+            n_ignore = c_long()
+            n_contained = c_long()
+            ovlp_reader.ovlp.ovlp_filter_stage1(chunk.records, chunk.n,
+                    max_diff, max_ovlp, min_ovlp, min_len, min_idt,
+                    ignore, byref(n_ignore), contained, byref(n_contained))
+            ignore = ignore[:n_ignore.value]
+            contained = contained[:n_contained.value]
+            ignore_rtn.update(ignore)
+            contained_rtn.update(contained)
+
+            ignore = ovlp_reader.get_sorted_ids(ignore)
+            contained = ovlp_reader.get_sorted_ids(contained)
+            selected = (c_long * chunk.n)()
+            n_selected = ovlp_reader.ovlp.ovlp_filter_stage2(chunk.buf, chunk.records, chunk.n,
+                    min_len, min_idt,
+                    ignore, len(ignore), contained, len(contained),
+                    2**31 - 1, selected)  # no bestn cutoff
+            out.write(b''.join(chunk.raw_line(i) for i in selected[:n_selected]))
+    return { "ignore": array.array('i', sorted(ignore_rtn)),
+             "contained": array.array('i', sorted(contained_rtn)) }
+
+
+def run_filter_stage2_block(candidates_fn, min_len, min_idt, ignore_fn, contained_fn, bestn):
+    ignore = ovlp_reader.mmap_ids(ignore_fn)
+    contained = ovlp_reader.mmap_ids(contained_fn)
+    with open(candidates_fn, 'rb') as f:
+        return candidates_fn, select_stage2(ovlp_reader.yield_chunks(f.read), min_len, min_idt, ignore, contained, bestn)
+
+
+def run_ovlp_filter_single_pass(outs, exe_pool, file_list, max_diff, max_cov, min_cov, min_len, min_idt, ignore_indels, bestn, db_fn, tmp_dir):
+    """Like run_ovlp_filter(), but LA4Falcon runs once per file.
+    Stage 1 saves the candidate overlaps of each file into tmp_dir,
+    and stage 2 reads the global ignore/contained ids from mmapped files there.
+    """
+    la4falcon_flags = "mo" + ("I" if ignore_indels else "")
+
+    io.LOG('preparing filter_stage1')
+    io.logstats()
+    inputs = []
+    for fn in file_list:
+        if len(fn) != 0:
+            candidates_fn = os.path.join(tmp_dir, 'candidates.%d.m4' % len(inputs))
+            inputs.append((run_filter_stage1_block, db_fn, fn, la4falcon_flags,
+                           max_diff, max_cov, min_cov, min_len, min_idt, candidates_fn))
+
+    ignore_all = set()
+    contained = set()
+    for res in exe_pool.imap(io.run_func, inputs):
+        ignore_all.update(res[1]["ignore"])
+        contained.update(res[1]["contained"])
+    contained = contained.difference(ignore_all) # do not count ignored reads as contained
+    ignore_fn = os.path.join(tmp_dir, 'ignore.ids')
+    contained_fn = os.path.join(tmp_dir, 'contained.ids')
+    ovlp_reader.write_ids(ignore_fn, ignore_all)
+    ovlp_reader.write_ids(contained_fn, contained)
+
+    io.LOG('preparing filter_stage2')
+    io.logstats()
+    inputs = [(run_filter_stage2_block, inp[-1], min_len, min_idt, ignore_fn, contained_fn, bestn)
+              for inp in inputs]
+    for res in exe_pool.imap(io.run_func, inputs):
+        for l in res[1]:
+            outs.write(l + "\n")
+    io.logstats()
+
+
 def run_ovlp_filter(outs, exe_pool, file_list, max_diff, max_cov, min_cov, min_len, min_idt, ignore_indels, bestn, db_fn):
     la4falcon_flags = "mo" + ("I" if ignore_indels else "")
 
@@ -185,11 +318,11 @@ def run_ovlp_filter(outs, exe_pool, file_list, max_diff, max_cov, min_cov, min_l
                            max_diff, max_cov, min_cov, min_len, min_idt, ignore_all, contained, bestn))
     for res in exe_pool.imap(io.run_func, inputs):
         for l in res[1]:
-            outs.write(" ".join(l) + "\n")
+            outs.write(l + "\n")
     io.logstats()
 
 
-def try_run_ovlp_filter(out_fn, n_core, fofn, max_diff, max_cov, min_cov, min_len, min_idt, ignore_indels, bestn, db_fn):
+def try_run_ovlp_filter(out_fn, n_core, fofn, max_diff, max_cov, min_cov, min_len, min_idt, ignore_indels, bestn, db_fn, two_pass=False):
     io.LOG('starting ovlp_filter')
     file_list = io.validated_fns(fofn)
     io.LOG('fofn %r: %r' % (fofn, file_list))
@@ -198,8 +331,13 @@ def try_run_ovlp_filter(out_fn, n_core, fofn, max_diff, max_cov, min_cov, min_le
     tmp_out_fn = out_fn + '.tmp'
     try:
         with open(tmp_out_fn, 'w') as outs:
-            run_ovlp_filter(outs, exe_pool, file_list, max_diff, max_cov,
-                            min_cov, min_len, min_idt, ignore_indels, bestn, db_fn)
+            if two_pass:
+                run_ovlp_filter(outs, exe_pool, file_list, max_diff, max_cov,
+                                min_cov, min_len, min_idt, ignore_indels, bestn, db_fn)
+            else:
+                with io.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_fn))) as tmp_dir:
+                    run_ovlp_filter_single_pass(outs, exe_pool, file_list, max_diff, max_cov,
+                                                min_cov, min_len, min_idt, ignore_indels, bestn, db_fn, tmp_dir)
         os.rename(tmp_out_fn, out_fn)
         io.LOG('finished ovlp_filter')
     except:
@@ -208,17 +346,14 @@ def try_run_ovlp_filter(out_fn, n_core, fofn, max_diff, max_cov, min_cov, min_le
         raise
 
 
-def ovlp_filter(out_fn, n_core, las_fofn, max_diff, max_cov, min_cov, min_len, min_idt, ignore_indels, bestn, db_fn, debug, silent, stream):
+def ovlp_filter(out_fn, n_core, las_fofn, max_diff, max_cov, min_cov, min_len, min_idt, ignore_indels, bestn, db_fn, debug, silent, stream, two_pass):
     if debug:
         n_core = 0
         silent = False
     if silent:
         io.LOG = io.write_nothing
-    if stream:
-        global Reader
-        Reader = io.StreamedProcessReaderContext
     try_run_ovlp_filter(out_fn, n_core, las_fofn, max_diff, max_cov,
-                        min_cov, min_len, min_idt, ignore_indels, bestn, db_fn)
+                        min_cov, min_len, min_idt, ignore_indels, bestn, db_fn, two_pass)
 
 
 def parse_args(argv):
@@ -267,7 +402,10 @@ def parse_args(argv):
         help="output at least best n overlaps on 5' or 3' ends if possible")
     parser.add_argument(
         '--stream', action='store_true',
-        help='stream from LA4Falcon, instead of slurping all at once; can save memory for large data')
+        help='ignored; LA4Falcon output is always read in chunks now')
+    parser.add_argument(
+        '--two-pass', action='store_true',
+        help='run LA4Falcon on each file in both stages, instead of saving candidate overlaps in a temporary directory beside --out-fn')
     parser.add_argument(
         '--debug', '-g', action='store_true',
         help="single-threaded, plus other aids to debugging")
@@ -1,4 +1,6 @@
 from falcon_kit.multiproc import Pool
+from falcon_kit import ovlp_reader
+from ctypes import c_int
 import falcon_kit.util.io as io
 import argparse
 import shlex
@@ -6,7 +8,7 @@ import subprocess as sp
 import sys
 import traceback
 
-Reader = io.CapturedProcessReaderContext
+Reader = ovlp_reader.OvlpReaderContext
 
 
 def filter_stats(readlines, min_len):
@@ -60,12 +62,25 @@ def filter_stats(readlines, min_len):
     return rtn_data
 
 
+def filter_stats_chunks(chunks, min_len):
+    """Same as filter_stats(), but for chunks from ovlp_reader.
+    """
+    rtn_data = []
+    for chunk in chunks:
+        stats = (c_int * (4 * chunk.n))()
+        n = ovlp_reader.ovlp.ovlp_stats(chunk.records, chunk.n, min_len, stats)
+        for i in range(n):
+            q_id, q_l, left_count, right_count = stats[4 * i:4 * i + 4]
+            rtn_data.append((ovlp_reader.format_id(q_id), q_l, left_count, right_count))
+    return rtn_data
+
+
 def run_filter_stats(db_fn, fn, min_len):
     try:
         cmd = "LA4Falcon -mo {} {}".format(db_fn, fn)
         reader = Reader(cmd)
         with reader:
-            return fn, filter_stats(reader.readlines, min_len)
+            return fn, filter_stats_chunks(reader.readchunks(), min_len)
     except Exception:
         stack = traceback.format_exc()
         io.LOG(stack)
@@ -102,9 +117,6 @@ def ovlp_stats(db_fn, fofn, min_len, n_core, stream, debug, silent):
         silent = False
     if silent:
         io.LOG = io.write_nothing
-    if stream:
-        global Reader
-        Reader = io.StreamedProcessReaderContext
     try_run_ovlp_stats(n_core, db_fn, fofn, min_len)
 
 
@@ -124,7 +136,7 @@ def parse_args(argv):
     parser.add_argument('--db-fn', default='./1-preads_ovl/preads.db',
                         help="DAZZLER DB of preads")
     parser.add_argument('--stream', action='store_true',
-                        help='stream from LA4Falcon, instead of slurping all at once; can save memory for large data')
+                        help='ignored; LA4Falcon output is always read in chunks now')
     parser.add_argument('--debug', '-g', action='store_true',
                         help="single-threaded, plus other aids to debugging")
     parser.add_argument('--silent', action='store_true',
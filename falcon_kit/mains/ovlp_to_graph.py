@@ -1,5 +1,6 @@
-import networkx as nx
 import argparse
+import builtins
+import hashlib
 import logging
 import os
 import random
@@ -8,6 +9,10 @@ import shlex
 import subprocess
 import sys
 
+from ..multiproc import Pool
+from ..string_graph import (StringGraph, MultiDigraph, FUZZ)
+from ..string_graph import load as load_string_graph
+
 # Makes chimer_nodes stable; maybe others.
 from ..util.ordered_set import OrderedSet as set
 
@@ -23,37 +28,6 @@ if PYTHONHASHSEED:
 LOG = logging.getLogger(__name__)
 
 
-class SGNode(object):
-    """
-    class representing a node in the string graph
-    """
-
-    def __init__(self, node_name):
-        self.name = node_name
-        self.out_edges = []
-        self.in_edges = []
-
-    def add_out_edge(self, out_edge):
-        self.out_edges.append(out_edge)
-
-    def add_in_edge(self, in_edge):
-        self.in_edges.append(in_edge)
-
-
-class SGEdge(object):
-    """
-    class representing an edge in the string graph
-    """
-
-    def __init__(self, in_node, out_node):
-        self.in_node = in_node
-        self.out_node = out_node
-        self.attr = {}
-
-    def set_attribute(self, attr, value):
-        self.attr[attr] = value
-
-
 def reverse_end(node_name):
     if (node_name == 'NA'):
         return node_name
@@ -65,353 +39,6 @@ def reverse_end(node_name):
     return node_id + ":" + new_end
 
 
-class StringGraph(object):
-    """
-    class representing the string graph
-    """
-
-    def __init__(self):
-        self.nodes = {}
-        self.edges = {}
-        self.e_reduce = {}
-        self.best_in = {}
-
-    def add_node(self, node_name):
-        """
-        add a node into the graph by given a node name
-        """
-        if node_name not in self.nodes:
-            self.nodes[node_name] = SGNode(node_name)
-
-    def add_edge(self, in_node_name, out_node_name, **attributes):
-        """
-        add an edge into the graph by given a pair of nodes
-        """
-        if (in_node_name, out_node_name) not in self.edges:
-
-            self.add_node(in_node_name)
-            self.add_node(out_node_name)
-            in_node = self.nodes[in_node_name]
-            out_node = self.nodes[out_node_name]
-
-            edge = SGEdge(in_node, out_node)
-            self.edges[(in_node_name, out_node_name)] = edge
-            in_node.add_out_edge(edge)
-            out_node.add_in_edge(edge)
-        edge = self.edges[(in_node_name, out_node_name)]
-        for (k, v) in attributes.items():
-            edge.attr[k] = v
-
-    def init_reduce_dict(self):
-        for e in self.edges:
-            self.e_reduce[e] = False
-
-    def bfs_nodes(self, n, exclude=None, depth=5):
-        all_nodes = set()
-        all_nodes.add(n)
-        candidate_nodes = set()
-        candidate_nodes.add(n)
-        dp = 1
-        while dp < depth and len(candidate_nodes) > 0:
-            v = candidate_nodes.pop()
-            for e in v.out_edges:
-                w = e.out_node
-                if w == exclude:
-                    continue
-                if w not in all_nodes:
-                    all_nodes.add(w)
-                    if len(w.out_edges) > 0:
-                        candidate_nodes.add(w)
-            dp += 1
-
-        return all_nodes
-
-    def mark_chimer_edges(self):
-
-        multi_in_nodes = {}
-        multi_out_nodes = {}
-        for n_name in self.nodes:
-            n = self.nodes[n_name]
-            out_nodes = [e.out_node for e in n.out_edges if self.e_reduce[(
-                e.in_node.name, e.out_node.name)] == False]
-            in_nodes = [e.in_node for e in n.in_edges if self.e_reduce[(
-                e.in_node.name, e.out_node.name)] == False]
-
-            if len(out_nodes) >= 2:
-                multi_out_nodes[n_name] = out_nodes
-            if len(in_nodes) >= 2:
-                multi_in_nodes[n_name] = in_nodes
-
-        chimer_candidates = set()
-        out_set = set()
-        in_set = set()
-        for n_name in multi_out_nodes:
-            out_nodes = set(multi_out_nodes[n_name])
-            out_set |= out_nodes
-
-        for n_name in multi_in_nodes:
-            in_nodes = set(multi_in_nodes[n_name])
-            in_set |= in_nodes
-
-        chimer_candidates = out_set & in_set
-
-        chimer_nodes = []
-        chimer_edges = set()
-        for n in chimer_candidates: # sort, or OrderedSet
-            out_nodes = set([e.out_node for e in n.out_edges])
-            test_set = set()
-            for in_node in [e.in_node for e in n.in_edges]:
-                test_set = test_set | set(
-                    [e.out_node for e in in_node.out_edges])
-            test_set -= set([n])
-            if len(out_nodes & test_set) == 0:
-                flow_node1 = set()
-                flow_node2 = set()
-                for v in list(out_nodes):
-                    flow_node1 |= self.bfs_nodes(v, exclude=n)
-                for v in list(test_set):
-                    flow_node2 |= self.bfs_nodes(v, exclude=n)
-                if len(flow_node1 & flow_node2) == 0:
-                    for e in n.out_edges:
-                        v, w = e.in_node.name, e.out_node.name
-                        if self.e_reduce[(v, w)] != True:
-                            self.e_reduce[(v, w)] = True
-                            chimer_edges.add((v, w))
-                            rv = reverse_end(w)
-                            rw = reverse_end(v)
-                            self.e_reduce[(rv, rw)] = True
-                            chimer_edges.add((rv, rw))
-
-                    for e in n.in_edges:
-                        v, w = e.in_node.name, e.out_node.name
-                        if self.e_reduce[(v, w)] != True:
-                            self.e_reduce[(v, w)] = True
-                            chimer_edges.add((v, w))
-                            rv = reverse_end(w)
-                            rw = reverse_end(v)
-                            self.e_reduce[(rv, rw)] = True
-                            chimer_edges.add((rv, rw))
-                    chimer_nodes.append(n.name)
-                    chimer_nodes.append(reverse_end(n.name))
-
-        return chimer_nodes, chimer_edges
-
-    def mark_spur_edge(self):
-
-        removed_edges = set()
-        for v in self.nodes:
-            if len([e for e in self.nodes[v].out_edges if self.e_reduce[(e.in_node.name, e.out_node.name)] != True]) > 1:
-                for out_edge in self.nodes[v].out_edges:
-                    w = out_edge.out_node.name
-
-                    if len(self.nodes[w].out_edges) == 0 and self.e_reduce[(v, w)] != True:
-                        self.e_reduce[(v, w)] = True
-                        removed_edges.add((v, w))
-                        v2, w2 = reverse_end(w), reverse_end(v)
-                        self.e_reduce[(v2, w2)] = True
-                        removed_edges.add((v2, w2))
-
-            if len([e for e in self.nodes[v].in_edges if self.e_reduce[(e.in_node.name, e.out_node.name)] != True]) > 1:
-                for in_edge in self.nodes[v].in_edges:
-                    w = in_edge.in_node.name
-                    if len(self.nodes[w].in_edges) == 0 and self.e_reduce[(w, v)] != True:
-                        self.e_reduce[(w, v)] = True
-                        removed_edges.add((w, v))
-                        v2, w2 = reverse_end(w), reverse_end(v)
-                        self.e_reduce[(w2, v2)] = True
-                        removed_edges.add((w2, v2))
-        return removed_edges
-
-    def mark_tr_edges(self):
-        """
-        transitive reduction
-        """
-        n_mark = {}
-        e_reduce = self.e_reduce
-        FUZZ = 500
-        for n in self.nodes:
-            n_mark[n] = "vacant"
-
-        for (n_name, node) in self.nodes.items():
-
-            out_edges = node.out_edges
-            if len(out_edges) == 0:
-                continue
-
-            out_edges.sort(key=lambda x: x.attr["length"])
-
-            for e in out_edges:
-                w = e.out_node
-                n_mark[w.name] = "inplay"
-
-            max_len = out_edges[-1].attr["length"]
-
-            max_len += FUZZ
-
-            for e in out_edges:
-                e_len = e.attr["length"]
-                w = e.out_node
-                if n_mark[w.name] == "inplay":
-                    w.out_edges.sort(key=lambda x: x.attr["length"])
-                    for e2 in w.out_edges:
-                        if e2.attr["length"] + e_len < max_len:
-                            x = e2.out_node
-                            if n_mark[x.name] == "inplay":
-                                n_mark[x.name] = "eliminated"
-
-            for e in out_edges:
-                e_len = e.attr["length"]
-                w = e.out_node
-                w.out_edges.sort(key=lambda x: x.attr["length"])
-                if len(w.out_edges) > 0:
-                    x = w.out_edges[0].out_node
-                    if n_mark[x.name] == "inplay":
-                        n_mark[x.name] = "eliminated"
-                for e2 in w.out_edges:
-                    if e2.attr["length"] < FUZZ:
-                        x = e2.out_node
-                        if n_mark[x.name] == "inplay":
-                            n_mark[x.name] = "eliminated"
-
-            for out_edge in out_edges:
-                v = out_edge.in_node
-                w = out_edge.out_node
-                if n_mark[w.name] == "eliminated":
-                    e_reduce[(v.name, w.name)] = True
-                    v_name, w_name = reverse_end(w.name), reverse_end(v.name)
-                    e_reduce[(v_name, w_name)] = True
-                n_mark[w.name] = "vacant"
-
-    def mark_best_overlap(self):
-        """
-        find the best overlapped edges
-        """
-
-        best_edges = set()
-        removed_edges = set()
-
-        for v in self.nodes:
-
-            out_edges = self.nodes[v].out_edges
-            if len(out_edges) > 0:
-                out_edges.sort(key=lambda e: -e.attr["score"])
-                for e in out_edges:
-                    if self.e_reduce[(e.in_node.name, e.out_node.name)] != True:
-                        best_edges.add((e.in_node.name, e.out_node.name))
-                        break
-
-            in_edges = self.nodes[v].in_edges
-            if len(in_edges) > 0:
-                in_edges.sort(key=lambda e: -e.attr["score"])
-                for e in in_edges:
-                    if self.e_reduce[(e.in_node.name, e.out_node.name)] != True:
-                        best_edges.add((e.in_node.name, e.out_node.name))
-                        self.best_in[v] = e.in_node.name
-                        break
-
-        LOG.debug(f"X {len(best_edges)}")
-
-        for (e_n, e) in self.edges.items():
-            v = e_n[0]
-            w = e_n[1]
-            if self.e_reduce[(v, w)] != True:
-                if (v, w) not in best_edges:
-                    self.e_reduce[(v, w)] = True
-                    removed_edges.add((v, w))
-                    v2, w2 = reverse_end(w), reverse_end(v)
-                    self.e_reduce[(v2, w2)] = True
-                    removed_edges.add((v2, w2))
-
-        return removed_edges
-
-    def resolve_repeat_edges(self):
-
-        edges_to_reduce = []
-        nodes_to_test = set()
-        for (v_n, v) in self.nodes.items():
-
-            out_nodes = []
-            for e in v.out_edges:
-                if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                    out_nodes.append(e.out_node.name)
-
-            in_nodes = []
-            for e in v.in_edges:
-                if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                    in_nodes.append(e.in_node.name)
-
-            if len(out_nodes) == 1 and len(in_nodes) == 1:
-                nodes_to_test.add(v_n)
-
-        for v_n in list(nodes_to_test):
-
-            v = self.nodes[v_n]
-
-            out_nodes = []
-            for e in v.out_edges:
-                if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                    out_nodes.append(e.out_node.name)
-
-            in_nodes = []
-            for e in v.in_edges:
-                if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                    in_nodes.append(e.in_node.name)
-
-            in_node_name = in_nodes[0]
-
-            for out_edge in self.nodes[in_node_name].out_edges:
-                vv = out_edge.in_node.name
-                ww = out_edge.out_node.name
-
-                ww_out = self.nodes[ww].out_edges
-                v_out = self.nodes[v_n].out_edges
-                ww_out_nodes = set([n.out_node.name for n in ww_out])
-                v_out_nodes = set([n.out_node.name for n in v_out])
-                o_overlap = len(ww_out_nodes & v_out_nodes)
-
-                ww_in_count = 0
-                for e in self.nodes[ww].in_edges:
-                    if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                        ww_in_count += 1
-
-                if ww != v_n and\
-                   self.e_reduce[(vv, ww)] == False and\
-                   ww_in_count > 1 and\
-                   ww not in nodes_to_test and\
-                   o_overlap == 0:
-                    edges_to_reduce.append((vv, ww))
-
-            out_node_name = out_nodes[0]
-
-            for in_edge in self.nodes[out_node_name].in_edges:
-                vv = in_edge.in_node.name
-                ww = in_edge.out_node.name
-
-                vv_in = self.nodes[vv].in_edges
-                v_in = self.nodes[v_n].in_edges
-                vv_in_nodes = set([n.in_node.name for n in vv_in])
-                v_in_nodes = set([n.in_node.name for n in v_in])
-                i_overlap = len(vv_in_nodes & v_in_nodes)
-
-                vv_out_count = 0
-                for e in self.nodes[vv].out_edges:
-                    if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                        vv_out_count += 1
-
-                if vv != v_n and\
-                   self.e_reduce[(vv, ww)] == False and\
-                   vv_out_count > 1 and\
-                   vv not in nodes_to_test and\
-                   i_overlap == 0:
-                    edges_to_reduce.append((vv, ww))
-
-        removed_edges = set()
-        for e in edges_to_reduce:
-            self.e_reduce[e] = True
-            removed_edges.add(e)
-
-        return removed_edges
-
 def reverse_edge(e):
     e1, e2 = e
     return reverse_end(e2), reverse_end(e1)
@@ -422,13 +49,13 @@ def reverse_path(p):
     return [reverse_end(n) for n in p]
 
 
-def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_cutoff, no_out_edge_printed):
+def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_cutoff, no_out_edge_nodes):
 
     tips = set()
     bundle_edges = set()
     bundle_nodes = set()
 
-    local_graph = nx.ego_graph(ug, start_node, depth_cutoff, undirected=False)
+    local_graph = ug.ego_graph(start_node, depth_cutoff)
     length_to_node = {start_node: 0}
     score_to_node = {start_node: 0}
 
@@ -511,9 +138,7 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
             LOG.debug(f"process {v}")
 
             if len(local_graph.out_edges(v, keys=True)) == 0:  # dead end route
-                if v not in no_out_edge_printed:
-                    print("no out edge", v)
-                    no_out_edge_printed.add(v)
+                no_out_edge_nodes.add(v)
                 continue
 
             max_score_edge = None
@@ -604,17 +229,18 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
     LOG.debug(f"{converage} {data} {data_r}")
     return converage, data, data_r
 
-def init_string_graph(overlap_data):
+def init_string_graph(overlap_data, n_thread=1):
     sg = StringGraph()
 
-    overlap_set = set()
+    # Only membership matters, so a plain set (of read pairs, as ints) will do.
+    overlap_set = builtins.set()
     for od in overlap_data:
         f_id, g_id, score, identity = od[:4]
         f_s, f_b, f_e, f_l = od[4:8]
         g_s, g_b, g_e, g_l = od[8:12]
-        overlap_pair = [f_id, g_id]
-        overlap_pair.sort()
-        overlap_pair = tuple(overlap_pair)
+        f_B, f_E = sg.get_node(f_id, 'B'), sg.get_node(f_id, 'E')
+        g_B, g_E = sg.get_node(g_id, 'B'), sg.get_node(g_id, 'E')
+        overlap_pair = (min(f_B, g_B) << 32) | max(f_B, g_B)
         if overlap_pair in overlap_set:  # don't allow duplicated records
             continue
         else:
@@ -634,14 +260,8 @@ def init_string_graph(overlap_data):
                 """
                 if f_b == 0 or g_e - g_l == 0:
                     continue
-                sg.add_edge("%s:B" % g_id, "%s:B" % f_id, label="%s:%d-%d"%(f_id, f_b, 0),
-                            length=abs(f_b - 0),
-                            score=-score,
-                            identity=identity)
-                sg.add_edge("%s:E" % f_id, "%s:E" % g_id, label="%s:%d-%d"%(g_id, g_e, g_l),
-                            length=abs(g_e - g_l),
-                            score=-score,
-                            identity=identity)
+                sg.add_edge(g_B, f_B, f_b, 0, -score, identity)
+                sg.add_edge(f_E, g_E, g_e, g_l, -score, identity)
             else:
                 """
                      f.B         f.E
@@ -651,14 +271,8 @@ def init_string_graph(overlap_data):
                 """
                 if f_b == 0 or g_e == 0:
                     continue
-                sg.add_edge("%s:E" % g_id, "%s:B" % f_id, label="%s:%d-%d"%(f_id, f_b, 0),
-                            length=abs(f_b - 0),
-                            score=-score,
-                            identity=identity)
-                sg.add_edge("%s:E" % f_id, "%s:B" % g_id, label="%s:%d-%d"%(g_id, g_e, 0),
-                            length=abs(g_e - 0),
-                            score=-score,
-                            identity=identity)
+                sg.add_edge(g_E, f_B, f_b, 0, -score, identity)
+                sg.add_edge(f_E, g_B, g_e, 0, -score, identity)
         else:
             if g_b < g_e:
                 """
@@ -669,14 +283,8 @@ def init_string_graph(overlap_data):
                 """
                 if g_b == 0 or f_e - f_l == 0:
                     continue
-                sg.add_edge("%s:B" % f_id, "%s:B" % g_id, label="%s:%d-%d"%(g_id, g_b, 0),
-                            length=abs(g_b - 0),
-                            score=-score,
-                            identity=identity)
-                sg.add_edge("%s:E" % g_id, "%s:E" % f_id, label="%s:%d-%d"%(f_id, f_e, f_l),
-                            length=abs(f_e - f_l),
-                            score=-score,
-                            identity=identity)
+                sg.add_edge(f_B, g_B, g_b, 0, -score, identity)
+                sg.add_edge(g_E, f_E, f_e, f_l, -score, identity)
             else:
                 """
                                     f.B         f.E
@@ -686,66 +294,77 @@ def init_string_graph(overlap_data):
                 """
                 if g_b - g_l == 0 or f_e - f_l == 0:
                     continue
-                sg.add_edge("%s:B" % f_id, "%s:E" % g_id, label="%s:%d-%d"%(g_id, g_b, g_l),
-                            length=abs(g_b - g_l),
-                            score=-score,
-                            identity=identity)
-                sg.add_edge("%s:B" % g_id, "%s:E" % f_id, label="%s:%d-%d"%(f_id, f_e, f_l),
-                            length=abs(f_e - f_l),
-                            score=-score,
-                            identity=identity)
-
-    sg.init_reduce_dict()
-    sg.mark_tr_edges()  # mark those edges that transitive redundant
+                sg.add_edge(f_B, g_E, g_b, g_l, -score, identity)
+                sg.add_edge(g_B, f_E, f_e, f_l, -score, identity)
+
+    sg.build_index()
+    sg.mark_tr_edges(n_thread)  # mark those edges that transitive redundant
     return sg
 
-re_label = re.compile(r"(.*):(\d+)-(\d+)")
+def checkpoint_key(overlap_file):
+    """The key of the checkpoint of the string graph of overlap_file (see init_string_graph()):
+    a hash of its content, and of what else the reduced graph depends on.
+    """
+    h = hashlib.sha1('fuzz={}\n'.format(FUZZ).encode('ascii'))
+    with open(overlap_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_or_init_string_graph(overlap_file, checkpoint_fn, n_thread=1):
+    """The string graph of overlap_file, after transitive reduction,
+    from checkpoint_fn if it was saved there for the same overlaps; if not, build it
+    and save it there. No checkpoint if not checkpoint_fn.
+    """
+    if checkpoint_fn:
+        key = checkpoint_key(overlap_file)
+        sg = load_string_graph(checkpoint_fn, key)
+        if sg is not None:
+            LOG.info(f"Loaded the reduced string graph of {overlap_file!r} from {checkpoint_fn!r}")
+            return sg
+    sg = init_string_graph(yield_from_overlap_file(overlap_file), n_thread)
+    if checkpoint_fn:
+        sg.save(checkpoint_fn, key)
+        LOG.info(f"Saved the reduced string graph of {overlap_file!r} to {checkpoint_fn!r}")
+    return sg
 
 def init_digraph(sg, chimer_edges, removed_edges, spur_edges):
-    nxsg = nx.DiGraph()
+    best_in = {}
     edge_data = {}
+    e_reduce = sg.e_reduce
     with open("sg_edges_list", "w") as out_f:
-        for v, w in sg.edges: # sort, or OrderedDict
-            e = sg.edges[(v, w)]
-            label = e.attr["label"]
-            score = e.attr["score"]
-            identity = e.attr["identity"]
-            length = e.attr["length"]
-            try:
-                mo = re_label.search(label)
-                rid = mo.group(1)
-                sp = int(mo.group(2))
-                tp = int(mo.group(3))
-            except Exception:
-                msg = 'parsing label="{}"'.format(label)
-                LOG.exception(msg)
-                raise
-            assert length == abs(sp - tp)
-
-            if not sg.e_reduce[(v, w)]:
+        for e in range(len(e_reduce)):  # in the order added
+            v = sg.node_name(sg.src[e])
+            w = sg.node_name(sg.dst[e])
+            rid = sg.read_names[sg.dst[e] >> 1]
+            sp = sg.sp[e]
+            tp = sg.tp[e]
+            score = sg.score[e]
+            identity = sg.identity[e]
+            length = abs(sp - tp)
+
+            if not e_reduce[e]:
                 type_ = "G"
-            elif (v, w) in chimer_edges:
+            elif e in chimer_edges:
                 type_ = "C"
-            elif (v, w) in removed_edges:
+            elif e in removed_edges:
                 type_ = "R"
-            elif (v, w) in spur_edges:
+            elif e in spur_edges:
                 type_ = "S"
             else:
-                assert sg.e_reduce[(v, w)]
                 type_ = "TR"
 
-            if not sg.e_reduce[(v, w)]:
-                assert label == "%s:%d-%d" % (rid, sp, tp)
-                nxsg.add_edge(v, w, label=label, length=length, score=score)
+            if not e_reduce[e]:
+                label = "%s:%d-%d" % (rid, sp, tp)
                 edge_data[(v, w)] = (rid, sp, tp, length, score, identity, type_)
-                if w in sg.best_in:
-                    nxsg.nodes[w]["best_in"] = v
+                if sg.best_in[sg.dst[e]] >= 0:
+                    best_in[w] = v
 
             line = '%s %s %s %5d %5d %5d %5.2f %s' % (
                 v, w, rid, sp, tp, score, identity, type_)
             print(line, file=out_f)
 
-    return nxsg, edge_data
+    return best_in, edge_data
 
 
 def yield_from_overlap_file(overlap_file):
@@ -768,9 +387,9 @@ def yield_from_overlap_file(overlap_file):
                                 f_strand, f_start, f_end, f_len,
                                 g_strand, g_start, g_end, g_len)
 
-def generate_nx_string_graph(sg, lfc=False, disable_chimer_bridge_removal=False):
-    LOG.debug("{}".format(sum([1 for c in sg.e_reduce.values() if c])))
-    LOG.debug("{}".format(sum([1 for c in sg.e_reduce.values() if not c])))
+def generate_string_graph(sg, lfc=False, disable_chimer_bridge_removal=False):
+    LOG.debug("{}".format(sg.e_reduce.count(1)))
+    LOG.debug("{}".format(sg.e_reduce.count(0)))
 
     if not disable_chimer_bridge_removal:
         chimer_nodes, chimer_edges = sg.mark_chimer_edges()
@@ -793,10 +412,10 @@ def generate_nx_string_graph(sg, lfc=False, disable_chimer_bridge_removal=False)
 
     spur_edges.update(sg.mark_spur_edge())
 
-    LOG.debug('{}'.format(sum([1 for c in sg.e_reduce.values() if not c])))
+    LOG.debug('{}'.format(sg.e_reduce.count(0)))
 
-    nxsg, edge_data = init_digraph(sg, chimer_edges, removed_edges, spur_edges)
-    return nxsg, edge_data
+    best_in, edge_data = init_digraph(sg, chimer_edges, removed_edges, spur_edges)
+    return best_in, edge_data
 
 def identify_branch_nodes(ug):
 
@@ -809,18 +428,57 @@ def identify_branch_nodes(ug):
 
     return branch_nodes
 
-def construct_compound_paths_0(ug, u_edge_data, branch_nodes):
+# The unitig graph (ug, u_edge_data) of construct_compound_paths_0(), set before its pool forks,
+# so that the workers share it (copy-on-write) rather than each unpickling a copy.
+_bundle_graph = None
+
+
+def find_bundle_of(start_node):
+    """find_bundle() from start_node in _bundle_graph, in a form cheap to send back from a worker:
+    the data of the bundle as a tuple (bundle_edges as a list), or None if it did not converge,
+    and the dead-end nodes it met.
+    """
+    ug, u_edge_data = _bundle_graph
+    no_out_edge_nodes = set()
+    coverage, data, data_r = find_bundle(
+        ug, u_edge_data, start_node, 48, 16, 500000, no_out_edge_nodes)
+    if coverage == True:
+        start_node, end_node, bundle_edges, length, score, depth = data
+        data = start_node, end_node, list(bundle_edges), length, score, depth
+    else:
+        data = None
+    return data, list(no_out_edge_nodes)
+
+def construct_compound_paths_0(ug, u_edge_data, branch_nodes, n_core=0):
+    """Find the bundle from each branch node of ug, in a pool of n_core processes
+    (none if n_core is 0). Each search only reads the graph, and the results are
+    taken in the order of branch_nodes, so they do not depend on n_core.
+    """
+    global _bundle_graph
     no_out_edge_printed = set()
 
+    start_nodes = [p for p in list(branch_nodes) if ug.out_degree(p) > 1]
+    n_core = min(n_core, len(start_nodes))
+    _bundle_graph = ug, u_edge_data
+    exe_pool = Pool(n_core)
+    try:
+        chunksize = len(start_nodes) // (4 * n_core) + 1 if n_core else 1
+        results = list(exe_pool.imap(find_bundle_of, start_nodes, chunksize))
+    finally:
+        exe_pool.terminate()
+        _bundle_graph = None
+
     compound_paths_0 = []
-    for p in list(branch_nodes):
-        if ug.out_degree(p) > 1:
-            coverage, data, data_r = find_bundle(
-                ug, u_edge_data, p, 48, 16, 500000, no_out_edge_printed)
-            if coverage == True:
-                start_node, end_node, bundle_edges, length, score, depth = data
-                compound_paths_0.append(
-                    (start_node, "NA", end_node, 1.0 * len(bundle_edges) / depth, length, score, bundle_edges))
+    for data, no_out_edge_nodes in results:
+        for v in no_out_edge_nodes:
+            if v not in no_out_edge_printed:
+                print("no out edge", v)
+                no_out_edge_printed.add(v)
+        if data is not None:
+            start_node, end_node, bundle_edges, length, score, depth = data
+            bundle_edges = set(bundle_edges)
+            compound_paths_0.append(
+                (start_node, "NA", end_node, 1.0 * len(bundle_edges) / depth, length, score, bundle_edges))
 
     compound_paths_0.sort(key=lambda x: -len(x[6]))
     return compound_paths_0
@@ -904,11 +562,11 @@ def construct_compound_paths_3(ug, compound_paths_2, edge_to_cpath):
             LOG.debug(f"compound {k}")
     return compound_paths_3
 
-def construct_compound_paths(ug, u_edge_data):
+def construct_compound_paths(ug, u_edge_data, n_core=0):
 
     branch_nodes = identify_branch_nodes(ug)
 
-    compound_paths_0 = construct_compound_paths_0(ug, u_edge_data, branch_nodes)
+    compound_paths_0 = construct_compound_paths_0(ug, u_edge_data, branch_nodes, n_core)
     compound_paths_1 = construct_compound_paths_1(compound_paths_0)
     compound_paths_2, edge_to_cpath = construct_compound_paths_2(compound_paths_1)
     compound_paths_3 = construct_compound_paths_3(ug, compound_paths_2, edge_to_cpath)
@@ -1051,7 +709,7 @@ def identify_spurs(ug, u_edge_data, spur_len):
         n = s_candidates.pop()
         if ug2.in_degree(n) != 0:
             continue
-        n_ego_graph = nx.ego_graph(ug2, n, radius=10)
+        n_ego_graph = ug2.ego_graph(n, radius=10)
         n_ego_node_set = set(n_ego_graph.nodes())
         for b_node in n_ego_graph.nodes():
             if ug2.in_degree(b_node) <= 1:
@@ -1071,7 +729,7 @@ def identify_spurs(ug, u_edge_data, spur_len):
             if not with_extern_node:
                 continue
 
-            s_path = nx.shortest_path(ug2, n, b_node)
+            s_path = ug2.shortest_path(n, b_node)
             v1 = s_path[0]
             total_length = 0
             for v2 in s_path[1:]:
@@ -1137,7 +795,7 @@ def remove_dup_simple_path(ug, u_edge_data):
     return ug2
 
 
-def construct_c_path_from_utgs(ug, u_edge_data, sg):
+def construct_c_path_from_utgs(ug, u_edge_data, best_in):
     # Side-effects: None, I think.
 
     s_nodes = set()
@@ -1198,7 +856,7 @@ def construct_c_path_from_utgs(ug, u_edge_data, sg):
                 likelihood to be correct.)
                 """
                 if len(ug.in_edges(t, keys=True)) > 1:
-                    best_in_node = sg.nodes[t]["best_in"]
+                    best_in_node = best_in[t]
 
                     if type_ == "simple" and best_in_node != path_or_edges[-2]:
                         break
@@ -1337,7 +995,7 @@ def identify_short_edges_to_remove(ug2, u_edge_data):
     return edges_to_remove
 
 def init_sg2(edge_data):
-    sg2 = nx.DiGraph()
+    sg2 = MultiDigraph()
     for (v, w) in edge_data.keys():
         assert (reverse_end(w), reverse_end(v)) in edge_data
         # if (v, w) in masked_edges:
@@ -1345,8 +1003,7 @@ def init_sg2(edge_data):
         rid, sp, tp, length, score, identity, type_ = edge_data[(v, w)]
         if type_ != "G":
             continue
-        label = "%s:%d-%d" % (rid, sp, tp)
-        sg2.add_edge(v, w, label=label, length=length, score=score)
+        sg2.add_edge(v, w)
     return sg2
 
 def print_edge_data(u_edge_data):
@@ -1378,29 +1035,26 @@ def print_utg_data0(u_edge_data):
             print(s, v, t, type_, length, score, path_or_edges, file=f)
 
 def ovlp_to_graph(args):
-    overlap_data = yield_from_overlap_file(args.overlap_file)
-
     # transitivity reduction
-    sg = init_string_graph(overlap_data)
+    sg = load_or_init_string_graph(args.overlap_file, args.graph_checkpoint, args.n_thread)
 
     # remove spurs, remove putative edges caused by repeats
-    nxsg, edge_data = generate_nx_string_graph(sg, args.lfc, args.disable_chimer_bridge_removal)
-    del sg, overlap_data
+    best_in, edge_data = generate_string_graph(sg, args.lfc, args.disable_chimer_bridge_removal)
+    del sg
 
     #dual_path = {}
-    nxsg2 = init_sg2(edge_data)
+    sg2 = init_sg2(edge_data)
 
-    ug = nx.MultiDiGraph()
+    ug = MultiDigraph()
     u_edge_data = {}
     circular_path = set()
 
-    simple_paths = identify_simple_paths(nxsg2, edge_data)
+    simple_paths = identify_simple_paths(sg2, edge_data)
     for s, v, t in simple_paths:
         length, score, path = simple_paths[(s, v, t)]
         u_edge_data[(s, t, v)] = (length, score, path, "simple")
         if s != t:
-            ug.add_edge(s, t, key=v, type_="simple",
-                        via=v, length=length, score=score)
+            ug.add_edge(s, t, key=v)
         else:
             circular_path.add((s, t, v))
 
@@ -1411,7 +1065,7 @@ def ovlp_to_graph(args):
     ug2 = remove_dup_simple_path(ug2, u_edge_data)
 
     # phase 2, finding all "consistent" compound paths
-    compound_paths = construct_compound_paths(ug2, u_edge_data)
+    compound_paths = construct_compound_paths(ug2, u_edge_data, args.n_core)
     edges_to_remove = identify_edges_to_remove(compound_paths, ug2)
     for s, t, v in edges_to_remove:
         ug2.remove_edge(s, t, v)
@@ -1422,8 +1076,7 @@ def ovlp_to_graph(args):
     for s, v, t in compound_paths:
         width, length, score, bundle_edges = compound_paths[(s, v, t)]
         u_edge_data[(s, t, v)] = (length, score, bundle_edges, "compound")
-        ug2.add_edge(s, t, key=v, via=v, type_="compound",
-                     length=length, score=score)
+        ug2.add_edge(s, t, key=v)
 
         assert v == "NA"
         rs = reverse_end(t)
@@ -1450,7 +1103,7 @@ def ovlp_to_graph(args):
     print_edge_data(u_edge_data)
 
     # contig construction from utgs
-    c_path = construct_c_path_from_utgs(ug, u_edge_data, nxsg)
+    c_path = construct_c_path_from_utgs(ug, u_edge_data, best_in)
 
     # Sorting contig paths by length.
     c_path.sort(key=lambda x: -x[3])
@@ -1477,6 +1130,7 @@ Outputs:
     - chimer_nodes (if not --disable-chimer-bridge-removal)
     - utg_data
     - utg_data0 (maybe)
+    - sg_checkpoint (unless --graph-checkpoint='')
 """
     parser = argparse.ArgumentParser(
             description='example string graph assembler that is desinged for handling diploid genomes',
@@ -1512,6 +1166,16 @@ Outputs:
     parser.add_argument(
         '--ctg-prefix', default='',
         help='Prefix for contig names.')
+    parser.add_argument(
+        '--n-thread', type=int, default=1,
+        help='number of threads for the transitive reduction')
+    parser.add_argument(
+        '--n-core', type=int, default=0,
+        help='number of processes to find the bundles (compound paths) of the unitig graph; 0 for none')
+    parser.add_argument(
+        '--graph-checkpoint', default='sg_checkpoint',
+        help='binary file of the string graph after transitive reduction, keyed by a hash of the overlap file; '
+        'loaded, instead of reading the overlaps again, if it matches, otherwise written. "" for none')
 
     args = parser.parse_args(argv[1:])
     logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(msg)s')
@@ -2,6 +2,8 @@
 
 
 from falcon_kit.multiproc import Pool
+from falcon_kit import ovlp_reader
+from ctypes import c_long
 import falcon_kit.util.io as io
 import argparse
 import sys
@@ -9,7 +11,7 @@ import glob
 import os
 from heapq import heappush, heappop, heappushpop
 
-Reader = io.CapturedProcessReaderContext
+Reader = ovlp_reader.OvlpReaderContext
 
 
 def get_rid_to_ctg(fn):
@@ -27,7 +29,31 @@ def run_tr_stage1(db_fn, fn, min_len, bestn, rid_to_ctg):
     cmd = "LA4Falcon -m %s %s" % (db_fn, fn)
     reader = Reader(cmd)
     with reader:
-        return fn, tr_stage1(reader.readlines, min_len, bestn, rid_to_ctg)
+        return fn, tr_stage1_chunks(reader.readchunks(), min_len, bestn, rid_to_ctg)
+
+
+def tr_stage1_chunks(chunks, min_len, bestn, rid_to_ctg):
+    """Same as tr_stage1(), but for chunks from ovlp_reader.
+    The t_l and q_id filters run in C, so only the kept overlaps reach the heaps.
+    """
+    # Only ids as LA4Falcon prints them can match a q_id.
+    q_ids = ovlp_reader.get_sorted_ids(rid for rid in rid_to_ctg
+            if rid.isdigit() and rid == ovlp_reader.format_id(int(rid)))
+    rtn = {}
+    for chunk in chunks:
+        selected = (c_long * chunk.n)()
+        n_selected = ovlp_reader.ovlp.ovlp_select_by_q(chunk.records, chunk.n, min_len,
+                q_ids, len(q_ids), selected)
+        for i in selected[:n_selected]:
+            rec = chunk.records[i]
+            t_id = ovlp_reader.format_id(rec.t_id)
+            item = (-rec.score, ovlp_reader.format_id(rec.q_id))
+            rtn.setdefault(t_id, [])
+            if len(rtn[t_id]) < bestn:
+                heappush(rtn[t_id], item)
+            else:
+                heappushpop(rtn[t_id], item)
+    return rtn
 
 
 def tr_stage1(readlines, min_len, bestn, rid_to_ctg):
@@ -144,10 +170,6 @@ def track_reads(n_core, base_dir, min_len, bestn, debug, silent, stream):
         silent = False
     if silent:
         io.LOG = io.write_nothing
-    if stream:
-        global Reader
-        Reader = io.StreamedProcessReaderContext
-
     try_run_track_reads(n_core, base_dir, min_len, bestn)
 
 
@@ -168,7 +190,7 @@ to the contigs with read_to_contig_map generated by `fc_get_read_ctg_map` in `2-
     parser.add_argument('--min_len', type=int, default=2500,
                         help="min length of the reads")
     parser.add_argument('--stream', action='store_true',
-                        help='stream from LA4Falcon, instead of slurping all at once; can save memory for large data')
+                        help='ignored; LA4Falcon output is always read in chunks now')
     parser.add_argument('--debug', '-g', action='store_true',
                         help="single-threaded, plus other aids to debugging")
     parser.add_argument('--silent', action='store_true',
@@ -1,9 +1,21 @@
 """Job pools for multiprocessing.
 """
 
+import collections
 import multiprocessing
 
 
+class FakeAsyncResult(object):
+    """Fake version of multiprocessing.pool.AsyncResult
+    """
+
+    def get(self, timeout=None):
+        return self.value
+
+    def __init__(self, value):
+        self.value = value
+
+
 class FakePool(object):
     """Fake version of multiprocessing.Pool
     """
@@ -14,9 +26,18 @@ class FakePool(object):
     def imap(self, func, iterable, chunksize=None):
         return list(map(func, iterable))
 
+    def apply_async(self, func, args=(), kwds={}):
+        return FakeAsyncResult(func(*args, **kwds))
+
     def terminate(self):
         pass
 
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
     def __init__(self, initializer=None, initargs=[], *args, **kwds):
         if initializer:
             initializer(*initargs)
@@ -31,3 +52,20 @@ def Pool(processes, *args, **kwds):
         return multiprocessing.Pool(processes, *args, **kwds)
     else:
         return FakePool(*args, **kwds)
+
+
+def imap_bounded(pool, func, iterable, max_pending):
+    """Like pool.imap(func, iterable), with at most max_pending items in flight.
+    pool.imap() drains the iterable eagerly (in a feeder thread), so a large
+    input ends up entirely in memory. Here the next item is pulled only
+    once the oldest pending result has been yielded. Results are yielded
+    in input order.
+    """
+    assert max_pending > 0, max_pending
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
@@ -0,0 +1,189 @@
+"""Read LA4Falcon -m output as chunks of decoded overlaps.
+
+Each line is decoded in C (src/c/ovlp.c) into an OvlpRecord, and the
+filters of ovlp_filter, ovlp_stats and rr_ctg_track run over those
+arrays, so there is no Python object (or str.split()) per overlap.
+A chunk always ends where q_id changes, so all the overlaps of a read
+are in the same chunk.
+"""
+from ctypes import (Structure, POINTER, byref, c_char_p, c_double, c_int, c_long, sizeof)
+import array
+import mmap
+import os
+import shlex
+import subprocess as sp
+from falcon_kit import falcon as ovlp
+from .util import io
+
+CHUNK_SIZE = 4 * 2**20
+
+# See OVLP_* in common.h.
+OVLP_OVERLAP = 0
+OVLP_CONTAINS = 1
+OVLP_CONTAINED = 2
+OVLP_OTHER = 3
+
+
+class OvlpRecord(Structure):
+    _fields_ = [("q_id", c_int),
+                ("t_id", c_int),
+                ("score", c_int),
+                ("q_strand", c_int),
+                ("q_s", c_int),
+                ("q_e", c_int),
+                ("q_l", c_int),
+                ("t_strand", c_int),
+                ("t_s", c_int),
+                ("t_e", c_int),
+                ("t_l", c_int),
+                ("kind", c_int),
+                ("idt", c_double),
+                ("line_start", c_long),
+                ("line_len", c_long)]
+
+
+ovlp.parse_ovlps.argtypes = [c_char_p, c_long, POINTER(OvlpRecord), c_long, POINTER(c_long)]
+ovlp.parse_ovlps.restype = c_long
+ovlp.ovlp_last_group_start.argtypes = [POINTER(OvlpRecord), c_long]
+ovlp.ovlp_last_group_start.restype = c_long
+ovlp.ovlp_filter_stage1.argtypes = [
+    POINTER(OvlpRecord), c_long, c_int, c_int, c_int, c_int, c_double,
+    POINTER(c_int), POINTER(c_long), POINTER(c_int), POINTER(c_long)]
+ovlp.ovlp_filter_stage1.restype = None
+ovlp.ovlp_filter_stage2.argtypes = [
+    c_char_p, POINTER(OvlpRecord), c_long, c_int, c_double,
+    POINTER(c_int), c_long, POINTER(c_int), c_long, c_int, POINTER(c_long)]
+ovlp.ovlp_filter_stage2.restype = c_long
+ovlp.ovlp_stats.argtypes = [POINTER(OvlpRecord), c_long, c_int, POINTER(c_int)]
+ovlp.ovlp_stats.restype = c_long
+ovlp.ovlp_select_by_q.argtypes = [
+    POINTER(OvlpRecord), c_long, c_int, POINTER(c_int), c_long, POINTER(c_long)]
+ovlp.ovlp_select_by_q.restype = c_long
+
+
+def format_id(i):
+    """As LA4Falcon prints read ids.
+
+    >>> format_id(47)
+    '000000047'
+    """
+    return '%09d' % i
+
+
+def get_sorted_ids(ids):
+    """Return the ids (str or int) as a sorted c_int array, to pass to the filters.
+    """
+    ids = sorted(int(i) for i in ids)
+    return (c_int * len(ids))(*ids)
+
+
+def write_ids(fn, ids):
+    """Write the sorted ids (str or int) as native ints, for mmap_ids().
+    """
+    with open(fn, 'wb') as f:
+        array.array('i', sorted(int(i) for i in ids)).tofile(f)
+
+
+def mmap_ids(fn):
+    """Return the ids from write_ids() as a c_int array on a private mmap of fn,
+    so processes reading the same file share its pages.
+    """
+    size = os.path.getsize(fn)
+    if size == 0:
+        return (c_int * 0)()
+    with open(fn, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    return (c_int * (size // sizeof(c_int))).from_buffer(mm)
+
+
+class OvlpChunk(object):
+    """n overlaps, decoded from buf into records.
+    """
+    def line(self, i):
+        """Return the text of overlap i, with single spaces, like " ".join(line.split()).
+        """
+        rec = self.records[i]
+        return b' '.join(self.buf[rec.line_start:rec.line_start + rec.line_len].split()).decode('ascii')
+
+    def raw_line(self, i):
+        """Return overlap i as it was read, with its newline.
+        """
+        rec = self.records[i]
+        return self.buf[rec.line_start:rec.line_start + rec.line_len] + b'\n'
+
+    def __init__(self, buf, records, n):
+        self.buf = buf
+        self.records = records
+        self.n = n
+
+
+def parse_ovlps(buf):
+    """Decode all the complete lines of buf.
+    Return (records, n, consumed), where consumed is the length of those lines.
+    Raise ValueError on a malformed line.
+    """
+    max_n = len(buf) // 32 + 1  # A line has at least 13 tokens, 2 of them 9-digit ids.
+    records = (OvlpRecord * max_n)()
+    n = c_long()
+    consumed = ovlp.parse_ovlps(buf, len(buf), records, max_n, byref(n))
+    if consumed < 0:
+        start = -1 - consumed
+        end = buf.find(b'\n', start)
+        raise ValueError('Bad LA4Falcon -m line: {!r}'.format(buf[start:end]))
+    return records, n.value, consumed
+
+
+def yield_chunks(read, chunk_size=CHUNK_SIZE):
+    """Yield OvlpChunks from read(size) (e.g. a binary file's read method) until it returns b''.
+    A chunk grows past chunk_size only when the overlaps of one read need it.
+    """
+    carry = b''
+    size = chunk_size
+    while True:
+        data = read(size)
+        eof = not data
+        buf = carry + data
+        if eof:
+            if not buf:
+                return
+            if not buf.endswith(b'\n'):
+                buf += b'\n'
+        records, n, consumed = parse_ovlps(buf)
+        if not eof:
+            k = ovlp.ovlp_last_group_start(records, n)
+            if k == 0:
+                # Still within the first read; keep reading.
+                carry = buf
+                size *= 2
+                continue
+            carry = buf[records[k].line_start:]
+            n = k
+        size = chunk_size
+        yield OvlpChunk(buf, records, n)
+        if eof:
+            return
+
+
+def yield_chunks_from_lines(lines, chunk_size=CHUNK_SIZE):
+    """Like yield_chunks(), but from an iterable of text lines (e.g. for tests).
+    """
+    data = ''.join(line + '\n' for line in lines).encode('ascii')
+    pos = [0]
+
+    def read(size):
+        start = pos[0]
+        pos[0] += size
+        return data[start:start + size]
+    return yield_chunks(read, chunk_size)
+
+
+class OvlpReaderContext(io.ProcessReaderContext):
+    """Like io.StreamedProcessReaderContext, but
+    yields chunks of decoded overlaps (see yield_chunks()) instead of lines.
+    """
+    def readchunks(self, chunk_size=CHUNK_SIZE):
+        return yield_chunks(self.proc.stdout.read, chunk_size)
+
+    def __enter__(self):
+        io.LOG('{!r}'.format(self.cmd))
+        self.proc = sp.Popen(shlex.split(self.cmd), stdout=sp.PIPE)
@@ -0,0 +1,222 @@
+"""Look up the sequences of preads4falcon.fasta (or any FASTA) by name, or just
+slices of them, without reading all of them into memory.
+
+The FASTA is mapped (mmap), and found through a samtools-style index (.fai):
+for each read, its name, length, the offset of its sequence, and the bases
+and bytes per line. The index is written next to the FASTA the first time
+(or when the FASTA is newer, or the index does not fit it), and only read after that.
+So a stage holds just the index, and the sequences it asks for.
+
+A FASTA which cannot be mapped (gzipped, dexta, or '-') is read into memory,
+as before; so is one which cannot be indexed (lines of uneven lengths).
+"""
+import collections
+import logging
+import mmap
+import os
+import tempfile
+
+from .FastaReader import (open_fasta_reader, backwards_compat)
+
+LOG = logging.getLogger(__name__)
+
+RCMAP = dict(list(zip("ACGTacgtNn-", "TGCAtgcaNn-")))
+RC_TABLE = str.maketrans(RCMAP)
+
+# Where the sequence of a read is in the FASTA, as in a .fai line.
+FaiEntry = collections.namedtuple('FaiEntry', ['length', 'offset', 'line_bases', 'line_width'])
+
+
+def rc(seq):
+    return seq.translate(RC_TABLE)[::-1]
+
+
+def yield_fai_entries(mm, fn=None):
+    """Yield (name, FaiEntry) of each read of the FASTA in mm.
+    As samtools faidx, require the lines of a read to be of one length, but the last.
+    """
+    size = len(mm)
+    pos = 0
+    while pos < size and mm[pos:pos + 1].isspace():
+        pos += 1
+    while pos < size:
+        if mm[pos:pos + 1] != b'>':
+            raise ValueError('Invalid FASTA file {!r} at byte {}'.format(fn, pos))
+        eol = mm.find(b'\n', pos)
+        if eol < 0:
+            eol = size
+        name = (mm[pos + 1:eol].split(None, 1) or [b''])[0].decode('ascii')
+        offset = eol + 1
+        end = mm.find(b'\n>', eol)
+        end = size if end < 0 else end + 1
+        lines = mm[offset:end].split(b'\n')
+        while lines and not lines[-1].strip():
+            lines.pop()
+        length = line_bases = line_width = 0
+        if lines:
+            line_width = len(lines[0]) + 1
+            line_bases = len(lines[0].rstrip(b'\r'))
+            last = len(lines[-1].rstrip(b'\r'))
+            if last > line_bases or any(len(line) + 1 != line_width for line in lines[1:-1]):
+                raise ValueError('Lines of different lengths in read {!r} of {!r}'.format(name, fn))
+            length = line_bases * (len(lines) - 1) + last
+        yield name, FaiEntry(length, offset, line_bases, line_width)
+        pos = end
+
+
+def get_entry_end(e):
+    """Return the offset just past the last base of the read of FaiEntry e.
+    """
+    if not e.length:
+        return e.offset
+    return e.offset + (e.length - 1) // e.line_bases * e.line_width + (e.length - 1) % e.line_bases + 1
+
+
+def write_fai(fp_out, entries):
+    for (name, e) in entries:
+        fp_out.write('%s\t%d\t%d\t%d\t%d\n' % (name, e.length, e.offset, e.line_bases, e.line_width))
+
+
+def read_fai(fp_in):
+    index = {}
+    for line in fp_in:
+        name, length, offset, line_bases, line_width = line.split('\t')[:5]
+        index[name] = FaiEntry(int(length), int(offset), int(line_bases), int(line_width))
+    return index
+
+
+class PreadStore(object):
+    """
+    the reads of a FASTA, by name (up to the first whitespace), upper-cased,
+    read from the file only when asked for
+    """
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return self.index.keys()
+
+    def length(self, name):
+        return self.index[name].length
+
+    def get_seq(self, name, start=0, end=None):
+        """
+        return the sequence of the named read, or the slice [start:end] of it
+        """
+        seq = self._get_seq(name, start, end)
+        if seq is None:
+            LOG.warning('The index {!r} does not fit {!r} any more; indexing again'.format(self.index_fn, self.fn))
+            self.close()
+            self._map(self.fn, self.index_fn, reindex=True)
+            seq = self._get_seq(name, start, end)
+            if seq is None:
+                raise ValueError('{!r} changed while it was being read'.format(self.fn))
+        return seq
+
+    def _get_seq(self, name, start, end):
+        # None if the read is not where the index says (as when the FASTA was rewritten since).
+        e = self.index[name]
+        start, end, _ = slice(start, end).indices(e.length)
+        if end <= start:
+            return ''
+        if self.seqs is not None:
+            return self.seqs[name][start:end]
+        mm = self.mm or b''
+        begin = e.offset + start // e.line_bases * e.line_width + start % e.line_bases
+        last = e.offset + (end - 1) // e.line_bases * e.line_width + (end - 1) % e.line_bases
+        if last >= len(mm) or mm[e.offset - 1:e.offset] != b'\n':
+            return None
+        data = mm[begin:last + 1]
+        if e.line_width != e.line_bases:
+            data = data.replace(b'\n', b'').replace(b'\r', b'')
+        if len(data) != end - start or b'>' in data:
+            return None
+        return data.decode('ascii').upper()
+
+    def get_edge_seq(self, name, s, t):
+        """
+        return the sequence of a string graph edge on the named read: [s:t] if s < t,
+        otherwise the reverse complement of [t:s]
+        """
+        if s < t:
+            return self.get_seq(name, s, t)
+        return rc(self.get_seq(name, t, s))
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _load(self, fn):
+        # Into memory, for what cannot be mapped.
+        self.seqs = {}
+        with open_fasta_reader(fn) as f:
+            for r in f:
+                self.seqs[r.id] = r.sequence.upper()
+        self.index = dict((name, FaiEntry(len(seq), 0, len(seq), len(seq) + 1))
+                          for (name, seq) in self.seqs.items())
+
+    def _fits(self):
+        # Whether the index fits the FASTA: its reads all within it, and only
+        # whitespace (and not much) after the last one. (get_seq() checks each read it reads.)
+        mm = self.mm or b''
+        end = max((get_entry_end(e) for e in self.index.values()), default=0)
+        return end <= len(mm) and len(mm) - end <= 4096 and not mm[end:].strip()
+
+    def _map(self, fn, index_fn, reindex=False):
+        with open(fn, 'rb') as f:
+            # (An empty file cannot be mapped, but has no reads to look up either.)
+            if os.path.getsize(fn):
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if not reindex and os.path.exists(index_fn) and os.path.getmtime(index_fn) >= os.path.getmtime(fn):
+            with open(index_fn) as f:
+                self.index = read_fai(f)
+            if self._fits():
+                return
+            LOG.warning('The index {!r} does not fit {!r}; indexing again'.format(index_fn, fn))
+        LOG.info('Indexing {!r}'.format(fn))
+        try:
+            self.index = dict(yield_fai_entries(self.mm or b'', fn))
+        except ValueError as exc:
+            LOG.warning('Could not index {!r}, so reading it into memory: {}'.format(fn, exc))
+            self.close()
+            self._load(fn)
+            return
+        try:
+            # Through a temp file of our own, as another stage might be indexing the same FASTA.
+            fd, tmp_fn = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_fn)),
+                                          prefix=os.path.basename(index_fn) + '.')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    os.fchmod(f.fileno(), os.stat(fn).st_mode & 0o666)  # (mkstemp() makes it private.)
+                    write_fai(f, self.index.items())
+                os.rename(tmp_fn, index_fn)
+            except:
+                os.remove(tmp_fn)
+                raise
+        except OSError as exc:
+            LOG.warning('Could not write the index {!r} (so will index again next time): {}'.format(index_fn, exc))
+
+    def __init__(self, fn, index_fn=None):
+        """
+        fn: str - FASTA filename
+        index_fn: str - its .fai (by default, fn + '.fai')
+        """
+        self.mm = None
+        self.seqs = None
+        if fn == '-' or fn.endswith('.gz') or fn.endswith('.dexta'):
+            self._load(fn)
+        else:
+            self.fn = backwards_compat(fn)
+            self.index_fn = index_fn or self.fn + '.fai'
+            self._map(self.fn, self.index_fn)
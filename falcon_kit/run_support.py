@@ -371,6 +371,7 @@ def update_defaults(cfg):
     set_default('falcon_sense_skip_contained', False)
     set_default('falcon_sense_greedy', False)
     set_default('LA4Falcon_preload', '')
+    set_default('LA4Falcon_inprocess', False)
     set_default('fc_ovlp_to_graph_option', '')
     set_default('genome_size', 0)
     set_default('seed_coverage', 20)
@@ -380,7 +381,7 @@ def update_defaults(cfg):
     set_default('target', 'assembly')
     set_default(TEXT_FILE_BUSY, bash.BUG_avoid_Text_file_busy)
 
-    for bool_key in ('skip_checks', 'dazcon', 'falcon_sense_skip_contained', 'falcon_sense_greedy', 'LA4Falcon_preload', TEXT_FILE_BUSY):
+    for bool_key in ('skip_checks', 'dazcon', 'falcon_sense_skip_contained', 'falcon_sense_greedy', 'LA4Falcon_preload', 'LA4Falcon_inprocess', TEXT_FILE_BUSY):
         cfg[bool_key] = functional.cfg_tobool(cfg.get(bool_key, False))
 
     if 'dust' in cfg:
@@ -474,6 +475,7 @@ def check_unexpected_keys(cfg):
         'falcon_sense_skip_contained',
         'falcon_sense_greedy',
         'LA4Falcon_preload',
+        'LA4Falcon_inprocess',
         'LA4Falcon_pre', # hidden
         'LA4Falcon_post', # hidden
         'LA4Falcon_dbdir', # hidden
@@ -0,0 +1,577 @@
+"""The string graph of ovlp_to_graph, in flat arrays.
+
+Read names are interned to ints, and node n is end (n & 1) of read (n >> 1),
+B being 0 and E 1, so reverse_end() is n ^ 1. Edge e (in the order added)
+is src[e] -> dst[e], with parallel arrays of its label coordinates, score
+and identity, and its e_reduce flag in a bytearray. The edges of each node
+are in CSR form: out_eids[out_start[n]:out_start[n + 1]] are the out-edges
+of n, and in_eids[in_start[n]:in_start[n + 1]] its in-edges.
+
+The marking passes visit nodes (in the order they were first added) and
+edges in the same order as the former graph of SGNode/SGEdge objects did,
+including its in-place sorts of the edges of each node, so sg_edges_list
+and chimers_nodes come out the same. The sorts and the transitive
+reduction run in C (src/c/sgraph.c).
+
+StringGraph.save() and load() keep a graph, e.g. once reduced, in a binary
+checkpoint file, so that re-runs on the same overlaps need not rebuild it.
+
+MultiDigraph stands in for the networkx graphs of the unitig phase, and
+EgoGraph for networkx.ego_graph(), without copying the subgraph.
+"""
+from ctypes import (POINTER, c_int, c_long, c_ubyte)
+import array
+import json
+import operator
+import os
+import sys
+from falcon_kit import falcon as sgraph
+
+sgraph.sg_sort_edges.argtypes = [c_int, POINTER(c_int), POINTER(c_int), POINTER(c_int), c_int]
+sgraph.sg_sort_edges.restype = None
+sgraph.sg_mark_tr_edges.argtypes = [c_int, POINTER(c_int), POINTER(c_int), c_int,
+                                    POINTER(c_int), POINTER(c_int), POINTER(c_int), c_int,
+                                    POINTER(c_ubyte), c_int]
+sgraph.sg_mark_tr_edges.restype = c_long
+
+FUZZ = 500
+
+CHECKPOINT_VERSION = 1
+# What save() writes, as is; read_ids and node_added follow from read_names and nodes.
+CHECKPOINT_ARRAYS = ('nodes', 'src', 'dst', 'sp', 'tp', 'score', 'identity',
+                     'out_start', 'out_eids', 'in_start', 'in_eids', 'rev', 'best_in')
+
+
+def as_c(a):
+    """A ctypes array over the buffer of array or bytearray a (not a copy).
+    """
+    c_type = c_ubyte if isinstance(a, bytearray) else c_int
+    return (c_type * len(a)).from_buffer(a) if len(a) else (c_type * 1)()
+
+
+class StringGraph(object):
+    """
+    class representing the string graph
+    """
+
+    def get_node(self, read_name, end):
+        """
+        return the node of end 'B' or 'E' of the named read, interning the name
+        """
+        i = self.read_ids.get(read_name)
+        if i is None:
+            i = self.read_ids[read_name] = len(self.read_names)
+            self.read_names.append(read_name)
+            self.node_added.extend(b'\0\0')
+        return (i << 1) | (end == 'E')
+
+    def node_name(self, n):
+        return '%s:%s' % (self.read_names[n >> 1], 'E' if n & 1 else 'B')
+
+    def add_edge(self, v, w, sp, tp, score, identity):
+        """
+        add an edge v -> w, labeled "<read of w>:<sp>-<tp>", of length abs(sp - tp)
+        (until build_index(); a repeated edge keeps its place but takes the new values)
+        """
+        for n in (v, w):
+            if not self.node_added[n]:
+                self.node_added[n] = 1
+                self.nodes.append(n)
+        self.src.append(v)
+        self.dst.append(w)
+        self.sp.append(sp)
+        self.tp.append(tp)
+        self.score.append(score)
+        self.identity.append(identity)
+
+    def get_length(self, e):
+        return abs(self.sp[e] - self.tp[e])
+
+    def out_edges(self, n):
+        return self.out_eids[self.out_start[n]:self.out_start[n + 1]]
+
+    def in_edges(self, n):
+        return self.in_eids[self.in_start[n]:self.in_start[n + 1]]
+
+    def get_edge(self, v, w):
+        """
+        return the edge v -> w, or -1
+        """
+        dst = self.dst
+        for e in self.out_edges(v):
+            if dst[e] == w:
+                return e
+        return -1
+
+    def _group(self, keys):
+        # Counting sort of the edges by keys[e], keeping their order within a node.
+        start = array.array('i', bytes(4 * (2 * len(self.read_names) + 1)))
+        for n in keys:
+            start[n + 1] += 1
+        for n in range(1, len(start)):
+            start[n] += start[n - 1]
+        eids = array.array('i', bytes(4 * len(keys)))
+        pos = array.array('i', start)
+        for (e, n) in enumerate(keys):
+            eids[pos[n]] = e
+            pos[n] += 1
+        return start, eids
+
+    def _drop_repeated_edges(self):
+        # The first copy of an edge keeps its place and takes the values of the last.
+        dst = self.dst
+        keep = bytearray(b'\1' * len(dst))
+        for n in self.nodes:
+            seen = {}
+            for e in self.out_edges(n):
+                first = seen.setdefault(dst[e], e)
+                if first != e:
+                    keep[e] = 0
+                    for a in (self.sp, self.tp, self.score, self.identity):
+                        a[first] = a[e]
+        if all(keep):
+            return False
+        for name in ('src', 'dst', 'sp', 'tp', 'score', 'identity'):
+            old = getattr(self, name)
+            setattr(self, name, array.array(old.typecode, (x for (x, k) in zip(old, keep) if k)))
+        return True
+
+    def build_index(self):
+        """
+        group the edges by node, once all are added, and clear e_reduce
+        """
+        self.out_start, self.out_eids = self._group(self.src)
+        if self._drop_repeated_edges():
+            self.out_start, self.out_eids = self._group(self.src)
+        self.in_start, self.in_eids = self._group(self.dst)
+        n_edges = len(self.src)
+        self.e_reduce = bytearray(n_edges)
+        self.rev = array.array('i', (self.get_edge(self.dst[e] ^ 1, self.src[e] ^ 1) for e in range(n_edges)))
+        self.best_in = array.array('i', [-1]) * (2 * len(self.read_names))
+
+    def sort_edges(self, eids, start, key, descending=False):
+        """
+        sort the edges of each node by key[e] (an array('i')), keeping the order of equal keys
+        """
+        sgraph.sg_sort_edges(len(start) - 1, as_c(start), as_c(eids), as_c(key), int(descending))
+
+    def reduce_edge(self, e, marked):
+        """
+        mark edge e and its reverse (if any) as reduced, and add both to the set marked
+        """
+        self.e_reduce[e] = 1
+        marked.add(e)
+        r = self.rev[e]
+        if r >= 0:
+            self.e_reduce[r] = 1
+            marked.add(r)
+
+    def bfs_nodes(self, n, exclude=None, depth=5):
+        all_nodes = set([n])
+        candidate_nodes = [n]
+        dst = self.dst
+        out_start = self.out_start
+        dp = 1
+        while dp < depth and candidate_nodes:
+            v = candidate_nodes.pop()
+            for e in self.out_edges(v):
+                w = dst[e]
+                if w == exclude:
+                    continue
+                if w not in all_nodes:
+                    all_nodes.add(w)
+                    if out_start[w + 1] > out_start[w]:
+                        candidate_nodes.append(w)
+            dp += 1
+
+        return all_nodes
+
+    def mark_chimer_edges(self):
+        """
+        return the names of the nodes of chimeric reads, and the set of their edges,
+        which are marked as reduced
+        """
+        e_reduce = self.e_reduce
+        src = self.src
+        dst = self.dst
+        out_set = set()
+        in_list = []
+        in_seen = set()
+        for n in self.nodes:
+            out_nodes = [dst[e] for e in self.out_edges(n) if not e_reduce[e]]
+            in_nodes = [src[e] for e in self.in_edges(n) if not e_reduce[e]]
+            if len(out_nodes) >= 2:
+                out_set.update(out_nodes)
+            if len(in_nodes) >= 2:
+                for v in in_nodes:
+                    if v not in in_seen:
+                        in_seen.add(v)
+                        in_list.append(v)
+        chimer_candidates = [n for n in in_list if n in out_set]
+
+        chimer_nodes = []
+        chimer_edges = set()
+        for n in chimer_candidates:
+            out_nodes = set(dst[e] for e in self.out_edges(n))
+            test_set = set()
+            for e in self.in_edges(n):
+                test_set.update(dst[e2] for e2 in self.out_edges(src[e]))
+            test_set.discard(n)
+            if out_nodes & test_set:
+                continue
+            flow_node1 = set()
+            flow_node2 = set()
+            for v in out_nodes:
+                flow_node1 |= self.bfs_nodes(v, exclude=n)
+            for v in test_set:
+                flow_node2 |= self.bfs_nodes(v, exclude=n)
+            if flow_node1 & flow_node2:
+                continue
+            for e in self.out_edges(n):
+                if not e_reduce[e]:
+                    self.reduce_edge(e, chimer_edges)
+            for e in self.in_edges(n):
+                if not e_reduce[e]:
+                    self.reduce_edge(e, chimer_edges)
+            chimer_nodes.append(self.node_name(n))
+            chimer_nodes.append(self.node_name(n ^ 1))
+
+        return chimer_nodes, chimer_edges
+
+    def mark_spur_edge(self):
+        """
+        mark the edges to dead-end nodes, from nodes with other edges, as reduced
+        """
+        e_reduce = self.e_reduce
+        src = self.src
+        dst = self.dst
+        out_start = self.out_start
+        in_start = self.in_start
+        removed_edges = set()
+        for v in self.nodes:
+            out_edges = self.out_edges(v)
+            if sum(1 for e in out_edges if not e_reduce[e]) > 1:
+                for e in out_edges:
+                    w = dst[e]
+                    if out_start[w + 1] == out_start[w] and not e_reduce[e]:
+                        self.reduce_edge(e, removed_edges)
+
+            in_edges = self.in_edges(v)
+            if sum(1 for e in in_edges if not e_reduce[e]) > 1:
+                for e in in_edges:
+                    w = src[e]
+                    if in_start[w + 1] == in_start[w] and not e_reduce[e]:
+                        self.reduce_edge(e, removed_edges)
+        return removed_edges
+
+    def mark_tr_edges(self, n_threads=1):
+        """
+        transitive reduction, of the nodes split among n_threads threads
+        """
+        length = array.array('i', map(abs, map(operator.sub, self.sp, self.tp)))
+        self.sort_edges(self.out_eids, self.out_start, length)
+        n_eliminated = sgraph.sg_mark_tr_edges(
+            len(self.out_start) - 1, as_c(self.out_start), as_c(self.out_eids), len(self.src),
+            as_c(self.dst), as_c(length), as_c(self.rev), FUZZ, as_c(self.e_reduce), n_threads)
+        if n_eliminated < 0:
+            raise MemoryError('sg_mark_tr_edges() failed for {} edges'.format(len(self.src)))
+        return n_eliminated
+
+    def mark_best_overlap(self):
+        """
+        find the best overlapped edges
+        """
+        e_reduce = self.e_reduce
+        src = self.src
+        best_edges = bytearray(len(e_reduce))
+        removed_edges = set()
+
+        self.sort_edges(self.out_eids, self.out_start, self.score, descending=True)
+        self.sort_edges(self.in_eids, self.in_start, self.score, descending=True)
+
+        for v in self.nodes:
+            for e in self.out_edges(v):
+                if not e_reduce[e]:
+                    best_edges[e] = 1
+                    break
+
+            for e in self.in_edges(v):
+                if not e_reduce[e]:
+                    best_edges[e] = 1
+                    self.best_in[v] = src[e]
+                    break
+
+        for e in range(len(e_reduce)):
+            if not e_reduce[e] and not best_edges[e]:
+                self.reduce_edge(e, removed_edges)
+
+        return removed_edges
+
+    def resolve_repeat_edges(self):
+        e_reduce = self.e_reduce
+        src = self.src
+        dst = self.dst
+
+        def get_in_out(v):
+            in_nodes = [src[e] for e in self.in_edges(v) if not e_reduce[e]]
+            out_nodes = [dst[e] for e in self.out_edges(v) if not e_reduce[e]]
+            return in_nodes, out_nodes
+
+        nodes_to_test = []
+        for v in self.nodes:
+            in_nodes, out_nodes = get_in_out(v)
+            if len(out_nodes) == 1 and len(in_nodes) == 1:
+                nodes_to_test.append(v)
+        test_set = set(nodes_to_test)
+
+        edges_to_reduce = []
+        for v in nodes_to_test:
+            in_nodes, out_nodes = get_in_out(v)
+
+            v_out_nodes = set(dst[e] for e in self.out_edges(v))
+            for e in self.out_edges(in_nodes[0]):
+                ww = dst[e]
+                ww_out_nodes = set(dst[e2] for e2 in self.out_edges(ww))
+                ww_in_count = sum(1 for e2 in self.in_edges(ww) if not e_reduce[e2])
+                if ww != v and not e_reduce[e] and ww_in_count > 1 and \
+                        ww not in test_set and not (ww_out_nodes & v_out_nodes):
+                    edges_to_reduce.append(e)
+
+            v_in_nodes = set(src[e] for e in self.in_edges(v))
+            for e in self.in_edges(out_nodes[0]):
+                vv = src[e]
+                vv_in_nodes = set(src[e2] for e2 in self.in_edges(vv))
+                vv_out_count = sum(1 for e2 in self.out_edges(vv) if not e_reduce[e2])
+                if vv != v and not e_reduce[e] and vv_out_count > 1 and \
+                        vv not in test_set and not (vv_in_nodes & v_in_nodes):
+                    edges_to_reduce.append(e)
+
+        removed_edges = set()
+        for e in edges_to_reduce:
+            e_reduce[e] = 1
+            removed_edges.add(e)
+
+        return removed_edges
+
+    def save(self, fn, key):
+        """
+        write the graph (after build_index()) to fn, for load(fn, key)
+        """
+        names = '\n'.join(self.read_names).encode('utf-8')
+        header = dict(
+            version=CHECKPOINT_VERSION, key=key, byteorder=sys.byteorder,
+            read_names=len(names), e_reduce=len(self.e_reduce),
+            arrays=[(name, getattr(self, name).typecode, len(getattr(self, name))) for name in CHECKPOINT_ARRAYS])
+        tmp_fn = fn + '.tmp'
+        with open(tmp_fn, 'wb') as f:
+            f.write(json.dumps(header).encode('ascii') + b'\n')
+            f.write(names)
+            for name in CHECKPOINT_ARRAYS:
+                getattr(self, name).tofile(f)
+            f.write(self.e_reduce)
+        os.rename(tmp_fn, fn)
+
+    def __init__(self):
+        self.read_ids = {}
+        self.read_names = []
+        self.node_added = bytearray()
+        # Nodes, in the order they were first added.
+        self.nodes = array.array('i')
+        self.src = array.array('i')
+        self.dst = array.array('i')
+        self.sp = array.array('i')
+        self.tp = array.array('i')
+        self.score = array.array('i')
+        self.identity = array.array('d')
+
+
+def load(fn, key):
+    """
+    return the StringGraph which save() wrote to fn, or None if there is none,
+    or it was saved with another key (or by another version), or it is truncated or corrupt
+    """
+    if not os.path.exists(fn):
+        return None
+    with open(fn, 'rb') as f:
+        try:
+            header = json.loads(f.readline().decode('ascii'))
+            if not isinstance(header, dict) or header.get('version') != CHECKPOINT_VERSION or \
+                    header.get('key') != key or header.get('byteorder') != sys.byteorder:
+                return None
+            sg = StringGraph()
+            names = f.read(header['read_names']).decode('utf-8')
+            sg.read_names = names.split('\n') if names else []
+            sg.read_ids = dict((name, i) for (i, name) in enumerate(sg.read_names))
+            for (name, typecode, n) in header['arrays']:
+                a = array.array(typecode)
+                a.fromfile(f, n)
+                setattr(sg, name, a)
+            sg.e_reduce = bytearray(f.read(header['e_reduce']))
+            if len(sg.e_reduce) != header['e_reduce']:
+                raise EOFError('{!r} is truncated'.format(fn))
+        except (EOFError, KeyError, TypeError, ValueError):
+            return None
+    sg.node_added = bytearray(2 * len(sg.read_names))
+    for n in sg.nodes:
+        sg.node_added[n] = 1
+    return sg
+
+
+class MultiDigraph(object):
+    """
+    the parts of a networkx MultiDiGraph which ovlp_to_graph uses, in plain dicts:
+    succ[u][v] and pred[v][u] are the same dict, of the keys of the edges u -> v
+    (just None, for a simple digraph). Edges carry no attributes.
+    Nodes, neighbors and keys come out in the order networkx gives them, copy() included.
+    """
+
+    def add_node(self, n):
+        if n not in self.succ:
+            self.index[n] = len(self.index)
+            self.succ[n] = {}
+            self.pred[n] = {}
+
+    def add_edge(self, u, v, key=None):
+        self.add_node(u)
+        self.add_node(v)
+        keys = self.succ[u].get(v)
+        if keys is None:
+            keys = self.succ[u][v] = self.pred[v][u] = {}
+        keys[key] = None
+
+    def remove_edge(self, u, v, key=None):
+        """
+        raise KeyError if there is no such edge
+        """
+        keys = self.succ[u][v]
+        del keys[key]
+        if not keys:
+            del self.succ[u][v]
+            del self.pred[v][u]
+
+    def nodes(self):
+        return self.succ.keys()
+
+    def out_edges(self, n, keys=False):
+        if keys:
+            return [(n, v, k) for (v, ks) in self.succ[n].items() for k in ks]
+        return [(n, v) for (v, ks) in self.succ[n].items() for k in ks]
+
+    def in_edges(self, n, keys=False):
+        if keys:
+            return [(u, n, k) for (u, ks) in self.pred[n].items() for k in ks]
+        return [(u, n) for (u, ks) in self.pred[n].items() for k in ks]
+
+    def edges(self, keys=False):
+        return [e for n in self.succ for e in self.out_edges(n, keys)]
+
+    def out_degree(self, n):
+        return sum(len(ks) for ks in self.succ[n].values())
+
+    def in_degree(self, n):
+        return sum(len(ks) for ks in self.pred[n].values())
+
+    def copy(self):
+        g = MultiDigraph()
+        for n in self.succ:
+            g.add_node(n)
+        for (u, v, k) in self.edges(keys=True):
+            g.add_edge(u, v, k)
+        return g
+
+    def ego_graph(self, n, radius):
+        return EgoGraph(self, n, radius)
+
+    def shortest_path(self, source, target):
+        """
+        a shortest path from source to target, by the bidirectional BFS of networkx
+        (so the same one, of several); raise KeyError if there is none
+        """
+        if source == target:
+            return [source]
+        pred = {source: None}
+        succ = {target: None}
+        forward_fringe = [source]
+        reverse_fringe = [target]
+        w = None
+        while w is None and forward_fringe and reverse_fringe:
+            if len(forward_fringe) <= len(reverse_fringe):
+                this_level, forward_fringe = forward_fringe, []
+                for v in this_level:
+                    for x in self.succ[v]:
+                        if x not in pred:
+                            forward_fringe.append(x)
+                            pred[x] = v
+                        if x in succ:
+                            w = x
+                            break
+                    if w is not None:
+                        break
+            else:
+                this_level, reverse_fringe = reverse_fringe, []
+                for v in this_level:
+                    for x in self.pred[v]:
+                        if x not in succ:
+                            succ[x] = v
+                            reverse_fringe.append(x)
+                        if x in pred:
+                            w = x
+                            break
+                    if w is not None:
+                        break
+        if w is None:
+            raise KeyError('No path from {} to {}'.format(source, target))
+        path = []
+        while w is not None:
+            path.append(w)
+            w = pred[w]
+        path.reverse()
+        w = succ[path[-1]]
+        while w is not None:
+            path.append(w)
+            w = succ[w]
+        return path
+
+    def __init__(self):
+        # Nodes, in the order added.
+        self.index = {}
+        self.succ = {}
+        self.pred = {}
+
+
+class EgoGraph(object):
+    """
+    the nodes of graph within radius out-edges of n, and the edges among them,
+    as networkx.ego_graph() would copy them, but without the copy
+    """
+
+    def nodes(self):
+        return sorted(self.dist, key=self.graph.index.__getitem__)
+
+    def out_edges(self, n, keys=False):
+        dist = self.dist
+        return [e for e in self.graph.out_edges(n, keys) if e[1] in dist]
+
+    def in_edges(self, n, keys=False):
+        dist = self.dist
+        pred = self.graph.pred[n]
+        us = sorted((u for u in pred if u in dist), key=self.graph.index.__getitem__)
+        if keys:
+            return [(u, n, k) for u in us for k in pred[u]]
+        return [(u, n) for u in us for k in pred[u]]
+
+    def __init__(self, graph, n, radius):
+        self.graph = graph
+        # BFS, as networkx.single_source_shortest_path_length().
+        self.dist = {n: 0}
+        level = [n]
+        for d in range(1, radius + 1):
+            next_level = []
+            for v in level:
+                for w in graph.succ[v]:
+                    if w not in self.dist:
+                        self.dist[w] = d
+                        next_level.append(w)
+            if not next_level:
+                break
+            level = next_level
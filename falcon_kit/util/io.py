@@ -254,7 +254,8 @@ def yield_validated_fns(fofn):
         fns = deserialize(fofn)
     except:
         #LOG('las fofn {!r} does not seem to be JSON or msgpack; try to switch, so we can detect truncated files.'.format(fofn))
-        fns = open(fofn).read().strip().split()
+        with open(fofn) as ifs:
+            fns = ifs.read().strip().split()
     try:
         for fn in fns:
             assert fn
@@ -269,8 +270,8 @@ def yield_validated_fns(fofn):
 
 
 @contextlib.contextmanager
-def TemporaryDirectory():
-    name = tempfile.mkdtemp()
+def TemporaryDirectory(dir=None):
+    name = tempfile.mkdtemp(dir=dir)
     LOG('TemporaryDirectory={!r}'.format(name))
     try:
         yield name
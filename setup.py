@@ -31,16 +31,18 @@ setup(name='falcon_kit',
       author='Jason Chin',
       author_email='jchin@pacificbiosciences.com',
       packages=['falcon_kit',
+                'falcon_kit.bench',
                 'falcon_kit.mains',
                 'falcon_kit.testkit',
                 'falcon_kit.util',
                 ],
       package_dir={'falcon_kit': 'falcon_kit/'},
       ext_modules=[
-          Extension('ext_falcon', ['src/c/ext_falcon.c', 'src/c/DW_banded.c', 'src/c/kmer_lookup.c', 'src/c/falcon.c'],
-                    extra_link_args=[],
+          Extension('ext_falcon', ['src/c/ext_falcon.c', 'src/c/DW_banded.c', 'src/c/kmer_lookup.c', 'src/c/falcon.c', 'src/c/myers.c', 'src/c/ovlp.c', 'src/c/dazz.c', 'src/c/sgraph.c'],
+                    extra_link_args=['-pthread'],
                     extra_compile_args=['-fPIC', '-O3',
                                         '-std=c99',
+                                        '-pthread',
                                         '-fno-omit-frame-pointer'],
                     # '-fno-omit-frame-pointer' can help with gperftools.
                     # libraries=['profiler'],
@@ -54,6 +56,7 @@ setup(name='falcon_kit',
           'falcon-task=falcon_kit.mains.tasks:main',
           'fc_actg_coordinate=falcon_kit.mains.actg_coordinate:main',
           'fc_consensus=falcon_kit.mains.consensus:main',
+          'fc_consensus_profile=falcon_kit.mains.consensus_profile:main',
           'fc_contig_annotate=falcon_kit.mains.contig_annotate:main',
           'fc_ctg_link_analysis=falcon_kit.mains.ctg_link_analysis:main',
           'fc_dedup_a_tigs=falcon_kit.mains.dedup_a_tigs:main',
@@ -8,6 +8,11 @@
 #include <stdbool.h>
 #include "common.h"
 
+#if defined(__x86_64__) && (defined(__GNUC__) || defined(__clang__))
+#define ALIGN_HAVE_X86_SIMD 1
+#include <immintrin.h>
+#endif
+
 int compare_d_path(const void * a, const void * b)
 {
     const d_path_data2 * arg1 = a;
@@ -58,6 +63,161 @@ void* my_calloc(int nitems, size_t size, char const* msg, int lineno) {
     return result;
 }
 
+// How align() keeps its backtracing information; see set_align_traceback().
+static int align_traceback = ALIGN_TRACEBACK_COMPACT;
+
+void set_align_traceback(int traceback) {
+    align_traceback = traceback;
+}
+
+int get_align_traceback(void) {
+    return align_traceback;
+}
+
+// The "snake" of align(): how far do query_seq[x:] and target_seq[y:] match?
+// Each returns the x of the first mismatch (or of the end of either sequence).
+typedef seq_coor_t (*extend_match_fn)(const char *, seq_coor_t, seq_coor_t,
+                                      const char *, seq_coor_t, seq_coor_t);
+
+static seq_coor_t extend_match_scalar(const char * q, seq_coor_t x, seq_coor_t q_len,
+                                      const char * t, seq_coor_t y, seq_coor_t t_len) {
+    while ( x < q_len && y < t_len && q[x] == t[y] ){
+        x++;
+        y++;
+    }
+    return x;
+}
+
+#ifdef ALIGN_HAVE_X86_SIMD
+// SSE2 is part of x86_64, so this needs no runtime check.
+static seq_coor_t extend_match_sse2(const char * q, seq_coor_t x, seq_coor_t q_len,
+                                    const char * t, seq_coor_t y, seq_coor_t t_len) {
+    while ( x + 16 <= q_len && y + 16 <= t_len ) {
+        __m128i a = _mm_loadu_si128((const __m128i *) (q + x));
+        __m128i b = _mm_loadu_si128((const __m128i *) (t + y));
+        unsigned mask = (unsigned) _mm_movemask_epi8(_mm_cmpeq_epi8(a, b));
+        if (mask != 0xFFFF) {
+            return x + __builtin_ctz(~mask);
+        }
+        x += 16;
+        y += 16;
+    }
+    return extend_match_scalar(q, x, q_len, t, y, t_len);
+}
+
+__attribute__((target("avx2")))
+static seq_coor_t extend_match_avx2(const char * q, seq_coor_t x, seq_coor_t q_len,
+                                    const char * t, seq_coor_t y, seq_coor_t t_len) {
+    while ( x + 32 <= q_len && y + 32 <= t_len ) {
+        __m256i a = _mm256_loadu_si256((const __m256i *) (q + x));
+        __m256i b = _mm256_loadu_si256((const __m256i *) (t + y));
+        unsigned mask = (unsigned) _mm256_movemask_epi8(_mm256_cmpeq_epi8(a, b));
+        if (mask != 0xFFFFFFFFu) {
+            return x + __builtin_ctz(~mask);
+        }
+        x += 32;
+        y += 32;
+    }
+    return extend_match_sse2(q, x, q_len, t, y, t_len);
+}
+#endif
+
+static int align_simd = ALIGN_SIMD_NONE;
+static extend_match_fn extend_match = extend_match_scalar;
+
+int set_align_simd(int level) {
+#ifdef ALIGN_HAVE_X86_SIMD
+    __builtin_cpu_init();
+    if (level >= ALIGN_SIMD_AVX2 && __builtin_cpu_supports("avx2")) {
+        align_simd = ALIGN_SIMD_AVX2;
+        extend_match = extend_match_avx2;
+    } else if (level >= ALIGN_SIMD_SSE2) {
+        align_simd = ALIGN_SIMD_SSE2;
+        extend_match = extend_match_sse2;
+    } else {
+        align_simd = ALIGN_SIMD_NONE;
+        extend_match = extend_match_scalar;
+    }
+#else
+    align_simd = ALIGN_SIMD_NONE;
+    extend_match = extend_match_scalar;
+#endif
+    return align_simd;
+}
+
+int get_align_simd(void) {
+    return align_simd;
+}
+
+// Pick the best extension for this CPU when the library is loaded, before any thread aligns.
+__attribute__((constructor))
+static void init_align_simd(void) {
+    set_align_simd(ALIGN_SIMD_AVX2);
+}
+
+// Backtracing information kept by ALIGN_TRACEBACK_COMPACT: one cell per (d, k) visited.
+// Cells of one d are consecutive, in increasing k (by 2), so a cell is found directly
+// from the start of its row and the min_k of that row. y1 and y2 follow from x and k.
+typedef struct {
+    seq_coor_t x1;
+    seq_coor_t x2_pre;  // (x2 << 1) | (pre_k == k + 1)
+} d_path_cell;
+
+typedef struct {
+    d_path_cell * cells;
+    unsigned long n_cells;
+    unsigned long max_cells;
+    unsigned long * row_start;  // index of the first cell of each d
+    seq_coor_t * row_min_k;
+} d_path_rows;
+
+static void d_path_rows_init(d_path_rows * rows, seq_coor_t max_d, seq_coor_t band_size) {
+    rows->n_cells = 0;
+    rows->max_cells = 4 * (band_size + 1);
+    rows->cells = my_calloc(rows->max_cells, sizeof(d_path_cell), "rows->cells", __LINE__);
+    rows->row_start = my_calloc(max_d + 1, sizeof(unsigned long), "rows->row_start", __LINE__);
+    rows->row_min_k = my_calloc(max_d + 1, sizeof(seq_coor_t), "rows->row_min_k", __LINE__);
+}
+
+static void d_path_rows_free(d_path_rows * rows) {
+    free(rows->cells);
+    free(rows->row_start);
+    free(rows->row_min_k);
+}
+
+static void d_path_rows_add(d_path_rows * rows, seq_coor_t x1, seq_coor_t x2, seq_coor_t k, seq_coor_t pre_k) {
+    if (rows->n_cells == rows->max_cells) {
+        rows->max_cells *= 2;
+        rows->cells = (d_path_cell *) realloc(rows->cells, rows->max_cells * sizeof(d_path_cell));
+        if (NULL == rows->cells) {
+            fprintf(stderr, "CRITICAL ERROR: realloc(rows->cells, %lu cells) returned 0 at line %d.\n",
+                    rows->max_cells, __LINE__);
+            abort();
+        }
+    }
+    rows->cells[rows->n_cells].x1 = x1;
+    rows->cells[rows->n_cells].x2_pre = (x2 << 1) | (pre_k == k + 1);
+    rows->n_cells++;
+}
+
+static void d_path_rows_get(d_path_rows * rows, seq_coor_t d, seq_coor_t k, d_path_data2 * out) {
+    unsigned long idx;
+    d_path_cell * cell;
+    idx = rows->row_start[d] + (unsigned long) ((k - rows->row_min_k[d]) / 2);
+    if (k < rows->row_min_k[d] || idx >= rows->row_start[d + 1]) {
+        fprintf(stderr, "CRITICAL ERROR: no backtracing information for d=%d, k=%d.\n", d, k);
+        abort();
+    }
+    cell = rows->cells + idx;
+    out->d = d;
+    out->k = k;
+    out->x1 = cell->x1;
+    out->y1 = cell->x1 - k;
+    out->x2 = cell->x2_pre >> 1;
+    out->y2 = out->x2 - k;
+    out->pre_k = (cell->x2_pre & 1) ? k + 1 : k - 1;
+}
+
 alignment * align(char * query_seq, seq_coor_t q_len,
                   char * target_seq, seq_coor_t t_len,
                   seq_coor_t band_tolerance,
@@ -80,8 +240,11 @@ alignment * align(char * query_seq, seq_coor_t q_len,
     unsigned long d_path_idx = 0;
     unsigned long max_idx = 0;
 
-    d_path_data2 * d_path;
+    d_path_data2 * d_path = NULL;
     d_path_data2 * d_path_aux;
+    d_path_data2 d_path_tmp;
+    d_path_rows rows = {0};
+    int traceback = align_traceback;
     path_point * aln_path;
     seq_coor_t aln_path_idx;
     alignment * align_rtn;
@@ -101,13 +264,17 @@ alignment * align(char * query_seq, seq_coor_t q_len,
 
     k_offset = max_d;
 
-    if ((size_t)INT_MAX < ((size_t)max_d * (size_t)(band_size + 1) * 2ULL)) {
-        fprintf(stderr, "CRITICAL ERROR: q_len=%d and t_len=%d => max_d=%d, and band_size=%d. Those lens are too big.\n", q_len, t_len, max_d, band_size);
-        abort();
+    if (traceback == ALIGN_TRACEBACK_FULL) {
+        if ((size_t)INT_MAX < ((size_t)max_d * (size_t)(band_size + 1) * 2ULL)) {
+            fprintf(stderr, "CRITICAL ERROR: q_len=%d and t_len=%d => max_d=%d, and band_size=%d. Those lens are too big.\n", q_len, t_len, max_d, band_size);
+            abort();
+        }
+        // This O(MN) block allocation scheme is convient, but it is slow for very long sequences.
+        d_path = my_calloc(max_d * (band_size + 1 ) * 2 + 1, sizeof(d_path_data2), "d_path", __LINE__);
+    } else {
+        // Only the cells actually visited are stored, and only if we need to backtrace.
+        d_path_rows_init(&rows, max_d, band_size);
     }
-    // We should probably use hashmap to store the backtracing information to save memory allocation time
-    // This O(MN) block allocation scheme is convient for now but it is slower for very long sequences
-    d_path = my_calloc(max_d * (band_size + 1 ) * 2 + 1, sizeof(d_path_data2), "d_path", __LINE__);
 
     aln_path = my_calloc(q_len + t_len + 1, sizeof(path_point), "aln_path", __LINE__);
 
@@ -131,7 +298,12 @@ alignment * align(char * query_seq, seq_coor_t q_len,
             break;
         }
 
+        if (traceback != ALIGN_TRACEBACK_FULL) {
+            rows.row_start[d] = rows.n_cells;
+            rows.row_min_k[d] = min_k;
+        }
         for (k = min_k; k <= max_k;  k += 2) {
+            seq_coor_t x1;
 
             if ( (k == min_k) || ((k != max_k) && (V[ k - 1 + k_offset ] < V[ k + 1 + k_offset])) ) {
                 pre_k = k + 1;
@@ -141,19 +313,25 @@ alignment * align(char * query_seq, seq_coor_t q_len,
                 x = V[ k - 1 + k_offset] + 1;
             }
             y = x - k;
-            d_path[d_path_idx].d = d;
-            d_path[d_path_idx].k = k;
-            d_path[d_path_idx].x1 = x;
-            d_path[d_path_idx].y1 = y;
-
-            while ( x < q_len && y < t_len && query_seq[x] == target_seq[y] ){
-                x++;
-                y++;
+            x1 = x;
+
+            // Most snakes stop at the first base; only pay for the call when they do not.
+            if ( x < q_len && y < t_len && query_seq[x] == target_seq[y] ) {
+                x = extend_match(query_seq, x + 1, q_len, target_seq, y + 1, t_len);
+                y = x - k;
             }
 
-            d_path[d_path_idx].x2 = x;
-            d_path[d_path_idx].y2 = y;
-            d_path[d_path_idx].pre_k = pre_k;
+            if (traceback == ALIGN_TRACEBACK_FULL) {
+                d_path[d_path_idx].d = d;
+                d_path[d_path_idx].k = k;
+                d_path[d_path_idx].x1 = x1;
+                d_path[d_path_idx].y1 = x1 - k;
+                d_path[d_path_idx].x2 = x;
+                d_path[d_path_idx].y2 = y;
+                d_path[d_path_idx].pre_k = pre_k;
+            } else if (get_aln_str > 0) {
+                d_path_rows_add(&rows, x1, x, k, pre_k);
+            }
             d_path_idx ++;
 
             V[ k + k_offset ] = x;
@@ -203,15 +381,24 @@ alignment * align(char * query_seq, seq_coor_t q_len,
             align_rtn->aln_q_s = 0;
             align_rtn->aln_t_s = 0;
 
-            d_path_sort(d_path, max_idx);
-            //print_d_path(d_path, max_idx);
+            if (traceback == ALIGN_TRACEBACK_FULL) {
+                d_path_sort(d_path, max_idx);
+                //print_d_path(d_path, max_idx);
+            } else {
+                rows.row_start[d + 1] = rows.n_cells;
+            }
 
             if (get_aln_str > 0) {
                 cd = d;
                 ck = k;
                 aln_path_idx = 0;
                 while (cd >= 0 && aln_path_idx < q_len + t_len + 1) {
-                    d_path_aux = (d_path_data2 *) get_dpath_idx( cd, ck, max_idx, d_path);
+                    if (traceback == ALIGN_TRACEBACK_FULL) {
+                        d_path_aux = (d_path_data2 *) get_dpath_idx( cd, ck, max_idx, d_path);
+                    } else {
+                        d_path_rows_get(&rows, cd, ck, &d_path_tmp);
+                        d_path_aux = &d_path_tmp;
+                    }
                     aln_path[aln_path_idx].x = d_path_aux -> x2;
                     aln_path[aln_path_idx].y = d_path_aux -> y2;
                     aln_path_idx ++;
@@ -270,7 +457,11 @@ alignment * align(char * query_seq, seq_coor_t q_len,
 
     free(V);
     free(U);
-    free(d_path);
+    if (traceback == ALIGN_TRACEBACK_FULL) {
+        free(d_path);
+    } else {
+        d_path_rows_free(&rows);
+    }
     free(aln_path);
     return align_rtn;
 }
@@ -56,8 +56,21 @@ typedef struct {
     seq_coor_t count;
     seq_coor_t * query_pos;
     seq_coor_t * target_pos;
+    seq_coor_t size;  // allocated length of query_pos and target_pos
 } kmer_match;
 
+// The k-mers of one sequence (the seed), to query many reads against.
+// Rebuilding it for the next seed only resets the lookup entries in "used".
+typedef struct {
+    unsigned int K;
+    kmer_lookup * lk;
+    seq_addr_array sda;
+    seq_coor_t seq_len;
+    seq_coor_t seq_size;  // allocated length of sda and used
+    seq_coor_t * used;    // the k-mers present, i.e. the entries of lk in use
+    seq_coor_t n_used;
+} kmer_index;
+
 
 typedef struct {
     seq_coor_t s1;
@@ -68,9 +81,25 @@ typedef struct {
 } aln_range;
 
 
+// What generate_consensus_ws() (or generate_consensus_from_mapping_ws()) did
+// with the reads of one seed, and where its time went, for profiling.
+typedef struct {
+    unsigned int n_reads;        // in the pile-up, not counting the seed
+    unsigned int n_bad_range;    // not aligned: their k-mer range was too short, or too skewed
+    unsigned int n_cov_skipped;  // not aligned: the seed was covered enough there (see set_consensus_max_cov())
+    unsigned int n_aligned;
+    unsigned int n_low_idt;      // aligned, but too short or too different to use
+    unsigned int n_used;         // aligned, and added to the MSA
+    double kmer_s;               // indexing the seed and matching k-mers
+    double align_s;
+    double msa_s;                // adding the alignments to the MSA
+    double vote_s;               // finding the consensus in the MSA
+} consensus_stats;
+
 typedef struct {
     char * sequence;
     int * eqv;
+    consensus_stats stats;
 } consensus_data;
 
 kmer_lookup * allocate_kmer_lookup (seq_coor_t);
@@ -91,6 +120,11 @@ aln_range *  find_best_aln_range(kmer_match *,
                               seq_coor_t, 
                               seq_coor_t); 
 
+aln_range *  find_best_aln_range2(kmer_match *,
+                                  seq_coor_t,
+                                  seq_coor_t,
+                                  seq_coor_t);
+
 void free_aln_range( aln_range *);
 
 kmer_match * find_kmer_pos_for_seq( char *, 
@@ -114,13 +148,132 @@ void add_sequence ( seq_coor_t,
 
 void mask_k_mer(seq_coor_t, kmer_lookup *, seq_coor_t);
 
+kmer_index * allocate_kmer_index(unsigned int K);
+void free_kmer_index(kmer_index *);
+void build_kmer_index(kmer_index *, char *, seq_coor_t);
+void mask_kmer_index(kmer_index *, seq_coor_t);
+kmer_match * allocate_kmer_match(void);
+void find_kmer_pos_in_index(kmer_index *, char *, seq_coor_t, kmer_match *);
+
 alignment * align(char *, seq_coor_t,
                   char *, seq_coor_t,
                   seq_coor_t,
                   int); 
 
+// How align() stores its backtracing information. The alignments are identical.
+#define ALIGN_TRACEBACK_FULL 0     // max_d * band_size matrix up-front, sorted and searched
+#define ALIGN_TRACEBACK_COMPACT 1  // only the (d, k) visited, grown on demand (default)
+
+void set_align_traceback(int);
+int get_align_traceback(void);
+
+// How align() extends matches along a diagonal. Chosen from the CPU features when the
+// library is loaded; set_align_simd() caps it (e.g. for benchmarks) and returns the level used.
+#define ALIGN_SIMD_NONE 0  // one base at a time
+#define ALIGN_SIMD_SSE2 1  // 16 bases at a time (x86_64)
+#define ALIGN_SIMD_AVX2 2  // 32 bases at a time, if the CPU supports AVX2
+
+int set_align_simd(int);
+int get_align_simd(void);
+
+// Global alignment by Myers' bit-vector algorithm, within band_width rows of the
+// diagonal. Its dist counts a mismatch as an insertion plus a deletion, as align() does.
+alignment * align_myers(char *, seq_coor_t,
+                        char *, seq_coor_t,
+                        seq_coor_t);
+
 void free_alignment(alignment *);
 
 
 void free_consensus_data(consensus_data *);
 
+typedef struct consensus_workspace consensus_workspace;
+
+consensus_workspace * allocate_consensus_workspace(void);
+void free_consensus_workspace(consensus_workspace *);
+
+// Skip aligning reads to parts of the seed already covered by this many
+// accepted alignments (0, the default, to align every read).
+void set_consensus_max_cov(consensus_workspace *, unsigned int);
+// Which alignment generate_consensus_ws() builds the MSA from.
+#define CONSENSUS_ALIGNER_DW 0     // align(), the banded O(ND) alignment (default)
+#define CONSENSUS_ALIGNER_MYERS 1  // align_myers()
+void set_consensus_aligner(consensus_workspace *, int);
+// How many reads the workspace has aligned, and skipped that way, so far.
+void get_consensus_counts(consensus_workspace *, unsigned long *, unsigned long *);
+
+consensus_data * generate_consensus_ws(consensus_workspace *,
+                                       char **,
+                                       unsigned int,
+                                       unsigned,
+                                       unsigned,
+                                       double);
+
+consensus_data * generate_consensus_from_mapping_ws(consensus_workspace *,
+                                                    char **,
+                                                    aln_range **,
+                                                    unsigned int,
+                                                    unsigned,
+                                                    unsigned,
+                                                    double);
+
+void get_trim_ranges_ws(consensus_workspace *,
+                        char **,
+                        unsigned int,
+                        unsigned,
+                        seq_coor_t,
+                        aln_range *);
+
+void generate_consensus_batch(consensus_workspace **,
+                              unsigned int,
+                              char **,
+                              aln_range **,
+                              unsigned int *,
+                              unsigned int,
+                              unsigned,
+                              unsigned,
+                              double,
+                              consensus_data **);
+
+// One line of LA4Falcon -m output, e.g.
+// 000000000 000000001 -1807 100.00 0 181 1988 1988 0 0 1807 1989 overlap
+// i.e. q_id t_id score idt q_strand q_s q_e q_l t_strand t_s t_e t_l kind.
+#define OVLP_OVERLAP 0
+#define OVLP_CONTAINS 1
+#define OVLP_CONTAINED 2
+#define OVLP_OTHER 3
+
+typedef struct {
+    int q_id;
+    int t_id;
+    int score;  // -(overlap length)
+    int q_strand;
+    int q_s;
+    int q_e;
+    int q_l;
+    int t_strand;
+    int t_s;
+    int t_e;
+    int t_l;
+    int kind;
+    double idt;
+    long line_start;  // offset of the line in the buffer it was parsed from
+    long line_len;
+} ovlp_t;
+
+long parse_ovlps(const char *, long, ovlp_t *, long, long *);
+long ovlp_last_group_start(const ovlp_t *, long);
+void ovlp_filter_stage1(const ovlp_t *, long, int, int, int, int, double,
+                        int *, long *, int *, long *);
+long ovlp_filter_stage2(const char *, const ovlp_t *, long, int, double,
+                        const int *, long, const int *, long, int, long *);
+long ovlp_stats(const ovlp_t *, long, int, int *);
+long ovlp_select_by_q(const ovlp_t *, long, int, const int *, long, long *);
+
+// See dazz.c.
+void dazz_decode_read(const unsigned char *, int, int, int, int, char *);
+
+// See sgraph.c.
+void sg_sort_edges(int, const int *, int *, const int *, int);
+long sg_mark_tr_edges(int, const int *, const int *, int, const int *, const int *, const int *, int,
+                      unsigned char *, int);
@@ -0,0 +1,20 @@
+/*
+ * Decode the reads of a Dazzler DB for consensus, without LA4Falcon.
+ * See falcon_kit/dazz_reader.py.
+ */
+
+#include "common.h"
+
+static const char dazz_bases[4] = {'A', 'C', 'G', 'T'};
+
+// Bases [start, end) of a read of rlen bases, packed 4 to a byte with the first
+// in the high bits, as in the .bps of a Dazzler DB; or, if comp, of its reverse
+// complement. end - start upper-case bases are written to out.
+void dazz_decode_read(const unsigned char * packed, int rlen, int start, int end, int comp, char * out) {
+    int i, p, code;
+    for (i = start; i < end; i++) {
+        p = comp ? rlen - 1 - i : i;
+        code = (packed[p >> 2] >> (6 - 2 * (p & 3))) & 3;
+        *out++ = dazz_bases[comp ? 3 - code : code];
+    }
+}
@@ -2,12 +2,16 @@
  *         Author:  Jason Chin,
  */
 
+#define _POSIX_C_SOURCE 200809L  // for clock_gettime(), under -std=c99
+
 #include <stdlib.h>
 #include <stdio.h>
 #include <limits.h>
 #include <string.h>
 #include <assert.h>
 #include <stdint.h>
+#include <pthread.h>
+#include <time.h>
 #include "common.h"
 
 // #define DEBUG_DETAILED_VERBOSE
@@ -29,13 +33,23 @@ typedef struct {
 } align_tags_t;
 
 
+// A link of an MSA column: the column of the previous base of a read, and how many reads share it.
+typedef struct {
+    seq_coor_t p_t_pos;   // the tag position of the previous base
+    uint8_t p_delta; // the tag delta of the previous base
+    char p_q_base;        // the previous base
+    uint16_t count;
+} msa_link_t;
+
+// Columns with more links than this also get a (linear-probing) hash index of them.
+#define MSA_SCAN_LINKS 8
+
 typedef struct {
-    uint16_t size;
+    size_t links;         // msa_link_t[link_size] in the arena, in the order they were added
+    size_t slots;         // uint16_t[slot_size] in the arena (link + 1, or 0 for empty), or 0 if not indexed
     uint16_t n_link;
-    seq_coor_t * p_t_pos;   // the tag position of the previous base
-    uint8_t * p_delta; // the tag delta of the previous base
-    char * p_q_base;        // the previous base
-    uint16_t * link_count;
+    uint16_t link_size;
+    uint32_t slot_size;
     uint16_t count;
     seq_coor_t best_p_t_pos;
     uint8_t best_p_delta;
@@ -43,32 +57,62 @@ typedef struct {
     double score;
 } align_tag_col_t;
 
+// The columns of one template position: 5 (ACGT-) per delta, n_delta * 5 of them in the arena.
 typedef struct {
-    align_tag_col_t * base;
-} msa_base_group_t;
-
-typedef struct {
-    uint8_t size;
+    size_t cols;          // 0 until the position gets its first tag
+    uint16_t n_delta;
     uint8_t max_delta;
-    msa_base_group_t * delta;
-} msa_delta_group_t;
-
-typedef msa_delta_group_t * msa_pos_t;
+} msa_pos_t;
 
-align_tags_t * get_align_tags( char * aln_q_seq,
-                               char * aln_t_seq,
-                               seq_coor_t aln_seq_len,
-                               seq_coor_t q_start,
-                               seq_coor_t t_start,
-                               unsigned q_id,
-                               seq_coor_t t_offset) {
+// Bump allocator for the MSA of one seed. Everything in it is addressed by
+// offset, since it moves as it grows. It is reset, not freed, between seeds.
+typedef struct {
+    char * data;
+    size_t used;
+    size_t size;
+} msa_arena_t;
+
+#define MSA_AT(ws, type, offset) ((type *) ((ws)->arena.data + (offset)))
+
+// Scratch space for generate_consensus_ws(), reused from one seed to the next.
+// Everything here grows to fit the longest seed (and deepest pile-up) seen so
+// far, and is only reset (not freed) between seeds.
+struct consensus_workspace {
+    kmer_index * index;
+    kmer_match * kmer_match;
+    align_tags_t tags;          // of one alignment at a time, on their way into the MSA
+    seq_coor_t tags_size;
+    msa_pos_t * msa_pos;
+    unsigned int msa_size;
+    unsigned int msa_len;       // of the current seed
+    seq_coor_t msa_t_pos;       // of the last tag added to the MSA with delta 0
+    msa_arena_t arena;
+    align_tag_col_t empty_col;  // stands in for the columns of a position without tags
+    unsigned int * coverage;
+    unsigned int * local_nbase;
+    unsigned int max_cov_per_base;  // see set_consensus_max_cov()
+    int aligner;                // see set_consensus_aligner()
+    unsigned int * aln_cov;     // depth of the accepted alignments along the seed
+    unsigned int aln_cov_size;
+    seq_coor_t aln_cov_len;
+    seq_coor_t n_saturated;     // positions of the seed with aln_cov >= max_cov_per_base
+    unsigned long n_aligned;
+    unsigned long n_skipped;
+};
+
+// Fill tags, which has room for aln_seq_len + 1 of them; see get_align_tags().
+static void set_align_tags( align_tags_t * tags,
+                            char * aln_q_seq,
+                            char * aln_t_seq,
+                            seq_coor_t aln_seq_len,
+                            seq_coor_t q_start,
+                            seq_coor_t t_start,
+                            unsigned q_id,
+                            seq_coor_t t_offset) {
     char p_q_base;
-    align_tags_t * tags;
     seq_coor_t i, j, jj, k, p_j, p_jj;
 
-    tags = calloc( 1, sizeof(align_tags_t) );
     tags->len = aln_seq_len;
-    tags->align_tags = calloc( aln_seq_len + 1, sizeof(align_tag_t) );
     i = q_start - 1;
     j = t_start - 1;
     jj = 0;
@@ -113,6 +157,19 @@ align_tags_t * get_align_tags( char * aln_q_seq,
     (tags->align_tags[k]).delta = UINT8_MAX;
     (tags->align_tags[k]).q_base = '.';
     (tags->align_tags[k]).q_id = UINT_MAX;
+}
+
+align_tags_t * get_align_tags( char * aln_q_seq,
+                               char * aln_t_seq,
+                               seq_coor_t aln_seq_len,
+                               seq_coor_t q_start,
+                               seq_coor_t t_start,
+                               unsigned q_id,
+                               seq_coor_t t_offset) {
+    align_tags_t * tags;
+    tags = calloc( 1, sizeof(align_tags_t) );
+    tags->align_tags = calloc( aln_seq_len + 1, sizeof(align_tag_t) );
+    set_align_tags(tags, aln_q_seq, aln_t_seq, aln_seq_len, q_start, t_start, q_id, t_offset);
     return tags;
 }
 
@@ -122,239 +179,360 @@ void free_align_tags( align_tags_t * tags) {
 }
 
 
-void allocate_aln_col( align_tag_col_t * col) {
-    col->p_t_pos = ( seq_coor_t * ) calloc(col->size, sizeof( seq_coor_t ));
-    col->p_delta = ( uint8_t * ) calloc(col->size, sizeof( uint8_t ));
-    col->p_q_base = ( char * )calloc(col->size, sizeof( char ));
-    col->link_count = ( uint16_t * ) calloc(col->size, sizeof( uint16_t ));
+// Return the offset of n zeroed bytes. Offset 0 is never returned, so it can mean "none".
+static size_t msa_alloc( msa_arena_t * arena, size_t n ) {
+    size_t offset;
+    size_t new_size;
+    n = (n + 7) & ~(size_t) 7;
+    if (arena->used == 0) {
+        arena->used = 8;
+    }
+    if (arena->used + n > arena->size) {
+        new_size = arena->size ? arena->size : (1 << 20);
+        while (arena->used + n > new_size) {
+            new_size *= 2;
+        }
+        arena->data = (char *) realloc(arena->data, new_size);
+        arena->size = new_size;
+    }
+    offset = arena->used;
+    memset(arena->data + offset, 0, n);
+    arena->used += n;
+    return offset;
 }
 
-void realloc_aln_col( align_tag_col_t * col ) {
-    col->p_t_pos = (seq_coor_t *) realloc( col->p_t_pos, (col->size) * sizeof( seq_coor_t ));
-    col->p_delta = ( uint8_t *)  realloc( col->p_delta, (col->size) * sizeof( uint8_t ));
-    col->p_q_base = (char *) realloc( col->p_q_base, (col->size) * sizeof( char ));
-    col->link_count = ( uint16_t *) realloc( col->link_count, (col->size) * sizeof( uint16_t ));
+static inline uint32_t msa_link_hash( seq_coor_t p_t_pos, uint8_t p_delta, char p_q_base ) {
+    uint32_t h = ((uint32_t) p_t_pos * 2654435761u) ^ ((uint32_t) p_delta << 8) ^ (uint8_t) p_q_base;
+    return h ^ (h >> 15);
 }
 
-void free_aln_col( align_tag_col_t * col) {
-    free(col->p_t_pos);
-    free(col->p_delta);
-    free(col->p_q_base);
-    free(col->link_count);
+// (Re)build the index of the links of a column, with at least twice link_size slots.
+static void msa_index_links( consensus_workspace * ws, size_t col_offset ) {
+    align_tag_col_t * col = MSA_AT(ws, align_tag_col_t, col_offset);
+    uint32_t slot_size = 16;
+    uint32_t mask, h;
+    size_t slots_offset;
+    uint16_t * slots;
+    msa_link_t * links;
+    int link;
+
+    while (slot_size < 2 * (uint32_t) col->link_size) {
+        slot_size *= 2;
+    }
+    slots_offset = msa_alloc(&ws->arena, slot_size * sizeof(uint16_t));
+    col = MSA_AT(ws, align_tag_col_t, col_offset);
+    slots = MSA_AT(ws, uint16_t, slots_offset);
+    links = MSA_AT(ws, msa_link_t, col->links);
+    mask = slot_size - 1;
+    for (link = 0; link < col->n_link; link++) {
+        h = msa_link_hash(links[link].p_t_pos, links[link].p_delta, links[link].p_q_base) & mask;
+        while (slots[h]) {
+            h = (h + 1) & mask;
+        }
+        slots[h] = link + 1;
+    }
+    col->slots = slots_offset;
+    col->slot_size = slot_size;
 }
 
+void update_col( consensus_workspace * ws, size_t col_offset, seq_coor_t p_t_pos, uint8_t p_delta, char p_q_base) {
+    align_tag_col_t * col = MSA_AT(ws, align_tag_col_t, col_offset);
+    msa_link_t * links = MSA_AT(ws, msa_link_t, col->links);
+    uint16_t * slots;
+    uint32_t mask, h = 0;
+    size_t links_offset;
+    uint16_t new_size;
+    int link;
 
-void allocate_delta_group( msa_delta_group_t * g) {
-    int i,j;
-    g->max_delta = 0;
-    g->delta = (msa_base_group_t *) calloc( g->size, sizeof(msa_base_group_t));
-    for (i = 0; i< g->size; i++) {
-        g->delta[i].base = ( align_tag_col_t * ) calloc( 5, sizeof(align_tag_col_t ) );
-        for (j = 0; j < 5; j++ ) {
-             g->delta[i].base[j].size = 8;
-             allocate_aln_col(&(g->delta[i].base[j]));
+    col->count += 1;
+    if (col->slots) {
+        slots = MSA_AT(ws, uint16_t, col->slots);
+        mask = col->slot_size - 1;
+        for (h = msa_link_hash(p_t_pos, p_delta, p_q_base) & mask; slots[h]; h = (h + 1) & mask) {
+            link = slots[h] - 1;
+            if ( p_t_pos == links[link].p_t_pos &&
+                 p_delta == links[link].p_delta &&
+                 p_q_base == links[link].p_q_base ) {
+                links[link].count ++;
+                return;
+            }
+        }
+    } else {
+        for (link = 0; link < col->n_link; link++) {
+            if ( p_t_pos == links[link].p_t_pos &&
+                 p_delta == links[link].p_delta &&
+                 p_q_base == links[link].p_q_base ) {
+                links[link].count ++;
+                return;
+            }
         }
     }
-}
 
-void realloc_delta_group( msa_delta_group_t * g, uint16_t new_size ) {
-    int i, j, bs, es;
-    bs = g->size;
-    es = new_size;
-    g->delta = (msa_base_group_t *) realloc(g->delta, new_size * sizeof(msa_base_group_t));
-    for (i=bs; i < es; i++) {
-        g->delta[i].base = ( align_tag_col_t *) calloc( 5, sizeof(align_tag_col_t ) );
-        for (j = 0; j < 5; j++ ) {
-             g->delta[i].base[j].size = 8;
-             allocate_aln_col(&(g->delta[i].base[j]));
+    if (col->n_link + 1 > col->link_size) {
+        if (col->link_size == 0) {
+            new_size = 4;
+        } else if (col->link_size < (UINT16_MAX >> 1)-1) {
+            new_size = col->link_size * 2;
+        } else {
+            new_size = col->link_size + 256;
+        }
+        if (new_size >= UINT16_MAX-1) {
+            fprintf(stderr, "[update_col] Assert will fail! (col->size < (UINT16_MAX-1))? Values: %u >= %u\n", new_size, (UINT16_MAX-1));
+        }
+        assert(new_size < UINT16_MAX-1 );
+        links_offset = msa_alloc(&ws->arena, new_size * sizeof(msa_link_t));
+        col = MSA_AT(ws, align_tag_col_t, col_offset);  // the arena may have moved
+        memcpy(ws->arena.data + links_offset, ws->arena.data + col->links, col->n_link * sizeof(msa_link_t));
+        col->links = links_offset;
+        col->link_size = new_size;
+        links = MSA_AT(ws, msa_link_t, col->links);
+    }
+    link = col->n_link;
+    links[link].p_t_pos = p_t_pos;
+    links[link].p_delta = p_delta;
+    links[link].p_q_base = p_q_base;
+    links[link].count = 1;
+    col->n_link++;
+
+    if (col->n_link > MSA_SCAN_LINKS) {
+        if (col->slots == 0 || col->slot_size < 2 * (uint32_t) col->link_size) {
+            msa_index_links(ws, col_offset);
+        } else {
+            // h is the empty slot where the lookup above stopped.
+            MSA_AT(ws, uint16_t, col->slots)[h] = link + 1;
         }
     }
-    g->size = new_size;
 }
 
-void free_delta_group( msa_delta_group_t * g) {
-    //manything to do here
-    int i, j;
-    for (i = 0; i < g->size; i++) {
-        for (j = 0; j < 5; j++) {
-            free_aln_col( &(g->delta[i].base[j]) );
+// Return the offset of the column of (t_pos, delta, base), making room for it.
+static size_t msa_reserve_col( consensus_workspace * ws, seq_coor_t t_pos, unsigned int delta, unsigned int base ) {
+    msa_pos_t * pos = ws->msa_pos + t_pos;
+    uint16_t n_delta;
+    size_t cols;
+    if (delta >= pos->n_delta) {
+        n_delta = pos->n_delta ? pos->n_delta : 1;
+        while (n_delta <= delta) {
+            n_delta *= 2;
+        }
+        cols = msa_alloc(&ws->arena, n_delta * 5 * sizeof(align_tag_col_t));
+        if (pos->cols) {
+            memcpy(ws->arena.data + cols, ws->arena.data + pos->cols, pos->n_delta * 5 * sizeof(align_tag_col_t));
         }
-        free(g->delta[i].base);
+        pos->cols = cols;
+        pos->n_delta = n_delta;
     }
-    free(g->delta);
+    if (delta > pos->max_delta) {
+        pos->max_delta = delta;
+    }
+    return pos->cols + (delta * 5 + base) * sizeof(align_tag_col_t);
 }
 
-void update_col( align_tag_col_t * col, seq_coor_t p_t_pos, uint8_t p_delta, char p_q_base) {
-    int updated = 0;
-    int link;
-    col->count += 1;
-    for (link = 0; link < col->n_link; link++) {
-        if ( p_t_pos == col->p_t_pos[link] &&
-             p_delta == col->p_delta[link] &&
-             p_q_base == col->p_q_base[link] ) {
-            col->link_count[link] ++;
-            updated = 1;
-            break;
-        }
+// The column of (t_pos, delta, base), once all tags are in. A position without
+// tags scores -1, as if its (empty) columns had been scored.
+static align_tag_col_t * msa_get_col( consensus_workspace * ws, seq_coor_t t_pos, unsigned int delta, unsigned int base ) {
+    msa_pos_t * pos;
+    if (t_pos < 0 || t_pos >= (seq_coor_t) ws->msa_len) {
+        return &ws->empty_col;
     }
-    if (updated == 0) {
-        if (col->n_link + 1 > col->size) {
-            if (col->size < (UINT16_MAX >> 1)-1) {
-                col->size *= 2;
-            } else {
-                col->size += 256;
-            }
-            if (col->size >= UINT16_MAX-1) {
-                fprintf(stderr, "[update_col] Assert will fail! (col->size < (UINT16_MAX-1))? Values: %u >= %u\n", col->size, (UINT16_MAX-1));
-            }
-            // fflush(stderr);
-            assert(col->size < UINT16_MAX-1 );
-            realloc_aln_col(col);
-        }
-        link = col->n_link;
-
-        col->p_t_pos[link] = p_t_pos;
-        col->p_delta[link] = p_delta;
-        col->p_q_base[link] = p_q_base;
-        col->link_count[link] = 1;
-        col->n_link++;
-    }
-}
-
-
-msa_pos_t * get_msa_working_sapce(unsigned int max_t_len) {
-    msa_pos_t * msa_array;
-    unsigned int i;
-    msa_array = calloc(max_t_len, sizeof(msa_pos_t *));
-    for (i = 0; i < max_t_len; i++) {
-        msa_array[i] = calloc(1, sizeof(msa_delta_group_t));
-        msa_array[i]->size = 8;
-        allocate_delta_group(msa_array[i]);
-    }
-    return msa_array;
-}
-
-void clean_msa_working_space( msa_pos_t * msa_array, unsigned int max_t_len) {
-    int i,j,k;
-    align_tag_col_t * col;
-    for (i = 0; i < (int)max_t_len; i++) {
-        for (j =0; j < msa_array[i]->max_delta + 1; j++) {
-            for (k = 0; k < 5; k++ ) {
-                col = msa_array[i]->delta[j].base + k;
-                /*
-                for (c =0; c < col->size; c++) {
-                    col->p_t_pos[c] = 0;
-                    col->p_delta[c] = 0;
-                    col->p_q_base[c] = 0;
-                    col->link_count[c] =0;
-                }
-                */
-                col->n_link = 0;
-                col->count = 0;
-                col->best_p_t_pos = 0;
-                col->best_p_delta = 0;
-                col->best_p_q_base = 0;
-                col->score = 0;
-            }
-        }
-        msa_array[i]->max_delta = 0;
+    pos = ws->msa_pos + t_pos;
+    if (pos->cols == 0 || delta >= pos->n_delta) {
+        return &ws->empty_col;
     }
+    return MSA_AT(ws, align_tag_col_t, pos->cols) + delta * 5 + base;
 }
 
-#define STATIC_ALLOCATE
-//#undef STATIC_ALLOCATE
+consensus_workspace * allocate_consensus_workspace(void) {
+    return (consensus_workspace *) calloc(1, sizeof(consensus_workspace));
+}
 
-consensus_data * get_cns_from_align_tags( align_tags_t ** tag_seqs,
-                                          unsigned n_tag_seqs,
-                                          unsigned t_len,
-                                          unsigned min_cov ) {
+void free_consensus_workspace(consensus_workspace * ws) {
+    if (ws->index) free_kmer_index(ws->index);
+    if (ws->kmer_match) free_kmer_match(ws->kmer_match);
+    free(ws->tags.align_tags);
+    free(ws->msa_pos);
+    free(ws->arena.data);
+    free(ws->coverage);
+    free(ws->local_nbase);
+    free(ws->aln_cov);
+    free(ws);
+}
 
-    seq_coor_t i, j;
-    seq_coor_t t_pos = 0;
-    unsigned int * coverage;
-    unsigned int * local_nbase;
+// Index the k-mers (of size K) of the seed, replacing the previous seed.
+static kmer_index * reserve_workspace_index(consensus_workspace * ws, char * seed, seq_coor_t seed_len, unsigned int K) {
+    if (ws->index == NULL || ws->index->K != K) {
+        if (ws->index) free_kmer_index(ws->index);
+        ws->index = allocate_kmer_index(K);
+    }
+    if (ws->kmer_match == NULL) {
+        ws->kmer_match = allocate_kmer_match();
+    }
+    build_kmer_index(ws->index, seed, seed_len);
+    return ws->index;
+}
 
-    consensus_data * consensus;
-    //char * consensus;
-    align_tag_t * c_tag;
+// Room for the tags of an alignment of aln_seq_len columns (and the sentinel).
+static align_tags_t * reserve_workspace_tags(consensus_workspace * ws, seq_coor_t aln_seq_len) {
+    if (aln_seq_len + 1 > ws->tags_size) {
+        ws->tags.align_tags = (align_tag_t *) realloc(ws->tags.align_tags, (aln_seq_len + 1) * sizeof(align_tag_t));
+        ws->tags_size = aln_seq_len + 1;
+    }
+    return &ws->tags;
+}
 
-    coverage = calloc( t_len, sizeof(unsigned int) );
-    local_nbase = calloc( t_len, sizeof(unsigned int) );
+void set_consensus_max_cov(consensus_workspace * ws, unsigned int max_cov_per_base) {
+    ws->max_cov_per_base = max_cov_per_base;
+}
 
-#ifndef STATIC_ALLOCATE
+void set_consensus_aligner(consensus_workspace * ws, int aligner) {
+    ws->aligner = aligner;
+}
 
-    msa_pos_t * msa_array = NULL; // For more efficiency, this should be injected.
-    msa_array = calloc(t_len, sizeof(msa_pos_t *));
+void get_consensus_counts(consensus_workspace * ws, unsigned long * n_aligned, unsigned long * n_skipped) {
+    *n_aligned = ws->n_aligned;
+    *n_skipped = ws->n_skipped;
+}
 
-    for (i = 0; i < t_len; i++) {
-        msa_array[i] = calloc(1, sizeof(msa_delta_group_t));
-        msa_array[i]->size = 8;
-        allocate_delta_group(msa_array[i]);
+// Start counting the depth of accepted alignments along a seed of seed_len.
+static void reserve_workspace_aln_cov(consensus_workspace * ws, seq_coor_t seed_len) {
+    ws->aln_cov_len = seed_len;
+    ws->n_saturated = 0;
+    if (ws->max_cov_per_base == 0) {
+        return;
+    }
+    if ((unsigned int) seed_len > ws->aln_cov_size) {
+        ws->aln_cov = (unsigned int *) realloc(ws->aln_cov, seed_len * sizeof(unsigned int));
+        ws->aln_cov_size = seed_len;
     }
+    memset(ws->aln_cov, 0, seed_len * sizeof(unsigned int));
+}
 
-#else
+// Whether the whole seed is already max_cov_per_base deep, but for at most slack positions.
+static int is_seed_saturated(consensus_workspace * ws, seq_coor_t slack) {
+    return ws->max_cov_per_base && ws->aln_cov_len - ws->n_saturated <= slack;
+}
 
-    unsigned const max_t_len = 128000;
-    if (t_len > max_t_len) {
-        fprintf(stderr, "t_len==%d > %d\n", t_len, max_t_len);
-        //abort();
+// Whether the seed is already max_cov_per_base deep over [s, e), but for at most
+// slack positions. (Read ends are rarely that deep, and k-mer ranges are fuzzy.)
+static int is_aln_cov_saturated(consensus_workspace * ws, seq_coor_t s, seq_coor_t e, seq_coor_t slack) {
+    seq_coor_t i;
+    seq_coor_t n_shallow = 0;
+    if (ws->max_cov_per_base == 0) {
         return 0;
     }
-    static msa_pos_t * msa_array = NULL;
-    if ( msa_array == NULL) {
-        msa_array = get_msa_working_sapce(max_t_len + 1);
+    if (is_seed_saturated(ws, slack)) {
+        return 1;
+    }
+    if (e > ws->aln_cov_len) e = ws->aln_cov_len;
+    for (i = (s > 0) ? s : 0; i < e; i++) {
+        if (ws->aln_cov[i] < ws->max_cov_per_base && ++n_shallow > slack) {
+            return 0;
+        }
     }
+    return 1;
+}
 
-    if (t_len > max_t_len) {
-        fprintf(stderr, "[get_cns_from_align_tags]  Assert will fail!\n");
+static void add_aln_cov(consensus_workspace * ws, seq_coor_t s, seq_coor_t e) {
+    seq_coor_t i;
+    if (ws->max_cov_per_base == 0) {
+        return;
+    }
+    if (e > ws->aln_cov_len) e = ws->aln_cov_len;
+    for (i = (s > 0) ? s : 0; i < e; i++) {
+        if (++ws->aln_cov[i] == ws->max_cov_per_base) {
+            ws->n_saturated++;
+        }
     }
-    assert(t_len <= max_t_len);
+}
 
-#endif
+// Start an empty MSA over t_len template positions.
+static void reserve_workspace_msa(consensus_workspace * ws, unsigned int t_len) {
+    if (t_len > ws->msa_size) {
+        ws->msa_pos = (msa_pos_t *) realloc(ws->msa_pos, t_len * sizeof(msa_pos_t));
+        ws->coverage = (unsigned int *) realloc(ws->coverage, t_len * sizeof(unsigned int));
+        ws->local_nbase = (unsigned int *) realloc(ws->local_nbase, t_len * sizeof(unsigned int));
+        ws->msa_size = t_len;
+    }
+    ws->msa_len = t_len;
+    ws->msa_t_pos = 0;
+    memset(ws->msa_pos, 0, t_len * sizeof(msa_pos_t));
+    memset(ws->coverage, 0, t_len * sizeof(unsigned int));
+    memset(ws->local_nbase, 0, t_len * sizeof(unsigned int));
+    ws->arena.used = 0;
+    memset(&ws->empty_col, 0, sizeof(align_tag_col_t));
+    ws->empty_col.score = -1;
+}
 
-    // loop through every alignment
-    //printf("XX %d\n", n_tag_seqs);
-    for (i = 0; i < (seq_coor_t)n_tag_seqs; i++) {
-
-        // for each alignment position, insert the alignment tag to msa_array
-        for (j = 0; j < tag_seqs[i]->len; j++) {
-            c_tag = tag_seqs[i]->align_tags + j;
-            unsigned int delta;
-            delta = c_tag->delta;
-            if (delta == 0) {
-                t_pos = c_tag->t_pos;
-                coverage[ t_pos ] ++;
-            }
-            // Assume t_pos was set on earlier iteration.
-            // (Otherwise, use its initial value, which might be an error. ~cd)
-            if (delta > msa_array[t_pos]->max_delta) {
-                msa_array[t_pos]->max_delta = delta;
-                if (msa_array[t_pos]->max_delta + 4 > msa_array[t_pos]->size ) {
-                    realloc_delta_group(msa_array[t_pos], msa_array[t_pos]->max_delta + 8);
-                }
-            }
+// Add the tags of one alignment to the MSA of the workspace (see reserve_workspace_msa()).
+// The tags of each alignment go in as soon as it is accepted, so they never all coexist.
+static void msa_add_tags( consensus_workspace * ws, align_tags_t * tags ) {
+    seq_coor_t j;
+    seq_coor_t t_pos = ws->msa_t_pos;
+    unsigned int * coverage = ws->coverage;
+    unsigned int * local_nbase = ws->local_nbase;
+    size_t col_offset;
+    align_tag_t * c_tag;
 
-            unsigned int base = -1;
-            switch (c_tag->q_base) {
-                case 'A': base = 0; break;
-                case 'C': base = 1; break;
-                case 'G': base = 2; break;
-                case 'T': base = 3; break;
-                case '-': base = 4; break;
-                default:
-                    base = -1;
-                    fprintf(stderr, "WARNING: Bad input detected! c_tag->q_base = '%c' (int value = %d).\n", c_tag->q_base, (int) c_tag->q_base);
-                    fprintf(stderr, "[get_cns_from_align_tags]:   before update_col: j = %d / %d, i = %d\n", j, tag_seqs[i]->len, i);
-                    fprintf(stderr, "t_pos = %d, delta = %d, base = %d, c_tag->q_base = %c, c_tag->p_t_pos = %d, c_tag->p_delta = %d, c_tag->p_q_base = %d\n",
-                                t_pos, delta, base, c_tag->q_base, c_tag->p_t_pos, c_tag->p_delta, c_tag->p_q_base);
-                    break;
-            }
+    // for each alignment position, insert the alignment tag to the MSA
+    for (j = 0; j < tags->len; j++) {
+        c_tag = tags->align_tags + j;
+        unsigned int delta;
+        delta = c_tag->delta;
+        if (delta == 0) {
+            t_pos = c_tag->t_pos;
+            coverage[ t_pos ] ++;
+        }
+        // Assume t_pos was set on earlier iteration (maybe by an earlier alignment).
+        // (Otherwise, use its initial value, which might be an error. ~cd)
+
+        unsigned int base = -1;
+        switch (c_tag->q_base) {
+            case 'A': base = 0; break;
+            case 'C': base = 1; break;
+            case 'G': base = 2; break;
+            case 'T': base = 3; break;
+            case '-': base = 4; break;
+            default:
+                base = -1;
+                fprintf(stderr, "WARNING: Bad input detected! c_tag->q_base = '%c' (int value = %d).\n", c_tag->q_base, (int) c_tag->q_base);
+                fprintf(stderr, "[get_cns_from_align_tags]:   before update_col: j = %d / %d, q_id = %u\n", j, tags->len, c_tag->q_id);
+                fprintf(stderr, "t_pos = %d, delta = %d, base = %d, c_tag->q_base = %c, c_tag->p_t_pos = %d, c_tag->p_delta = %d, c_tag->p_q_base = %d\n",
+                            t_pos, delta, base, c_tag->q_base, c_tag->p_t_pos, c_tag->p_delta, c_tag->p_q_base);
+                break;
+        }
 
-            // Note: On bad input, base may be -1.
-            update_col( &(msa_array[t_pos]->delta[delta].base[base]), c_tag->p_t_pos, c_tag->p_delta, c_tag->p_q_base);
-            local_nbase[ t_pos ] ++;
+        // Note: On bad input, base is -1, and the tag is left out of the columns.
+        col_offset = msa_reserve_col(ws, t_pos, delta, (base < 5) ? base : 0);
+        if (base < 5) {
+            update_col(ws, col_offset, c_tag->p_t_pos, c_tag->p_delta, c_tag->p_q_base);
         }
+        local_nbase[ t_pos ] ++;
     }
+    ws->msa_t_pos = t_pos;
+}
+
+// Add an alignment (from align()) of a read to the seed to the MSA, as get_align_tags() tags it.
+static void msa_add_alignment( consensus_workspace * ws,
+                               char * aln_q_seq,
+                               char * aln_t_seq,
+                               seq_coor_t aln_seq_len,
+                               seq_coor_t q_start,
+                               seq_coor_t t_start,
+                               unsigned q_id ) {
+    align_tags_t * tags = reserve_workspace_tags(ws, aln_seq_len);
+    set_align_tags(tags, aln_q_seq, aln_t_seq, aln_seq_len, q_start, t_start, q_id, 0);
+    msa_add_tags(ws, tags);
+}
+
+// The consensus of the MSA of the workspace, over t_len template positions.
+static consensus_data * get_cns_from_msa_ws( consensus_workspace * ws,
+                                             unsigned t_len,
+                                             unsigned min_cov ) {
+
+    seq_coor_t i, j;
+    unsigned int * coverage = ws->coverage;
+
+    consensus_data * consensus;
+    //char * consensus;
 
 #ifdef DEBUG_DETAILED_VERBOSE
     fprintf(stderr, "[get_cns_from_align_tags] 3: Ping!\n");
@@ -372,6 +550,9 @@ consensus_data * get_cns_from_align_tags( align_tags_t ** tag_seqs,
         double g_best_score = 0.0;
 
         align_tag_col_t * aln_col = 0;
+        align_tag_col_t * cols;
+        msa_link_t * links;
+        msa_pos_t * pos;
 
         g_best_score = -1;
 
@@ -380,26 +561,32 @@ consensus_data * get_cns_from_align_tags( align_tags_t ** tag_seqs,
                 fprintf(stderr, "[get_cns_from_align_tags] 3.1a: starting i = %d / %d\n", i, t_len);
             #endif
 
-            //printf("max delta: %d %d\n", i, msa_array[i]->max_delta);
-            for (j = 0; j <= msa_array[i]->max_delta; j++) { // loop through every delta position
+            pos = ws->msa_pos + i;
+            if (pos->cols == 0) {
+                continue;  // no tags here; see msa_get_col()
+            }
+            cols = MSA_AT(ws, align_tag_col_t, pos->cols);
+            //printf("max delta: %d %d\n", i, pos->max_delta);
+            for (j = 0; j <= pos->max_delta; j++) { // loop through every delta position
                 #ifdef DEBUG_DETAILED_VERBOSE
-                    fprintf(stderr, "     j = %d / %d; k = ", j, msa_array[i]->max_delta);
+                    fprintf(stderr, "     j = %d / %d; k = ", j, pos->max_delta);
                 #endif
                 for (k = 0; k < 5; k++) {  // loop through diff bases of the same delta posiiton
-                    aln_col = msa_array[i]->delta[j].base + k;
+                    aln_col = cols + j * 5 + k;
                     #ifdef DEBUG_DETAILED_VERBOSE
                         fprintf(stderr, "%d ", k);
                     #endif
                     if (aln_col->count >= 0) {
                         best_score = -1;
+                        links = MSA_AT(ws, msa_link_t, aln_col->links);
 
                         for (int link = 0; link < aln_col->n_link; link++) { // loop through differnt link to previous column
                             int pi = 0;
                             int pj = 0;
                             int pk = 0;
-                            pi = aln_col->p_t_pos[link];
-                            pj = aln_col->p_delta[link];
-                            switch (aln_col->p_q_base[link]) {
+                            pi = links[link].p_t_pos;
+                            pj = links[link].p_delta;
+                            switch (links[link].p_q_base) {
                                 case 'A': pk = 0; break;
                                 case 'C': pk = 1; break;
                                 case 'G': pk = 2; break;
@@ -408,11 +595,11 @@ consensus_data * get_cns_from_align_tags( align_tags_t ** tag_seqs,
                                 default: pk = 4;
                             }
 
-                            if (aln_col->p_t_pos[link] == -1) {
-                                score =  (double) aln_col->link_count[link] - (double) coverage[i] * 0.5;
+                            if (links[link].p_t_pos == -1) {
+                                score =  (double) links[link].count - (double) coverage[i] * 0.5;
                             } else {
-                                score = msa_array[pi]->delta[pj].base[pk].score +
-                                        (double) aln_col->link_count[link] - (double) coverage[i] * 0.5;
+                                score = msa_get_col(ws, pi, pj, pk)->score +
+                                        (double) links[link].count - (double) coverage[i] * 0.5;
                             }
                             if (score > best_score) {
                                 best_score = score;
@@ -499,7 +686,7 @@ consensus_data * get_cns_from_align_tags( align_tags_t ** tag_seqs,
         if (i == -1 || index >= t_len * 2) break;
         j = g_best_aln_col->best_p_delta;
         k = g_best_aln_col->best_p_q_base;
-        g_best_aln_col = msa_array[i]->delta[j].base + k;
+        g_best_aln_col = msa_get_col(ws, i, j, k);
 
         if (bb != '-') {
             cns_str[index] = bb;
@@ -525,19 +712,6 @@ consensus_data * get_cns_from_align_tags( align_tags_t ** tag_seqs,
 
     cns_str[index] = 0;
     //printf("%s\n", cns_str);
-#ifndef STATIC_ALLOCATE
-    for (i = 0; i < t_len; i++) {
-        free_delta_group(msa_array[i]);
-        free(msa_array[i]);
-    }
-
-    free(msa_array);
-#else
-    clean_msa_working_space(msa_array, t_len+1);
-#endif
-
-    free(coverage);
-    free(local_nbase);
 
     #ifdef DEBUG_DETAILED_VERBOSE
         fprintf(stderr, "[get_cns_from_align_tags] 6: Ping!\n");
@@ -546,9 +720,72 @@ consensus_data * get_cns_from_align_tags( align_tags_t ** tag_seqs,
     return consensus;
 }
 
+consensus_data * get_cns_from_align_tags_ws( consensus_workspace * ws,
+                                             align_tags_t ** tag_seqs,
+                                             unsigned n_tag_seqs,
+                                             unsigned t_len,
+                                             unsigned min_cov ) {
+    unsigned i;
+    reserve_workspace_msa(ws, t_len + 1);
+    for (i = 0; i < n_tag_seqs; i++) {
+        msa_add_tags(ws, tag_seqs[i]);
+    }
+    return get_cns_from_msa_ws(ws, t_len, min_cov);
+}
+
+// The workspace used by the original (workspace-less) entry points, which have
+// always kept their MSA working space in a static. Not thread-safe; callers
+// that need that should allocate their own workspace.
+static consensus_workspace * default_workspace = NULL;
+
+static consensus_workspace * get_default_workspace(void) {
+    if (default_workspace == NULL) {
+        default_workspace = allocate_consensus_workspace();
+    }
+    return default_workspace;
+}
+
+consensus_data * get_cns_from_align_tags( align_tags_t ** tag_seqs,
+                                          unsigned n_tag_seqs,
+                                          unsigned t_len,
+                                          unsigned min_cov ) {
+    return get_cns_from_align_tags_ws(get_default_workspace(), tag_seqs, n_tag_seqs, t_len, min_cov);
+}
+
+static consensus_data * get_empty_consensus(void) {
+    consensus_data * consensus;
+    consensus = calloc( 1, sizeof(consensus_data) );
+    consensus->sequence = calloc( 1, sizeof(char) );
+    consensus->eqv = calloc( 1, sizeof(unsigned int) );
+    return consensus;
+}
+
+// Seconds since *t, which is then reset to now; for consensus_stats.
+static double lap_s(struct timespec * t) {
+    struct timespec now;
+    double s;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    s = (double) (now.tv_sec - t->tv_sec) + (now.tv_nsec - t->tv_nsec) * 1e-9;
+    *t = now;
+    return s;
+}
+
 //const unsigned int K = 8;
+#define INDEL_ALLOWENCE_0 6
+#define INDEL_ALLOWENCE_2 150
 
-consensus_data * generate_consensus( char ** input_seq,
+// Align the k-mer range of a read to that of the seed, with the aligner of the workspace.
+static alignment * align_ws(consensus_workspace * ws,
+                            char * query_seq, seq_coor_t q_len,
+                            char * target_seq, seq_coor_t t_len) {
+    if (ws->aligner == CONSENSUS_ALIGNER_MYERS) {
+        return align_myers(query_seq, q_len, target_seq, t_len, INDEL_ALLOWENCE_2);
+    }
+    return align(query_seq, q_len, target_seq, t_len, INDEL_ALLOWENCE_2, 1);
+}
+
+consensus_data * generate_consensus_ws( consensus_workspace * ws,
+                           char ** input_seq,
                            unsigned int n_seq,
                            unsigned min_cov,
                            unsigned K,
@@ -556,17 +793,16 @@ consensus_data * generate_consensus( char ** input_seq,
     unsigned int j;
     unsigned int seq_count;
     unsigned int aligned_seq_count;
-    kmer_lookup * lk_ptr;
-    seq_array sa_ptr;
-    seq_addr_array sda_ptr;
+    kmer_index * index;
     kmer_match * kmer_match_ptr;
     aln_range * arange;
     alignment * aln;
-    align_tags_t ** tags_list;
     //char * consensus;
     consensus_data * consensus;
     double max_diff;
-    const unsigned int lk_ptr_size = (1 << (K * 2));
+    seq_coor_t seed_len;
+    consensus_stats stats;
+    struct timespec t;
     max_diff = 1.0 - min_idt;
 
     fprintf(stderr, "[consensus] In generate_consensus.\n");
@@ -578,22 +814,31 @@ consensus_data * generate_consensus( char ** input_seq,
     //};
     fflush(stdout);
 
-    tags_list = calloc( seq_count, sizeof(align_tags_t *) );
-    lk_ptr = allocate_kmer_lookup( lk_ptr_size );
-    sa_ptr = allocate_seq( (seq_coor_t) strlen( input_seq[0]) );
-    sda_ptr = allocate_seq_addr( (seq_coor_t) strlen( input_seq[0]) );
-    add_sequence( 0, K, input_seq[0], strlen(input_seq[0]), sda_ptr, sa_ptr, lk_ptr);
-    mask_k_mer(lk_ptr_size, lk_ptr, 10000);
+    memset(&stats, 0, sizeof(stats));
+    stats.n_reads = seq_count - 1;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+
+    seed_len = (seq_coor_t) strlen( input_seq[0] );
+    index = reserve_workspace_index(ws, input_seq[0], seed_len, K);
+    mask_kmer_index(index, 10000);
+    kmer_match_ptr = ws->kmer_match;
+    reserve_workspace_aln_cov(ws, seed_len);
+    reserve_workspace_msa(ws, seed_len + 1);
 
     aligned_seq_count = 0;
     for (j=1; j < seq_count; j++) {
+        if (is_seed_saturated(ws, K * INDEL_ALLOWENCE_0)) {
+            ws->n_skipped += seq_count - j;
+            stats.n_cov_skipped += seq_count - j;
+            break;
+        }
 
         //printf("seq_len: %ld %u\n", j, strlen(input_seq[j]));
 
-        kmer_match_ptr = find_kmer_pos_for_seq(input_seq[j], strlen(input_seq[j]), K, sda_ptr, lk_ptr);
-#define INDEL_ALLOWENCE_0 6
+        find_kmer_pos_in_index(index, input_seq[j], strlen(input_seq[j]), kmer_match_ptr);
 
         arange = find_best_aln_range(kmer_match_ptr, K, K * INDEL_ALLOWENCE_0, 5);  // narrow band to avoid aligning through big indels
+        stats.kmer_s += lap_s(&t);
 
         //printf("1:%ld %ld %ld %ld\n", arange_->s1, arange_->e1, arange_->s2, arange_->e2);
 
@@ -607,7 +852,13 @@ consensus_data * generate_consensus( char ** input_seq,
         if (arange->e1 - arange->s1 < 100 || arange->e2 - arange->s2 < 100 ||
             abs( (arange->e1 - arange->s1 ) - (arange->e2 - arange->s2) ) >
                    (int) (0.5 * INDEL_ALLOWENCE_1 * (arange->e1 - arange->s1 + arange->e2 - arange->s2))) {
-            free_kmer_match( kmer_match_ptr);
+            stats.n_bad_range++;
+            free_aln_range(arange);
+            continue;
+        }
+        if (is_aln_cov_saturated(ws, arange->s2, arange->e2, K * INDEL_ALLOWENCE_0)) {
+            ws->n_skipped++;
+            stats.n_cov_skipped++;
             free_aln_range(arange);
             continue;
         }
@@ -615,59 +866,112 @@ consensus_data * generate_consensus( char ** input_seq,
         //printf("%ld %s\n\n", strlen(input_seq[0]), input_seq[0]);
 
 
-#define INDEL_ALLOWENCE_2 150
-
-        aln = align(input_seq[j]+arange->s1, arange->e1 - arange->s1 ,
-                    input_seq[0]+arange->s2, arange->e2 - arange->s2 ,
-                    INDEL_ALLOWENCE_2, 1);
+        aln = align_ws(ws, input_seq[j]+arange->s1, arange->e1 - arange->s1 ,
+                       input_seq[0]+arange->s2, arange->e2 - arange->s2);
+        ws->n_aligned++;
+        stats.n_aligned++;
+        stats.align_s += lap_s(&t);
 
 #ifdef DEBUG_PRINT_CONS_STATUS
         fprintf(stderr, "(internal) 2: %lf\n\n", (((double) aln->dist / (double) aln->aln_str_size)));
 #endif
 
         if (aln->aln_str_size > 500 && ((double) aln->dist / (double) aln->aln_str_size) < max_diff) {
-            tags_list[aligned_seq_count] = get_align_tags( aln->q_aln_str,
-                                                           aln->t_aln_str,
-                                                           aln->aln_str_size,
-                                                           arange->s1,
-                                                           arange->s2,
-                                                           j,
-                                                           0);
+            msa_add_alignment( ws,
+                               aln->q_aln_str,
+                               aln->t_aln_str,
+                               aln->aln_str_size,
+                               arange->s1,
+                               arange->s2,
+                               j);
             aligned_seq_count ++;
+            add_aln_cov(ws, arange->s2, arange->e2);
+            stats.n_used++;
+            stats.msa_s += lap_s(&t);
+        } else {
+            stats.n_low_idt++;
         }
-        /***
-        for (k = 0; k < tags_list[j]->len; k++) {
-            printf("%ld %d %c\n", tags_list[j]->align_tags[k].t_pos,
-                                   tags_list[j]->align_tags[k].delta,
-                                   tags_list[j]->align_tags[k].q_base);
-        }
-        ***/
         free_aln_range(arange);
         free_alignment(aln);
-        free_kmer_match( kmer_match_ptr);
     }
 
+    lap_s(&t);
     if (aligned_seq_count > 0) {
-        consensus = get_cns_from_align_tags( tags_list, aligned_seq_count, strlen(input_seq[0]), min_cov );
-        if (!consensus) return 0;
+        consensus = get_cns_from_msa_ws( ws, seed_len, min_cov );
     } else {
         // allocate an empty consensus sequence
-        consensus = calloc( 1, sizeof(consensus_data) );
-        consensus->sequence = calloc( 1, sizeof(char) );
-        consensus->eqv = calloc( 1, sizeof(unsigned int) );
-    }
-    //free(consensus);
-    free_seq_addr_array(sda_ptr);
-    free_seq_array(sa_ptr);
-    free_kmer_lookup(lk_ptr);
-    for (j=0; j < aligned_seq_count; j++) {
-        free_align_tags(tags_list[j]);
-    }
-    free(tags_list);
+        consensus = get_empty_consensus();
+    }
+    if (!consensus) {
+        // get_cns_from_msa_ws() found no consensus; return it empty, but with the stats.
+        consensus = get_empty_consensus();
+    }
+    stats.vote_s = lap_s(&t);
+    consensus->stats = stats;
     return consensus;
 }
 
-consensus_data * generate_consensus_from_mapping( char ** input_seq,
+// For --trim: the range of each read input_seq[1..n_seq) which shares k-mers with
+// the seed input_seq[0], the same as falcon_kit.mains.consensus.get_alignment(), but
+// indexing the seed only once. ranges[j - 1] gets the range of read j, with
+// score = 48 * the k-mer score, or all 0s if the read does not align to the seed.
+void get_trim_ranges_ws( consensus_workspace * ws,
+                         char ** input_seq,
+                         unsigned int n_seq,
+                         unsigned K,
+                         seq_coor_t edge_tolerance,
+                         aln_range * ranges) {
+    unsigned int j;
+    seq_coor_t seed_len;
+    seq_coor_t read_len;
+    seq_coor_t s1, e1, s0, e0, aln_size;
+    long int km_score;
+    kmer_index * index;
+    aln_range * arange;
+
+    seed_len = (seq_coor_t) strlen( input_seq[0] );
+    index = reserve_workspace_index(ws, input_seq[0], seed_len, K);
+    mask_kmer_index(index, 16);
+    for (j = 1; j < n_seq; j++) {
+        memset(&ranges[j - 1], 0, sizeof(aln_range));
+        read_len = (seq_coor_t) strlen( input_seq[j] );
+        find_kmer_pos_in_index(index, input_seq[j], read_len, ws->kmer_match);
+        if (ws->kmer_match->count == 0) {
+            continue;
+        }
+        arange = find_best_aln_range2(ws->kmer_match, K, K * 50, 25);
+        s1 = arange->s1;
+        e1 = arange->e1 + K + K / 2;
+        s0 = arange->s2;
+        e0 = arange->e2 + K + K / 2;
+        km_score = arange->score;
+        free_aln_range(arange);
+        if (e1 > read_len) e1 = read_len;
+        if (e0 > seed_len) e0 = seed_len;
+        aln_size = (e1 - s1 > e0 - s0) ? e1 - s1 : e0 - s0;
+
+        if (s1 > edge_tolerance && s0 > edge_tolerance) continue;
+        if (read_len - e1 > edge_tolerance && seed_len - e0 > edge_tolerance) continue;
+        if (e1 - s1 > 500 && aln_size > 500) {
+            ranges[j - 1].s1 = s1;
+            ranges[j - 1].e1 = e1;
+            ranges[j - 1].s2 = s0;
+            ranges[j - 1].e2 = e0;
+            ranges[j - 1].score = km_score * 48;
+        }
+    }
+}
+
+consensus_data * generate_consensus( char ** input_seq,
+                           unsigned int n_seq,
+                           unsigned min_cov,
+                           unsigned K,
+                           double min_idt) {
+    return generate_consensus_ws(get_default_workspace(), input_seq, n_seq, min_cov, K, min_idt);
+}
+
+consensus_data * generate_consensus_from_mapping_ws( consensus_workspace * ws,
+                           char ** input_seq,
                            aln_range **input_aranges,
                            unsigned int n_seq,
                            unsigned min_cov,
@@ -680,10 +984,11 @@ consensus_data * generate_consensus_from_mapping( char ** input_seq,
     //kmer_match * kmer_match_ptr = NULL;
     aln_range * arange = NULL;
     alignment * aln = NULL;
-    align_tags_t ** tags_list = NULL;
     //char * consensus;
     consensus_data * consensus = NULL;
     double max_diff = 0.0;
+    consensus_stats stats;
+    struct timespec t;
     max_diff = 1.0 - min_idt;
 
     fprintf(stderr, "[consensus] In generate_consensus_from_mapping.\n");
@@ -692,10 +997,20 @@ consensus_data * generate_consensus_from_mapping( char ** input_seq,
 
     fflush(stdout);
 
-    tags_list = calloc( seq_count, sizeof(align_tags_t *) );
+    memset(&stats, 0, sizeof(stats));
+    stats.n_reads = seq_count - 1;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+
+    reserve_workspace_aln_cov(ws, (seq_coor_t) strlen(input_seq[0]));
+    reserve_workspace_msa(ws, strlen(input_seq[0]) + 1);
 
     aligned_seq_count = 0;
     for (j=1; j < seq_count; j++) {
+        if (is_seed_saturated(ws, K * INDEL_ALLOWENCE_0)) {
+            ws->n_skipped += seq_count - j;
+            stats.n_cov_skipped += seq_count - j;
+            break;
+        }
         arange = input_aranges[j];
 
 #define INDEL_ALLOWENCE_1 0.10
@@ -707,13 +1022,20 @@ consensus_data * generate_consensus_from_mapping( char ** input_seq,
         if (arange->e1 - arange->s1 < 100 || arange->e2 - arange->s2 < 100 ||
             abs( (arange->e1 - arange->s1 ) - (arange->e2 - arange->s2) ) >
                    (int) (0.5 * INDEL_ALLOWENCE_1 * (arange->e1 - arange->s1 + arange->e2 - arange->s2))) {
+            stats.n_bad_range++;
+            continue;
+        }
+        if (is_aln_cov_saturated(ws, arange->s2, arange->e2, K * INDEL_ALLOWENCE_0)) {
+            ws->n_skipped++;
+            stats.n_cov_skipped++;
             continue;
         }
 
-#define INDEL_ALLOWENCE_2 150
-        aln = align(input_seq[j]+arange->s1, arange->e1 - arange->s1 ,
-                    input_seq[0]+arange->s2, arange->e2 - arange->s2 ,
-                    INDEL_ALLOWENCE_2, 1);
+        aln = align_ws(ws, input_seq[j]+arange->s1, arange->e1 - arange->s1 ,
+                       input_seq[0]+arange->s2, arange->e2 - arange->s2);
+        ws->n_aligned++;
+        stats.n_aligned++;
+        stats.align_s += lap_s(&t);
 
 #ifdef DEBUG_PRINT_CONS_STATUS
         fprintf(stderr, "(external) 2: %lf\n", (((double) aln->dist / (double) aln->aln_str_size)));
@@ -751,17 +1073,22 @@ consensus_data * generate_consensus_from_mapping( char ** input_seq,
         // }
 
         if ((aln->aln_str_size - aln_clip_offset) > 500 && ((double) aln->dist / (double) (aln->aln_str_size - aln_clip_offset)) < max_diff) {
-            tags_list[aligned_seq_count] = get_align_tags( aln->q_aln_str + aln_clip_offset,
-                                                           aln->t_aln_str + aln_clip_offset,
-                                                           aln->aln_str_size - aln_clip_offset,
-                                                           q_start,
-                                                           t_start,
-                                                           j,
-                                                           0);
+            msa_add_alignment( ws,
+                               aln->q_aln_str + aln_clip_offset,
+                               aln->t_aln_str + aln_clip_offset,
+                               aln->aln_str_size - aln_clip_offset,
+                               q_start,
+                               t_start,
+                               j);
             aligned_seq_count ++;
+            add_aln_cov(ws, arange->s2, arange->e2);
+            stats.n_used++;
+            stats.msa_s += lap_s(&t);
 #ifdef DEBUG_PRINT_CONS_STATUS
             fprintf(stderr, "(external) 3: Passed filters and added tags.\n");
 #endif
+        } else {
+            stats.n_low_idt++;
         }
 
 #ifdef DEBUG_PRINT_CONS_STATUS
@@ -775,25 +1102,137 @@ consensus_data * generate_consensus_from_mapping( char ** input_seq,
     fprintf(stderr, "(external) 5: Finally, aligned_seq_count = %d\n\n", aligned_seq_count);
 #endif
 
+    lap_s(&t);
     if (aligned_seq_count > 0) {
-        consensus = get_cns_from_align_tags( tags_list, aligned_seq_count, strlen(input_seq[0]), min_cov );
-        if (!consensus) {
-            return 0;
-        }
+        consensus = get_cns_from_msa_ws( ws, strlen(input_seq[0]), min_cov );
     } else {
         // allocate an empty consensus sequence
-        consensus = calloc( 1, sizeof(consensus_data) );
-        consensus->sequence = calloc( 1, sizeof(char) );
-        consensus->eqv = calloc( 1, sizeof(unsigned int) );
+        consensus = get_empty_consensus();
     }
-
-    for (j=0; j < aligned_seq_count; j++) {
-        free_align_tags(tags_list[j]);
+    if (!consensus) {
+        // get_cns_from_msa_ws() found no consensus; return it empty, but with the stats.
+        consensus = get_empty_consensus();
     }
-    free(tags_list);
+    stats.vote_s = lap_s(&t);
+    consensus->stats = stats;
     return consensus;
 }
 
+consensus_data * generate_consensus_from_mapping( char ** input_seq,
+                           aln_range **input_aranges,
+                           unsigned int n_seq,
+                           unsigned min_cov,
+                           unsigned K,
+                           double min_idt) {
+    return generate_consensus_from_mapping_ws(get_default_workspace(), input_seq, input_aranges,
+                                              n_seq, min_cov, K, min_idt);
+}
+
+typedef struct {
+    char ** input_seq;
+    aln_range ** input_aranges;
+    unsigned int * n_seqs;
+    unsigned int * first_seq;
+    unsigned int n_pileups;
+    unsigned min_cov;
+    unsigned K;
+    double min_idt;
+    consensus_data ** results;
+    unsigned int next_pileup;
+    pthread_mutex_t lock;
+} consensus_batch_t;
+
+typedef struct {
+    consensus_batch_t * batch;
+    consensus_workspace * ws;
+} consensus_batch_worker_t;
+
+static void * run_consensus_batch_worker(void * arg) {
+    consensus_batch_worker_t * worker = (consensus_batch_worker_t *) arg;
+    consensus_batch_t * batch = worker->batch;
+    unsigned int i, first;
+    while (1) {
+        pthread_mutex_lock(&batch->lock);
+        i = batch->next_pileup++;
+        pthread_mutex_unlock(&batch->lock);
+        if (i >= batch->n_pileups) break;
+        first = batch->first_seq[i];
+        if (batch->input_aranges && batch->input_aranges[first]) {
+            batch->results[i] = generate_consensus_from_mapping_ws(worker->ws, batch->input_seq + first,
+                                    batch->input_aranges + first, batch->n_seqs[i],
+                                    batch->min_cov, batch->K, batch->min_idt);
+        } else {
+            batch->results[i] = generate_consensus_ws(worker->ws, batch->input_seq + first,
+                                    batch->n_seqs[i], batch->min_cov, batch->K, batch->min_idt);
+        }
+    }
+    return NULL;
+}
+
+// Generate the consensus of n_pileups pile-ups on n_threads threads, one workspace per thread.
+// The sequences of pile-up i are n_seqs[i] consecutive entries of input_seq, seed first.
+// input_aranges is either NULL, or parallel to input_seq; a pile-up whose seed has a
+// non-NULL entry there uses those mapping coordinates, as in generate_consensus_from_mapping().
+// results[i] gets the consensus of pile-up i (NULL on failure), to be released with free_consensus_data().
+// This holds no Python state, so ctypes callers keep running other Python threads meanwhile.
+void generate_consensus_batch( consensus_workspace ** ws,
+                               unsigned int n_threads,
+                               char ** input_seq,
+                               aln_range ** input_aranges,
+                               unsigned int * n_seqs,
+                               unsigned int n_pileups,
+                               unsigned min_cov,
+                               unsigned K,
+                               double min_idt,
+                               consensus_data ** results) {
+    unsigned int i, n_started;
+    consensus_batch_t batch;
+    consensus_batch_worker_t * workers;
+    pthread_t * threads;
+
+    batch.input_seq = input_seq;
+    batch.input_aranges = input_aranges;
+    batch.n_seqs = n_seqs;
+    batch.n_pileups = n_pileups;
+    batch.min_cov = min_cov;
+    batch.K = K;
+    batch.min_idt = min_idt;
+    batch.results = results;
+    batch.next_pileup = 0;
+    batch.first_seq = calloc( n_pileups + 1, sizeof(unsigned int) );
+    for (i = 0; i < n_pileups; i++) {
+        batch.first_seq[i + 1] = batch.first_seq[i] + n_seqs[i];
+    }
+    pthread_mutex_init(&batch.lock, NULL);
+
+    if (n_threads > n_pileups) n_threads = n_pileups;
+    if (n_threads < 1) n_threads = 1;
+    workers = calloc( n_threads, sizeof(consensus_batch_worker_t) );
+    threads = calloc( n_threads, sizeof(pthread_t) );
+    for (i = 0; i < n_threads; i++) {
+        workers[i].batch = &batch;
+        workers[i].ws = ws[i];
+    }
+    // The calling thread is worker 0.
+    n_started = 1;
+    for (i = 1; i < n_threads; i++) {
+        if (pthread_create(&threads[i], NULL, run_consensus_batch_worker, &workers[i]) != 0) {
+            fprintf(stderr, "[generate_consensus_batch] Could only start %u of %u threads.\n", i, n_threads);
+            break;
+        }
+        n_started++;
+    }
+    run_consensus_batch_worker(&workers[0]);
+    for (i = 1; i < n_started; i++) {
+        pthread_join(threads[i], NULL);
+    }
+
+    pthread_mutex_destroy(&batch.lock);
+    free(batch.first_seq);
+    free(workers);
+    free(threads);
+}
+
 void free_consensus_data( consensus_data * consensus ){
     free(consensus->sequence);
     free(consensus->eqv);
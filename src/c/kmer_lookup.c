@@ -168,6 +168,7 @@ kmer_match * find_kmer_pos_for_seq( char * seq, seq_coor_t seq_len, unsigned int
 
     kmer_match_rtn = (kmer_match *) malloc( sizeof(kmer_match) );
     kmer_match_rtn->count = 0;
+    kmer_match_rtn->size = kmer_match_rtn_allocation_size;
     kmer_match_rtn->query_pos = (seq_coor_t *) calloc( kmer_match_rtn_allocation_size, sizeof( seq_coor_t ) );
     kmer_match_rtn->target_pos = (seq_coor_t *) calloc( kmer_match_rtn_allocation_size, sizeof( seq_coor_t ) );
 
@@ -230,10 +231,162 @@ kmer_match * find_kmer_pos_for_seq( char * seq, seq_coor_t seq_len, unsigned int
             }
         }
     }
+    kmer_match_rtn->size = kmer_match_rtn_allocation_size;
     free(sa);
     return kmer_match_rtn;
 }
 
+// 2-bit code of a base, or -1 for anything but ACGT.
+static inline int base_code(char c) {
+    switch (c) {
+        case 'A': return 0;
+        case 'C': return 1;
+        case 'G': return 2;
+        case 'T': return 3;
+        default: return -1;
+    }
+}
+
+kmer_index * allocate_kmer_index(unsigned int K) {
+    kmer_index * idx;
+    idx = (kmer_index *) calloc(1, sizeof(kmer_index));
+    idx->K = K;
+    idx->lk = allocate_kmer_lookup(1 << (K * 2));
+    return idx;
+}
+
+void free_kmer_index(kmer_index * idx) {
+    free_kmer_lookup(idx->lk);
+    free_seq_addr_array(idx->sda);
+    free(idx->used);
+    free(idx);
+}
+
+// Index the k-mers of seq (the seed), replacing whatever was indexed before.
+// Only the entries of lk used by the previous seed are reset, so this is
+// O(seq_len) rather than O(4^K). The k-mers are rolled directly from the
+// bases, 2 bits each, and are the same as those of add_sequence(start=0)
+// (which also means a base other than ACGT becomes 3 in the first k-mer,
+// and sets the low 8 bits of the rolling k-mer after that).
+void build_kmer_index(kmer_index * idx, char * seq, seq_coor_t seq_len) {
+    seq_coor_t i;
+    seq_coor_t kmer_bv;
+    seq_coor_t kmer_mask;
+    seq_coor_t K = (seq_coor_t) idx->K;
+    kmer_lookup * lk = idx->lk;
+    int code;
+
+    for (i = 0; i < idx->n_used; i++) {
+        lk[idx->used[i]].start = INT_MAX;
+        lk[idx->used[i]].last = INT_MAX;
+        lk[idx->used[i]].count = 0;
+    }
+    idx->n_used = 0;
+    if (seq_len > idx->seq_size) {
+        free_seq_addr_array(idx->sda);
+        free(idx->used);
+        idx->sda = allocate_seq_addr(seq_len);
+        idx->used = (seq_coor_t *) calloc(seq_len, sizeof(seq_coor_t));
+        idx->seq_size = seq_len;
+    }
+    idx->seq_len = seq_len;
+
+    kmer_mask = (seq_coor_t) ((1U << (K * 2)) - 1);
+    kmer_bv = 0;
+    for (i = 0; i < K && i < seq_len; i++) {
+        code = base_code(seq[i]);
+        kmer_bv = (kmer_bv << 2) | (code < 0 ? 3 : code);
+    }
+    for (i = 0; i < seq_len - K; i++) {
+        // Chains end at a 0 (see find_kmer_pos_for_seq()), so clear what a longer seed left here.
+        idx->sda[i] = 0;
+        if (lk[kmer_bv].start == INT_MAX) {
+            lk[kmer_bv].start = i;
+            lk[kmer_bv].last = i;
+            lk[kmer_bv].count += 1;
+            idx->used[idx->n_used++] = kmer_bv;
+        } else {
+            idx->sda[ lk[kmer_bv].last ] = i;
+            lk[kmer_bv].count += 1;
+            lk[kmer_bv].last = i;
+        }
+        code = base_code(seq[i + K]);
+        kmer_bv = ((kmer_bv << 2) | (code < 0 ? 0xff : code)) & kmer_mask;
+    }
+}
+
+// Like mask_k_mer(), but only looks at the k-mers present in the index.
+void mask_kmer_index(kmer_index * idx, seq_coor_t threshold) {
+    seq_coor_t i;
+    kmer_lookup * lk = idx->lk;
+    for (i = 0; i < idx->n_used; i++) {
+        if (lk[idx->used[i]].count > threshold) {
+            lk[idx->used[i]].start = INT_MAX;
+            lk[idx->used[i]].last = INT_MAX;
+        }
+    }
+}
+
+kmer_match * allocate_kmer_match(void) {
+    kmer_match * km;
+    km = (kmer_match *) calloc(1, sizeof(kmer_match));
+    km->size = KMERMATCHINC;
+    km->query_pos = (seq_coor_t *) calloc(km->size, sizeof(seq_coor_t));
+    km->target_pos = (seq_coor_t *) calloc(km->size, sizeof(seq_coor_t));
+    return km;
+}
+
+static inline void append_kmer_match(kmer_match * km, seq_coor_t query_pos, seq_coor_t target_pos) {
+    if (km->count == km->size) {
+        km->size *= 2;
+        km->query_pos = (seq_coor_t *) realloc(km->query_pos, km->size * sizeof(seq_coor_t));
+        km->target_pos = (seq_coor_t *) realloc(km->target_pos, km->size * sizeof(seq_coor_t));
+    }
+    km->query_pos[km->count] = query_pos;
+    km->target_pos[km->count] = target_pos;
+    km->count += 1;
+}
+
+// Same as find_kmer_pos_for_seq(), but into km (which is emptied first, and
+// grown as needed), and without any per-query allocation. The index is only
+// read, so several threads can query it at once, each with its own km.
+void find_kmer_pos_in_index(kmer_index * idx, char * seq, seq_coor_t seq_len, kmer_match * km) {
+    seq_coor_t i;
+    seq_coor_t kmer_bv;
+    seq_coor_t kmer_mask;
+    seq_coor_t kmer_pos;
+    seq_coor_t next_kmer_pos;
+    seq_coor_t K = (seq_coor_t) idx->K;
+    seq_coor_t half_K = K >> 1;
+    kmer_lookup * lk = idx->lk;
+    seq_addr_array sda = idx->sda;
+    int code;
+
+    km->count = 0;
+    kmer_mask = (seq_coor_t) ((1U << (K * 2)) - 1);
+    kmer_bv = 0;
+    // kmer_bv is the k-mer ending at base i, so the one starting at i - K + 1.
+    // Like find_kmer_pos_for_seq(), a base other than ACGT counts as A.
+    for (i = 0; i < seq_len - 1; i++) {
+        code = base_code(seq[i]);
+        kmer_bv = ((kmer_bv << 2) | (code < 0 ? 0 : code)) & kmer_mask;
+        if (i < K - 1 || (i - K + 1) % half_K != 0) {
+            continue;
+        }
+        if (lk[kmer_bv].start == INT_MAX) {  //for high count k-mers
+            continue;
+        }
+        kmer_pos = lk[ kmer_bv ].start;
+        next_kmer_pos = sda[ kmer_pos ];
+        append_kmer_match(km, i - K + 1, kmer_pos);
+        while ( next_kmer_pos > kmer_pos ){
+            kmer_pos = next_kmer_pos;
+            next_kmer_pos = sda[ kmer_pos ];
+            append_kmer_match(km, i - K + 1, kmer_pos);
+        }
+    }
+}
+
 void free_kmer_match( kmer_match * ptr) {
     free(ptr->query_pos);
     free(ptr->target_pos);
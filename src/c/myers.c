@@ -0,0 +1,247 @@
+/*
+ * Global alignment by Myers' bit-vector algorithm (Myers 1999), with the
+ * query in blocks of 64 rows as in Hyyro (2003) and edlib. Only the blocks
+ * within a band around the diagonal of the two sequences are computed, and
+ * kept for the traceback.
+ *
+ * align_myers() returns the same kind of alignment as align(), so it can
+ * stand in for it in consensus; see set_consensus_aligner().
+ */
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <limits.h>
+#include "common.h"
+
+typedef uint64_t myers_word;
+
+#define MYERS_WORD_BITS 64
+#define MYERS_INF (INT_MAX / 2)
+
+// One block of 64 rows of one column.
+typedef struct {
+    myers_word pv;     // rows where D is one more than in the row above
+    myers_word mv;     // rows where D is one less than in the row above
+    seq_coor_t score;  // D in the last row of the block
+} myers_block;
+
+// The banded DP matrix: column j (1..t_len) holds blocks col_first[j]..col_last[j],
+// stored from blocks[col_start[j]].
+typedef struct {
+    myers_block * blocks;
+    size_t * col_start;
+    seq_coor_t * col_first;
+    seq_coor_t * col_last;
+} myers_matrix;
+
+// Advance one block by one column; hin and the returned hout are the changes
+// of D along the row above the block, and along its last row.
+static int advance_block(myers_block * blk, myers_word eq, int hin) {
+    myers_word pv = blk->pv;
+    myers_word mv = blk->mv;
+    myers_word hin_pos = (myers_word) (hin > 0);
+    myers_word hin_neg = (myers_word) (hin < 0);
+    myers_word xv = eq | mv;
+    myers_word xh, ph, mh;
+    int hout;
+
+    // No branches: hin and hout are as good as random.
+    eq |= hin_neg;
+    xh = (((eq & pv) + pv) ^ pv) | eq;
+    ph = mv | ~(xh | pv);
+    mh = pv & xh;
+    hout = (int) (ph >> (MYERS_WORD_BITS - 1)) - (int) (mh >> (MYERS_WORD_BITS - 1));
+    ph = (ph << 1) | hin_pos;
+    mh = (mh << 1) | hin_neg;
+    blk->pv = mh | ~(xv | ph);
+    blk->mv = ph & xv;
+    blk->score += hout;
+    return hout;
+}
+
+// The rows [lo, hi] of column j within band_width of the diagonal, as blocks.
+static void get_band(seq_coor_t j, seq_coor_t q_len, seq_coor_t t_len, seq_coor_t band_width,
+                     seq_coor_t * first, seq_coor_t * last) {
+    seq_coor_t center = (seq_coor_t) ((long long) j * q_len / t_len);
+    seq_coor_t lo = center - band_width;
+    seq_coor_t hi = center + band_width;
+    if (lo < 1) lo = 1;
+    if (hi > q_len) hi = q_len;
+    if (hi < lo) hi = lo;
+    *first = (lo - 1) / MYERS_WORD_BITS;
+    *last = (hi - 1) / MYERS_WORD_BITS;
+}
+
+static void fill_matrix(myers_matrix * m,
+                        const char * query_seq, seq_coor_t q_len,
+                        const char * target_seq, seq_coor_t t_len,
+                        seq_coor_t band_width) {
+    seq_coor_t n_blocks = (q_len + MYERS_WORD_BITS - 1) / MYERS_WORD_BITS;
+    int sym_of[256];
+    int n_sym = 0;
+    myers_word * peq;
+    const myers_word * eqs;
+    myers_block * state;
+    myers_block * col;
+    size_t n_stored = 0;
+    seq_coor_t i, j, b, first, last;
+    seq_coor_t prev_last = -1;
+    int hin, sym;
+
+    m->col_start = (size_t *) calloc(t_len + 1, sizeof(size_t));
+    m->col_first = (seq_coor_t *) calloc(t_len + 1, sizeof(seq_coor_t));
+    m->col_last = (seq_coor_t *) calloc(t_len + 1, sizeof(seq_coor_t));
+    for (j = 1; j <= t_len; j++) {
+        get_band(j, q_len, t_len, band_width, &m->col_first[j], &m->col_last[j]);
+        m->col_start[j] = n_stored;
+        n_stored += m->col_last[j] - m->col_first[j] + 1;
+    }
+    m->blocks = (myers_block *) malloc((n_stored + 1) * sizeof(myers_block));
+
+    // The rows of each block which match each symbol of the query.
+    memset(sym_of, -1, sizeof(sym_of));
+    for (i = 0; i < q_len; i++) {
+        if (sym_of[(unsigned char) query_seq[i]] < 0) {
+            sym_of[(unsigned char) query_seq[i]] = n_sym++;
+        }
+    }
+    // The last row of peq, all zeros, is for symbols not in the query.
+    peq = (myers_word *) calloc((size_t) (n_sym + 1) * n_blocks, sizeof(myers_word));
+    for (i = 0; i < q_len; i++) {
+        sym = sym_of[(unsigned char) query_seq[i]];
+        peq[(size_t) sym * n_blocks + i / MYERS_WORD_BITS] |= (myers_word) 1 << (i % MYERS_WORD_BITS);
+    }
+
+    state = (myers_block *) malloc((n_blocks + 1) * sizeof(myers_block));
+    for (j = 1; j <= t_len; j++) {
+        first = m->col_first[j];
+        last = m->col_last[j];
+        // Blocks entering the band start from column j - 1 as if D went up by one per row.
+        for (b = prev_last + 1; b <= last; b++) {
+            state[b].pv = ~(myers_word) 0;
+            state[b].mv = 0;
+            state[b].score = ((b > 0) ? state[b - 1].score : 0) + MYERS_WORD_BITS;
+            if (j == 1) state[b].score = (b + 1) * MYERS_WORD_BITS;
+        }
+        prev_last = last;
+        sym = sym_of[(unsigned char) target_seq[j - 1]];
+        eqs = (sym < 0) ? peq + (size_t) n_sym * n_blocks : peq + (size_t) sym * n_blocks;
+        col = m->blocks + m->col_start[j] - first;
+        // D goes up by one along row 0; above the band, take it to do the same.
+        hin = 1;
+        for (b = first; b <= last; b++) {
+            hin = advance_block(&state[b], eqs[b], hin);
+            col[b] = state[b];
+        }
+    }
+    free(state);
+    free(peq);
+}
+
+static void free_matrix(myers_matrix * m) {
+    free(m->blocks);
+    free(m->col_start);
+    free(m->col_first);
+    free(m->col_last);
+}
+
+// D[i][j], or MYERS_INF outside the band.
+static seq_coor_t get_cell(const myers_matrix * m, seq_coor_t i, seq_coor_t j) {
+    const myers_block * blk;
+    seq_coor_t b, bit;
+    myers_word below;
+    if (j == 0) return i;
+    if (i == 0) return j;
+    b = (i - 1) / MYERS_WORD_BITS;
+    if (b < m->col_first[j] || b > m->col_last[j]) return MYERS_INF;
+    blk = &m->blocks[m->col_start[j] + (b - m->col_first[j])];
+    bit = (i - 1) % MYERS_WORD_BITS;
+    below = (bit == MYERS_WORD_BITS - 1) ? 0 : (~(myers_word) 0 << (bit + 1));
+    return blk->score - __builtin_popcountll(blk->pv & below) + __builtin_popcountll(blk->mv & below);
+}
+
+alignment * align_myers(char * query_seq, seq_coor_t q_len,
+                        char * target_seq, seq_coor_t t_len,
+                        seq_coor_t band_width) {
+    myers_matrix m = {0};
+    alignment * align_rtn;
+    char * q_aln;
+    char * t_aln;
+    seq_coor_t i = q_len;
+    seq_coor_t j = t_len;
+    seq_coor_t d, diag, up, left;
+    seq_coor_t n_indel = 0, n_mismatch = 0;
+    seq_coor_t pos = 0, k;
+    char c;
+
+    if (q_len > 0 && t_len > 0) {
+        fill_matrix(&m, query_seq, q_len, target_seq, t_len, band_width);
+    }
+
+    align_rtn = calloc(1, sizeof(alignment));
+    q_aln = calloc(q_len + t_len + 1, sizeof(char));
+    t_aln = calloc(q_len + t_len + 1, sizeof(char));
+
+    // Trace back from the end. A match is taken first, so gaps go as far left
+    // as they can, as in align(); then a gap before a mismatch, since the MSA
+    // of the consensus was tuned on the gaps-only alignments of align().
+    d = get_cell(&m, i, j);
+    while (i > 0 || j > 0) {
+        diag = (i > 0 && j > 0) ? get_cell(&m, i - 1, j - 1) : MYERS_INF;
+        if (diag < MYERS_INF && diag == d && query_seq[i - 1] == target_seq[j - 1]) {
+            q_aln[pos] = query_seq[--i];
+            t_aln[pos++] = target_seq[--j];
+            continue;
+        }
+        up = (i > 0) ? get_cell(&m, i - 1, j) : MYERS_INF;
+        left = (j > 0) ? get_cell(&m, i, j - 1) : MYERS_INF;
+        if (up == d - 1) {
+            q_aln[pos] = query_seq[--i];
+            t_aln[pos] = '-';
+            n_indel++;
+            d = up;
+        } else if (left == d - 1) {
+            q_aln[pos] = '-';
+            t_aln[pos] = target_seq[--j];
+            n_indel++;
+            d = left;
+        } else if (diag < MYERS_INF && (diag == d - 1 || (diag <= up && diag <= left))) {
+            // A mismatch; or, where the band cut the path off, the least costly way back.
+            q_aln[pos] = query_seq[--i];
+            t_aln[pos] = target_seq[--j];
+            if (q_aln[pos] != t_aln[pos]) n_mismatch++;
+            d = diag;
+        } else if (up <= left) {
+            q_aln[pos] = query_seq[--i];
+            t_aln[pos] = '-';
+            n_indel++;
+            d = up;
+        } else {
+            q_aln[pos] = '-';
+            t_aln[pos] = target_seq[--j];
+            n_indel++;
+            d = left;
+        }
+        pos++;
+    }
+    for (k = 0; k < pos / 2; k++) {
+        c = q_aln[k]; q_aln[k] = q_aln[pos - 1 - k]; q_aln[pos - 1 - k] = c;
+        c = t_aln[k]; t_aln[k] = t_aln[pos - 1 - k]; t_aln[pos - 1 - k] = c;
+    }
+
+    align_rtn->q_aln_str = q_aln;
+    align_rtn->t_aln_str = t_aln;
+    align_rtn->aln_str_size = pos;
+    // As align() counts: a mismatch is an insertion plus a deletion.
+    align_rtn->dist = n_indel + 2 * n_mismatch;
+    align_rtn->aln_q_s = 0;
+    align_rtn->aln_q_e = q_len;
+    align_rtn->aln_t_s = 0;
+    align_rtn->aln_t_e = t_len;
+
+    if (q_len > 0 && t_len > 0) {
+        free_matrix(&m);
+    }
+    return align_rtn;
+}
@@ -0,0 +1,302 @@
+/*
+ * Decode LA4Falcon -m output, and filter the overlaps, without a Python
+ * object per line. See falcon_kit/ovlp_reader.py.
+ */
+
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include "common.h"
+
+static int is_space(char c) {
+    return c == ' ' || c == '\t' || c == '\r';
+}
+
+// The next whitespace-separated token of the line [*p, end), or 0 if none is left.
+static long next_token(const char ** p, const char * end, const char ** tok) {
+    const char * s = *p;
+    while (s < end && is_space(*s)) s++;
+    *tok = s;
+    while (s < end && !is_space(*s)) s++;
+    *p = s;
+    return s - *tok;
+}
+
+static int parse_int(const char * tok, long len, int * out) {
+    long i = 0;
+    long v = 0;
+    int neg = 0;
+    if (len > 0 && tok[0] == '-') {
+        neg = 1;
+        i = 1;
+    }
+    if (i == len || len - i > 10) return 0;
+    for (; i < len; i++) {
+        if (tok[i] < '0' || tok[i] > '9') return 0;
+        v = v * 10 + (tok[i] - '0');
+    }
+    if (v > 2147483647L) return 0;
+    *out = (int) (neg ? -v : v);
+    return 1;
+}
+
+// Read ids must be printed as "%09d", so they convert back exactly.
+static int parse_id(const char * tok, long len, int * out) {
+    if (len < 9 || (len > 9 && tok[0] == '0') || tok[0] == '-') return 0;
+    return parse_int(tok, len, out);
+}
+
+static int parse_double(const char * tok, long len, double * out) {
+    char tmp[64];
+    char * tmp_end;
+    if (len == 0 || len >= (long) sizeof(tmp)) return 0;
+    memcpy(tmp, tok, len);
+    tmp[len] = '\0';
+    *out = strtod(tmp, &tmp_end);
+    return tmp_end == tmp + len;
+}
+
+static int parse_kind(const char * tok, long len) {
+    if (len == 7 && memcmp(tok, "overlap", 7) == 0) return OVLP_OVERLAP;
+    if (len == 8 && memcmp(tok, "contains", 8) == 0) return OVLP_CONTAINS;
+    if (len == 9 && memcmp(tok, "contained", 9) == 0) return OVLP_CONTAINED;
+    return OVLP_OTHER;
+}
+
+// Parse one line [line, end) into o. Return 1 on success, 0 for a blank line, -1 if malformed.
+static int parse_ovlp_line(const char * line, const char * end, ovlp_t * o) {
+    const char * p = line;
+    const char * tok;
+    const char * last_tok = NULL;
+    long len, last_len = 0;
+    int * ints[] = {&o->q_id, &o->t_id, &o->score, NULL, &o->q_strand, &o->q_s, &o->q_e, &o->q_l,
+                    &o->t_strand, &o->t_s, &o->t_e, &o->t_l};
+    int field;
+
+    for (field = 0; field < 12; field++) {
+        len = next_token(&p, end, &tok);
+        if (len == 0) {
+            return (field == 0) ? 0 : -1;
+        }
+        if (field == 3) {
+            if (!parse_double(tok, len, &o->idt)) return -1;
+        } else if (field < 2) {
+            if (!parse_id(tok, len, ints[field])) return -1;
+        } else {
+            if (!parse_int(tok, len, ints[field])) return -1;
+        }
+    }
+    // Like l[-1] of line.split(), the kind is the last token, if there is more.
+    while ((len = next_token(&p, end, &tok)) > 0) {
+        last_tok = tok;
+        last_len = len;
+    }
+    o->kind = last_tok ? parse_kind(last_tok, last_len) : OVLP_OTHER;
+    o->line_len = end - line;
+    return 1;
+}
+
+long parse_ovlps(const char * buf, long len, ovlp_t * ovlps, long max_ovlps, long * n_ovlps) {
+    const char * p = buf;
+    const char * buf_end = buf + len;
+    const char * eol;
+    long n = 0;
+    int rc;
+
+    while (n < max_ovlps && p < buf_end) {
+        eol = memchr(p, '\n', buf_end - p);
+        if (eol == NULL) break;
+        rc = parse_ovlp_line(p, eol, &ovlps[n]);
+        if (rc < 0) {
+            *n_ovlps = n;
+            return -1 - (p - buf);
+        }
+        if (rc > 0) {
+            ovlps[n].line_start = p - buf;
+            n++;
+        }
+        p = eol + 1;
+    }
+    *n_ovlps = n;
+    return p - buf;
+}
+
+long ovlp_last_group_start(const ovlp_t * ovlps, long n) {
+    long i = n - 1;
+    if (n == 0) return 0;
+    while (i > 0 && ovlps[i - 1].q_id == ovlps[n - 1].q_id) i--;
+    return i;
+}
+
+static int compare_int(const void * a, const void * b) {
+    int x = *(const int *) a;
+    int y = *(const int *) b;
+    return (x > y) - (x < y);
+}
+
+static int in_sorted_ids(int id, const int * ids, long n_ids) {
+    return n_ids > 0 && bsearch(&id, ids, n_ids, sizeof(int), compare_int) != NULL;
+}
+
+void ovlp_filter_stage1(const ovlp_t * ovlps, long n,
+                        int max_diff, int max_ovlp, int min_ovlp, int min_len, double min_idt,
+                        int * ignore, long * n_ignore, int * contained, long * n_contained) {
+    long i = 0, j;
+    int left, right;
+    long group_contained;
+
+    *n_ignore = 0;
+    *n_contained = 0;
+    while (i < n) {
+        left = 0;
+        right = 0;
+        group_contained = *n_contained;
+        for (j = i; j < n && ovlps[j].q_id == ovlps[i].q_id; j++) {
+            const ovlp_t * o = &ovlps[j];
+            if (o->idt < min_idt) continue;
+            if (o->q_l < min_len || o->t_l < min_len) continue;
+            if (o->q_s == 0) left++;
+            if (o->q_e == o->q_l) right++;
+            if (o->kind == OVLP_CONTAINS) {
+                contained[(*n_contained)++] = o->t_id;
+            }
+        }
+        if (abs(left - right) > max_diff ||
+            left > max_ovlp || right > max_ovlp ||
+            left < min_ovlp || right < min_ovlp) {
+            ignore[(*n_ignore)++] = ovlps[i].q_id;
+            *n_contained = group_contained;  // an ignored read does not count as containing anything
+        }
+        i = j;
+    }
+}
+
+// Compare the whitespace-separated tokens of two lines, as Python compares line.split() lists.
+static int compare_line_tokens(const char * a, long a_len, const char * b, long b_len) {
+    const char * a_end = a + a_len;
+    const char * b_end = b + b_len;
+    const char * ta;
+    const char * tb;
+    long la, lb, m;
+    int c;
+    while (1) {
+        la = next_token(&a, a_end, &ta);
+        lb = next_token(&b, b_end, &tb);
+        if (la == 0 || lb == 0) return (la > 0) - (lb > 0);
+        m = la < lb ? la : lb;
+        c = memcmp(ta, tb, m);
+        if (c != 0) return c;
+        if (la != lb) return (la > lb) - (la < lb);
+    }
+}
+
+typedef struct {
+    int score;
+    int m_range;
+    const char * line;
+    long line_len;
+    long idx;
+} end_candidate;
+
+static int compare_end_candidate(const void * a, const void * b) {
+    const end_candidate * x = a;
+    const end_candidate * y = b;
+    if (x->score != y->score) return (x->score > y->score) - (x->score < y->score);
+    if (x->m_range != y->m_range) return (x->m_range > y->m_range) - (x->m_range < y->m_range);
+    return compare_line_tokens(x->line, x->line_len, y->line, y->line_len);
+}
+
+// Keep the best of one end: in order, up to and including the first after bestn with m_range > 1000.
+static long select_end(end_candidate * cands, long n_cands, int bestn, long * selected, long n_selected) {
+    long i;
+    qsort(cands, n_cands, sizeof(end_candidate), compare_end_candidate);
+    for (i = 0; i < n_cands; i++) {
+        selected[n_selected++] = cands[i].idx;
+        if (i >= bestn && cands[i].m_range > 1000) break;
+    }
+    return n_selected;
+}
+
+long ovlp_filter_stage2(const char * buf, const ovlp_t * ovlps, long n,
+                        int min_len, double min_idt,
+                        const int * ignore, long n_ignore, const int * contained, long n_contained,
+                        int bestn, long * selected) {
+    long i = 0, j;
+    long n_left, n_right;
+    long n_selected = 0;
+    end_candidate * left = (end_candidate *) malloc((n + 1) * sizeof(end_candidate));
+    end_candidate * right = (end_candidate *) malloc((n + 1) * sizeof(end_candidate));
+
+    while (i < n) {
+        n_left = 0;
+        n_right = 0;
+        for (j = i; j < n && ovlps[j].q_id == ovlps[i].q_id; j++) {
+            const ovlp_t * o = &ovlps[j];
+            end_candidate * c;
+            if (in_sorted_ids(o->q_id, contained, n_contained)) continue;
+            if (in_sorted_ids(o->t_id, contained, n_contained)) continue;
+            if (in_sorted_ids(o->q_id, ignore, n_ignore)) continue;
+            if (in_sorted_ids(o->t_id, ignore, n_ignore)) continue;
+            if (o->idt < min_idt) continue;
+            if (o->q_l < min_len || o->t_l < min_len) continue;
+            if (o->q_s == 0) {
+                c = &left[n_left++];
+            } else if (o->q_e == o->q_l) {
+                c = &right[n_right++];
+            } else {
+                continue;
+            }
+            c->score = o->score;
+            c->m_range = o->t_l - (o->t_e - o->t_s);
+            c->line = buf + o->line_start;
+            c->line_len = o->line_len;
+            c->idx = j;
+        }
+        n_selected = select_end(left, n_left, bestn, selected, n_selected);
+        n_selected = select_end(right, n_right, bestn, selected, n_selected);
+        i = j;
+    }
+    free(left);
+    free(right);
+    return n_selected;
+}
+
+long ovlp_stats(const ovlp_t * ovlps, long n, int min_len, int * stats) {
+    long i = 0, j;
+    long n_stats = 0;
+    int left, right;
+
+    while (i < n) {
+        left = 0;
+        right = 0;
+        for (j = i; j < n && ovlps[j].q_id == ovlps[i].q_id; j++) {
+            const ovlp_t * o = &ovlps[j];
+            if (o->q_l < min_len || o->t_l < min_len) continue;
+            if (o->idt < 90) continue;
+            if (o->q_s == 0) left++;
+            if (o->q_e == o->q_l) right++;
+        }
+        if (left > 0 || right > 0) {
+            // q_l is taken from the last line of the read, as in filter_stats().
+            stats[4 * n_stats + 0] = ovlps[i].q_id;
+            stats[4 * n_stats + 1] = ovlps[j - 1].q_l;
+            stats[4 * n_stats + 2] = left;
+            stats[4 * n_stats + 3] = right;
+            n_stats++;
+        }
+        i = j;
+    }
+    return n_stats;
+}
+
+long ovlp_select_by_q(const ovlp_t * ovlps, long n, int min_t_len,
+                      const int * q_ids, long n_q_ids, long * selected) {
+    long i;
+    long n_selected = 0;
+    for (i = 0; i < n; i++) {
+        if (ovlps[i].t_l < min_t_len) continue;
+        if (!in_sorted_ids(ovlps[i].q_id, q_ids, n_q_ids)) continue;
+        selected[n_selected++] = i;
+    }
+    return n_selected;
+}
@@ -0,0 +1,198 @@
+/*
+ * Passes over the string graph of ovlp_to_graph, on the arrays of
+ * falcon_kit/string_graph.py: the edges of node n are
+ * eids[start[n]:start[n + 1]], and dst[e] is the node edge e goes to.
+ */
+
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include <pthread.h>
+#include "common.h"
+
+#define TR_VACANT 0
+#define TR_INPLAY 1
+#define TR_ELIMINATED 2
+#define TR_BLOCK 4096
+
+// Stable merge sort of eids[0:n] by key[eid], using tmp (of n ints).
+static void sort_eids(int * eids, int * tmp, int n, const int * key, int descending) {
+    int width, lo, mid, hi, i, j, k, a, b;
+    for (width = 1; width < n; width *= 2) {
+        for (lo = 0; lo < n; lo += 2 * width) {
+            mid = lo + width < n ? lo + width : n;
+            hi = lo + 2 * width < n ? lo + 2 * width : n;
+            i = lo; j = mid; k = lo;
+            while (i < mid && j < hi) {
+                a = key[eids[i]];
+                b = key[eids[j]];
+                if (descending ? b > a : b < a) {
+                    tmp[k++] = eids[j++];
+                } else {
+                    tmp[k++] = eids[i++];
+                }
+            }
+            while (i < mid) tmp[k++] = eids[i++];
+            while (j < hi) tmp[k++] = eids[j++];
+        }
+        memcpy(eids, tmp, n * sizeof(int));
+    }
+}
+
+// Sort the edges of each of the n_nodes nodes by key[e], keeping the order of equal keys,
+// as list.sort(key=...) (or, if descending, with key=-key) does.
+void sg_sort_edges(int n_nodes, const int * start, int * eids, const int * key, int descending) {
+    int n, d, max_d = 0;
+    int * tmp;
+    for (n = 0; n < n_nodes; n++) {
+        d = start[n + 1] - start[n];
+        if (d > max_d) max_d = d;
+    }
+    tmp = malloc((max_d + 1) * sizeof(int));
+    for (n = 0; n < n_nodes; n++) {
+        d = start[n + 1] - start[n];
+        if (d > 1) sort_eids(eids + start[n], tmp, d, key, descending);
+    }
+    free(tmp);
+}
+
+typedef struct {
+    int n_nodes;
+    const int * out_start;
+    const int * out_eids;
+    const int * dst;
+    const int * len;
+    int fuzz;
+    unsigned char * eliminated;
+    int block;
+    int next_node;
+    pthread_mutex_t lock;
+} tr_pass_t;
+
+// The transitive reduction of the out-edges of node n, as mark_tr_edges() did it in Python.
+// n_mark is all TR_VACANT before and after; only eliminated[e] of the out-edges of n is set.
+static void mark_tr_node(const tr_pass_t * tr, int n, unsigned char * n_mark) {
+    const int * out_start = tr->out_start;
+    const int * out_eids = tr->out_eids;
+    const int * dst = tr->dst;
+    const int * len = tr->len;
+    int s = out_start[n], t = out_start[n + 1];
+    int i, j, e, e2, w, x, max_len;
+
+    if (s == t) return;
+    for (i = s; i < t; i++) {
+        n_mark[dst[out_eids[i]]] = TR_INPLAY;
+    }
+    max_len = len[out_eids[t - 1]] + tr->fuzz;
+
+    for (i = s; i < t; i++) {
+        e = out_eids[i];
+        w = dst[e];
+        if (n_mark[w] != TR_INPLAY) continue;
+        for (j = out_start[w]; j < out_start[w + 1]; j++) {
+            e2 = out_eids[j];
+            if (len[e2] + len[e] < max_len) {
+                x = dst[e2];
+                if (n_mark[x] == TR_INPLAY) n_mark[x] = TR_ELIMINATED;
+            }
+        }
+    }
+
+    for (i = s; i < t; i++) {
+        w = dst[out_eids[i]];
+        if (out_start[w + 1] > out_start[w]) {
+            x = dst[out_eids[out_start[w]]];
+            if (n_mark[x] == TR_INPLAY) n_mark[x] = TR_ELIMINATED;
+        }
+        for (j = out_start[w]; j < out_start[w + 1]; j++) {
+            e2 = out_eids[j];
+            if (len[e2] < tr->fuzz) {
+                x = dst[e2];
+                if (n_mark[x] == TR_INPLAY) n_mark[x] = TR_ELIMINATED;
+            }
+        }
+    }
+
+    for (i = s; i < t; i++) {
+        e = out_eids[i];
+        w = dst[e];
+        if (n_mark[w] == TR_ELIMINATED) tr->eliminated[e] = 1;
+        n_mark[w] = TR_VACANT;
+    }
+}
+
+static void * run_tr_worker(void * arg) {
+    tr_pass_t * tr = (tr_pass_t *) arg;
+    unsigned char * n_mark = calloc(tr->n_nodes, 1);
+    int n, first;
+    while (1) {
+        pthread_mutex_lock(&tr->lock);
+        first = tr->next_node;
+        tr->next_node += tr->block;
+        pthread_mutex_unlock(&tr->lock);
+        if (first >= tr->n_nodes) break;
+        for (n = first; n < first + tr->block && n < tr->n_nodes; n++) {
+            mark_tr_node(tr, n, n_mark);
+        }
+    }
+    free(n_mark);
+    return NULL;
+}
+
+// Transitive reduction: set e_reduce[e] and e_reduce[rev[e]] (unless rev[e] < 0) of each
+// out-edge e of a node which another path of out-edges, up to fuzz longer, also reaches.
+// The out-edges of each node must be sorted by len[e], shortest first.
+// Nodes depend only on the graph, not on each other's marks, so they are split among
+// n_threads threads; the result does not depend on n_threads.
+// Returns the number of edges eliminated (not counting their reverses), or -1 on failure.
+long sg_mark_tr_edges(int n_nodes, const int * out_start, const int * out_eids, int n_edges,
+                      const int * dst, const int * len, const int * rev, int fuzz,
+                      unsigned char * e_reduce, int n_threads) {
+    tr_pass_t tr;
+    pthread_t * threads;
+    int i, n_started;
+    long n_eliminated = 0;
+
+    tr.n_nodes = n_nodes;
+    tr.out_start = out_start;
+    tr.out_eids = out_eids;
+    tr.dst = dst;
+    tr.len = len;
+    tr.fuzz = fuzz;
+    tr.eliminated = calloc(n_edges + 1, 1);
+    tr.next_node = 0;
+    if (!tr.eliminated) return -1;
+    pthread_mutex_init(&tr.lock, NULL);
+
+    if (n_threads > n_nodes) n_threads = n_nodes;
+    if (n_threads < 1) n_threads = 1;
+    // Small enough blocks of nodes to keep all threads busy to the end.
+    tr.block = n_nodes / (16 * n_threads) + 1;
+    if (tr.block > TR_BLOCK) tr.block = TR_BLOCK;
+    threads = calloc(n_threads, sizeof(pthread_t));
+    // The calling thread is worker 0.
+    n_started = 1;
+    for (i = 1; i < n_threads; i++) {
+        if (pthread_create(&threads[i], NULL, run_tr_worker, &tr) != 0) {
+            fprintf(stderr, "[sg_mark_tr_edges] Could only start %d of %d threads.\n", i, n_threads);
+            break;
+        }
+        n_started++;
+    }
+    run_tr_worker(&tr);
+    for (i = 1; i < n_started; i++) {
+        pthread_join(threads[i], NULL);
+    }
+
+    for (i = 0; i < n_edges; i++) {
+        if (!tr.eliminated[i]) continue;
+        n_eliminated++;
+        e_reduce[i] = 1;
+        if (rev[i] >= 0) e_reduce[rev[i]] = 1;
+    }
+
+    pthread_mutex_destroy(&tr.lock);
+    free(tr.eliminated);
+    free(threads);
+    return n_eliminated;
+}
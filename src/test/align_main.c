@@ -0,0 +1,83 @@
+/*
+ * Check that align() gives identical results with either traceback store
+ * and with every match extension the CPU supports.
+ *
+ *   cat test.in | ./align_check
+ *
+ * Every read of each pile-up is aligned to the seed and to the next read,
+ * with ALIGN_TRACEBACK_FULL and scalar extension as the reference.
+ */
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include "common.h"
+
+static int same_alignment(alignment * a, alignment * b) {
+    return a->aln_str_size == b->aln_str_size &&
+           a->dist == b->dist &&
+           a->aln_q_s == b->aln_q_s && a->aln_q_e == b->aln_q_e &&
+           a->aln_t_s == b->aln_t_s && a->aln_t_e == b->aln_t_e &&
+           strcmp(a->q_aln_str, b->q_aln_str) == 0 &&
+           strcmp(a->t_aln_str, b->t_aln_str) == 0;
+}
+
+static int check_pair(char * q, char * t, seq_coor_t band_tolerance, int get_aln_str, int max_simd) {
+    alignment * expected;
+    alignment * aln;
+    int ok = 1;
+    int simd;
+
+    set_align_traceback(ALIGN_TRACEBACK_FULL);
+    set_align_simd(ALIGN_SIMD_NONE);
+    expected = align(q, strlen(q), t, strlen(t), band_tolerance, get_aln_str);
+    set_align_traceback(ALIGN_TRACEBACK_COMPACT);
+    for (simd = ALIGN_SIMD_NONE; simd <= max_simd; simd++) {
+        set_align_simd(simd);
+        aln = align(q, strlen(q), t, strlen(t), band_tolerance, get_aln_str);
+        ok = ok && same_alignment(expected, aln);
+        free_alignment(aln);
+    }
+    free_alignment(expected);
+    return ok;
+}
+
+int main() {
+    char id_buffer[1024];
+    char seq_buffer[65536];
+    char * seqs[501];
+    int n_seq = 0;
+    int n_checked = 0;
+    int n_failed = 0;
+    int max_simd = get_align_simd();
+    int i;
+
+    while (scanf("%1023s %65535s", id_buffer, seq_buffer) == 2) {
+        if (strcmp(id_buffer, "+") != 0 && strcmp(id_buffer, "-") != 0) {
+            if (n_seq < 501) {
+                seqs[n_seq++] = strdup(seq_buffer);
+            }
+            continue;
+        }
+        for (i = 1; i < n_seq; i++) {
+            seq_coor_t bands[] = {100, 10};
+            int b, get_aln_str;
+            for (b = 0; b < 2; b++) {
+                for (get_aln_str = 0; get_aln_str < 2; get_aln_str++) {
+                    n_checked += 2;
+                    n_failed += !check_pair(seqs[i], seqs[0], bands[b], get_aln_str, max_simd);
+                    n_failed += !check_pair(seqs[i], seqs[i % (n_seq - 1) + 1], bands[b], get_aln_str, max_simd);
+                }
+            }
+        }
+        for (i = 0; i < n_seq; i++) {
+            free(seqs[i]);
+        }
+        n_seq = 0;
+    }
+    if (n_failed > 0) {
+        fprintf(stderr, "%d of %d alignments differ\n", n_failed, n_checked);
+        return 1;
+    }
+    printf("%d alignments identical (up to simd level %d)\n", n_checked, max_simd);
+    return 0;
+}
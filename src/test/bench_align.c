@@ -0,0 +1,123 @@
+/*
+ * Time align() on simulated read pairs.
+ *
+ *   ./bench_align [-t full|compact] [-s none|sse2|avx2] [-n n_pairs] [-i identity] [length ...]
+ *
+ * Reads are copies of a random template with 85% identity by default (5%
+ * insertions, 5% deletions, 5% substitutions), like raw reads in a pile-up.
+ * -t picks the traceback store and -s caps the match extension (the default
+ * is the best one the CPU supports). Run each setting in its own process to
+ * compare the peak RSS (maxrss).
+ */
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+#include <sys/resource.h>
+#include "common.h"
+
+static const char bases[] = "ACGT";
+static const char * simd_names[] = {"none", "sse2", "avx2"};
+
+// Each of insertion, deletion and substitution happens with probability error_rate / 3.
+static char * sim_read(unsigned * state, const char * template, int len, double error_rate) {
+    char * read = calloc(2 * len + 1, sizeof(char));
+    int i, j = 0;
+    for (i = 0; i < len; i++) {
+        double r = (double) rand_r(state) / ((double) RAND_MAX + 1.0);
+        if (r < error_rate / 3) {
+            read[j++] = bases[rand_r(state) % 4];
+            read[j++] = template[i];
+        } else if (r < 2 * error_rate / 3) {
+            continue;
+        } else if (r < error_rate) {
+            read[j++] = bases[rand_r(state) % 4];
+        } else {
+            read[j++] = template[i];
+        }
+    }
+    return read;
+}
+
+static double now(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + 1e-9 * ts.tv_nsec;
+}
+
+int main(int argc, char ** argv) {
+    static const int default_lengths[] = {1000, 5000, 10000, 20000, 30000};
+    int traceback = ALIGN_TRACEBACK_COMPACT;
+    int simd = get_align_simd();
+    int n_pairs = 10;
+    double identity = 0.85;
+    int n_lengths = 5;
+    int lengths[64];
+    int i, l, opt;
+    unsigned state = 42;
+    struct rusage usage;
+
+    while ((opt = getopt(argc, argv, "t:s:n:i:")) != -1) {
+        switch (opt) {
+        case 't':
+            traceback = strcmp(optarg, "full") == 0 ? ALIGN_TRACEBACK_FULL : ALIGN_TRACEBACK_COMPACT;
+            break;
+        case 's':
+            simd = strcmp(optarg, "avx2") == 0 ? ALIGN_SIMD_AVX2 :
+                   strcmp(optarg, "sse2") == 0 ? ALIGN_SIMD_SSE2 : ALIGN_SIMD_NONE;
+            break;
+        case 'n':
+            n_pairs = atoi(optarg);
+            break;
+        case 'i':
+            identity = atof(optarg);
+            break;
+        default:
+            fprintf(stderr, "usage: %s [-t full|compact] [-s none|sse2|avx2] [-n n_pairs] [-i identity] [length ...]\n", argv[0]);
+            return 1;
+        }
+    }
+    if (optind < argc) {
+        n_lengths = 0;
+        for (i = optind; i < argc && n_lengths < 64; i++) {
+            lengths[n_lengths++] = atoi(argv[i]);
+        }
+    } else {
+        memcpy(lengths, default_lengths, sizeof(default_lengths));
+    }
+    set_align_traceback(traceback);
+    simd = set_align_simd(simd);
+
+    printf("# identity\t%.3f\n", identity);
+    printf("traceback\tsimd\tlength\tpairs\tsec_per_pair\tmbases_per_sec\tmean_dist\n");
+    for (l = 0; l < n_lengths; l++) {
+        int len = lengths[l];
+        char * template = calloc(len + 1, sizeof(char));
+        double elapsed = 0.0;
+        double n_bases = 0.0;
+        long total_dist = 0;
+        for (i = 0; i < len; i++) {
+            template[i] = bases[rand_r(&state) % 4];
+        }
+        for (i = 0; i < n_pairs; i++) {
+            char * q = sim_read(&state, template, len, 1.0 - identity);
+            char * t = sim_read(&state, template, len, 1.0 - identity);
+            double start = now();
+            alignment * aln = align(q, strlen(q), t, strlen(t), 100, 1);
+            elapsed += now() - start;
+            n_bases += strlen(q) + strlen(t);
+            total_dist += aln->dist;
+            free_alignment(aln);
+            free(q);
+            free(t);
+        }
+        printf("%s\t%s\t%d\t%d\t%.6f\t%.2f\t%.1f\n", traceback == ALIGN_TRACEBACK_FULL ? "full" : "compact",
+               simd_names[simd], len, n_pairs, elapsed / n_pairs, n_bases / elapsed / 1e6,
+               (double) total_dist / n_pairs);
+        free(template);
+    }
+    getrusage(RUSAGE_SELF, &usage);
+    printf("# maxrss_kb\t%ld\n", usage.ru_maxrss);
+    return 0;
+}
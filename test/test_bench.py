@@ -0,0 +1,89 @@
+import json
+import falcon_kit.bench.__main__ as mod
+
+
+def test_help():
+    try:
+        mod.main(['prog', '--help'])
+    except SystemExit:
+        pass
+
+
+def test_transport(tmpdir):
+    json_fn = str(tmpdir.join('out.json'))
+    mod.main(['prog', '--json-fn', json_fn, 'transport',
+              '--n-core', '1', '--n-pileups', '3', '--n-reads', '5', '--read-len', '1000', '--max-in-flight', '2'])
+    with open(json_fn) as f:
+        results = json.load(f)
+    assert [r['transport'] for r in results] == ['pickle', 'shared']
+    assert all(r['pileups'] == 3 for r in results)
+
+
+def test_aligners(tmpdir):
+    json_fn = str(tmpdir.join('out.json'))
+    mod.main(['prog', '--json-fn', json_fn, 'aligners',
+              '--n-pileups', '2', '--n-reads', '12', '--read-len', '1000', '--identity', '0.9'])
+    with open(json_fn) as f:
+        results = json.load(f)
+    assert [r['aligner'] for r in results] == ['dw', 'myers']
+    assert results[0]['identical'] == 2
+    assert all(r['mean_idt_template'] > 0.9 for r in results)
+
+
+def test_memory(tmpdir):
+    json_fn = str(tmpdir.join('out.json'))
+    mod.main(['prog', '--json-fn', json_fn, 'memory',
+              '--n-reads', '20', '--read-len', '2000', '--aligners', 'dw', 'myers'])
+    with open(json_fn) as f:
+        results = json.load(f)
+    assert [r['aligner'] for r in results] == ['dw', 'myers']
+    assert all(r['cns_len'] > 1800 for r in results)
+    assert all(r['peak_rss_growth_mb'] >= 0 for r in results)
+
+
+def test_kernels(tmpdir):
+    json_fn = str(tmpdir.join('out.json'))
+    argv = ['prog', '--json-fn', json_fn, 'kernels',
+            '--n-pileups', '2', '--n-reads', '12', '--read-len', '2000', '--identity', '0.9']
+    mod.main(argv)
+    with open(json_fn) as f:
+        results = json.load(f)
+    assert sorted(r['kernel'] for r in results) == sorted(mod.kernels.KERNELS)
+    calls = dict((r['kernel'], r['calls']) for r in results)
+    assert calls['kmer_lookup'] == calls['kmer_index'] == 24
+    assert calls['consensus'] == calls['cns_tags'] == 2
+    assert all(r['p50_ms'] <= r['p99_ms'] <= r['max_ms'] for r in results)
+
+    baseline_fn = str(tmpdir.join('baseline.json'))
+    tmpdir.join('out.json').move(tmpdir.join('baseline.json'))
+    mod.main(argv + ['--kernels', 'align', '--baseline-fn', baseline_fn])
+    with open(json_fn) as f:
+        results = json.load(f)
+    assert results[0]['speedup'] > 0
+
+
+def test_workflow(tmpdir):
+    json_fn = str(tmpdir.join('out.json'))
+    work_dir = str(tmpdir.join('work'))
+    argv = ['prog', '--json-fn', json_fn, 'workflow', '--work-dir', work_dir,
+            '--genome-size', '30000', '--coverage', '20', '--read-len', '4000', '--identity', '0.9']
+    mod.main(argv)
+    with open(json_fn) as f:
+        results = json.load(f)
+    assert [r['stage'] for r in results] == [stage for (stage, _) in mod.workflow.STAGES]
+    stages = dict((r['stage'], r) for r in results)
+    assert stages['consensus']['cns_seqs'] > 0
+    assert stages['graph_to_contig']['p_ctgs'] == 1
+    assert stages['graph_to_contig']['p_ctg_bases'] > 25000
+    assert all(r['wall_s'] >= 0 and r['peak_rss_mb'] > 0 for r in results)
+    with open(str(tmpdir.join('work', 'genome.fasta'))) as f:
+        genome = f.read().splitlines()[1]
+    with open(str(tmpdir.join('work', 'p_ctg.fasta'))) as f:
+        p_ctg = f.read().splitlines()[1]
+    assert p_ctg in genome or mod.workflow.synth.revcomp(p_ctg) in genome
+
+    # Later stages again, on what the first run left.
+    mod.main(argv + ['--stages', 'ovlp_filter', 'ovlp_to_graph'])
+    with open(json_fn) as f:
+        results = json.load(f)
+    assert [r['stage'] for r in results] == ['ovlp_filter', 'ovlp_to_graph']
@@ -1,4 +1,5 @@
 from io import StringIO
+import logging
 import sys
 import falcon_kit.mains.consensus as mod
 
@@ -81,3 +82,217 @@ def test_process_get_consensus_result(capsys):
         '',
     ]
     assert lines == expected
+
+def sim_reads(rnd, seq, n, err=0.05):
+    reads = []
+    for _ in range(n):
+        read = []
+        for c in seq:
+            r = rnd.random()
+            if r < err:
+                continue # deletion
+            read.append(c)
+            if r > 1.0 - err:
+                read.append(rnd.choice('ACGT')) # insertion
+        reads.append(''.join(read))
+    return reads
+
+def get_pileup(seed, length, n=12):
+    import random
+    rnd = random.Random(seed)
+    seq = ''.join(rnd.choice('ACGT') for _ in range(length))
+    return [mod.SeqTuple(name=str(i), seq=s, qstrand=0, qstart=-1, qend=-1, qlen=-1,
+                         tstart=-1, tend=-1, tlen=-1, aln='*', is_mapped=False, is_trimmed=False)
+            for i, s in enumerate([seq] + sim_reads(rnd, seq, n))]
+
+def test_get_consensus_core_reuses_workspace():
+    pileups = [get_pileup(1, 2000), get_pileup(2, 1000), get_pileup(3, 3000), get_pileup(1, 2000)]
+    got = [mod.get_consensus_core(seqs, 6, 8, 0.70, False) for seqs in pileups]
+    assert all(len(cns) > 500 for cns in got)
+    assert got[0] == got[3]
+
+def test_get_consensus_core_long_seed():
+    # Seeds used to be limited to 128 kb.
+    seqs = get_pileup(5, 140000, n=6)
+    cns = mod.get_consensus_core(seqs, 3, 8, 0.70, False)
+    assert len(cns) > 135000
+
+def test_get_consensus_from_shared():
+    seqs = get_pileup(4, 2000)
+    config = (6, 8, 500, 0.70, 1000, 50, 1, 0, False, 0, 'dw')
+    expected = mod.get_consensus_without_trim((seqs, '4', config))
+    ring = mod.SharedPileupRing(2)
+    try:
+        for _ in range(3):
+            ref = ring.put(seqs)
+            assert ref.headers[0].name == '0' and ref.headers[0].seq is None
+            got = mod.get_consensus_from_shared((ref, '4', config, False))
+            assert got == expected
+    finally:
+        ring.close()
+
+def test_get_consensus_batch():
+    from ctypes import c_void_p
+    pileups = [(get_pileup(i, 1000 + 500 * i), str(i)) for i in range(6)]
+    expected = []
+    for (seqs, seed_id) in pileups:
+        cns, stats = mod.get_consensus_core(seqs, 6, 8, 0.70, False, with_stats=True)
+        expected.append((cns, seed_id, mod.get_counts(stats)))
+    workspaces = (c_void_p * 3)(*[mod.falcon.allocate_consensus_workspace() for _ in range(3)])
+    try:
+        for _ in range(2):
+            got = mod.get_consensus_batch(pileups, workspaces, 6, 8, 0.70, False)
+            assert got == expected
+    finally:
+        for ws in workspaces:
+            mod.falcon.free_consensus_workspace(ws)
+
+def legacy_kmer_match(read, seed, K=8, threshold=16):
+    kup = mod.falcon_kit.kup
+    lk_ptr = kup.allocate_kmer_lookup(1 << (K * 2))
+    sa_ptr = kup.allocate_seq(len(seed))
+    sda_ptr = kup.allocate_seq_addr(len(seed))
+    kup.add_sequence(0, K, seed, len(seed), sda_ptr, sa_ptr, lk_ptr)
+    kup.mask_k_mer(1 << (K * 2), lk_ptr, threshold)
+    km = kup.find_kmer_pos_for_seq(read, len(read), K, sda_ptr, lk_ptr)
+    result = [(km[0].query_pos[i], km[0].target_pos[i]) for i in range(km[0].count)]
+    kup.free_kmer_match(km)
+    kup.free_seq_addr_array(sda_ptr)
+    kup.free_seq_array(sa_ptr)
+    kup.free_kmer_lookup(lk_ptr)
+    return result
+
+def test_build_seed_index():
+    kup = mod.falcon_kit.kup
+    pileups = [get_pileup(4, 3000), get_pileup(5, 1000)]
+    # Repeats (masked at 16), and bases other than ACGT.
+    pileups.append(get_pileup(6, 200)[:1] + get_pileup(7, 2000)[1:4])
+    pileups[2][0] = pileups[2][0]._replace(seq='ACGTNACGTA' * 30 + pileups[2][0].seq + 'nN')
+    km = kup.allocate_kmer_match()
+    index = kup.allocate_kmer_index(8)
+    try:
+        for seqs in pileups:
+            seed = seqs[0].seq.encode('ascii')
+            kup.build_kmer_index(index, seed, len(seed))
+            kup.mask_kmer_index(index, 16)
+            for seq in seqs[1:] + [seqs[0]._replace(seq=seqs[0].seq[::-1] + 'NNACGT')]:
+                read = seq.seq.encode('ascii')
+                kup.find_kmer_pos_in_index(index, read, len(read), km)
+                got = [(km[0].query_pos[i], km[0].target_pos[i]) for i in range(km[0].count)]
+                assert got == legacy_kmer_match(read, seed)
+    finally:
+        kup.free_kmer_index(index)
+        kup.free_kmer_match(km)
+
+def test_get_trimmed_pileup():
+    seqs = get_pileup(8, 3000)
+    seqs[3] = seqs[3]._replace(seq='ACGT' * 500 + seqs[3].seq)
+    config = (6, 8, 500, 0.70, 1000, 50, 1, 500, False, 0, 'dw')
+    got = mod.get_trimmed_pileup(seqs, config)
+    assert got[0] == seqs[0]
+    assert len(got) == len(seqs)
+    assert all(seq.is_trimmed for seq in got[1:])
+    assert all(len(seq.seq) < 3000 for seq in got[1:])
+    seed = seqs[0].seq.encode('ascii')
+    read = seqs[3].seq.encode('ascii')
+    s1, e1, s2, e2, aln_size, aln_score, c_status = mod.get_alignment(read, seed)
+    assert c_status == 'aln' and s1 > 1900 and s2 < 100
+
+def test_get_trim_ranges():
+    seqs = get_pileup(10, 3000, n=8)
+    seqs[2] = seqs[2]._replace(seq='ACGT' * 500 + seqs[2].seq)  # junk before
+    seqs[4] = seqs[4]._replace(seq=seqs[4].seq[:400])  # too short
+    seqs[5] = get_pileup(11, 3000, n=1)[0]  # unrelated
+    got = mod.get_trim_ranges(seqs, 1000)
+    assert len(got) == len(seqs) - 1
+    seed = seqs[0].seq.encode('ascii')
+    for seq, r in zip(seqs[1:], got):
+        s1, e1, s2, e2, aln_size, aln_score, c_status = mod.get_alignment(seq.seq.encode('ascii'), seed, 1000)
+        assert (r.s1, r.e1, r.s2, r.e2, r.score) == (s1, e1, s2, e2, aln_score)
+    assert got[1].s1 > 1900
+    assert got[3].score == got[4].score == 0
+
+def test_get_consensus_core_max_cov_per_base():
+    seqs = get_pileup(6, 3000, n=40)
+    ws = mod.get_workspace()
+    aligned0, skipped0 = mod.get_consensus_counts(ws)
+    expected = mod.get_consensus_core(seqs, 6, 8, 0.70, False)
+    aligned1, skipped1 = mod.get_consensus_counts(ws)
+    assert (aligned1 - aligned0, skipped1 - skipped0) == (40, 0)
+
+    got = mod.get_consensus_core(seqs, 6, 8, 0.70, False, max_cov_per_base=12)
+    aligned2, skipped2 = mod.get_consensus_counts(ws)
+    assert aligned2 - aligned1 < 20
+    assert (aligned2 - aligned1) + (skipped2 - skipped1) == 40
+    assert abs(len(got) - len(expected)) < 30
+
+    # The setting is per call.
+    assert mod.get_consensus_core(seqs, 6, 8, 0.70, False) == expected
+
+def test_get_consensus_core_aligner():
+    seqs = get_pileup(12, 3000)
+    expected = mod.get_consensus_core(seqs, 6, 8, 0.70, False)
+    got = mod.get_consensus_core(seqs, 6, 8, 0.70, False, aligner='myers')
+    assert abs(len(got) - len(expected)) < 30
+    import edlib
+    assert edlib.align(got, expected)['editDistance'] < 30
+    # The setting is per call.
+    assert mod.get_consensus_core(seqs, 6, 8, 0.70, False) == expected
+
+def test_get_consensus_core_with_stats():
+    seqs = get_pileup(6, 3000, n=40)
+    seqs.append(seqs[1]._replace(seq='ACGT' * 100))  # too short to align
+    cns, stats = mod.get_consensus_core(seqs, 6, 8, 0.70, False, max_cov_per_base=12, with_stats=True)
+    assert cns == mod.get_consensus_core(seqs, 6, 8, 0.70, False, max_cov_per_base=12)
+    assert stats['n_reads'] == 41
+    assert stats['n_bad_range'] == 1
+    assert stats['n_cov_skipped'] > 0
+    assert stats['n_bad_range'] + stats['n_cov_skipped'] + stats['n_aligned'] == 41
+    assert stats['n_low_idt'] + stats['n_used'] == stats['n_aligned']
+    assert stats['align_s'] > 0 and stats['vote_s'] > 0
+
+def test_main_max_cov_per_base(capsys, caplog, monkeypatch):
+    # The counts are logged in every mode, even when the workspaces are in pool workers.
+    pileups = [get_pileup(i, 3000, n=40) for i in range(2)]
+    logged = set()
+    for opts in [['--n-core', '0'], ['--n-core', '1'], ['--n-thread', '1'], ['--n-core', '1', '--shared-memory']]:
+        monkeypatch.setattr(sys, 'stdin', write_pileups(pileups))
+        caplog.clear()
+        with caplog.at_level(logging.INFO, logger=mod.LOG.name):
+            mod.main(['prog', '--min-cov-aln', '1', '--max-cov-per-base', '12'] + opts)
+        capsys.readouterr()
+        logged.update(r.getMessage() for r in caplog.records if r.getMessage().startswith('aligned '))
+    assert len(logged) == 1
+    n_aligned, n_skipped = [int(word) for word in logged.pop().replace(',', '').split() if word.isdigit()]
+    # get_seq_data() adds the seed to its own pile-up.
+    assert n_skipped > 0 and n_aligned + n_skipped == 2 * 41
+
+def write_pileups(pileups):
+    lines = []
+    for seqs in pileups:
+        lines.extend('{:09d} {}'.format(i, seq.seq) for (i, seq) in enumerate(seqs))
+        lines.append('+ +')
+    lines.append('- -')
+    return StringIO('\n'.join(lines) + '\n')
+
+def test_main_profile(tmpdir, capsys, monkeypatch):
+    pileups = [get_pileup(i, 2000) for i in range(3)]
+    for profile_fn, opts in [('p.tsv', ['--n-core', '0']), ('p.jsonl', ['--n-thread', '1']), ('t.tsv', ['--n-core', '0', '--trim']),
+                              ('tt.tsv', ['--n-thread', '1', '--trim']), ('s.tsv', ['--n-core', '1', '--shared-memory'])]:
+        profile_fn = str(tmpdir.join(profile_fn))
+        monkeypatch.setattr(sys, 'stdin', write_pileups(pileups))
+        mod.main(['prog', '--min-cov-aln', '1', '--profile-fn', profile_fn] + opts)
+        out, err = capsys.readouterr()
+        seqs = out.splitlines()[1::2]
+        assert len(seqs) == 3
+        from falcon_kit.mains.consensus_profile import read_profiles
+        profiles = list(read_profiles(profile_fn))
+        assert [p['seed_id'] for p in profiles] == ['000000000'] * 3
+        assert [p['out_len'] for p in profiles] == [len(seq) for seq in seqs]
+        for p in profiles:
+            # get_seq_data() adds the seed to its own pile-up.
+            assert p['seed_len'] == 2000 and p['n_pileup'] == 13
+            assert p['n_used'] > 6 and p['cns_len'] >= p['out_len']
+            assert p['total_s'] >= p['align_s'] > 0
+            assert (p['trim_s'] > 0) == ('--trim' in opts)
+        assert not mod._profile
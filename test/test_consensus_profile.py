@@ -0,0 +1,53 @@
+import falcon_kit.mains.consensus as consensus
+import falcon_kit.mains.consensus_profile as mod
+import pytest
+
+
+def get_profile(i, total_s):
+    profile = dict((key, 1) for key in consensus.PROFILE_FIELDS)
+    profile.update(seed_id='{:09d}'.format(i), seed_len=1000, n_pileup=10, n_reads=10, n_used=8,
+                   trim_s=0.0, kmer_s=0.1 * total_s, align_s=0.8 * total_s, msa_s=0.05 * total_s,
+                   vote_s=0.05 * total_s, total_s=total_s)
+    return profile
+
+
+def write_profiles(fn, profiles):
+    writer = consensus.ProfileWriter(fn)
+    for profile in profiles:
+        writer.write(profile, 900)
+    writer.close()
+
+
+@pytest.mark.parametrize('ext', ['tsv', 'jsonl'])
+def test_read_profiles(tmpdir, ext):
+    fn = str(tmpdir.join('cns.' + ext))
+    profiles = [get_profile(i, 0.5 + i) for i in range(3)]
+    write_profiles(fn, profiles)
+    got = list(mod.read_profiles(fn))
+    assert [p['seed_id'] for p in got] == ['000000000', '000000001', '000000002']
+    assert [p['total_s'] for p in got] == [0.5, 1.5, 2.5]
+    assert all(p['out_len'] == 900 and p['n_used'] == 8 for p in got)
+
+
+def test_main(tmpdir, capsys):
+    fn0 = str(tmpdir.join('0.tsv'))
+    fn1 = str(tmpdir.join('1.jsonl'))
+    write_profiles(fn0, [get_profile(i, 1.0) for i in range(150)])
+    write_profiles(fn1, [get_profile(1000, 150.0), get_profile(1001, 2.0)])
+    fofn = str(tmpdir.join('fofn'))
+    with open(fofn, 'w') as f:
+        f.write(fn1 + '\n')
+    mod.main(['prog', '--top', '2', fn0, '--fofn', fofn])
+    out, err = capsys.readouterr()
+    assert 'seeds: 152 in 2 files' in out
+    assert 'the slowest 1% of seeds (1) took 49.7% of the time' in out
+    assert 'align 80.0%' in out
+    lines = out.splitlines()
+    top = lines[lines.index('slowest 2 seeds, by total_s:') + 2:]
+    assert [line.split('\t')[0] for line in top] == ['000001000', '000001001']
+    assert top[0].endswith(fn1)
+
+
+def test_main_no_profiles():
+    with pytest.raises(SystemExit):
+        mod.main(['prog'])
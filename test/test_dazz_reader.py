@@ -0,0 +1,130 @@
+import falcon_kit.dazz_reader as mod
+import falcon_kit.mains.consensus as consensus
+import pytest
+import random
+
+COMP = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
+
+
+def revcomp(seq):
+    return ''.join(COMP[c] for c in reversed(seq))
+
+
+def test_get_db_paths():
+    assert ('.raw_reads.idx', '.raw_reads.bps') == mod.get_db_paths('raw_reads')
+    assert ('a/.raw_reads.idx', 'a/.raw_reads.bps') == mod.get_db_paths('a/raw_reads.db')
+
+
+def test_db(tmpdir):
+    rnd = random.Random(3)
+    seqs = [''.join(rnd.choice('ACGT') for _ in range(n)) for n in (0, 1, 7, 8, 300, 1001)]
+    db_fn = str(tmpdir.join('raw_reads.db'))
+    mod.write_db(db_fn, seqs)
+    db = mod.DazzDB(db_fn)
+    assert len(seqs) == len(db)
+    for i, seq in enumerate(seqs):
+        assert seq == db.get_seq(i)
+        assert revcomp(seq) == db.get_seq(i, comp=True)
+        if len(seq) > 5:
+            assert seq[2:5] == db.get_seq(i, 2, 5)
+            assert revcomp(seq)[1:len(seq) - 1] == db.get_seq(i, 1, len(seq) - 1, comp=True)
+    with pytest.raises(ValueError):
+        db.get_seq(2, 0, 8)
+
+
+def test_db_trimmed(tmpdir):
+    seqs = ['ACGT' * n for n in (10, 200, 30, 150)]
+    db_fn = str(tmpdir.join('raw_reads.db'))
+    mod.write_db(db_fn, seqs, cutoff=500)
+    db = mod.DazzDB(db_fn)
+    assert [seqs[1], seqs[3]] == [db.get_seq(i) for i in range(len(db))]
+
+
+@pytest.mark.parametrize('tspace', [100, 200])
+def test_read_las(tmpdir, tspace):
+    ovls = [mod.Overlap(0, 1, False, 0, 900, 100, 1000, 12),
+            mod.Overlap(0, 2, True, 50, 1000, 0, 950, 30),
+            mod.Overlap(3, 0, False, 0, 0, 0, 0, 0)]
+    las_fn = str(tmpdir.join('x.las'))
+    mod.write_las(las_fn, ovls, tspace)
+    assert ovls == list(mod.read_las(las_fn))
+
+
+def test_read_las_empty(tmpdir):
+    from falcon_kit.mains.las_write_empty import run
+    las_fn = str(tmpdir.join('empty.las'))
+    run(las_fn)
+    assert [] == list(mod.read_las(las_fn))
+
+
+def get_pileup_db(tmpdir):
+    """Read 0 is a seed. 1 overlaps its end, 2 is reverse-complemented and
+    within it, 3 aligns only locally, and 4 contains it.
+    """
+    rnd = random.Random(5)
+    seed = ''.join(rnd.choice('ACGT') for _ in range(1000))
+    seqs = [seed, seed[600:] + 'TTTT', revcomp(seed[100:900]), 'A' * 50 + seed[300:500] + 'C' * 50,
+            'ACGT' + seed + 'TGCA', 'ACGT' * 100]
+    ovls = [mod.Overlap(0, 1, False, 600, 1000, 0, 400, 0),
+            mod.Overlap(0, 2, True, 100, 900, 0, 800, 0),
+            mod.Overlap(0, 3, False, 300, 500, 50, 250, 0),
+            mod.Overlap(0, 1, False, 700, 1000, 100, 400, 0),
+            mod.Overlap(0, 4, False, 0, 1000, 4, 1004, 0),
+            mod.Overlap(5, 0, False, 0, 100, 0, 100, 0)]
+    db_fn = str(tmpdir.join('raw_reads.db'))
+    las_fn = str(tmpdir.join('raw_reads.las'))
+    mod.write_db(db_fn, seqs)
+    mod.write_las(las_fn, ovls)
+    return db_fn, las_fn, seqs
+
+
+def test_get_pileup_fields(tmpdir):
+    db_fn, las_fn, seqs = get_pileup_db(tmpdir)
+    db = mod.DazzDB(db_fn)
+    seed = seqs[0]
+
+    def get(min_seed_len, flags):
+        return list(mod.get_pileup_fields(db, mod.read_las(las_fn), min_seed_len, flags))
+
+    got = get(500, 'fo')
+    assert [
+        ['000000000', seed],
+        ['000000001', seed[600:]],
+        ['000000002', seed[100:900]],
+        ['000000004', seed],
+        ['+', '+'],
+        ['-', '-']] == got
+    # Local alignments too, and shorter seeds.
+    got = get(0, 'f')
+    assert ['000000003', seed[300:500]] in got
+    assert ['000000005', seqs[5]] in got
+    # The longest overlap of each read.
+    got = get(500, 'fg')
+    assert [f[0] for f in got] == ['000000000', '000000001', '000000002', '000000003', '000000004', '+', '-']
+    assert ['000000001', seed[600:]] in got
+    # Read 0 is contained in read 4.
+    assert [['*', '*'], ['-', '-']] == get(500, 'fso')
+
+
+def test_consensus_from_las(tmpdir, capsys):
+    rnd = random.Random(7)
+    seed = ''.join(rnd.choice('ACGT') for _ in range(2000))
+    seqs = [seed]
+    ovls = []
+    for i in range(1, 13):
+        s, e = sorted(rnd.sample(range(0, 2001), 2))
+        if e - s < 600 or i < 4:
+            s, e = 0, 2000
+        seqs.append(seed[s:e] if i % 2 else revcomp(seed[s:e]))
+        ovls.append(mod.Overlap(0, i, not i % 2, s, e, 0, e - s, 0))
+    db_fn = str(tmpdir.join('raw_reads.db'))
+    las_fn = str(tmpdir.join('raw_reads.las'))
+    mod.write_db(db_fn, seqs)
+    mod.write_las(las_fn, ovls)
+    consensus.main(['prog', '--n-core', '0', '--min-cov', '2', '--min-cov-aln', '2',
+                    '--db-fn', db_fn, '--las-fn', las_fn])
+    out, err = capsys.readouterr()
+    lines = out.splitlines()
+    assert '>0' == lines[0]
+    assert len(lines[1]) > 1900
+    assert lines[1] in seed
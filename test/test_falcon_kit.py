@@ -0,0 +1,80 @@
+import random
+import falcon_kit.falcon_kit as mod
+
+
+def sim_read(rnd, seq):
+    out = []
+    for c in seq:
+        r = rnd.random()
+        if r < 0.05:
+            out.append(rnd.choice('ACGT'))
+            out.append(c)
+        elif r < 0.10:
+            continue
+        elif r < 0.15:
+            out.append(rnd.choice('ACGT'))
+        else:
+            out.append(c)
+    return ''.join(out).encode('ascii')
+
+
+def align(q, t, band_tolerance=100):
+    aln = mod.DWA.align(q, len(q), t, len(t), band_tolerance, 1)
+    a = aln.contents
+    result = (a.aln_str_size, a.dist, a.aln_q_s, a.aln_q_e, a.aln_t_s, a.aln_t_e,
+              a.q_aln_str, a.t_aln_str)
+    mod.DWA.free_alignment(aln)
+    return result
+
+
+def test_align_traceback():
+    rnd = random.Random(7)
+    seq = ''.join(rnd.choice('ACGT') for _ in range(3000))
+    pairs = [(sim_read(rnd, seq), sim_read(rnd, seq)) for _ in range(4)]
+    orig = mod.DWA.get_align_traceback()
+    assert orig == mod.ALIGN_TRACEBACK_COMPACT
+    try:
+        mod.DWA.set_align_traceback(mod.ALIGN_TRACEBACK_FULL)
+        full = [align(q, t) for (q, t) in pairs] + [align(q, t, 10) for (q, t) in pairs]
+        mod.DWA.set_align_traceback(mod.ALIGN_TRACEBACK_COMPACT)
+        compact = [align(q, t) for (q, t) in pairs] + [align(q, t, 10) for (q, t) in pairs]
+    finally:
+        mod.DWA.set_align_traceback(orig)
+    assert full == compact
+    assert full[0][1] > 0
+
+
+def test_align_simd():
+    rnd = random.Random(11)
+    seq = ''.join(rnd.choice('ACGT') for _ in range(3000))
+    pairs = [(sim_read(rnd, seq), sim_read(rnd, seq)) for _ in range(4)]
+    pairs.append((seq.encode('ascii'), seq.encode('ascii')))
+    orig = mod.DWA.get_align_simd()
+    try:
+        results = []
+        for level in (mod.ALIGN_SIMD_NONE, mod.ALIGN_SIMD_SSE2, mod.ALIGN_SIMD_AVX2):
+            assert mod.DWA.set_align_simd(level) <= level
+            results.append([align(q, t) for (q, t) in pairs])
+    finally:
+        mod.DWA.set_align_simd(orig)
+    assert results[0] == results[1] == results[2]
+    assert results[0][-1][1] == 0
+
+
+def test_align_myers():
+    import edlib
+    rnd = random.Random(13)
+    seq = ''.join(rnd.choice('ACGT') for _ in range(3000))
+    pairs = [(sim_read(rnd, seq[:n]), sim_read(rnd, seq[:n])) for n in (1, 63, 64, 65, 200, 3000)]
+    pairs.append((b'ACGT', b''))
+    for (q, t) in pairs:
+        aln = mod.DWA.align_myers(q, len(q), t, len(t), 150)
+        a = aln.contents
+        q_aln, t_aln = a.q_aln_str or b'', a.t_aln_str or b''
+        assert (a.aln_q_s, a.aln_q_e, a.aln_t_s, a.aln_t_e) == (0, len(q), 0, len(t))
+        assert q_aln.replace(b'-', b'') == q and t_aln.replace(b'-', b'') == t
+        n_diff = sum(x != y for (x, y) in zip(q_aln, t_aln))
+        assert n_diff == edlib.align(q, t, mode='NW')['editDistance'] if t else n_diff == len(q)
+        n_gap = q_aln.count(b'-') + t_aln.count(b'-')
+        assert a.dist == n_gap + 2 * (n_diff - n_gap)
+        mod.DWA.free_alignment(aln)
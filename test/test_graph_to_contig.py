@@ -8,3 +8,34 @@ def test_help():
     except SystemExit:
         pass
 '''
+
+
+# A bubble from s to t: through a and b, through c, and through d, which joins b.
+BUBBLE = [
+    ('s', 'a', 10), ('a', 'b', 10), ('b', 't', 10),
+    ('s', 'c', 5), ('c', 't', 40),
+    ('s', 'd', 30), ('d', 'b', 1),
+]
+
+
+def test_get_bubble_paths_dag():
+    expected = [(30, ['s', 'a', 'b', 't']), (45, ['s', 'c', 't'])]
+    assert expected == list(mod.yield_bubble_paths_nx(BUBBLE, 's', 't'))
+    assert expected == mod.get_bubble_paths_dag(BUBBLE, 's', 't')
+    assert expected[:1] == mod.get_bubble_paths_dag(BUBBLE, 's', 't', max_paths=1)
+    # Two lightest paths: left to networkx.
+    assert mod.get_bubble_paths_dag(BUBBLE + [('s', 'b', 20)], 's', 't') is None
+    # A cycle.
+    assert mod.get_bubble_paths_dag(BUBBLE + [('b', 'd', 1)], 's', 't') is None
+    # No path.
+    assert mod.get_bubble_paths_dag(BUBBLE, 't', 's') is None
+
+
+def test_get_bubble_paths():
+    stats = dict(bubbles=0, paths=0, nx_bubbles=0, capped_bubbles=0, max_paths=0, max_edges=0)
+    tied = BUBBLE + [('s', 'b', 20)]
+    assert [(45, ['s', 'c', 't']), (30, ['s', 'b', 't'])] == mod.get_bubble_paths(tied, 's', 't', 0, stats)
+    assert [(30, ['s', 'a', 'b', 't'])] == mod.get_bubble_paths(BUBBLE, 's', 't', 1, stats)
+    # Exactly max_paths paths: none left out, so not capped.
+    assert [(45, ['s', 'c', 't']), (30, ['s', 'a', 'b', 't'])] == mod.get_bubble_paths(BUBBLE, 's', 't', 2, stats)
+    assert dict(bubbles=3, paths=5, nx_bubbles=1, capped_bubbles=1, max_paths=2, max_edges=8) == stats
@@ -0,0 +1,28 @@
+import falcon_kit.multiproc as mod
+
+
+def square(x):
+    return x * x
+
+
+def test_imap_bounded_fake_pool():
+    pool = mod.Pool(0)
+    got = list(mod.imap_bounded(pool, square, range(10), 3))
+    assert got == [x * x for x in range(10)]
+
+
+def test_imap_bounded_pulls_lazily():
+    pulled = []
+
+    def gen():
+        for i in range(10):
+            pulled.append(i)
+            yield i
+    pool = mod.Pool(2)
+    try:
+        results = mod.imap_bounded(pool, square, gen(), 3)
+        assert next(results) == 0
+        assert len(pulled) == 3
+        assert list(results) == [x * x for x in range(1, 10)]
+    finally:
+        pool.terminate()
@@ -1,5 +1,8 @@
 
+from falcon_kit import ovlp_reader
 import falcon_kit.mains.ovlp_filter as mod
+import pytest
+from test_ovlp_reader import gen_lines
 
 
 def assert_equal(expected, got):
@@ -79,3 +82,61 @@ def test_empty():
     max_diff, max_ovlp, min_ovlp, min_len = 1000, 1000, 1, 1
     got = mod.filter_stage1(readlines, max_diff, max_ovlp, min_ovlp, min_len)
     assert_equal(expected, got)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 1000, ovlp_reader.CHUNK_SIZE])
+def test_chunks_same_as_lines(chunk_size):
+    lines = gen_lines()
+    max_diff, max_ovlp, min_ovlp, min_len, min_idt, bestn = 10, 12, 1, 1000, 90.0, 3
+    expected = mod.filter_stage1(lambda: iter(lines), max_diff, max_ovlp, min_ovlp, min_len, min_idt)
+    got = mod.filter_stage1_chunks(ovlp_reader.yield_chunks_from_lines(lines, chunk_size),
+            max_diff, max_ovlp, min_ovlp, min_len, min_idt)
+    assert_equal(expected, got)
+    assert expected['ignore'] and expected['contained']
+    ignore, contained = expected['ignore'], expected['contained'] - expected['ignore']
+    expected = mod.filter_stage2(lambda: iter(lines), max_diff, max_ovlp, min_ovlp, min_len, min_idt,
+            ignore, contained, bestn)
+    got = mod.filter_stage2_chunks(ovlp_reader.yield_chunks_from_lines(lines, chunk_size),
+            max_diff, max_ovlp, min_ovlp, min_len, min_idt, ignore, contained, bestn)
+    assert_equal([' '.join(l) for l in expected], got)
+    assert expected
+
+
+class FileReader(object):
+    """Stand-in for LA4Falcon: the last word of cmd is a file of its output.
+    """
+    def readchunks(self):
+        with open(self.fn, 'rb') as f:
+            return list(ovlp_reader.yield_chunks(f.read, 1000))
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+    def __init__(self, cmd):
+        self.fn = cmd.split()[-1]
+
+
+def test_single_pass_same_as_two_pass(tmpdir, monkeypatch):
+    lines = gen_lines(90)
+    # Split into blocks by q_id, like the .las files of a DB.
+    file_list = []
+    for i, q_ids in enumerate([range(0, 30), range(30, 60), range(60, 90)]):
+        fn = str(tmpdir.join('block.%d.m4' % i))
+        with open(fn, 'w') as f:
+            f.write(''.join(l + '\n' for l in lines if int(l.split()[0]) in q_ids))
+        file_list.append(fn)
+    tmp_dir = str(tmpdir.mkdir('tmp'))
+    monkeypatch.setattr(mod, 'Reader', FileReader)
+
+    class Outs(list):
+        write = list.append
+    expected = Outs()
+    got = Outs()
+    args = (file_list, 10, 12, 1, 1000, 90.0, False, 3, 'raw_reads.db')
+    mod.run_ovlp_filter(expected, mod.Pool(0), *args)
+    mod.run_ovlp_filter_single_pass(got, mod.Pool(0), *(args + (tmp_dir,)))
+    assert_equal(expected, got)
+    assert expected
@@ -0,0 +1,63 @@
+import falcon_kit.ovlp_reader as mod
+import pytest
+import random
+
+
+def gen_lines(n_reads=60, seed=7):
+    """Random LA4Falcon -m lines, grouped by q_id like the real output.
+    """
+    rand = random.Random(seed)
+    lens = [rand.randint(500, 5000) for i in range(n_reads)]
+    lines = []
+    for q in range(n_reads):
+        for i in range(rand.randint(0, 30)):
+            t = rand.randrange(n_reads)
+            q_l, t_l = lens[q], lens[t]
+            q_s = rand.choice([0, 0, rand.randint(0, q_l)])
+            q_e = rand.choice([q_l, q_l, rand.randint(q_s, q_l)])
+            t_s = rand.randint(0, t_l)
+            t_e = rand.randint(t_s, t_l)
+            kind = rand.choice(['overlap', 'overlap', 'contains', 'contained', 'none'])
+            lines.append('%09d %09d %d %.3f 0 %d %d %d %d %d %d %d %s' % (
+                q, t, -rand.randint(1, 5000), rand.uniform(85, 100),
+                q_s, q_e, q_l, rand.randint(0, 1), t_s, t_e, t_l, kind))
+    return lines
+
+
+def test_format_id():
+    assert '000000047' == mod.format_id(47)
+
+
+def test_parse_ovlps():
+    buf = b'000000047 000000550 -206 100.000 0 0 206 603 1 0 206 741 overlap\n\n000000047 000000551 -20'
+    records, n, consumed = mod.parse_ovlps(buf)
+    assert 1 == n
+    assert buf.index(b'\n') + 2 == consumed
+    rec = records[0]
+    assert (47, 550, -206, 100.0) == (rec.q_id, rec.t_id, rec.score, rec.idt)
+    assert (0, 0, 206, 603) == (rec.q_strand, rec.q_s, rec.q_e, rec.q_l)
+    assert (1, 0, 206, 741) == (rec.t_strand, rec.t_s, rec.t_e, rec.t_l)
+    assert mod.OVLP_OVERLAP == rec.kind
+
+
+def test_parse_ovlps_bad():
+    buf = b'000000047 000000550 -206 100.000 0 0 206 603 1 0 206 741 overlap\n47 550 -206 x\n'
+    with pytest.raises(ValueError) as excinfo:
+        mod.parse_ovlps(buf)
+    assert '47 550 -206 x' in str(excinfo.value)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 100, 4096, mod.CHUNK_SIZE])
+def test_yield_chunks(chunk_size):
+    lines = gen_lines()
+    chunks = list(mod.yield_chunks_from_lines(lines, chunk_size))
+    got = [chunk.line(i) for chunk in chunks for i in range(chunk.n)]
+    assert lines == got
+    # No read is split between chunks.
+    firsts = [chunk.records[0].q_id for chunk in chunks]
+    lasts = [chunk.records[chunk.n - 1].q_id for chunk in chunks]
+    assert all(last != first for (last, first) in zip(lasts, firsts[1:]))
+
+
+def test_yield_chunks_empty():
+    assert [] == list(mod.yield_chunks_from_lines([]))
@@ -1,5 +1,7 @@
 
+from falcon_kit import ovlp_reader
 import falcon_kit.mains.ovlp_stats as mod
+from test_ovlp_reader import gen_lines
 
 
 def test_help():
@@ -16,6 +18,20 @@ def test():
     assert expected == stats
 
 
+def test_chunks():
+    lines = data.strip().splitlines()
+    stats = mod.filter_stats_chunks(ovlp_reader.yield_chunks_from_lines(lines), min_len=62)
+    assert expected == stats
+
+
+def test_chunks_same_as_lines():
+    lines = gen_lines()
+    expected = mod.filter_stats(lambda: iter(lines), min_len=1000)
+    got = mod.filter_stats_chunks(ovlp_reader.yield_chunks_from_lines(lines, 1000), min_len=1000)
+    assert expected == got
+    assert expected
+
+
 expected = [('000000000', 1988, 2, 1), ('000000001', 1989, 2, 0),
             ('000000002', 1989, 0, 2), ('000000017', 1989, 0, 1)]
 data = """
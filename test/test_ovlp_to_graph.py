@@ -1,5 +1,6 @@
 
 import falcon_kit.mains.ovlp_to_graph as mod
+import logging
 import pytest
 
 
@@ -38,3 +39,74 @@ def test_reverse_end():
 
     with pytest.raises(Exception) as e_info:
         ret = mod.reverse_end(':::')
+
+
+M4 = """\
+000000001 000000002 -7000 99.50 0 3000 10000 10000 0 0 7000 10000 overlap
+000000001 000000003 -4000 99.00 0 6000 10000 10000 1 6000 10000 10000 overlap
+000000002 000000003 -7000 99.80 0 3000 10000 10000 1 3000 10000 10000 overlap
+000000002 000000001 -7000 99.50 0 0 7000 10000 0 3000 10000 10000 overlap
+"""
+
+SG_EDGES_LIST = """\
+000000002:B 000000001:B 000000001  3000     0  7000 99.50 G
+000000001:E 000000002:E 000000002  7000 10000  7000 99.50 G
+000000003:E 000000001:B 000000001  6000     0  4000 99.00 TR
+000000001:E 000000003:B 000000003  6000     0  4000 99.00 TR
+000000003:E 000000002:B 000000002  3000     0  7000 99.80 G
+000000002:E 000000003:B 000000003  3000     0  7000 99.80 G
+"""
+
+
+def test_main(tmpdir):
+    with tmpdir.as_cwd():
+        tmpdir.join('preads.m4').write(M4)
+        mod.main(['prog', '--overlap-file', 'preads.m4'])
+        assert SG_EDGES_LIST == tmpdir.join('sg_edges_list').read()
+        assert '' == tmpdir.join('chimers_nodes').read()
+        ctg_paths = tmpdir.join('ctg_paths').read().splitlines()
+        assert '000000F ctg_linear 000000001:E~000000002:E~000000003:B 000000003:B 6000 14000 000000001:E~000000002:E~000000003:B' == ctg_paths[0]
+
+
+def test_main_checkpoint(tmpdir, caplog):
+    caplog.set_level(logging.INFO)
+    with tmpdir.as_cwd():
+        tmpdir.join('preads.m4').write(M4)
+        mod.main(['prog', '--overlap-file', 'preads.m4'])
+        assert 'Saved the reduced string graph' in caplog.text
+        caplog.clear()
+        tmpdir.join('sg_edges_list').remove()
+        mod.main(['prog', '--overlap-file', 'preads.m4'])
+        assert 'Loaded the reduced string graph' in caplog.text
+        caplog.clear()
+        assert SG_EDGES_LIST == tmpdir.join('sg_edges_list').read()
+        # Other overlaps, another key.
+        tmpdir.join('preads.m4').write(M4.replace('99.80', '99.70'))
+        mod.main(['prog', '--overlap-file', 'preads.m4'])
+        assert 'Saved the reduced string graph' in caplog.text
+        assert SG_EDGES_LIST.replace('99.80', '99.70') == tmpdir.join('sg_edges_list').read()
+
+
+def test_construct_compound_paths_0(capsys):
+    from falcon_kit.string_graph import MultiDigraph
+    ug = MultiDigraph()
+    u_edge_data = {}
+    # A bubble from 1:E to 2:E (and its reverse), and a fork into two dead ends at 7:E.
+    for (s, t, v, length, score) in (
+            ('1:E', '2:E', '5:E', 1000, 900), ('1:E', '2:E', '6:E', 1200, 1100),
+            ('2:B', '1:B', '5:B', 1000, 900), ('2:B', '1:B', '6:B', 1200, 1100),
+            ('7:E', '8:E', '9:E', 500, 400), ('7:E', '10:E', '11:E', 600, 500)):
+        ug.add_edge(s, t, key=v)
+        u_edge_data[(s, t, v)] = (length, score, [], 'simple')
+    branch_nodes = mod.identify_branch_nodes(ug)
+
+    def run(n_core):
+        paths = mod.construct_compound_paths_0(ug, u_edge_data, branch_nodes, n_core)
+        return [p[:6] + (list(p[6]),) for p in paths], capsys.readouterr().out
+
+    expected = [
+        ('1:E', 'NA', '2:E', 2.0, 1200, 1100, [('1:E', '2:E', '5:E'), ('1:E', '2:E', '6:E')]),
+        ('2:B', 'NA', '1:B', 2.0, 1200, 1100, [('2:B', '1:B', '5:B'), ('2:B', '1:B', '6:B')]),
+    ]
+    assert (expected, 'no out edge 8:E\nno out edge 10:E\n') == run(0)
+    assert run(0) == run(2)
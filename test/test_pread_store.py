@@ -0,0 +1,101 @@
+import falcon_kit.pread_store as mod
+import gzip
+import os
+import pytest
+
+FASTA = """\
+>r1 some metadata
+ACGTACGTAC
+GTac
+>r2
+TTTTGGGGCCCCAAAA
+>r3
+"""
+
+
+def test_rc():
+    assert 'GTNAC' == mod.rc('GTNAC')
+    assert 'TTGCA' == mod.rc('TGCAA')
+
+
+def test_yield_fai_entries():
+    entries = list(mod.yield_fai_entries(FASTA.encode('ascii')))
+    assert [
+        ('r1', mod.FaiEntry(14, 18, 10, 11)),
+        ('r2', mod.FaiEntry(16, 38, 16, 17)),
+        ('r3', mod.FaiEntry(0, 59, 0, 0)),
+    ] == entries
+    with pytest.raises(ValueError):
+        list(mod.yield_fai_entries(b'>r1\nACG\nACGT\nA\n'))
+    with pytest.raises(ValueError):
+        list(mod.yield_fai_entries(b'ACGT\n'))
+
+
+def test_pread_store(tmpdir):
+    fn = str(tmpdir.join('preads.fasta'))
+    with open(fn, 'w') as f:
+        f.write(FASTA)
+    for _ in range(2):  # Index, then use the index.
+        with mod.PreadStore(fn) as preads:
+            assert 3 == len(preads)
+            assert 'r1' in preads
+            assert 'r1 some metadata' not in preads
+            assert 14 == preads.length('r1')
+            assert 'ACGTACGTACGTAC' == preads.get_seq('r1')
+            assert 'ACGTAC' == preads.get_seq('r1', 8)
+            assert 'TACG' == preads.get_seq('r1', 7, 11)
+            assert 'CGTA' == preads.get_edge_seq('r1', 11, 7)
+            assert 'GGCC' == preads.get_edge_seq('r2', 6, 10)
+            assert '' == preads.get_seq('r3')
+        assert sorted(os.listdir(str(tmpdir))) == ['preads.fasta', 'preads.fasta.fai']
+        assert os.stat(fn + '.fai').st_mode == os.stat(fn).st_mode
+    with open(fn + '.fai') as f:
+        assert 'r2\t16\t38\t16\t17\n' == f.readlines()[1]
+
+
+def test_pread_store_gz(tmpdir):
+    fn = str(tmpdir.join('preads.fasta.gz'))
+    with gzip.open(fn, 'wt') as f:
+        f.write(FASTA[:FASTA.index('>r3')])
+    with mod.PreadStore(fn) as preads:
+        assert 'TACG' == preads.get_seq('r1', 7, 11)
+        assert 'CGTA' == preads.get_edge_seq('r1', 11, 7)
+    assert not os.path.exists(fn + '.fai')
+
+
+def write_as_of(fn, data, mtime):
+    with open(fn, 'w') as f:
+        f.write(data)
+    os.utime(fn, (mtime, mtime))
+
+
+def test_pread_store_rewritten(tmpdir):
+    # Rewritten since indexed, but no newer than the index.
+    fn = str(tmpdir.join('preads.fasta'))
+    write_as_of(fn, '>r1\nAAAACCCC\n>r2\nGGGGTTTT\n', 1000000000)
+    with mod.PreadStore(fn) as preads:
+        assert 'GGGGTTTT' == preads.get_seq('r2')
+    # Longer: the index no longer fits.
+    write_as_of(fn, '>r1\nAAAACCCCAA\n>r2\nGGGGTTTT\n', 1000000000)
+    with mod.PreadStore(fn) as preads:
+        assert 'GGGGTTTT' == preads.get_seq('r2')
+        assert 10 == preads.length('r1')
+    # Of the same size: found out on reading.
+    write_as_of(fn, '>r1\nAAAACCCCAAAA\n>r2\nGGGGTT\n', 1000000000)
+    with mod.PreadStore(fn) as preads:
+        assert 'GGGGTT' == preads.get_seq('r2')
+        assert 'AAAACCCCAAAA' == preads.get_seq('r1')
+    with open(fn + '.fai') as f:
+        assert 'r2\t6\t21\t6\t7\n' == f.readlines()[1]
+
+
+def test_pread_store_uneven_lines(tmpdir):
+    # Cannot be indexed, so read into memory, as FastaReader reads it.
+    fn = str(tmpdir.join('preads.fasta'))
+    with open(fn, 'w') as f:
+        f.write('>r1\nACG\nACGT\nA\n>r2\nTTTT\n')
+    with mod.PreadStore(fn) as preads:
+        assert 'ACGACGTA' == preads.get_seq('r1')
+        assert 'GTA' == preads.get_seq('r1', 5)
+        assert 'TTTT' == preads.get_seq('r2')
+    assert not os.path.exists(fn + '.fai')
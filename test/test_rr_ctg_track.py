@@ -0,0 +1,20 @@
+from falcon_kit import ovlp_reader
+import falcon_kit.mains.rr_ctg_track as mod
+from test_ovlp_reader import gen_lines
+
+
+def test_help():
+    try:
+        mod.main(['prog', '--help'])
+    except SystemExit:
+        pass
+
+
+def test_tr_stage1_chunks_same_as_lines():
+    lines = gen_lines()
+    rid_to_ctg = dict(('%09d' % rid, set(['%06dF' % (rid % 3)])) for rid in range(0, 60, 2))
+    rid_to_ctg['1'] = set(['000001F'])  # never matches a q_id
+    expected = mod.tr_stage1(lambda: iter(lines), 1000, 5, rid_to_ctg)
+    got = mod.tr_stage1_chunks(ovlp_reader.yield_chunks_from_lines(lines, 1000), 1000, 5, rid_to_ctg)
+    assert expected == got
+    assert expected
@@ -0,0 +1,210 @@
+import falcon_kit.string_graph as mod
+import pytest
+import random
+
+
+def get_graph():
+    """Reads 1, 2 and 3 each overlap the next by 7000, and 1 overlaps 3 by 4000;
+    3 is reverse-complemented. (See test_ovlp_to_graph.)
+    """
+    sg = mod.StringGraph()
+    n = dict(('%s:%s' % (r, end), sg.get_node(r, end)) for r in ('1', '2', '3') for end in 'BE')
+    for (v, w, sp, tp, score) in [
+            ('2:B', '1:B', 3000, 0, -7000),
+            ('1:E', '2:E', 7000, 10000, -7000),
+            ('3:E', '1:B', 6000, 0, -4000),
+            ('1:E', '3:B', 6000, 0, -4000),
+            ('3:E', '2:B', 3000, 0, -7000),
+            ('2:E', '3:B', 3000, 0, -7000)]:
+        sg.add_edge(n[v], n[w], sp, tp, score, 99.0)
+    sg.build_index()
+    return sg, n
+
+
+def test_get_node():
+    sg = mod.StringGraph()
+    assert 0 == sg.get_node('a', 'B')
+    assert 1 == sg.get_node('a', 'E')
+    assert 2 == sg.get_node('b', 'B')
+    assert 0 == sg.get_node('a', 'B')
+    assert ['a', 'b'] == sg.read_names
+    assert 'b:B' == sg.node_name(2)
+    assert 'b:E' == sg.node_name(2 ^ 1)
+
+
+def test_build_index():
+    sg, n = get_graph()
+    assert [n['2:B'], n['1:B'], n['1:E'], n['2:E'], n['3:E'], n['3:B']] == list(sg.nodes)
+    assert [1, 3] == list(sg.out_edges(n['1:E']))
+    assert [0, 2] == list(sg.in_edges(n['1:B']))
+    assert 3 == sg.get_edge(n['1:E'], n['3:B'])
+    assert -1 == sg.get_edge(n['1:B'], n['3:B'])
+    assert [1, 0, 3, 2, 5, 4] == list(sg.rev)
+    assert 6000 == sg.get_length(2)
+
+
+def test_repeated_edge():
+    sg = mod.StringGraph()
+    v, w = sg.get_node('1', 'B'), sg.get_node('1', 'E')
+    sg.add_edge(v, w, 100, 0, -1, 99.0)
+    sg.add_edge(v, w, 200, 0, -2, 98.0)
+    sg.build_index()
+    assert [v] == list(sg.src)
+    assert (200, -2, 98.0) == (sg.sp[0], sg.score[0], sg.identity[0])
+    assert [0] == list(sg.rev)
+
+
+def test_mark_tr_edges():
+    sg, n = get_graph()
+    sg.mark_tr_edges()
+    # 1 -> 3 is implied by 1 -> 2 -> 3, on both strands.
+    assert [0, 0, 1, 1, 0, 0] == list(sg.e_reduce)
+    assert set() == sg.mark_spur_edge()
+    assert ([], set()) == sg.mark_chimer_edges()
+    assert set() == sg.mark_best_overlap()
+    assert n['1:E'] == sg.best_in[n['2:E']]
+    assert -1 == sg.best_in[n['1:E']]
+
+
+def get_random_graph(seed, n_reads=300):
+    rnd = random.Random(seed)
+    sg = mod.StringGraph()
+    for _ in range(n_reads * 8):
+        v = sg.get_node(str(rnd.randrange(n_reads)), rnd.choice('BE'))
+        w = sg.get_node(str(rnd.randrange(n_reads)), rnd.choice('BE'))
+        sp = rnd.choice([rnd.randrange(1000), rnd.randrange(10000)])
+        sg.add_edge(v, w, sp, 0, -rnd.randrange(5000), 99.0)
+        sg.add_edge(w ^ 1, v ^ 1, sp, 0, -rnd.randrange(5000), 99.0)
+    sg.build_index()
+    return sg
+
+
+def mark_tr_edges(sg):
+    """The transitive reduction, as it was done in Python (on sorted out-edges).
+    """
+    n_mark = {}
+    dst = sg.dst
+    length = [sg.get_length(e) for e in range(len(sg.src))]
+    out_edges = dict((n, sorted(sg.out_edges(n), key=lambda e: length[e])) for n in range(len(sg.node_added)))
+    for n in sg.nodes:
+        if not out_edges[n]:
+            continue
+        for e in out_edges[n]:
+            n_mark[dst[e]] = 'inplay'
+        max_len = length[out_edges[n][-1]] + mod.FUZZ
+        for e in out_edges[n]:
+            if n_mark[dst[e]] == 'inplay':
+                for e2 in out_edges[dst[e]]:
+                    if length[e2] + length[e] < max_len and n_mark.get(dst[e2]) == 'inplay':
+                        n_mark[dst[e2]] = 'eliminated'
+        for e in out_edges[n]:
+            w_out = out_edges[dst[e]]
+            for e2 in w_out:
+                if (e2 == w_out[0] or length[e2] < mod.FUZZ) and n_mark.get(dst[e2]) == 'inplay':
+                    n_mark[dst[e2]] = 'eliminated'
+        for e in out_edges[n]:
+            if n_mark[dst[e]] == 'eliminated':
+                sg.e_reduce[e] = 1
+                sg.e_reduce[sg.rev[e]] = 1
+            n_mark[dst[e]] = 'vacant'
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_mark_tr_edges_random(seed):
+    sg = get_random_graph(seed)
+    mark_tr_edges(sg)
+    expected = list(sg.e_reduce)
+    assert 0 < sum(expected) < len(expected)
+    for n_threads in (1, 4):
+        sg = get_random_graph(seed)
+        assert sg.mark_tr_edges(n_threads) > 0
+        assert expected == list(sg.e_reduce)
+
+
+def test_sort_edges():
+    sg, n = get_graph()
+    key = mod.array.array('i', [5, 1, 5, 2, 0, 0])
+    sg.sort_edges(sg.out_eids, sg.out_start, key)
+    assert [1, 3] == list(sg.out_edges(n['1:E']))
+    sg.sort_edges(sg.in_eids, sg.in_start, key, descending=True)
+    assert [0, 2] == list(sg.in_edges(n['1:B']))
+    key[0] = 4
+    sg.sort_edges(sg.in_eids, sg.in_start, key, descending=True)
+    assert [2, 0] == list(sg.in_edges(n['1:B']))
+
+
+def test_save_load(tmpdir):
+    fn = str(tmpdir.join('sg_checkpoint'))
+    assert mod.load(fn, 'key') is None
+    sg = get_random_graph(0)
+    sg.mark_tr_edges()
+    sg.save(fn, 'key')
+    assert mod.load(fn, 'other') is None
+    sg2 = mod.load(fn, 'key')
+    for name in mod.CHECKPOINT_ARRAYS + ('read_names', 'read_ids', 'node_added', 'e_reduce'):
+        assert getattr(sg, name) == getattr(sg2, name), name
+    assert sg.mark_spur_edge() == sg2.mark_spur_edge()
+
+    # Truncated, or corrupt.
+    with open(fn, 'rb') as f:
+        data = f.read()
+    for bad in [data[:len(data) // 2], data[:-1], b'\n' + data, b'[]\n' + data.split(b'\n', 1)[1],
+                data.replace(b'"arrays"', b'"arrayz"', 1)]:
+        with open(fn, 'wb') as f:
+            f.write(bad)
+        assert mod.load(fn, 'key') is None
+
+
+def test_mark_spur_edge():
+    sg = mod.StringGraph()
+    a, b, c = [sg.get_node(r, 'E') for r in 'abc']
+    sg.add_edge(a, b, 1000, 0, -5000, 99.0)
+    sg.add_edge(b ^ 1, a ^ 1, 1000, 0, -5000, 99.0)
+    sg.add_edge(a, c, 2000, 0, -4000, 99.0)
+    sg.add_edge(c ^ 1, a ^ 1, 2000, 0, -4000, 99.0)
+    sg.add_edge(b, sg.get_node('d', 'E'), 3000, 0, -3000, 99.0)
+    sg.add_edge(sg.get_node('d', 'B'), b ^ 1, 3000, 0, -3000, 99.0)
+    sg.build_index()
+    # c ends at a dead end, b does not.
+    assert set([2, 3]) == sg.mark_spur_edge()
+
+
+def get_random_multigraphs(seed, n_nodes=40, n_edges=120):
+    import networkx as nx
+    rnd = random.Random(seed)
+    g, nxg = mod.MultiDigraph(), nx.MultiDiGraph()
+    for _ in range(n_edges):
+        u, v, k = rnd.randrange(n_nodes), rnd.randrange(n_nodes), rnd.choice('ab')
+        g.add_edge(u, v, k)
+        nxg.add_edge(u, v, key=k)
+    for (u, v, k) in rnd.sample(list(nxg.edges(keys=True)), n_edges // 4):
+        g.remove_edge(u, v, k)
+        nxg.remove_edge(u, v, key=k)
+    return g, nxg
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_multidigraph(seed):
+    import networkx as nx
+    g, nxg = get_random_multigraphs(seed)
+    g, nxg = g.copy(), nxg.copy()
+    assert list(nxg.nodes()) == list(g.nodes())
+    assert list(nxg.edges(keys=True)) == g.edges(keys=True)
+    for n in nxg.nodes():
+        assert list(nxg.out_edges(n, keys=True)) == g.out_edges(n, keys=True)
+        assert list(nxg.in_edges(n, keys=True)) == g.in_edges(n, keys=True)
+        assert list(nxg.in_edges(n)) == g.in_edges(n)
+        assert (nxg.in_degree(n), nxg.out_degree(n)) == (g.in_degree(n), g.out_degree(n))
+        for t in nxg.nodes():
+            if nx.has_path(nxg, n, t):
+                assert nx.shortest_path(nxg, n, t) == g.shortest_path(n, t)
+            else:
+                with pytest.raises(KeyError):
+                    g.shortest_path(n, t)
+        ego, nxego = g.ego_graph(n, 3), nx.ego_graph(nxg, n, 3)
+        assert set(nxego.nodes()) == set(ego.nodes())
+        for v in nxego.nodes():
+            assert list(nxego.out_edges(v, keys=True)) == ego.out_edges(v, keys=True)
+            assert sorted(nxego.in_edges(v, keys=True)) == sorted(ego.in_edges(v, keys=True))
+    with pytest.raises(KeyError):
+        g.remove_edge(0, 0, 'c')